@@ -1,6 +1,10 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import cameras
+from app.api.v1.endpoints import auth, cameras, potential_power, scada_measurements, t19
 
 api_router = APIRouter()
 
+api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
 api_router.include_router(cameras.router, prefix="/cameras", tags=["cameras"])
+api_router.include_router(t19.router, prefix="/t19", tags=["t19"])
+api_router.include_router(potential_power.router, prefix="/potential-power", tags=["potential power"])
+api_router.include_router(scada_measurements.router, prefix="/scada", tags=["scada"])
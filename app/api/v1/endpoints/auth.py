@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.dependancies import get_current_user, get_db
+from app.schemas.user import Token, UserCredentials, UserOut
+from app.services import auth_service
+from app.services.auth_service import UserExistsError
+
+router = APIRouter()
+
+
+@router.post("/register", response_model=UserOut)
+async def register(credentials: UserCredentials, db: AsyncSession = Depends(get_db)):
+    try:
+        return await auth_service.register_user(db, credentials)
+    except UserExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/token", response_model=Token)
+async def login(credentials: UserCredentials, db: AsyncSession = Depends(get_db)):
+    token = await auth_service.login(db, credentials)
+    if not token:
+        raise HTTPException(
+            status_code=401, detail="Incorrect username or password", headers={"WWW-Authenticate": "Bearer"}
+        )
+    return token
+
+
+@router.get("/me", response_model=UserOut)
+async def me(user_id: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    user = await auth_service.get_user_by_id(db, int(user_id))
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found", headers={"WWW-Authenticate": "Bearer"})
+    return user
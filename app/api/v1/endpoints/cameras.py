@@ -1,21 +1,68 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.schemas.camera import CameraOut
-from app.models.camera import Camera
 from app.core.dependancies import get_db
+from app.db.redis.client import get_redis
+from app.schemas.camera import CameraCreate, CameraOut, CameraPage, CameraUpdate
+from app.services import camera_service
+from app.services.camera_service import CameraExistsError
 
 router = APIRouter()
 
-@router.get("/")
-def list_cameras():
-    return [{"id": 1, "name": "Camera1"}]
 
-@router.get("/cameras/{id}", response_model=CameraOut)
-def get_camera(id: int, db: Session = Depends(get_db)):
-    camera = db.query(Camera).filter(Camera.id == id).first()
+@router.get("/", response_model=CameraPage)
+async def list_cameras(
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    return await camera_service.list_cameras(db, after_id=after_id, limit=limit)
 
+
+@router.post("/", response_model=CameraOut)
+async def create_camera(camera_in: CameraCreate, db: AsyncSession = Depends(get_db)):
+    try:
+        return await camera_service.add_camera(db, camera_in)
+    except CameraExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/{camera_id}", response_model=CameraOut)
+async def get_camera(
+    camera_id: int,
+    db: AsyncSession = Depends(get_db),
+    r: redis.Redis = Depends(get_redis),
+):
+    camera = await camera_service.get_camera_by_id(db, r, camera_id)
+    if not camera:
+        raise HTTPException(status_code=404, detail="Camera not found")
+    return camera
+
+
+@router.patch("/{camera_id}", response_model=CameraOut)
+async def update_camera(
+    camera_id: int,
+    camera_in: CameraUpdate,
+    db: AsyncSession = Depends(get_db),
+    r: redis.Redis = Depends(get_redis),
+):
+    try:
+        camera = await camera_service.modify_camera(db, r, camera_id, camera_in)
+    except CameraExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if not camera:
         raise HTTPException(status_code=404, detail="Camera not found")
+    return camera
 
+
+@router.delete("/{camera_id}", response_model=CameraOut)
+async def delete_camera(
+    camera_id: int,
+    db: AsyncSession = Depends(get_db),
+    r: redis.Redis = Depends(get_redis),
+):
+    camera = await camera_service.remove_camera(db, r, camera_id)
+    if not camera:
+        raise HTTPException(status_code=404, detail="Camera not found")
     return camera
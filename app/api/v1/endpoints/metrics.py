@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app.services.metrics_service import CONTENT_TYPE, MetricsRegistry, get_metrics_registry
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(registry: MetricsRegistry = Depends(get_metrics_registry)):
+    """Metrics of the app in the Prometheus text format."""
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,71 @@
+from typing import AsyncIterator, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from app.schemas.potential_power import Percentile, PotentialPowerBatch, PotentialPowerBatchOut
+from app.services.potential_power_service import (
+    CsvPotentialPower,
+    NdjsonPotentialPower,
+    PotentialPowerService,
+    PowerCurveError,
+    get_potential_power_service,
+    line_chunks,
+)
+
+router = APIRouter()
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+
+
+@router.post("/batch", response_model=PotentialPowerBatchOut)
+def batch(
+    batch_in: PotentialPowerBatch,
+    service: PotentialPowerService = Depends(get_potential_power_service),
+):
+    # a plain def runs in the threadpool, parsing a changed curve file does not block the event loop
+    try:
+        results = service.batch([reading.model_dump() for reading in batch_in.readings], batch_in.percentiles)
+    except PowerCurveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"results": results}
+
+
+@router.post("/stream")
+async def stream(
+    request: Request,
+    curve: str = Query(min_length=1),
+    wind_col: str = "Wind speed [m/s]",
+    dir_col: Optional[str] = None,
+    percentiles: List[Percentile] = Query(["p50", "p10", "p90"]),
+    service: PotentialPowerService = Depends(get_potential_power_service),
+):
+    """
+    Add potential power to a CSV (text/csv) or newline delimited JSON request body.
+
+    The body is processed in chunks of rows as it arrives and the response is streamed
+    back in the same format, so uploads of any size are not held in memory.
+    """
+    ndjson = request.headers.get("content-type", "").split(";")[0].strip() in NDJSON_TYPES
+    try:
+        curves = service.curves(curve)
+    except PowerCurveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if ndjson:
+        processor = NdjsonPotentialPower(curves, percentiles)
+    else:
+        processor = CsvPotentialPower(curves, wind_col, dir_col, percentiles)
+
+    chunks = line_chunks(request.stream())
+    # the first chunk is processed before the response starts, so a bad header is still a 400
+    try:
+        first = processor.process(await anext(chunks, []))
+    except PowerCurveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def body() -> AsyncIterator[str]:
+        yield first
+        async for lines in chunks:
+            yield processor.process(lines)
+
+    return StreamingResponse(body(), media_type="application/x-ndjson" if ndjson else "text/csv")
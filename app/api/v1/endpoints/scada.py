@@ -6,20 +6,37 @@ fetch_scada_to_csv.py to use at task 19 folder
 - Parses JSON response
 - Extracts fields + defaults/transforms
 - Writes a CSV named "scada data.csv"
-- Overwrites the old file if it already exists
 
-Required: pip install requests
+The time range is split into windows that are fetched concurrently. Records are
+parsed from the response as it arrives and written to disk window by window, so
+memory use does not depend on the length of the range. The last written timepoint
+is kept in "<csv>.state.json", running again continues from there instead of
+fetching everything again. Remove the state file to start over.
+
+With --store the rows are appended into a T19 column store directory instead of
+a CSV. T19 reads a store without parsing text, and running again continues after
+the last timestamp of the store.
+
+Required: pip install httpx numpy
 """
 
 from __future__ import annotations
 
+import argparse
+import asyncio
 import csv
+import os
+import re
+import shutil
 import sys
 import json
-from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
-import requests
+import httpx
+import numpy as np
 
 
 OUTPUT_CSV_NAME = "scada_data.csv"
@@ -36,6 +53,10 @@ OUTPUT_FIELDS = [
     "IPS",
 ]
 
+T19_REPO_DIR = os.environ.get(
+    "T19_REPO_DIR", str(Path(__file__).resolve().parents[4] / "external" / "T19IceLossMethod-master")
+)
+
 
 def ms_epoch_to_iso(ms: Any) -> str:
     """Convert Unix epoch milliseconds -> 'D.M.YYYY H:MM' (UTC)."""
@@ -104,39 +125,407 @@ def transform_row(obj: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def fetch_json(url: str, token: Optional[str] = None, timeout: int = 30) -> Any:
+DEFAULT_URL = "https://api-144067630816.europe-west1.run.app/api/scada/dragaliden-01/data-log/"
+API_TIME_FORMAT = "%Y-%m-%dT%H:%M"
+
+DATA_VECTOR_RE = re.compile(r'"data_vector"\s*:\s*')
+
+
+class DataVectorParser:
+    """
+    Incremental parser for data-log responses.
+
+    Feed the response text in chunks, the records of "data_vector" (or of a plain
+    top level list) are returned as soon as they are complete. Only the unparsed
+    tail of the text is kept in memory. Responses without a "data_vector" list are
+    parsed as a whole when the parser is closed and handled like extract_records.
+    An empty "data_vector" gives no records.
+    """
+
+    def __init__(self) -> None:
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._state = "start"  # start, search, array, done
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self._buffer += chunk
+        if self._state == "start":
+            stripped = self._buffer.lstrip()
+            if not stripped:
+                return []
+            if stripped[0] == "[":
+                self._buffer = stripped[1:]
+                self._state = "array"
+            else:
+                self._state = "search"
+        if self._state == "search":
+            match = DATA_VECTOR_RE.search(self._buffer)
+            if match is None or match.end() == len(self._buffer):
+                return []
+            if self._buffer[match.end()] != "[":
+                # null or some other value, parse the whole response in close()
+                return []
+            self._buffer = self._buffer[match.end() + 1:]
+            self._state = "array"
+        if self._state == "array":
+            return self._parse_array()
+        return []
+
+    def _parse_array(self) -> List[Dict[str, Any]]:
+        records = []
+        buffer = self._buffer
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buffer):
+                break
+            if buffer[pos] == "]":
+                self._state = "done"
+                pos = len(buffer)
+                break
+            try:
+                obj, pos = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # incomplete record, wait for more text
+                break
+            if isinstance(obj, dict):
+                records.append(obj)
+        self._buffer = buffer[pos:]
+        return records
+
+    def close(self) -> List[Dict[str, Any]]:
+        if self._state == "array":
+            raise ValueError("Response ended in the middle of data_vector")
+        if self._state in ("start", "search") and self._buffer.strip():
+            return extract_records(json.loads(self._buffer))
+        return []
+
+
+def time_windows(start: datetime, end: datetime, window: timedelta) -> Iterator[Tuple[datetime, datetime]]:
+    """Split [start, end) into consecutive windows of at most `window`."""
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + window, end)
+        yield window_start, window_end
+        window_start = window_end
+
+
+def epoch_ms(moment: datetime) -> int:
+    return int(moment.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+async def stream_window_records(
+    client: httpx.AsyncClient,
+    url: str,
+    window_start: datetime,
+    window_end: datetime,
+    token: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
     headers = {"Accept": "application/json"}
     if token:
         headers["Authorization"] = f"Bearer {token}"
-    print('headersssss',headers)
-    resp = requests.get(url, headers=headers, timeout=timeout)
-    resp.raise_for_status()
-    return resp.json()
+    params = {
+        "start_time": window_start.strftime(API_TIME_FORMAT),
+        "end_time": window_end.strftime(API_TIME_FORMAT),
+    }
+    parser = DataVectorParser()
+    async with client.stream("GET", url, params=params, headers=headers) as resp:
+        resp.raise_for_status()
+        async for chunk in resp.aiter_text():
+            for record in parser.feed(chunk):
+                yield record
+    for record in parser.close():
+        yield record
 
 
-def write_csv(rows: List[Dict[str, Any]], path: str) -> None:
-    # mode="w" overwrites if file exists
-    with open(path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS)
-        writer.writeheader()
-        writer.writerows(rows)
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, (httpx.TransportError, ValueError))
 
 
-def main() -> int:
-    
-        print("Usage: python fetch_scada_to_csv.py <Scada data log> [BEARER_TOKEN]", file=sys.stderr)
-        print('Example: python fetch_scada_to_csv.py "https://example.com/task19?wec_uuid=..."', file=sys.stderr)
+async def fetch_window_to_file(
+    client: httpx.AsyncClient,
+    url: str,
+    window_start: datetime,
+    window_end: datetime,
+    part_path: str,
+    after_ms: int,
+    slots: asyncio.Semaphore,
+    token: Optional[str] = None,
+    retries: int = 3,
+    backoff: float = 1.0,
+) -> Tuple[int, int]:
+    """
+    Fetch one window and write its transformed rows (without header) into part_path.
+
+    Only records with window_start <= timepoint < window_end and timepoint > after_ms
+    are written, so overlapping window bounds do not produce duplicates.
+
+    Returns the number of rows written and the largest timepoint written.
+    """
+    start_ms = max(epoch_ms(window_start), after_ms + 1)
+    end_ms = epoch_ms(window_end)
+    attempt = 0
+    while True:
+        rows = 0
+        last_timepoint = after_ms
+        try:
+            async with slots:
+                with open(part_path, "w", newline="", encoding="utf-8") as f:
+                    writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS)
+                    async for record in stream_window_records(client, url, window_start, window_end, token):
+                        try:
+                            timepoint = int(float(record.get("timepoint")))
+                        except (TypeError, ValueError):
+                            continue
+                        if timepoint < start_ms or timepoint >= end_ms:
+                            continue
+                        writer.writerow(transform_row(record))
+                        rows += 1
+                        last_timepoint = max(last_timepoint, timepoint)
+            return rows, last_timepoint
+        except (httpx.HTTPError, ValueError) as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            attempt += 1
+            await asyncio.sleep(backoff * 2 ** (attempt - 1))
 
-        url = "https://api-144067630816.europe-west1.run.app/api/scada/dragaliden-01/data-log/?start_time=2023-09-08T00:00&end_time=2025-09-08T12:00"
-        token = "" #to be added access to end point 
 
-        payload = fetch_json(url, token=token)
-        records = extract_records(payload)
-        rows = [transform_row(obj) for obj in records]
+async def fetch_window_columns(
+    client: httpx.AsyncClient,
+    url: str,
+    window_start: datetime,
+    window_end: datetime,
+    after_ms: int,
+    slots: asyncio.Semaphore,
+    token: Optional[str] = None,
+    retries: int = 3,
+    backoff: float = 1.0,
+) -> Tuple[List[Any], int]:
+    """
+    Fetch one window into typed columns in the order of OUTPUT_FIELDS.
+
+    Same records and values as fetch_window_to_file, but the timestamp column holds
+    datetime64 values (UTC, truncated to minutes like the CSV text) and the other
+    columns the values of transform_row.
+
+    Returns the columns and the largest timepoint fetched.
+    """
+    start_ms = max(epoch_ms(window_start), after_ms + 1)
+    end_ms = epoch_ms(window_end)
+    attempt = 0
+    while True:
+        timepoints: List[int] = []
+        rows: List[Dict[str, Any]] = []
+        try:
+            async with slots:
+                async for record in stream_window_records(client, url, window_start, window_end, token):
+                    try:
+                        timepoint = int(float(record.get("timepoint")))
+                    except (TypeError, ValueError):
+                        continue
+                    if timepoint < start_ms or timepoint >= end_ms:
+                        continue
+                    timepoints.append(timepoint)
+                    rows.append(transform_row(record))
+            columns: List[Any] = [np.array(timepoints, dtype="datetime64[ms]").astype("datetime64[m]")]
+            columns.extend([row[field] for row in rows] for field in OUTPUT_FIELDS[1:])
+            return columns, max(timepoints, default=after_ms)
+        except (httpx.HTTPError, ValueError) as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            attempt += 1
+            await asyncio.sleep(backoff * 2 ** (attempt - 1))
+
+
+def column_store_module() -> Any:
+    """Import t19_ice_loss.column_store from the T19 repository."""
+    if T19_REPO_DIR not in sys.path:
+        sys.path.insert(0, T19_REPO_DIR)
+    from t19_ice_loss import column_store
+
+    return column_store
+
+
+def read_state(state_path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_state(state_path: str, state: Dict[str, Any]) -> None:
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+async def ingest(
+    url: str,
+    start: datetime,
+    end: datetime,
+    out_path: str,
+    token: Optional[str] = None,
+    window: timedelta = timedelta(days=1),
+    parallel: int = 4,
+    retries: int = 3,
+    backoff: float = 1.0,
+    timeout: float = 60.0,
+) -> int:
+    """
+    Fetch [start, end) window by window and append the rows to out_path.
+
+    Up to `parallel` windows are fetched at the same time over one connection
+    pool. Finished windows are appended to the CSV in time order, after each one
+    the last timepoint and the size of the CSV are saved into the state file. If
+    the state file exists, the CSV is truncated to the saved size (dropping rows
+    of an interrupted append) and fetching continues after the saved timepoint.
+
+    Returns the number of rows written in this run.
+    """
+    state_path = out_path + ".state.json"
+    parts_dir = out_path + ".parts"
+    state = read_state(state_path)
+    if state is not None and state.get("url") == url and os.path.exists(out_path):
+        after_ms = state["last_timepoint"]
+        with open(out_path, "r+b") as f:
+            f.truncate(state["size"])
+        resume_from = datetime.fromtimestamp(after_ms / 1000.0, tz=timezone.utc).replace(tzinfo=None, second=0, microsecond=0)
+        start = max(start, resume_from)
+    else:
+        after_ms = -1
+        # mode="w" overwrites if file exists
+        with open(out_path, "w", newline="", encoding="utf-8") as f:
+            csv.DictWriter(f, fieldnames=OUTPUT_FIELDS).writeheader()
+        write_state(state_path, {"url": url, "last_timepoint": after_ms, "size": os.path.getsize(out_path)})
+
+    os.makedirs(parts_dir, exist_ok=True)
+    slots = asyncio.Semaphore(parallel)
+    limits = httpx.Limits(max_connections=parallel, max_keepalive_connections=parallel)
+    written = 0
+    pending: deque = deque()
+
+    async def append_oldest() -> None:
+        nonlocal after_ms, written
+        task, part_path = pending.popleft()
+        rows, last_timepoint = await task
+        with open(part_path, "rb") as part, open(out_path, "ab") as out:
+            shutil.copyfileobj(part, out)
+            out.flush()
+            os.fsync(out.fileno())
+        os.remove(part_path)
+        written += rows
+        after_ms = max(after_ms, last_timepoint)
+        write_state(state_path, {"url": url, "last_timepoint": after_ms, "size": os.path.getsize(out_path)})
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        try:
+            for index, (window_start, window_end) in enumerate(time_windows(start, end, window)):
+                part_path = os.path.join(parts_dir, f"{index}.csv")
+                task = asyncio.create_task(fetch_window_to_file(
+                    client, url, window_start, window_end, part_path, after_ms, slots, token, retries, backoff
+                ))
+                pending.append((task, part_path))
+                # fetch ahead at most two rounds of windows, so finished parts do not pile up
+                if len(pending) >= 2 * parallel:
+                    await append_oldest()
+            while pending:
+                await append_oldest()
+        finally:
+            for task, _ in pending:
+                task.cancel()
+            await asyncio.gather(*(task for task, _ in pending), return_exceptions=True)
+            shutil.rmtree(parts_dir, ignore_errors=True)
+    return written
+
+
+async def ingest_to_store(
+    url: str,
+    start: datetime,
+    end: datetime,
+    store_path: str,
+    token: Optional[str] = None,
+    window: timedelta = timedelta(days=1),
+    parallel: int = 4,
+    retries: int = 3,
+    backoff: float = 1.0,
+    timeout: float = 60.0,
+) -> int:
+    """
+    Fetch [start, end) window by window and append the rows to a T19 column store.
+
+    Windows are fetched like in ingest() and appended in time order. The store keeps
+    its own row count, so an interrupted run leaves no partial rows and the next run
+    continues after the last timestamp in the store.
+
+    Returns the number of rows written in this run.
+    """
+    column_store = column_store_module()
+    writer = column_store.ColumnStoreWriter(store_path, OUTPUT_FIELDS, 0)
+    after_ms = -1
+    if column_store.is_column_store(store_path):
+        last = column_store.ColumnStore(store_path).last_timestamp()
+        if last is not None:
+            # timestamps are stored truncated to minutes, skip the rest of that minute
+            after_ms = int(last.astype("datetime64[ms]").astype(np.int64)) + 59999
+            start = max(start, last.astype(datetime))
+
+    slots = asyncio.Semaphore(parallel)
+    limits = httpx.Limits(max_connections=parallel, max_keepalive_connections=parallel)
+    written = 0
+    pending: deque = deque()
+
+    async def append_oldest() -> None:
+        nonlocal written
+        columns, _ = await pending.popleft()
+        if len(columns[0]):
+            written += await asyncio.to_thread(writer.append, columns)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        try:
+            for window_start, window_end in time_windows(start, end, window):
+                pending.append(asyncio.create_task(fetch_window_columns(
+                    client, url, window_start, window_end, after_ms, slots, token, retries, backoff
+                )))
+                if len(pending) >= 2 * parallel:
+                    await append_oldest()
+            while pending:
+                await append_oldest()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+    return written
+
+
+def parse_time(value: str) -> datetime:
+    return datetime.strptime(value, API_TIME_FORMAT)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Fetch SCADA data log into a Task19 CSV")
+    ap.add_argument("--url", default=DEFAULT_URL, help="data-log endpoint without query parameters")
+    ap.add_argument("--start", type=parse_time, default=parse_time("2023-09-08T00:00"), help="YYYY-MM-DDTHH:MM (UTC)")
+    ap.add_argument("--end", type=parse_time, default=parse_time("2025-09-08T12:00"), help="YYYY-MM-DDTHH:MM (UTC)")
+    ap.add_argument("--out", default=OUTPUT_CSV_NAME)
+    ap.add_argument("--store", default="", help="append into this T19 column store directory instead of --out")
+    ap.add_argument("--token", default=os.environ.get("SCADA_TOKEN", ""), help="bearer token, defaults to $SCADA_TOKEN")
+    ap.add_argument("--window-hours", type=float, default=24.0, help="length of one request")
+    ap.add_argument("--parallel", type=int, default=4, help="concurrent requests")
+    ap.add_argument("--retries", type=int, default=3)
+    args = ap.parse_args()
 
-        write_csv(rows, OUTPUT_CSV_NAME)
-        print(f"Wrote {len(rows)} rows to '{OUTPUT_CSV_NAME}' (overwritten if existed).")
-        return 0
+    target = args.store or args.out
+    rows = asyncio.run((ingest_to_store if args.store else ingest)(
+        args.url, args.start, args.end, target, token=args.token or None,
+        window=timedelta(hours=args.window_hours), parallel=args.parallel, retries=args.retries,
+    ))
+    print(f"Wrote {rows} new rows to '{target}'.")
+    return 0
 
 
 if __name__ == "__main__":
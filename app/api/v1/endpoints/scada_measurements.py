@@ -0,0 +1,44 @@
+from datetime import datetime
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core.dependancies import get_db
+from app.schemas.scada import ScadaField, ScadaIngestOut, ScadaSeries
+from app.services import scada_service
+from app.services.potential_power_service import line_chunks
+from app.services.scada_service import ScadaError
+
+router = APIRouter()
+
+
+@router.post("/{turbine_id}/measurements", response_model=ScadaIngestOut)
+async def ingest_measurements(turbine_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Store a Task19 SCADA CSV (text/csv body, e.g. scada_data.csv) for a turbine.
+
+    The body is inserted batch by batch as it arrives, rows that are stored already are skipped.
+    """
+    chunks = line_chunks(request.stream(), chunk_rows=settings.SCADA_INSERT_BATCH_ROWS)
+    try:
+        return await scada_service.ingest_csv(db, turbine_id, chunks)
+    except ScadaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/{turbine_id}/measurements", response_model=ScadaSeries)
+async def get_measurements(
+    turbine_id: str,
+    start: datetime,
+    end: datetime,
+    points: int = Query(1000, ge=1, le=10000),
+    fields: List[ScadaField] = Query(["power"]),
+    db: AsyncSession = Depends(get_db),
+):
+    """Min, mean and max of the fields in at most `points` equal time buckets of [start, end)."""
+    try:
+        return await scada_service.downsample(db, turbine_id, start, end, points, list(dict.fromkeys(fields)))
+    except ScadaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
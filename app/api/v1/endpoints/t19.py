@@ -0,0 +1,49 @@
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.db.redis.client import get_redis
+from app.schemas.t19 import T19JobCreate, T19JobOut, T19Result
+from app.services.t19_service import T19JobError, T19JobService, get_t19_service
+
+router = APIRouter()
+
+
+@router.post("/jobs", response_model=T19JobOut, status_code=202)
+async def submit_job(
+    job_in: T19JobCreate,
+    r: redis.Redis = Depends(get_redis),
+    service: T19JobService = Depends(get_t19_service),
+):
+    try:
+        return await service.submit(r, job_in.dataset, job_in.config)
+    except T19JobError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/jobs/{job_id}", response_model=T19JobOut)
+async def get_job(
+    job_id: str,
+    r: redis.Redis = Depends(get_redis),
+    service: T19JobService = Depends(get_t19_service),
+):
+    job = await service.get_job(r, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/result", response_model=T19Result)
+async def get_job_result(
+    job_id: str,
+    r: redis.Redis = Depends(get_redis),
+    service: T19JobService = Depends(get_t19_service),
+):
+    job = await service.get_job(r, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "finished":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    result = await service.get_result(r, job["fingerprint"])
+    if result is None:
+        raise HTTPException(status_code=404, detail="Result has expired")
+    return result
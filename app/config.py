@@ -1,10 +1,39 @@
+from pathlib import Path
+
 from pydantic_settings import BaseSettings
 
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
 class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite+aiosqlite:///./test.db"
+    DATABASE_ECHO: bool = False                          # log every SQL statement
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_MAX_OVERFLOW: int = 20
     SECRET_KEY: str = "your-secret-key"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    BCRYPT_ROUNDS: int = 12                              # each round doubles the time of a hash
+    BCRYPT_WORKERS: int = 4                              # bcrypt threads, logins beyond this wait in line
+    # verified token claims kept in-process, entries are dropped after the TTL or at the token exp
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_TTL_SECONDS: int = 60
+
+    # Task19 ice loss jobs
+    T19_REPO_DIR: str = str(PROJECT_ROOT / "external" / "T19IceLossMethod-master")
+    T19_DATA_DIR: str = str(PROJECT_ROOT / "data")      # datasets can only be read from here
+    T19_WORK_DIR: str = str(PROJECT_ROOT / "outputs" / "t19_jobs")
+    T19_WORKERS: int = 2                                 # parallel T19 processes per app process
+    T19_RESULT_TTL_SECONDS: int = 7 * 24 * 3600
+    T19_JOB_TTL_SECONDS: int = 24 * 3600
+
+    # Task19 powercurve.txt files used for potential power, curves are requested by their path in here
+    POWER_CURVE_DIR: str = str(PROJECT_ROOT / "outputs" / "power_curves")
+
+    # cameras read through Redis, entries are dropped on update and delete and expire after this
+    CAMERA_CACHE_TTL_SECONDS: int = 300
+
+    # SCADA measurement rows inserted per transaction
+    SCADA_INSERT_BATCH_ROWS: int = 10000
 
     class Config:
         env_file = ".env"
@@ -1,26 +1,36 @@
-from app.db.session import SessionLocal
+from typing import AsyncIterator, Optional
+
+from app.core.security import decode_access_token
+from app.db.session import get_sessionmaker
 from fastapi import Depends
-from jose import jwt, JWTError
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from fastapi import HTTPException
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncIterator[AsyncSession]:
+    async with get_sessionmaker()() as db:
         yield db
-    finally:
-        db.close()
 
 
-SECRET_KEY = "mysecretkey"
-ALGORITHM = "HS256"
+bearer_scheme = HTTPBearer(auto_error=False)
 
-def get_current_user(token: str):
+# ID of the user of the bearer token. Verified tokens are cached (TOKEN_CACHE_TTL_SECONDS),
+# a request with a known token skips the signature check.
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+) -> str:
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return user_id
+        payload = decode_access_token(credentials.credentials)
     except JWTError:
-        raise HTTPException(status_code=401, detail="Token error")
+        raise HTTPException(status_code=401, detail="Token error", headers={"WWW-Authenticate": "Bearer"})
+    user_id = payload.get("sub")
+    # the tokens of create_access_token have the numeric user ID as the subject
+    try:
+        int(user_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+    return user_id
@@ -1,26 +1,131 @@
-from passlib.context import CryptContext
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import bcrypt
 from jose import jwt
-from datetime import datetime, timedelta
 
-SECRET_KEY = "mysecretkey"
-ALGORITHM = "HS256"
+from app.config import settings
+
+# bcrypt is called directly, passlib 1.7 fails on the current bcrypt releases. The hashes are the same $2b$ strings.
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def _password_bytes(password: str) -> bytes:
+    # bcrypt uses the first 72 bytes, passlib cut longer passwords the same way
+    return password.encode("utf-8")[:72]
 
 
 # Hash password
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return bcrypt.hashpw(_password_bytes(password), bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)).decode("ascii")
 
 
 # Verify password
 def verify_password(password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(password, hashed_password)
+    try:
+        return bcrypt.checkpw(_password_bytes(password), hashed_password.encode("ascii"))
+    except ValueError:
+        # not a bcrypt hash
+        return False
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_password_executor() -> ThreadPoolExecutor:
+    """Threads for bcrypt, it releases the GIL while hashing. Hashes beyond BCRYPT_WORKERS wait in the queue."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+        return _executor
+
+
+def shutdown_password_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def _run_in_password_executor(function: Callable[..., Any], *args: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_password_executor(), function, *args)
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password off the event loop."""
+    return await _run_in_password_executor(hash_password, password)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    """verify_password off the event loop."""
+    return await _run_in_password_executor(verify_password, password, hashed_password)
 
 
 # Create JWT token
-def create_access_token(user_id: int):
-    expire = datetime.utcnow() + timedelta(minutes=30)
+def create_access_token(user_id: int, expires_minutes: Optional[int] = None) -> str:
+    minutes = settings.ACCESS_TOKEN_EXPIRE_MINUTES if expires_minutes is None else expires_minutes
+    expire = datetime.now(timezone.utc) + timedelta(minutes=minutes)
     payload = {"sub": str(user_id), "exp": expire}
-    token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+    token = jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return token
+
+
+class TokenCache:
+    """
+    Verified claims by token. An entry is dropped ttl_seconds after it was added or when the token expires,
+    whichever comes first, so a cached token is never accepted after its exp.
+
+    Keeps at most max_entries tokens, the least recently used one is dropped first.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 60.0, clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if self.clock() >= entry[0]:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return dict(entry[1])
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        expires = self.clock() + self.ttl_seconds
+        if "exp" in claims:
+            expires = min(expires, float(claims["exp"]))
+        with self._lock:
+            self._entries[token] = (expires, dict(claims))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL_SECONDS)
+
+
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """Claims of a valid token, raises JWTError for an invalid or expired one. Verified claims are cached."""
+    claims = token_cache.get(token)
+    if claims is None:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        token_cache.put(token, claims)
+    return claims
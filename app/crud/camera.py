@@ -1,47 +1,53 @@
-from sqlalchemy.orm import Session
+from typing import Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
 from app.models.camera import Camera
 from app.schemas.camera import CameraCreate, CameraUpdate
 
 
 # Get one camera by ID
-def get_camera(db: Session, camera_id: int):
-    return db.query(Camera).filter(Camera.id == camera_id).first()
+async def get_camera(db: AsyncSession, camera_id: int) -> Optional[Camera]:
+    return await db.get(Camera, camera_id)
 
 
-# Get all cameras
-def get_cameras(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Camera).offset(skip).limit(limit).all()
+# Get a page of cameras ordered by ID, starting after the last ID of the previous page.
+# Seeking on the primary key index costs the same on every page, an offset scans all the skipped rows.
+async def get_cameras(db: AsyncSession, after_id: int = 0, limit: int = 100) -> Sequence[Camera]:
+    result = await db.scalars(
+        select(Camera).where(Camera.id > after_id).order_by(Camera.id).limit(limit)
+    )
+    return result.all()
 
 
 # Create camera
-def create_camera(db: Session, camera: CameraCreate):
+async def create_camera(db: AsyncSession, camera: CameraCreate) -> Camera:
     db_camera = Camera(name=camera.name)
     db.add(db_camera)
-    db.commit()
-    db.refresh(db_camera)
+    await db.commit()
     return db_camera
 
 
 # Update camera
-def update_camera(db: Session, camera_id: int, camera_data: CameraUpdate):
-    camera = get_camera(db, camera_id)
+async def update_camera(db: AsyncSession, camera_id: int, camera_data: CameraUpdate) -> Optional[Camera]:
+    camera = await get_camera(db, camera_id)
     if not camera:
         return None
 
     if camera_data.name is not None:
         camera.name = camera_data.name
 
-    db.commit()
-    db.refresh(camera)
+    await db.commit()
     return camera
 
 
 # Delete camera
-def delete_camera(db: Session, camera_id: int):
-    camera = get_camera(db, camera_id)
+async def delete_camera(db: AsyncSession, camera_id: int) -> Optional[Camera]:
+    camera = await get_camera(db, camera_id)
     if not camera:
         return None
 
-    db.delete(camera)
-    db.commit()
+    await db.delete(camera)
+    await db.commit()
     return camera
@@ -0,0 +1,72 @@
+from datetime import datetime
+from typing import Any, Dict, List, Sequence
+
+from sqlalchemy import BigInteger, cast, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.scada import ScadaMeasurement
+
+# numeric columns that can be downsampled
+NUMERIC_FIELDS = ("wind_speed", "wind_direction", "ambient_temperature", "power")
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _insert_statement(dialect: str):
+    """INSERT that skips rows already stored, ingesting the same file again adds nothing."""
+    # on the table, a Core executemany without the ORM bulk insert bookkeeping
+    table = ScadaMeasurement.__table__
+    if dialect == "sqlite":
+        return sqlite_insert(table).on_conflict_do_nothing()
+    if dialect == "postgresql":
+        return postgresql_insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+
+def _epoch_seconds(column, dialect: str):
+    if dialect == "sqlite":
+        return cast(func.strftime("%s", column), BigInteger)
+    return cast(func.extract("epoch", column), BigInteger)
+
+
+# Insert a batch of measurements in one transaction.
+# A list of parameter sets is sent as executemany, SQLAlchemy packs it into multi-row INSERTs.
+async def insert_measurements(db: AsyncSession, rows: List[Dict[str, Any]]) -> int:
+    if not rows:
+        return 0
+    result = await db.execute(_insert_statement(db.bind.dialect.name), rows)
+    await db.commit()
+    return max(result.rowcount, 0)
+
+
+# Min, mean and max of fields in buckets of bucket_seconds from start, computed by the database.
+# Returns one row per bucket that has measurements: bucket number, row count, then min, mean, max of every field.
+async def get_measurement_buckets(
+    db: AsyncSession,
+    turbine_id: str,
+    start: datetime,
+    end: datetime,
+    bucket_seconds: int,
+    fields: Sequence[str],
+) -> List[Any]:
+    epoch = _epoch_seconds(ScadaMeasurement.timestamp, db.bind.dialect.name)
+    start_seconds = int((start - EPOCH).total_seconds())
+    bucket = ((epoch - start_seconds) // bucket_seconds).label("bucket")
+    columns = [bucket, func.count()]
+    for field in fields:
+        column = getattr(ScadaMeasurement, field)
+        columns.extend([func.min(column), func.avg(column), func.max(column)])
+    result = await db.execute(
+        select(*columns)
+        .where(
+            ScadaMeasurement.turbine_id == turbine_id,
+            ScadaMeasurement.timestamp >= start,
+            ScadaMeasurement.timestamp < end,
+        )
+        # by the label, the bucket expression has bound parameters
+        .group_by("bucket")
+        .order_by("bucket")
+    )
+    return result.all()
@@ -0,0 +1,24 @@
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import User
+
+
+# Get one user by ID
+async def get_user(db: AsyncSession, user_id: int) -> Optional[User]:
+    return await db.get(User, user_id)
+
+
+# Get one user by name
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    return await db.scalar(select(User).where(User.username == username))
+
+
+# Create user, the password is hashed by the caller
+async def create_user(db: AsyncSession, username: str, hashed_password: str) -> User:
+    db_user = User(username=username, hashed_password=hashed_password)
+    db.add(db_user)
+    await db.commit()
+    return db_user
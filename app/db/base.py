@@ -1,10 +1,9 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from app.config import settings
+from sqlalchemy.orm import declarative_base
+
+from app.db.session import get_engine
 
 Base = declarative_base()
-engine = create_async_engine(settings.DATABASE_URL, echo=True)
 
 async def init_db():
-    async with engine.begin() as conn:
+    async with get_engine().begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
@@ -19,4 +19,8 @@ async def close_redis() -> None:
     global redis_client
     if redis_client is not None:
         await redis_client.aclose()
-        redis_client = None
\ No newline at end of file
+        redis_client = None
+
+async def get_redis() -> redis.Redis:
+    """FastAPI dependency, connects on first use."""
+    return await init_redis()
@@ -5,4 +5,8 @@ class Settings(BaseSettings):
     DATABASE_URL: str
     REDIS_URL: str = "redis://localhost:6379/"
 
-settings = Settings()
\ No newline at end of file
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+settings = Settings()
@@ -1,19 +1,41 @@
+from typing import AsyncIterator
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from app.core.config import settings
-
-# 1. Create Engine (DB Connection)
-engine = create_engine(
-    settings.database_url,
-    echo=False,  # True only in development if you want SQL logs
-    pool_size=10,
-    max_overflow=20
-)
-
-# 2. Create Session Factory
-SessionLocal = sessionmaker(
-    autocommit=False,
-    autoflush=False,
-    bind=engine
-)
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from app.config import settings
+
+engine: AsyncEngine | None = None
+SessionLocal: async_sessionmaker[AsyncSession] | None = None
+
+
+def get_engine() -> AsyncEngine:
+    """Creates the engine on first use, importing the models does not need a database driver."""
+    global engine
+    if engine is None:
+        options = {"echo": settings.DATABASE_ECHO, "pool_pre_ping": True}
+        # SQLite picks its own pool, a server database shares a bounded pool between the requests
+        if not settings.DATABASE_URL.startswith("sqlite"):
+            options.update(pool_size=settings.DATABASE_POOL_SIZE, max_overflow=settings.DATABASE_MAX_OVERFLOW)
+        engine = create_async_engine(settings.DATABASE_URL, **options)
+    return engine
+
+
+def get_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    global SessionLocal
+    if SessionLocal is None:
+        # objects stay readable after commit, an AsyncSession cannot lazy load expired attributes
+        SessionLocal = async_sessionmaker(get_engine(), autoflush=False, expire_on_commit=False)
+    return SessionLocal
+
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    async with get_sessionmaker()() as session:
+        yield session
+
+
+async def close_engine() -> None:
+    global engine, SessionLocal
+    if engine is not None:
+        await engine.dispose()
+        engine = None
+        SessionLocal = None
@@ -1,12 +1,18 @@
 from fastapi import FastAPI
 from app.api.v1.api import api_router
+from app.api.v1.endpoints import metrics
 from app.db.redis.client import init_redis, close_redis
 from app.db.base import init_db
+from app.core.security import shutdown_password_executor
+from app.db.session import close_engine
+from app.services.t19_service import shutdown_t19_service
 
 app = FastAPI(title="My Company Backend")
 
 # Include routers
 app.include_router(api_router, prefix="/api/v1")
+# scraped from the usual Prometheus path, outside the versioned API
+app.include_router(metrics.router, tags=["metrics"])
 
 # Initialize database on startup
 @app.on_event("startup")
@@ -17,7 +23,10 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown():
+    shutdown_t19_service()
+    shutdown_password_executor()
     await close_redis()
+    await close_engine()
 
 @app.get("/")
 async def root():
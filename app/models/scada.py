@@ -0,0 +1,21 @@
+from sqlalchemy import Column, DateTime, Float, String
+
+from app.db.base import Base
+
+
+class ScadaMeasurement(Base):
+    """One SCADA row of a turbine, the columns of the Task19 CSV written by transform_row."""
+
+    __tablename__ = "scada_measurements"
+
+    # the composite primary key is the index of the range queries: one turbine, a time range
+    turbine_id = Column(String(50), primary_key=True)
+    timestamp = Column(DateTime, primary_key=True)  # UTC
+    wind_speed = Column(Float)
+    wind_direction = Column(Float)
+    ambient_temperature = Column(Float)
+    power = Column(Float)
+    status = Column(String(8))
+    state = Column(String(8))
+    ice_detected = Column(String(8))
+    ips = Column(String(8))
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy.sql import func
+
+from app.db.base import Base
+
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String(100), nullable=False, unique=True)
+    hashed_password = Column(String(60), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
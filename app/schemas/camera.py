@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 
 class CameraBase(BaseModel):
     name: str = Field(min_length=1, max_length=100)
@@ -15,3 +15,8 @@ class CameraOut(CameraBase):
 
     class Config:
         from_attributes = True   # Pydantic v2
+
+class CameraPage(BaseModel):
+    items: List[CameraOut]
+    # id to pass as after_id for the next page, None on the last page
+    next_after: Optional[int] = None
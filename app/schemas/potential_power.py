@@ -0,0 +1,29 @@
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+
+Percentile = Literal["p50", "p10", "p90"]
+
+
+class PotentialPowerReading(BaseModel):
+    # path of the turbine's powercurve.txt, relative to the power curve directory
+    curve: str = Field(min_length=1)
+    wind_speed: Optional[float] = None
+    # degrees, picks the direction sector of the curve; the first sector if missing
+    direction: Optional[float] = None
+
+
+class PotentialPowerBatch(BaseModel):
+    readings: List[PotentialPowerReading]
+    percentiles: List[Percentile] = ["p50", "p10", "p90"]
+
+
+class PotentialPowerOut(BaseModel):
+    # kW by percentile, None if the wind speed is missing
+    p50: Optional[float] = None
+    p10: Optional[float] = None
+    p90: Optional[float] = None
+
+
+class PotentialPowerBatchOut(BaseModel):
+    # in the order of the readings
+    results: List[PotentialPowerOut]
@@ -0,0 +1,34 @@
+from datetime import datetime
+from typing import Dict, List, Literal, Optional
+
+from pydantic import BaseModel
+
+# numeric columns of the SCADA measurements
+ScadaField = Literal["wind_speed", "wind_direction", "ambient_temperature", "power"]
+
+
+class ScadaIngestOut(BaseModel):
+    received: int  # rows with a timestamp in the body
+    inserted: int  # rows that were not stored yet
+
+
+class ScadaFieldStats(BaseModel):
+    # None if the field is missing in every row of the bucket
+    min: Optional[float] = None
+    mean: Optional[float] = None
+    max: Optional[float] = None
+
+
+class ScadaBucket(BaseModel):
+    start: datetime  # UTC
+    count: int
+    values: Dict[str, ScadaFieldStats]
+
+
+class ScadaSeries(BaseModel):
+    turbine_id: str
+    start: datetime
+    end: datetime
+    bucket_seconds: int
+    # only buckets that have measurements, in time order
+    buckets: List[ScadaBucket]
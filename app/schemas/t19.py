@@ -0,0 +1,39 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+
+
+class T19JobCreate(BaseModel):
+    # path of the SCADA data file, relative to the T19 data directory
+    dataset: str = Field(min_length=1)
+    # sections and options of the T19 .ini file, e.g. {"Source file": {"id": "WT1", ...}, ...}
+    # only the sections and options of t19_service.ALLOWED_OPTIONS are accepted,
+    # "filename", "result directory" and the power curve cache are set by the service
+    config: Dict[str, Dict[str, str]]
+
+
+class T19JobOut(BaseModel):
+    id: str
+    status: str  # queued, running, finished or failed
+    fingerprint: str
+    dataset: str
+    cached: bool
+    submitted_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    error: Optional[str] = None
+
+
+class T19PowerCurve(BaseModel):
+    wind_speed: List[float]
+    direction: List[float]
+    # [wind speed bin][direction bin]
+    p50: List[List[float]]
+    p10: List[List[float]]
+    p90: List[List[float]]
+
+
+class T19Result(BaseModel):
+    summary: Dict[str, str]
+    power_curve: T19PowerCurve
+    # event tables by type (losses, stops, status, ips, ice_detection), one dict per event
+    events: Dict[str, List[Dict[str, str]]]
@@ -0,0 +1,67 @@
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core.security import create_access_token, hash_password_async, verify_password_async
+from app.crud.user import create_user, get_user, get_user_by_username
+from app.schemas.user import Token, UserCredentials, UserOut
+
+
+class UserExistsError(Exception):
+    """Raised when a username is taken."""
+
+
+_dummy_hash: Optional[str] = None
+
+
+# Hash checked for unknown users, made on the first failed lookup
+async def _get_dummy_hash() -> str:
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = await hash_password_async("dummy password")
+    return _dummy_hash
+
+
+# Create user, the password is hashed off the event loop
+async def register_user(db: AsyncSession, credentials: UserCredentials) -> UserOut:
+    username = credentials.username.strip()
+    hashed_password = await hash_password_async(credentials.password)
+    try:
+        user = await create_user(db, username, hashed_password)
+    except IntegrityError:
+        await db.rollback()
+        raise UserExistsError(f"User '{username}' already exists")
+    return UserOut.model_validate(user)
+
+
+# Check a username and password, None if either is wrong.
+# An unknown user is checked against a dummy hash, so the response time does not tell which names exist.
+async def authenticate(db: AsyncSession, username: str, password: str) -> Optional[UserOut]:
+    user = await get_user_by_username(db, username.strip())
+    if not user:
+        await verify_password_async(password, await _get_dummy_hash())
+        return None
+    if not await verify_password_async(password, user.hashed_password):
+        return None
+    return UserOut.model_validate(user)
+
+
+# Log in, None if the credentials are wrong
+async def login(db: AsyncSession, credentials: UserCredentials) -> Optional[Token]:
+    user = await authenticate(db, credentials.username, credentials.password)
+    if not user:
+        return None
+    return Token(
+        access_token=create_access_token(user.id),
+        expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    )
+
+
+# Get the user of a verified token
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[UserOut]:
+    user = await get_user(db, user_id)
+    if not user:
+        return None
+    return UserOut.model_validate(user)
@@ -1,36 +1,85 @@
-from sqlalchemy.orm import Session
+from typing import Optional
+
+import redis.asyncio as redis
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
 from app.crud.camera import get_camera, get_cameras, create_camera, update_camera, delete_camera
-from app.schemas.camera import CameraCreate, CameraUpdate
+from app.schemas.camera import CameraCreate, CameraOut, CameraPage, CameraUpdate
+
+CAMERA_KEY = "camera:{}"
+
+
+class CameraExistsError(Exception):
+    """Raised when a camera name is taken."""
+
 
+async def _cache_camera(r: redis.Redis, camera: CameraOut) -> None:
+    await r.set(CAMERA_KEY.format(camera.id), camera.model_dump_json(), ex=settings.CAMERA_CACHE_TTL_SECONDS)
 
-# Get one camera
-def get_camera_by_id(db: Session, camera_id: int):
-    camera = get_camera(db, camera_id)
+
+async def _forget_camera(r: redis.Redis, camera_id: int) -> None:
+    await r.delete(CAMERA_KEY.format(camera_id))
+
+
+# Get one camera, read through the cache.
+# A read that misses can still cache a row an update replaced meanwhile, the TTL bounds how long that lasts.
+async def get_camera_by_id(db: AsyncSession, r: redis.Redis, camera_id: int) -> Optional[CameraOut]:
+    raw = await r.get(CAMERA_KEY.format(camera_id))
+    if raw:
+        return CameraOut.model_validate_json(raw)
+    camera = await get_camera(db, camera_id)
     if not camera:
-        return None  # or raise exception here if you want
-    return camera
+        return None
+    camera_out = CameraOut.model_validate(camera)
+    await _cache_camera(r, camera_out)
+    return camera_out
 
 
-# Get all cameras with optional pagination
-def list_cameras(db: Session, skip: int = 0, limit: int = 100):
-    return get_cameras(db, skip=skip, limit=limit)
+# Get a page of cameras, pass next_after of the page to get the following one
+async def list_cameras(db: AsyncSession, after_id: int = 0, limit: int = 100) -> CameraPage:
+    cameras = await get_cameras(db, after_id=after_id, limit=limit)
+    items = [CameraOut.model_validate(camera) for camera in cameras]
+    # a short page is the last one
+    next_after = items[-1].id if len(items) == limit else None
+    return CameraPage(items=items, next_after=next_after)
 
 
 # Create new camera with some business rules
-def add_camera(db: Session, camera_data: CameraCreate):
+async def add_camera(db: AsyncSession, camera_data: CameraCreate) -> CameraOut:
     # Example business rule: name must be capitalized
     camera_data.name = camera_data.name.title()
-    return create_camera(db, camera_data)
+    try:
+        camera = await create_camera(db, camera_data)
+    except IntegrityError:
+        await db.rollback()
+        raise CameraExistsError(f"Camera '{camera_data.name}' already exists")
+    return CameraOut.model_validate(camera)
 
 
-# Update camera
-def modify_camera(db: Session, camera_id: int, camera_data: CameraUpdate):
+# Update camera, the cached copy is dropped after the commit
+async def modify_camera(
+    db: AsyncSession, r: redis.Redis, camera_id: int, camera_data: CameraUpdate
+) -> Optional[CameraOut]:
     # Example business rule: trim whitespace
     if camera_data.name:
         camera_data.name = camera_data.name.strip()
-    return update_camera(db, camera_id, camera_data)
+    try:
+        camera = await update_camera(db, camera_id, camera_data)
+    except IntegrityError:
+        await db.rollback()
+        raise CameraExistsError(f"Camera '{camera_data.name}' already exists")
+    if not camera:
+        return None
+    await _forget_camera(r, camera_id)
+    return CameraOut.model_validate(camera)
 
 
-# Delete camera
-def remove_camera(db: Session, camera_id: int):
-    return delete_camera(db, camera_id)
\ No newline at end of file
+# Delete camera, the cached copy is dropped after the commit
+async def remove_camera(db: AsyncSession, r: redis.Redis, camera_id: int) -> Optional[CameraOut]:
+    camera = await delete_camera(db, camera_id)
+    if not camera:
+        return None
+    await _forget_camera(r, camera_id)
+    return CameraOut.model_validate(camera)
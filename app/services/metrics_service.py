@@ -0,0 +1,100 @@
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+# content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+METRIC_KINDS = ("counter", "gauge")
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+@dataclass
+class Metric:
+    kind: str
+    help: str
+    values: Dict[LabelKey, float] = field(default_factory=OrderedDict)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    Counters and gauges kept in memory and rendered in the Prometheus text format.
+
+    The values are per app process, every worker of a multi-process server is
+    scraped separately.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = OrderedDict()
+
+    def define(self, name: str, kind: str, help_text: str) -> None:
+        """Add a metric, defining an existing metric again keeps its values."""
+        if kind not in METRIC_KINDS:
+            raise ValueError(f"Unknown metric kind '{kind}'")
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is not None and metric.kind != kind:
+                raise ValueError(f"Metric '{name}' is already defined as a {metric.kind}")
+            if metric is None:
+                self._metrics[name] = Metric(kind, help_text)
+
+    def _update(self, name: str, labels: Dict[str, str], update) -> None:
+        key = tuple(sorted((label, str(value)) for label, value in labels.items()))
+        with self._lock:
+            values = self._metrics[name].values
+            values[key] = update(values.get(key))
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        if value < 0 and self._metrics[name].kind == "counter":
+            raise ValueError(f"Counter '{name}' cannot decrease")
+        self._update(name, labels, lambda old: (old or 0.0) + value)
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        self._update(name, labels, lambda old: float(value))
+
+    def set_max(self, name: str, value: float, **labels: str) -> None:
+        """Set a gauge to value if it is larger than the current one."""
+        self._update(name, labels, lambda old: float(value) if old is None else max(old, float(value)))
+
+    def value(self, name: str, **labels: str) -> Optional[float]:
+        key = tuple(sorted((label, str(value)) for label, value in labels.items()))
+        with self._lock:
+            return self._metrics[name].values.get(key)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, metric in self._metrics.items():
+                lines.append(f"# HELP {name} {metric.help}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+                for key, value in metric.values.items():
+                    labels = ",".join(f'{label}="{_escape_label(text)}"' for label, text in key)
+                    series = f"{name}{{{labels}}}" if labels else name
+                    lines.append(f"{series} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+_registry: Optional[MetricsRegistry] = None
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry()
+    return _registry
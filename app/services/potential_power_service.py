@@ -0,0 +1,388 @@
+import codecs
+import csv
+import io
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import settings
+
+# sections of a Task19 powercurve.txt returned by the service, by their title after the dataset name
+CURVE_SECTIONS = {"Power Curve": "p50", "P10": "p10", "P90": "p90"}
+PERCENTILES = ("p50", "p10", "p90")
+
+# rows interpolated at once by the streaming functions
+CHUNK_ROWS = 5000
+
+MISSING_VALUES = {"", "null", "none", "nan"}
+
+
+class PowerCurveError(Exception):
+    """Raised for power curve files that cannot be used, e.g. a missing or malformed file."""
+
+
+@dataclass(frozen=True)
+class PowerCurves:
+    """Power curves of a Task19 powercurve.txt, every curve has one column per direction sector."""
+
+    wind_speeds: np.ndarray  # bin centers, ascending
+    directions: np.ndarray  # sector centers in degrees
+    curves: Dict[str, np.ndarray]  # percentile -> [wind speed bin, sector]
+
+    def sector_indices(self, directions: np.ndarray) -> np.ndarray:
+        """
+        Closest sector of every direction, the same choice as AEPcounter.direction_bin_indices.
+
+        Missing directions go to the first sector.
+        """
+        directions = np.asarray(directions, dtype=float)
+        if len(self.directions) == 1:
+            return np.zeros(len(directions), dtype=int)
+        distance = np.abs(directions[:, np.newaxis] - self.directions)
+        distance[np.isnan(distance)] = np.inf
+        return np.argmin(distance, axis=1)
+
+    def interpolate(
+        self,
+        wind_speeds: Sequence[float],
+        directions: Optional[Sequence[float]] = None,
+        percentiles: Sequence[str] = PERCENTILES,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Potential power for every wind speed by linear interpolation between the bins.
+
+        Values outside the curve are clamped to the first and last bin, missing wind
+        speeds give nan.
+        """
+        wind_speeds = np.asarray(wind_speeds, dtype=float)
+        if directions is None:
+            sectors = np.zeros(len(wind_speeds), dtype=int)
+        else:
+            sectors = self.sector_indices(directions)
+        result = {name: np.full(len(wind_speeds), np.nan) for name in percentiles}
+        for sector in np.unique(sectors):
+            rows = sectors == sector
+            for name in percentiles:
+                result[name][rows] = np.interp(wind_speeds[rows], self.wind_speeds, self.curves[name][:, sector])
+        missing = np.isnan(wind_speeds)
+        for name in percentiles:
+            result[name][missing] = np.nan
+        return result
+
+
+def parse_power_curve_text(lines: Iterable[str]) -> PowerCurves:
+    """
+    Parse every section of a Task19 powercurve.txt.
+
+    A section is a title line "<dataset> <name>", a line with the sector centers and
+    one line per wind speed bin, fields separated by tabs.
+    """
+    sections: Dict[str, Tuple[List[float], List[float], List[List[float]]]] = {}
+    current = None
+    for line in lines:
+        fields = [field.strip() for field in line.rstrip("\r\n").split("\t")]
+        if not any(fields):
+            continue
+        if len(fields) == 1 or (fields[0] and parse_float(fields[0]) is None):
+            title = fields[0]
+            current = None
+            for section, name in CURVE_SECTIONS.items():
+                if title.endswith(" " + section) or title == section:
+                    current = sections.setdefault(name, ([], [], []))
+            continue
+        if current is None:
+            continue
+        directions, wind_speeds, rows = current
+        values = [parse_float(field) for field in fields[1:]]
+        if not fields[0]:
+            directions[:] = [value for value in values if value is not None]
+        elif None not in values:
+            wind_speeds.append(float(fields[0]))
+            rows.append(values)
+
+    if "p50" not in sections or not sections["p50"][1]:
+        raise PowerCurveError("Could not find any numeric data in 'Power Curve' section. Check file format.")
+    directions, wind_speeds, _ = sections["p50"]
+    wind_speeds = np.asarray(wind_speeds)
+    order = np.argsort(wind_speeds, kind="stable")
+    curves = {}
+    for name in PERCENTILES:
+        # files without P10/P90 sections use the P50 curve for them
+        _, section_speeds, rows = sections.get(name, sections["p50"])
+        table = np.asarray(rows, dtype=float)
+        if section_speeds != sections["p50"][1] or table.ndim != 2 or table.shape[1] != max(len(directions), 1):
+            raise PowerCurveError(f"Section '{name}' does not match the bins of the 'Power Curve' section")
+        curves[name] = table[order]
+    return PowerCurves(wind_speeds[order], np.asarray(directions or [0.0]), curves)
+
+
+def read_power_curve_file(path: str) -> PowerCurves:
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return parse_power_curve_text(f)
+    except OSError as e:
+        raise PowerCurveError(f"Could not read power curve file: {e}")
+
+
+class PowerCurveCache:
+    """
+    Parsed power curves by file path, a file is parsed again when its mtime or size changes.
+
+    Keeps at most max_entries files, the least recently used one is dropped first.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int], PowerCurves]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> PowerCurves:
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            raise PowerCurveError(f"Could not read power curve file: {e}")
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(path)
+                return entry[1]
+        curves = read_power_curve_file(path)
+        with self._lock:
+            self._entries[path] = (version, curves)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return curves
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def parse_float(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    s = str(value).strip()
+    if s.lower() in MISSING_VALUES:
+        return None
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def float_array(values: Sequence[Any]) -> np.ndarray:
+    """Floats of the values, missing or invalid values as nan."""
+    try:
+        # numpy converts numeric strings itself, the slow path is only needed for missing values
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        return np.array([parse_float(value) for value in values], dtype=float)
+
+
+def output_value(value: float) -> Optional[float]:
+    """Interpolated value for JSON output, nan as null."""
+    return None if math.isnan(value) else value
+
+
+def csv_column(values: np.ndarray) -> List[Any]:
+    """Interpolated values for CSV output, nan as an empty field."""
+    column = values.tolist()
+    for index in np.flatnonzero(np.isnan(values)).tolist():
+        column[index] = ""
+    return column
+
+
+class CsvPotentialPower:
+    """
+    Adds potential power columns to CSV text given in chunks of lines.
+
+    The first chunk starts with the header line. The output has the columns in
+    keep_columns (all input columns by default) and one column per percentile named
+    prefix + percentile or as given in column_names. Quoted fields can not contain
+    line breaks.
+    """
+
+    def __init__(
+        self,
+        curves: PowerCurves,
+        wind_col: str,
+        dir_col: Optional[str] = None,
+        percentiles: Sequence[str] = PERCENTILES,
+        prefix: str = "P_potential_",
+        keep_columns: Optional[Sequence[str]] = None,
+        column_names: Optional[Sequence[str]] = None,
+    ):
+        self.curves = curves
+        self.wind_col = wind_col
+        self.dir_col = dir_col
+        self.percentiles = list(percentiles)
+        self.column_names = list(column_names or [prefix + name for name in self.percentiles])
+        self.keep_columns = keep_columns
+        self.header: Optional[List[str]] = None
+
+    def start(self, header: List[str]) -> List[str]:
+        for column in (self.wind_col, self.dir_col):
+            if column is not None and column not in header:
+                raise PowerCurveError(f"Column '{column}' not found. Available columns: {header}")
+        self.header = header
+        keep = list(header if self.keep_columns is None else self.keep_columns)
+        self.keep_indices = [header.index(column) for column in keep]
+        self.wind_index = header.index(self.wind_col)
+        self.dir_index = header.index(self.dir_col) if self.dir_col is not None else None
+        return keep + self.column_names
+
+    def process(self, lines: Sequence[str]) -> str:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        rows = [row for row in csv.reader(lines) if row]
+        if self.header is None:
+            if not rows:
+                raise PowerCurveError("Input CSV has no header row.")
+            writer.writerow(self.start(rows.pop(0)))
+        if not rows:
+            return buffer.getvalue()
+
+        width = len(self.header)
+        # short rows are padded so that every column can be taken with a plain index
+        rows = [row if len(row) >= width else row + [""] * (width - len(row)) for row in rows]
+
+        def float_column(index: Optional[int]) -> Optional[np.ndarray]:
+            if index is None:
+                return None
+            return float_array([row[index] for row in rows])
+
+        power = self.curves.interpolate(float_column(self.wind_index), float_column(self.dir_index), self.percentiles)
+        columns = [csv_column(power[name]) for name in self.percentiles]
+        if self.keep_indices != list(range(width)):
+            rows = [[row[index] for index in self.keep_indices] for row in rows]
+        writer.writerows([*row, *values] for row, values in zip(rows, zip(*columns)))
+        return buffer.getvalue()
+
+
+class NdjsonPotentialPower:
+    """
+    Adds potential power to newline delimited JSON given in chunks of lines.
+
+    Every input line is an object with "wind_speed" and optionally "direction", the
+    output line is the same object with one key per percentile.
+    """
+
+    def __init__(self, curves: PowerCurves, percentiles: Sequence[str] = PERCENTILES):
+        self.curves = curves
+        self.percentiles = list(percentiles)
+        self.line_number = 0
+
+    def process(self, lines: Sequence[str]) -> str:
+        items = []
+        for line in lines:
+            self.line_number += 1
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                raise PowerCurveError(f"Line {self.line_number} is not valid JSON")
+            if not isinstance(item, dict):
+                raise PowerCurveError(f"Line {self.line_number} is not a JSON object")
+            items.append(item)
+        wind_speeds = float_array([item.get("wind_speed") for item in items])
+        directions = float_array([item.get("direction") for item in items])
+        power = self.curves.interpolate(wind_speeds, directions, self.percentiles)
+        columns = {name: power[name].tolist() for name in self.percentiles}
+        return "".join(
+            json.dumps({**item, **{name: output_value(columns[name][i]) for name in self.percentiles}}) + "\n"
+            for i, item in enumerate(items)
+        )
+
+
+def process_lines(processor: Any, lines: Iterable[str], chunk_rows: int = CHUNK_ROWS) -> Iterator[str]:
+    """Run lines through a CSV or NDJSON processor chunk_rows lines at a time, yielding the output text."""
+    chunk: List[str] = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_rows:
+            yield processor.process(chunk)
+            chunk = []
+    if chunk or getattr(processor, "header", True) is None:
+        yield processor.process(chunk)
+
+
+async def line_chunks(chunks: AsyncIterator[bytes], chunk_rows: int = CHUNK_ROWS) -> AsyncIterator[List[str]]:
+    """Split a stream of bytes (e.g. a request body) into lists of at most chunk_rows text lines."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    rest = ""
+    lines: List[str] = []
+    async for data in chunks:
+        *complete, rest = (rest + decoder.decode(data)).split("\n")
+        for line in complete:
+            lines.append(line + "\n")
+            if len(lines) >= chunk_rows:
+                yield lines
+                lines = []
+    rest += decoder.decode(b"", final=True)
+    if rest:
+        lines.append(rest)
+    if lines:
+        yield lines
+
+
+class PotentialPowerService:
+    """Potential power from the Task19 power curves in curve_dir, the parsed curves are cached in-process."""
+
+    def __init__(self, curve_dir: str = settings.POWER_CURVE_DIR, cache: Optional[PowerCurveCache] = None):
+        self.curve_dir = curve_dir
+        self.cache = cache or PowerCurveCache()
+
+    def curve_path(self, curve: str) -> Path:
+        """Absolute path of a power curve file, which has to be inside curve_dir."""
+        root = Path(self.curve_dir).resolve()
+        path = (root / curve).resolve()
+        if root != path and root not in path.parents:
+            raise PowerCurveError(f"Power curve '{curve}' is outside the power curve directory")
+        if not path.is_file():
+            raise PowerCurveError(f"Power curve '{curve}' not found")
+        return path
+
+    def curves(self, curve: str) -> PowerCurves:
+        return self.cache.get(str(self.curve_path(curve)))
+
+    def batch(self, items: Sequence[Dict[str, Any]], percentiles: Sequence[str] = PERCENTILES) -> List[Dict[str, Any]]:
+        """
+        Potential power for a batch of readings, possibly from many turbines.
+
+        Readings are grouped by curve file and every group is interpolated at once.
+        The results are in the order of the items.
+        """
+        results: List[Dict[str, Any]] = [{} for _ in items]
+        groups: Dict[str, List[int]] = {}
+        for index, item in enumerate(items):
+            groups.setdefault(item["curve"], []).append(index)
+        for curve, indices in groups.items():
+            curves = self.curves(curve)
+            wind_speeds = float_array([items[i].get("wind_speed") for i in indices])
+            directions = float_array([items[i].get("direction") for i in indices])
+            power = curves.interpolate(wind_speeds, directions, percentiles)
+            for name in percentiles:
+                for i, value in zip(indices, power[name].tolist()):
+                    results[i][name] = output_value(value)
+        return results
+
+
+_service: Optional[PotentialPowerService] = None
+
+
+def get_potential_power_service() -> PotentialPowerService:
+    global _service
+    if _service is None:
+        _service = PotentialPowerService()
+    return _service
@@ -0,0 +1,154 @@
+import csv
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.crud.scada import get_measurement_buckets, insert_measurements
+
+# columns of the Task19 CSV written by transform_row and the measurement attributes they go into
+CSV_COLUMNS = {
+    "Timestamp": "timestamp",
+    "Wind speed [m/s]": "wind_speed",
+    "Wind direction [deg]": "wind_direction",
+    "Ambient temperature [C]": "ambient_temperature",
+    "Output power [kW]": "power",
+    "Status": "status",
+    "State": "state",
+    "Ice detected": "ice_detected",
+    "IPS": "ips",
+}
+FLOAT_COLUMNS = {"wind_speed", "wind_direction", "ambient_temperature", "power"}
+
+# format of ms_epoch_to_iso, UTC
+TIMESTAMP_FORMAT = "%d.%m.%Y %H:%M"
+
+
+class ScadaError(Exception):
+    """Raised for SCADA requests that cannot be served, e.g. a CSV without a Timestamp column."""
+
+
+def to_utc_naive(moment: datetime) -> datetime:
+    """Timestamps are stored as naive UTC, aware datetimes are converted."""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _to_float(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def measurement_values(turbine_id: str, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Column values of a transform_row dict (or a row of its CSV) for ScadaMeasurement.
+
+    Returns None for rows without a valid timestamp, other unreadable values are stored as NULL.
+    """
+    try:
+        timestamp = datetime.strptime(str(row.get("Timestamp") or "").strip(), TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+    values: Dict[str, Any] = {"turbine_id": turbine_id, "timestamp": timestamp}
+    for column, attribute in CSV_COLUMNS.items():
+        if attribute == "timestamp":
+            continue
+        value = row.get(column)
+        if attribute in FLOAT_COLUMNS:
+            values[attribute] = _to_float(value)
+        else:
+            values[attribute] = str(value).strip() if value not in (None, "") else None
+    return values
+
+
+async def ingest_rows(
+    db: AsyncSession,
+    turbine_id: str,
+    rows: Iterable[Dict[str, Any]],
+    batch_rows: int = settings.SCADA_INSERT_BATCH_ROWS,
+) -> Dict[str, int]:
+    """Insert transform_row dicts in transactions of batch_rows rows, rows already stored are skipped."""
+    received = inserted = 0
+    batch: List[Dict[str, Any]] = []
+    for row in rows:
+        values = measurement_values(turbine_id, row)
+        if values is None:
+            continue
+        batch.append(values)
+        if len(batch) >= batch_rows:
+            received += len(batch)
+            inserted += await insert_measurements(db, batch)
+            batch = []
+    received += len(batch)
+    inserted += await insert_measurements(db, batch)
+    return {"received": received, "inserted": inserted}
+
+
+async def ingest_csv(db: AsyncSession, turbine_id: str, chunks: AsyncIterator[List[str]]) -> Dict[str, int]:
+    """
+    Insert a Task19 SCADA CSV (the scada_data.csv of the fetch script) given as chunks of text lines.
+
+    Every chunk is inserted in one transaction, so the text of at most one chunk is held in memory.
+    """
+    header: Optional[List[str]] = None
+    received = inserted = 0
+    async for lines in chunks:
+        reader = csv.reader(lines)
+        if header is None:
+            header = next(reader, None)
+            if header is None:
+                continue
+            header = [name.strip() for name in header]
+            if "Timestamp" not in header:
+                raise ScadaError("CSV has no Timestamp column")
+        rows = (dict(zip(header, fields)) for fields in reader if fields)
+        counts = await ingest_rows(db, turbine_id, rows, batch_rows=max(len(lines), 1))
+        received += counts["received"]
+        inserted += counts["inserted"]
+    return {"received": received, "inserted": inserted}
+
+
+async def downsample(
+    db: AsyncSession,
+    turbine_id: str,
+    start: datetime,
+    end: datetime,
+    points: int,
+    fields: Sequence[str],
+) -> Dict[str, Any]:
+    """
+    Measurements of [start, end) in at most `points` buckets of equal length with the min, mean and max of
+    every field, aggregated by the database so only the buckets leave it.
+    """
+    start = to_utc_naive(start)
+    end = to_utc_naive(end)
+    if end <= start:
+        raise ScadaError("end must be after start")
+    bucket_seconds = max(1, math.ceil((end - start).total_seconds() / points))
+    rows = await get_measurement_buckets(db, turbine_id, start, end, bucket_seconds, fields)
+    buckets = []
+    for bucket, count, *stats in rows:
+        values = {
+            field: {"min": stats[3 * index], "mean": stats[3 * index + 1], "max": stats[3 * index + 2]}
+            for index, field in enumerate(fields)
+        }
+        buckets.append({
+            "start": start + timedelta(seconds=int(bucket) * bucket_seconds),
+            "count": count,
+            "values": values,
+        })
+    return {
+        "turbine_id": turbine_id,
+        "start": start,
+        "end": end,
+        "bucket_seconds": bucket_seconds,
+        "buckets": buckets,
+    }
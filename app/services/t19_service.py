@@ -0,0 +1,402 @@
+import asyncio
+import configparser
+import csv
+import hashlib
+import json
+import os
+import sys
+import traceback
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import redis.asyncio as redis
+
+from app.config import settings
+from app.services.metrics_service import MetricsRegistry, get_metrics_registry
+from app.services.potential_power_service import read_power_curve_file
+
+# bump when the contents of cached results change
+RESULT_FORMAT_VERSION = 2
+
+JOB_KEY = "t19:job:{}"
+RESULT_KEY = "t19:result:{}"
+INFLIGHT_KEY = "t19:inflight:{}"
+
+# event tables written by t19_counter.py when "icing events" is on
+EVENT_FILES = {
+    "losses": "_losses.csv",
+    "stops": "_stops.csv",
+    "status": "_status.csv",
+    "ips": "_ips.csv",
+    "ice_detection": "_ice_det.csv",
+}
+
+# names of the columns that write_alarm_timings writes without a header, by column index
+EXTRA_EVENT_COLUMNS = {9: "ips consumption"}
+
+# sections and options a job config may contain, by section, option names in lower case.
+# Options that name files or directories are set by the service, the ones below are
+# overwritten by it if given.
+ALLOWED_OPTIONS = {
+    "Source file": {
+        "id", "filename", "delimiter", "quotechar", "datetime format", "datetime extra char",
+        "skip columns", "fault columns", "replace fault codes", "columnar read", "chunk size",
+    },
+    "Output": {
+        "result directory", "summary", "plot", "alarm time series", "filtered raw data", "icing events",
+        "power curve", "production stats periods", "background writing",
+    },
+    "Data Structure": {
+        "timestamp index", "wind speed index", "wind direction index", "temperature index", "power index",
+        "rated power", "state index", "normal state", "site elevation", "status index",
+        "status code stop value", "maximum wind speed",
+    },
+    "Icing": {
+        "heating", "ice detection", "icing alarm index", "icing alarm code", "ips status index",
+        "ips status code", "ips status type", "ips power consumption index",
+    },
+    "Binning": {"minimum wind speed", "maximum wind speed", "wind speed bin size", "wind direction bin size"},
+    "Filtering": {
+        "power drop limit", "overproduction limit", "power level filter", "temperature filter",
+        "reference temperature", "icing time", "stop filter type", "stop limit multiplier", "stop time filter",
+        "statefilter type", "min bin size", "distance filter", "start time", "stop time",
+        "reference refinement passes", "refinement tolerance",
+    },
+}
+
+# outputs the job API does not return, turned off to save time
+FORCED_OUTPUT_OPTIONS = {
+    "summary": "True",
+    "power curve": "True",
+    "icing events": "True",
+    "plot": "False",
+    "alarm time series": "False",
+    "filtered raw data": "False",
+}
+
+
+# counters summed from the stage records of the T19 runs, by record field
+STAGE_COUNTERS = {
+    "wall_s": ("t19_stage_seconds_total", "Wall time spent in the stages of Task19 runs."),
+    "cpu_s": ("t19_stage_cpu_seconds_total", "CPU time spent in the stages of Task19 runs."),
+    "rows_in": ("t19_stage_rows_in_total", "Rows going into the stages of Task19 runs."),
+    "rows_out": ("t19_stage_rows_out_total", "Rows produced by the stages of Task19 runs."),
+}
+
+# gauges of the latest run of every dataset, by total record field
+DATASET_GAUGES = {
+    "wall_s": ("t19_dataset_last_run_seconds", "Wall time of the latest Task19 run of a dataset."),
+    "cpu_s": ("t19_dataset_last_run_cpu_seconds", "CPU time of the latest Task19 run of a dataset."),
+    "rows_in": ("t19_dataset_last_run_rows", "Rows in the dataset of the latest Task19 run."),
+}
+
+
+class T19JobError(Exception):
+    """Raised for job requests that cannot be run, e.g. a dataset outside the data directory."""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def resolve_dataset(dataset: str, data_dir: str) -> Path:
+    """Return the absolute path of a dataset, which has to be a file inside data_dir."""
+    root = Path(data_dir).resolve()
+    path = (root / dataset).resolve()
+    if root != path and root not in path.parents:
+        raise T19JobError(f"Dataset '{dataset}' is outside the data directory")
+    if not path.is_file():
+        raise T19JobError(f"Dataset '{dataset}' not found")
+    return path
+
+
+def file_digest(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_config(config: Dict[str, Dict[str, str]]) -> None:
+    """Raise T19JobError if the config has a section or an option that is not in ALLOWED_OPTIONS."""
+    for section, options in config.items():
+        if section not in ALLOWED_OPTIONS:
+            raise T19JobError(f"Section '{section}' is not allowed in a job config")
+        for option in options:
+            if option.lower() not in ALLOWED_OPTIONS[section]:
+                raise T19JobError(f"Option '{option}' of section '{section}' is not allowed in a job config")
+    if "id" not in {option.lower() for option in config.get("Source file", {})}:
+        raise T19JobError("Config is missing the 'id' option of section 'Source file'")
+
+
+def job_config(config: Dict[str, Dict[str, str]], dataset_path: str, result_dir: str, cache_dir: str) -> configparser.ConfigParser:
+    """
+    Build the .ini of a job from the requested sections, see check_config.
+
+    The dataset and result paths and the power curve cache are set by the service,
+    and the outputs that are not returned by the API are turned off.
+    """
+    # no interpolation, datetime formats contain % characters
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read_dict(config)
+    # the cache directory is shared by the jobs, its options are never taken from a request
+    parser.remove_section("Cache")
+    for section in ("Source file", "Output", "Cache"):
+        if not parser.has_section(section):
+            parser.add_section(section)
+    parser.set("Source file", "filename", dataset_path)
+    # t19_counter builds file names as result_dir + id
+    parser.set("Output", "result directory", os.path.join(result_dir, ""))
+    for option, value in FORCED_OUTPUT_OPTIONS.items():
+        parser.set("Output", option, value)
+    parser.set("Cache", "power curve cache", "True")
+    parser.set("Cache", "cache directory", cache_dir)
+    return parser
+
+
+def config_fingerprint(config: Dict[str, Dict[str, str]], dataset_digest: str) -> str:
+    """Fingerprint of everything that affects the results of a job."""
+    sections = {
+        section: {option.lower(): str(value) for option, value in options.items()}
+        for section, options in config.items()
+    }
+    # set by the service for every job
+    sections.get("Source file", {}).pop("filename", None)
+    sections.get("Output", {}).pop("result directory", None)
+    payload = json.dumps(
+        {"version": RESULT_FORMAT_VERSION, "dataset": dataset_digest, "config": sections},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def read_event_table(path: Path) -> list:
+    """
+    Read an event table as a list of rows by column name.
+
+    The header is the same for every table, the columns past its end are named by
+    EXTRA_EVENT_COLUMNS, so every value has a string key.
+    """
+    with open(path, newline="") as f:
+        reader = csv.reader(f, delimiter=";")
+        header = next(reader, [])
+        rows = list(reader)
+    width = max([len(header)] + [len(row) for row in rows])
+    fieldnames = header + [EXTRA_EVENT_COLUMNS.get(index, f"column {index + 1}") for index in range(len(header), width)]
+    return [dict(zip(fieldnames, row)) for row in rows]
+
+
+def register_t19_metrics(metrics: MetricsRegistry) -> None:
+    metrics.define("t19_jobs_total", "counter", "Task19 jobs by final status, cached jobs were not run again.")
+    metrics.define("t19_jobs_running", "gauge", "Task19 jobs running at the moment.")
+    metrics.define("t19_stage_runs_total", "counter", "Runs of the stages of Task19 runs.")
+    for name, help_text in STAGE_COUNTERS.values():
+        metrics.define(name, "counter", help_text)
+    metrics.define("t19_stage_max_rss_bytes", "gauge", "Largest memory high-water mark of a worker process at the end of a stage.")
+    for name, help_text in DATASET_GAUGES.values():
+        metrics.define(name, "gauge", help_text)
+    metrics.define("t19_dataset_last_run_max_rss_bytes", "gauge", "Memory high-water mark of the worker process after the latest Task19 run of a dataset.")
+
+
+def record_t19_stages(metrics: MetricsRegistry, records: Iterable[Dict[str, Any]]) -> None:
+    """Add the stage records of one T19 run to the metrics."""
+    for record in records:
+        max_rss = record.get("max_rss_mb")
+        if record["stage"] == "total":
+            for field_name, (name, _) in DATASET_GAUGES.items():
+                if record.get(field_name) is not None:
+                    metrics.set(name, record[field_name], dataset=record["dataset"])
+            if max_rss is not None:
+                metrics.set("t19_dataset_last_run_max_rss_bytes", max_rss * 1024 * 1024, dataset=record["dataset"])
+            continue
+        metrics.inc("t19_stage_runs_total", stage=record["stage"])
+        for field_name, (name, _) in STAGE_COUNTERS.items():
+            if record.get(field_name) is not None:
+                metrics.inc(name, record[field_name], stage=record["stage"])
+        if max_rss is not None:
+            metrics.set_max("t19_stage_max_rss_bytes", max_rss * 1024 * 1024, stage=record["stage"])
+
+
+def run_t19_job(config_path: str, t19_repo_dir: str) -> Dict[str, Any]:
+    """
+    Run t19_counter.py for one .ini file and collect the results.
+
+    Runs in a worker process, returns the summary, power curves and event tables
+    as JSON serializable values, and the stage records of the run under "metrics".
+    """
+    if t19_repo_dir not in sys.path:
+        sys.path.insert(0, t19_repo_dir)
+    import t19_counter
+    from t19_ice_loss.instrumentation import Instrumentation
+
+    # the records are returned to the app, a "metrics file" option of the job config is not used
+    instrumentation = Instrumentation()
+    summary = t19_counter.main(config_path, instrumentation)
+
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(config_path)
+    dataset_id = config.get("Source file", "id")
+    result_dir = Path(config.get("Output", "result directory"))
+
+    curves = read_power_curve_file(str(result_dir / f"{dataset_id}_powercurve.txt"))
+    power_curve = {
+        "wind_speed": curves.wind_speeds.tolist(),
+        "direction": curves.directions.tolist(),
+        **{name: table.tolist() for name, table in curves.curves.items()},
+    }
+    events = {}
+    for name, suffix in EVENT_FILES.items():
+        path = result_dir / f"{dataset_id}{suffix}"
+        if path.exists():
+            events[name] = read_event_table(path)
+    return {
+        "summary": dict(summary or {}),
+        "power_curve": power_curve,
+        "events": events,
+        "metrics": [dict(record) for record in instrumentation.records],
+    }
+
+
+class T19JobService:
+    """
+    Runs Task19 jobs on a bounded pool and keeps job state and results in Redis.
+
+    Results are cached by a fingerprint of the dataset contents and the config, so a
+    repeated request is answered from the cache without running T19 again. Identical
+    requests that arrive while a job is running are attached to that job.
+
+    The stage records of every run are added to the metrics registry, they are
+    not part of the cached result.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        max_workers: int,
+        runner: Callable[[str, str], Dict[str, Any]] = run_t19_job,
+        data_dir: str = settings.T19_DATA_DIR,
+        work_dir: str = settings.T19_WORK_DIR,
+        t19_repo_dir: str = settings.T19_REPO_DIR,
+        result_ttl: int = settings.T19_RESULT_TTL_SECONDS,
+        job_ttl: int = settings.T19_JOB_TTL_SECONDS,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        self.executor = executor
+        self.runner = runner
+        self.data_dir = data_dir
+        self.work_dir = work_dir
+        self.t19_repo_dir = t19_repo_dir
+        self.result_ttl = result_ttl
+        self.job_ttl = job_ttl
+        self._slots = asyncio.Semaphore(max_workers)
+        self._tasks: set = set()
+        self.metrics = metrics if metrics is not None else get_metrics_registry()
+        register_t19_metrics(self.metrics)
+
+    async def _save_job(self, r: redis.Redis, job: Dict[str, Any]) -> None:
+        await r.set(JOB_KEY.format(job["id"]), json.dumps(job), ex=self.job_ttl)
+
+    async def get_job(self, r: redis.Redis, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = await r.get(JOB_KEY.format(job_id))
+        return json.loads(raw) if raw else None
+
+    async def get_result(self, r: redis.Redis, fingerprint: str) -> Optional[Dict[str, Any]]:
+        raw = await r.get(RESULT_KEY.format(fingerprint))
+        return json.loads(raw) if raw else None
+
+    async def submit(self, r: redis.Redis, dataset: str, config: Dict[str, Dict[str, str]]) -> Dict[str, Any]:
+        check_config(config)
+        dataset_path = resolve_dataset(dataset, self.data_dir)
+        # hashing a large dataset must not block the event loop
+        dataset_digest = await asyncio.to_thread(file_digest, dataset_path)
+        fingerprint = config_fingerprint(config, dataset_digest)
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "fingerprint": fingerprint,
+            "dataset": dataset,
+            "cached": False,
+            "submitted_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+        }
+        if await r.exists(RESULT_KEY.format(fingerprint)):
+            job.update(status="finished", cached=True, finished_at=job["submitted_at"])
+            await self._save_job(r, job)
+            self.metrics.inc("t19_jobs_total", status="cached")
+            return job
+
+        running_id = await r.get(INFLIGHT_KEY.format(fingerprint))
+        if running_id:
+            running = await self.get_job(r, running_id)
+            if running is not None:
+                return running
+        if not await r.set(INFLIGHT_KEY.format(fingerprint), job["id"], nx=True, ex=self.job_ttl):
+            running = await self.get_job(r, await r.get(INFLIGHT_KEY.format(fingerprint)))
+            if running is not None:
+                return running
+
+        await self._save_job(r, job)
+        task = asyncio.create_task(self._run(r, job, dataset_path, config))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, r: redis.Redis, job: Dict[str, Any], dataset_path: Path, config: Dict[str, Dict[str, str]]) -> None:
+        fingerprint = job["fingerprint"]
+        result_dir = Path(self.work_dir) / fingerprint
+        config_path = result_dir / "job.ini"
+        try:
+            async with self._slots:
+                job.update(status="running", started_at=_now())
+                await self._save_job(r, job)
+                result_dir.mkdir(parents=True, exist_ok=True)
+                parser = job_config(config, str(dataset_path), str(result_dir), str(Path(self.work_dir) / "pc_cache"))
+                with open(config_path, "w") as f:
+                    parser.write(f)
+                loop = asyncio.get_running_loop()
+                self.metrics.inc("t19_jobs_running")
+                try:
+                    result = await loop.run_in_executor(self.executor, self.runner, str(config_path), self.t19_repo_dir)
+                finally:
+                    self.metrics.inc("t19_jobs_running", -1)
+            record_t19_stages(self.metrics, result.get("metrics", []))
+            result = {key: value for key, value in result.items() if key != "metrics"}
+            await r.set(RESULT_KEY.format(fingerprint), json.dumps(result), ex=self.result_ttl)
+            job.update(status="finished", finished_at=_now())
+        except BaseException as e:
+            job.update(status="failed", finished_at=_now(), error="".join(traceback.format_exception_only(type(e), e)).strip())
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            self.metrics.inc("t19_jobs_total", status=job["status"])
+            await self._save_job(r, job)
+            await r.delete(INFLIGHT_KEY.format(fingerprint))
+
+    def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_service: Optional[T19JobService] = None
+
+
+def get_t19_service() -> T19JobService:
+    global _service
+    if _service is None:
+        _service = T19JobService(ProcessPoolExecutor(max_workers=settings.T19_WORKERS), settings.T19_WORKERS)
+    return _service
+
+
+def shutdown_t19_service() -> None:
+    global _service
+    if _service is not None:
+        _service.shutdown()
+        _service = None
@@ -0,0 +1,413 @@
+"""
+Benchmarks of the Task 19 ice loss counter.
+
+Every scenario generates synthetic SCADA data with synthetic_scada.py, runs t19_counter.main on it and reports the
+wall time, CPU time and memory high-water mark of every stage of the processing. A stage is timed by wrapping the
+methods that implement it for the duration of the benchmark, the time of a call is assigned to the innermost stage
+it belongs to, so the stage times add up to the run time. Memory is measured with tracemalloc in a second run
+because tracing slows the processing down considerably.
+
+The results are compared against the stored baselines in baselines.json. Before the scenarios, the example data set
+is processed and its summary, power curve and event tables are compared number by number with the reference results
+in results/example, so an optimization that changes the results is caught right away. Usage ::
+
+    python benchmarks/run_benchmarks.py                  # quick suite
+    python benchmarks/run_benchmarks.py --suite full --memory
+    python benchmarks/run_benchmarks.py --months 60 --step 1 --sectors 12 --icing 5 --turbines 2
+    python benchmarks/run_benchmarks.py --save-baseline  # store the results as the new baselines
+
+Exit status is 1 if the results differ from the reference or a stage is slower than its baseline.
+"""
+
+import argparse
+import collections
+import configparser
+import contextlib
+import datetime
+import functools
+import gc
+import inspect
+import json
+import math
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import synthetic_scada
+import t19_counter
+from t19_ice_loss import aep_counter as aep
+from t19_ice_loss import data_file_handler as dfh
+from t19_ice_loss import pc_cache
+from t19_ice_loss import plotting
+
+BASELINE_FILENAME = os.path.join(BENCHMARK_DIR, 'baselines.json')
+REFERENCE_DIR = os.path.join(synthetic_scada.T19_DIR, 'results', 'example')
+
+# stages of t19_counter.main and the methods that implement them
+STAGES = [('load', [(dfh.CSVimporter, 'read_data')]),
+          ('density correction', [(aep.AEPcounter, 'air_density_correction')]),
+          ('filters', [(aep.AEPcounter, 'time_mask'), (aep.AEPcounter, 'state_mask'), (aep.AEPcounter, 'temperature_mask'),
+                       (aep.AEPcounter, 'power_level_mask'), (aep.PreprocessedData, 'select')]),
+          ('power curve', [(pc_cache.PowerCurveCache, 'power_curves')]),
+          ('alarms', [(aep.AEPcounter, 'interpolate_power_curves'), (aep.AEPcounter, 'power_alarms'),
+                      (aep.AEPcounter, 'find_icing_related_stops'), (aep.AEPcounter, 'status_code_stops'),
+                      (aep.AEPcounter, 'align_alarms')]),
+          ('event integration', [(aep.AEPcounter, 'power_loss_during_alarm')]),
+          ('stats', [(dfh.Result_file_writer, 'summary_statistics'), (aep.AEPcounter, 'production_series'),
+                     (aep.AEPcounter, 'calculate_production_stats'), (aep.AEPcounter, 'combine_timeseries')]),
+          ('writes', [(dfh.Result_file_writer, 'write_power_curve'), (dfh.Result_file_writer, 'write_alarm_timings'),
+                      (dfh.Result_file_writer, 'write_monthly_stats'), (dfh.Result_file_writer, 'write_alarm_file'),
+                      (dfh.Result_file_writer, 'insert_fault_codes'), (dfh.Result_file_writer, 'write_time_series_file')]),
+          ('plots', [(dfh.Result_file_writer, 'generate_standard_plots')])]
+STAGE_NAMES = [stage for stage, methods in STAGES] + ['other']
+
+SUITES = {'quick': [{'name': '1m-10min', 'start': '2003-04', 'months': 1},
+                    {'name': '1y-10min', 'months': 12},
+                    {'name': '1y-10min-12sectors', 'months': 12, 'sectors': 12},
+                    {'name': '1y-10min-icy', 'months': 12, 'icing': 15.0},
+                    {'name': '1y-1min', 'months': 12, 'step': 1},
+                    {'name': '1y-10min-4turbines', 'months': 12, 'turbines': 4}]}
+SUITES['full'] = SUITES['quick'] + [{'name': '5y-10min', 'months': 60},
+                                    {'name': '20y-10min', 'months': 240},
+                                    {'name': '5y-1min', 'months': 60, 'step': 1},
+                                    {'name': '20y-1min', 'months': 240, 'step': 1}]
+SCENARIO_DEFAULTS = {'start': '2003-01', 'months': 12, 'step': 10, 'sectors': 1, 'icing': 3.0, 'turbines': 1}
+
+# differences below these are measurement noise
+MIN_TIME_DIFFERENCE = 0.1
+MIN_MEMORY_DIFFERENCE = 5.0
+# some event table columns are float32 values, they are printed with about 7 significant digits
+REFERENCE_TOLERANCE = 1e-6
+
+
+class StageProfiler:
+    """
+    collects the time and memory used by every stage
+
+    Nested stages are timed separately, the time of the outer stage does not include the inner one. The memory high
+    water mark of a stage is the largest increase of traced memory during one call of the stage, inner stages
+    included.
+    """
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.wall = collections.defaultdict(float)
+        self.cpu = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.peak = collections.defaultdict(float)
+        self.stack = []
+
+    def enter(self, stage):
+        now = (time.perf_counter(), time.process_time())
+        if self.stack:
+            self.pause(self.stack[-1], now)
+        frame = {'stage': stage, 'started': now}
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1]['peak'] = max(self.stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['memory'] = current
+            frame['peak'] = current
+        self.stack.append(frame)
+
+    def exit(self):
+        now = (time.perf_counter(), time.process_time())
+        frame = self.stack.pop()
+        self.pause(frame, now)
+        self.calls[frame['stage']] += 1
+        if self.memory:
+            frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            self.peak[frame['stage']] = max(self.peak[frame['stage']], (frame['peak'] - frame['memory']) / 1e6)
+            if self.stack:
+                self.stack[-1]['peak'] = max(self.stack[-1]['peak'], frame['peak'])
+        if self.stack:
+            self.stack[-1]['started'] = now
+
+    def pause(self, frame, now):
+        self.wall[frame['stage']] += now[0] - frame['started'][0]
+        self.cpu[frame['stage']] += now[1] - frame['started'][1]
+
+    def timed(self, stage, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            self.enter(stage)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.exit()
+        return wrapper
+
+
+@contextlib.contextmanager
+def profiled_stages(profiler):
+    """
+    wrap the methods of every stage for the duration of the block, the plots are drawn in this process so that
+    they can be timed
+    """
+    originals = []
+    try:
+        for stage, methods in STAGES:
+            for owner, name in methods:
+                method = inspect.getattr_static(owner, name)
+                originals.append((owner, name, method))
+                setattr(owner, name, profiler.timed(stage, method))
+        originals.append((plotting, 'start_in_background', plotting.start_in_background))
+        plotting.start_in_background = lambda target, *args: target(*args)
+        yield profiler
+    finally:
+        for owner, name, method in reversed(originals):
+            setattr(owner, name, method)
+
+
+def run_profiled(config_filenames, memory=False):
+    """
+    run t19_counter.main for every turbine
+
+    :return: StageProfiler with the stages of all the turbines, 'total' holds the whole run
+    """
+    profiler = StageProfiler(memory)
+    # start every run from the same state, garbage left by the previous run would be collected during this one
+    gc.collect()
+    if memory:
+        tracemalloc.start()
+    try:
+        with profiled_stages(profiler), open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for config_filename in config_filenames:
+                profiler.enter('other')
+                try:
+                    t19_counter.main(config_filename)
+                finally:
+                    profiler.exit()
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return profiler
+
+
+def count_rows(config_filenames):
+    rows = 0
+    for config_filename in config_filenames:
+        config = configparser.ConfigParser()
+        config.read(config_filename)
+        with open(config.get('Source file', 'filename'), 'rb') as data_file:
+            rows += sum(1 for line in data_file) - 1
+    return rows
+
+
+def run_scenario(scenario, data_dir, repeat=3, memory=False, plot=False, all_outputs=False):
+    """
+    :param scenario: dictionary with a name and the parameters of synthetic_scada.generate_turbines
+    :param data_dir: directory of the generated data, data of earlier runs is reused
+    :param repeat: number of timed runs, the fastest time of every stage is reported
+    :param memory: also measure the memory high-water marks
+    :return: dictionary of results
+    """
+    parameters = dict(SCENARIO_DEFAULTS, **{key: value for key, value in scenario.items() if key != 'name'})
+    config_filenames = synthetic_scada.generate_turbines(data_dir, plot=plot, all_outputs=all_outputs, **parameters)
+    result = {'rows': count_rows(config_filenames), 'stages': {}}
+    runs = [run_profiled(config_filenames) for _ in range(max(1, repeat))]
+    for stage in STAGE_NAMES:
+        if any(profiler.calls[stage] for profiler in runs):
+            result['stages'][stage] = {'wall': min(profiler.wall[stage] for profiler in runs),
+                                       'cpu': min(profiler.cpu[stage] for profiler in runs)}
+    result['total'] = min(sum(profiler.wall.values()) for profiler in runs)
+    if memory:
+        profiler = run_profiled(config_filenames, memory=True)
+        for stage, values in result['stages'].items():
+            values['peak_mb'] = profiler.peak[stage]
+        # the outermost stage covers the whole run
+        result['peak_mb'] = profiler.peak['other']
+    return result
+
+
+def compare_to_baseline(result, baseline, tolerance):
+    """
+    :return: list of (stage, quantity, baseline value, current value) of the regressions
+    """
+    regressions = []
+    measured = [(stage, values) for stage, values in result['stages'].items()] + [('total', {'wall': result['total']})]
+    for stage, values in measured:
+        base_values = {'wall': baseline['total']} if stage == 'total' else baseline['stages'].get(stage, {})
+        for quantity, noise in (('wall', MIN_TIME_DIFFERENCE), ('peak_mb', MIN_MEMORY_DIFFERENCE)):
+            if quantity not in values or quantity not in base_values:
+                continue
+            if values[quantity] > base_values[quantity] * (1.0 + tolerance) and values[quantity] - base_values[quantity] > noise:
+                regressions.append((stage, quantity, base_values[quantity], values[quantity]))
+    return regressions
+
+
+def print_result(name, result, baseline=None):
+    print('\n{0}: {1} rows, {2:.2f} s'.format(name, result['rows'], result['total']))
+    print('    {0:<20}{1:>10}{2:>10}{3:>12}{4:>12}'.format('stage', 'wall [s]', 'cpu [s]', 'peak [MB]', 'baseline'))
+    for stage in STAGE_NAMES:
+        if stage not in result['stages']:
+            continue
+        values = result['stages'][stage]
+        peak = '{0:.1f}'.format(values['peak_mb']) if 'peak_mb' in values else '-'
+        base = baseline['stages'].get(stage, {}).get('wall') if baseline else None
+        base = '{0:.2f}'.format(base) if base is not None else '-'
+        print('    {0:<20}{1:>10.2f}{2:>10.2f}{3:>12}{4:>12}'.format(stage, values['wall'], values['cpu'], peak, base))
+
+
+NUMBER_SEPARATORS = re.compile(r'[;\t,]')
+
+
+def same_line(line, reference_line, tolerance):
+    """
+    compare two lines of result files, numbers are compared with a relative tolerance
+    """
+    if line == reference_line:
+        return True
+    fields = NUMBER_SEPARATORS.split(line)
+    reference_fields = NUMBER_SEPARATORS.split(reference_line)
+    if len(fields) != len(reference_fields):
+        return False
+    for field, reference_field in zip(fields, reference_fields):
+        field, reference_field = field.strip(), reference_field.strip()
+        if field == reference_field:
+            continue
+        try:
+            value, reference_value = float(field), float(reference_field)
+        except ValueError:
+            return False
+        if not (math.isclose(value, reference_value, rel_tol=tolerance, abs_tol=tolerance)
+                or (math.isnan(value) and math.isnan(reference_value))):
+            return False
+    return True
+
+
+def check_reference_results(tolerance=REFERENCE_TOLERANCE):
+    """
+    process the example data set and compare the results with the reference results in results/example
+
+    :param tolerance: relative tolerance of the numbers
+
+    :return: list of differences, empty if every file matches
+    """
+    differences = []
+    work_dir = tempfile.mkdtemp(prefix='t19_reference_')
+    try:
+        config = configparser.ConfigParser()
+        config.read(synthetic_scada.EXAMPLE_CONFIG)
+        config.set('Source file', 'filename', synthetic_scada.SAMPLE_FILENAME)
+        config.set('Output', 'result directory', os.path.join(work_dir, ''))
+        for option in ('plot', 'alarm time series', 'filtered raw data'):
+            config.set('Output', option, 'False')
+        if not config.has_section('Cache'):
+            config.add_section('Cache')
+        config.set('Cache', 'power curve cache', 'False')
+        config_filename = os.path.join(work_dir, 'example.ini')
+        with open(config_filename, 'w') as config_file:
+            config.write(config_file)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            t19_counter.main(config_filename)
+        for filename in sorted(os.listdir(REFERENCE_DIR)):
+            result_filename = os.path.join(work_dir, filename)
+            if not os.path.exists(result_filename):
+                differences.append('{0}: not written'.format(filename))
+                continue
+            with open(os.path.join(REFERENCE_DIR, filename), 'r') as reference_file:
+                reference_lines = reference_file.read().splitlines()
+            with open(result_filename, 'r') as result_file:
+                lines = result_file.read().splitlines()
+            if len(lines) != len(reference_lines):
+                differences.append('{0}: {1} lines instead of {2}'.format(filename, len(lines), len(reference_lines)))
+                continue
+            for number, (line, reference_line) in enumerate(zip(lines, reference_lines)):
+                if not same_line(line, reference_line, tolerance):
+                    differences.append('{0} line {1}:\n    {2}\n    {3}'.format(filename, number + 1, line, reference_line))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return differences
+
+
+def read_baselines(filename):
+    if not os.path.exists(filename):
+        return {'scenarios': {}}
+    with open(filename, 'r') as baseline_file:
+        return json.load(baseline_file)
+
+
+def write_baselines(filename, baselines, results):
+    baselines['machine'] = {'platform': platform.platform(), 'processor': platform.processor(),
+                            'python': platform.python_version(), 'cpus': os.cpu_count(),
+                            'date': datetime.date.today().isoformat()}
+    baselines['scenarios'].update(results)
+    with open(filename, 'w') as baseline_file:
+        json.dump(baselines, baseline_file, indent=1, sort_keys=True)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the Task 19 ice loss counter')
+    parser.add_argument('--suite', choices=sorted(SUITES), default='quick', help='set of scenarios to run')
+    parser.add_argument('--months', type=int, help='run a single scenario of this many months instead of a suite')
+    parser.add_argument('--start', help='first month of the single scenario as YYYY-MM')
+    parser.add_argument('--step', type=int, help='sampling interval of the single scenario in minutes')
+    parser.add_argument('--sectors', type=int, help='wind direction sectors of the single scenario')
+    parser.add_argument('--icing', type=float, help='icing episodes per month in the single scenario')
+    parser.add_argument('--turbines', type=int, help='number of turbines in the single scenario')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per scenario, the fastest one counts')
+    parser.add_argument('--memory', action='store_true', help='measure the memory high-water marks (slow)')
+    parser.add_argument('--plot', action='store_true', help='draw the plots')
+    parser.add_argument('--all-outputs', action='store_true', help='also write the alarm time series')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 't19_benchmarks'),
+                        help='directory of the generated data, reused between runs')
+    parser.add_argument('--baselines', default=BASELINE_FILENAME, help='baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative slowdown against the baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baselines')
+    parser.add_argument('--no-reference', action='store_true', help='skip the check against results/example')
+    parser.add_argument('--reference-tolerance', type=float, default=REFERENCE_TOLERANCE,
+                        help='relative tolerance of the numbers in the check against results/example')
+    parser.add_argument('--output', help='write the results into this .json file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    failed = False
+    if not args.no_reference:
+        differences = check_reference_results(args.reference_tolerance)
+        if differences:
+            failed = True
+            print('Results of the example data set differ from {0}:'.format(REFERENCE_DIR))
+            for difference in differences[:20]:
+                print('  ' + difference)
+        else:
+            print('Results of the example data set match {0}'.format(REFERENCE_DIR))
+
+    custom = {key: getattr(args, key) for key in SCENARIO_DEFAULTS if getattr(args, key) is not None}
+    if custom:
+        parameters = dict(SCENARIO_DEFAULTS, **custom)
+        scenarios = [dict(parameters, name='{start}-{months}m-{step}min-{sectors}sectors-{icing}icing-{turbines}turbines'.format(**parameters))]
+    else:
+        scenarios = SUITES[args.suite]
+    baselines = read_baselines(args.baselines)
+    results = collections.OrderedDict()
+    for scenario in scenarios:
+        result = run_scenario(scenario, args.data_dir, args.repeat, args.memory, args.plot, args.all_outputs)
+        results[scenario['name']] = result
+        baseline = baselines['scenarios'].get(scenario['name'])
+        print_result(scenario['name'], result, baseline)
+        if baseline and not args.save_baseline:
+            for stage, quantity, base_value, value in compare_to_baseline(result, baseline, args.tolerance):
+                failed = True
+                print('    REGRESSION {0} {1}: {2:.2f} -> {3:.2f}'.format(stage, quantity, base_value, value))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=1)
+    if args.save_baseline:
+        write_baselines(args.baselines, baselines, results)
+        print('\nBaselines written into {0}'.format(args.baselines))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
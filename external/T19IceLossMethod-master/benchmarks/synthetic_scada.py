@@ -0,0 +1,350 @@
+"""
+Synthetic wind turbine SCADA data for benchmarks.
+
+The statistics of a sample data file (by default the example data set fake_data2.csv) are measured once and any
+amount of data that behaves like the sample is generated from them:
+
+* wind speed and direction follow the distributions of the sample, their time correlation is that of the sample
+  scaled to the sampling rate
+* temperature follows the monthly means and deviations of the sample
+* power follows the power curve of the sample with the same scatter, with a small direction dependent gain so that
+  directional power curves differ
+* turbine faults, status code stops and gaps in the data appear as often and last as long as in the sample
+* icing episodes are placed into cold weather, their number per month is a parameter. An episode either reduces
+  production, stops the turbine or shows up as overproduction, the ice detector reports it and the blade heating
+  (IPS) is on during part of it
+
+The files have the same columns and time stamp format as the sample, so the example .ini works with them after
+changing the file name. Usage ::
+
+    python benchmarks/synthetic_scada.py ./synthetic/ --months 24 --step 1 --sectors 12 --icing 4 --turbines 3
+
+writes the data and an .ini file of every turbine into ./synthetic/
+"""
+
+import argparse
+import configparser
+import csv
+import datetime
+import os
+
+import numpy as np
+import scipy.signal
+import scipy.special
+
+T19_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_FILENAME = os.path.join(T19_DIR, 'fake_data2.csv')
+EXAMPLE_CONFIG = os.path.join(T19_DIR, 'example.ini')
+
+# column layout of the sample, same as in example.ini
+TIMESTAMP, WIND_SPEED, DIRECTION, TEMPERATURE, POWER, STATE, STATUS, ICE, IPS = range(9)
+TIME_FORMAT = '%d.%m.%Y %H:%M'
+QUANTILES = np.linspace(0.0, 1.0, 1001)
+POWER_CURVE_BIN = 0.5
+MEAN_EPISODE_HOURS = 6.0
+
+
+def runs(flags):
+    """
+    :param flags: boolean array
+    :return: number of runs of consecutive True values, mean run length
+    """
+    flags = np.asarray(flags, dtype=bool)
+    starts = np.count_nonzero(flags[1:] & ~flags[:-1]) + int(flags[0]) if len(flags) > 0 else 0
+    if starts == 0:
+        return 0, 0.0
+    return starts, np.count_nonzero(flags) / starts
+
+
+def lag_correlation(values):
+    """
+    :return: correlation of consecutive values
+    """
+    values = np.asarray(values, dtype=float)
+    return float(np.corrcoef(values[:-1], values[1:])[0, 1])
+
+
+class SiteStatistics:
+    """
+    statistics of a sample SCADA data file, used to generate synthetic data
+    """
+    def __init__(self, filename=SAMPLE_FILENAME):
+        """
+        :param filename: sample .csv file with the column layout of fake_data2.csv
+        """
+        with open(filename, 'r', newline='') as sample_file:
+            reader = csv.reader(sample_file)
+            self.headers = next(reader)
+            rows = [row for row in reader if len(row) == len(self.headers)]
+        timestamps = np.array([datetime.datetime.strptime(row[TIMESTAMP], TIME_FORMAT) for row in rows], dtype='datetime64[m]')
+        wind_speed = np.array([float(row[WIND_SPEED]) for row in rows])
+        direction = np.array([float(row[DIRECTION]) for row in rows])
+        temperature = np.array([float(row[TEMPERATURE]) for row in rows])
+        power = np.array([float(row[POWER]) for row in rows])
+        column_values = {index: np.array([row[index] for row in rows]) for index in (STATE, STATUS, ICE, IPS)}
+        steps = np.diff(timestamps).astype(np.int64)
+        self.step = float(np.median(steps))
+        # texts of the normal and the flagged values of every text column, the flagged one is the rarer one
+        self.codes = {}
+        for index, values in column_values.items():
+            texts, counts = np.unique(values, return_counts=True)
+            self.codes[index] = [str(texts[np.argmax(counts)]), str(texts[np.argmin(counts)])]
+        flags = {index: values == self.codes[index][1] for index, values in column_values.items()}
+        self.fault_share, self.fault_length = self.flag_statistics(flags[STATE])
+        self.stop_share, self.stop_length = self.flag_statistics(flags[STATUS])
+        expected_rows = (timestamps[-1] - timestamps[0]).astype(np.int64) / self.step + 1
+        self.gap_share = max(0.0, 1.0 - len(rows) / expected_rows)
+        self.gap_length = float(np.mean(steps[steps > self.step] / self.step - 1)) if np.any(steps > self.step) else 1.0
+
+        self.wind_speed_quantiles = np.quantile(wind_speed, QUANTILES)
+        self.direction_quantiles = np.quantile(direction, QUANTILES)
+        self.wind_speed_correlation = lag_correlation(wind_speed)
+        self.direction_correlation = lag_correlation(np.argsort(np.argsort(direction)))
+        months = timestamps.astype('datetime64[M]').astype(np.int64) % 12
+        self.temperature_mean = np.array([np.mean(temperature[months == month]) if np.any(months == month) else np.mean(temperature)
+                                          for month in range(12)])
+        self.temperature_std = np.array([np.std(temperature[months == month]) if np.any(months == month) else np.std(temperature)
+                                         for month in range(12)])
+        anomaly = temperature - self.temperature_mean[months]
+        self.temperature_correlation = lag_correlation(anomaly)
+
+        normal = ~(flags[STATE] | flags[STATUS] | flags[ICE] | flags[IPS])
+        self.rated_power = float(np.max(power))
+        bins = np.floor(wind_speed[normal] / POWER_CURVE_BIN).astype(np.int64)
+        self.power_curve = np.zeros(bins.max() + 1)
+        self.power_scatter = np.zeros(bins.max() + 1)
+        for speed_bin in np.unique(bins):
+            bin_powers = power[normal][bins == speed_bin]
+            self.power_curve[speed_bin] = np.median(bin_powers)
+            self.power_scatter[speed_bin] = np.std(bin_powers)
+        # wind speed bins above the sample run at rated power
+        self.power_curve = np.maximum.accumulate(self.power_curve)
+
+    def flag_statistics(self, flags):
+        """
+        :return: share of the flagged lines, mean length of a flagged run in minutes
+        """
+        count, length = runs(flags)
+        return np.count_nonzero(flags) / len(flags), max(length, 1.0) * self.step
+
+
+def correlated_uniform(rng, n, correlation):
+    """
+    uniformly distributed values with the given correlation between consecutive values (of their normal scores)
+
+    :param rng: numpy random generator
+    :param n: number of values
+    :param correlation: lag one correlation, between 0 and 1
+    """
+    correlation = min(max(correlation, 0.0), 0.9999)
+    noise = rng.standard_normal(n) * np.sqrt(1.0 - correlation ** 2)
+    noise[0] = rng.standard_normal()
+    return scipy.special.ndtr(scipy.signal.lfilter([1.0], [1.0, -correlation], noise))
+
+
+def random_runs(rng, n, share, length):
+    """
+    flag random runs of consecutive lines
+
+    :param rng: numpy random generator
+    :param n: number of lines
+    :param share: expected share of flagged lines
+    :param length: mean length of a run in lines
+    :return: boolean array
+    """
+    flags = np.zeros(n, dtype=bool)
+    count = rng.poisson(share * n / max(length, 1.0))
+    if count == 0 or n == 0:
+        return flags
+    starts = rng.integers(0, n, count)
+    lengths = np.maximum(1, rng.geometric(1.0 / max(length, 1.0), count))
+    # mark run starts with +1 and ends with -1, a cumulative sum covers every run
+    change = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(change, starts, 1)
+    np.add.at(change, np.minimum(starts + lengths, n), -1)
+    return np.cumsum(change[:-1]) > 0
+
+
+def generate(statistics, start=datetime.datetime(2003, 1, 1), months=12, step=10, icing=3.0, seed=1, wind_scale=1.0,
+             episode_hours=MEAN_EPISODE_HOURS):
+    """
+    generate one turbine worth of data
+
+    :param statistics: SiteStatistics of the sample
+    :param start: first time stamp
+    :param months: length of the data in months
+    :param step: sampling interval in minutes
+    :param icing: mean number of icing episodes per month, episodes start when it is below zero degrees
+    :param seed: random seed, the same seed gives the same data
+    :param wind_scale: multiplier for the wind speeds, different turbines of a park
+    :param episode_hours: mean length of an icing episode
+    :return: dictionary of columns, time stamps as datetime64[m], text columns as boolean flags
+    """
+    rng = np.random.default_rng(seed)
+    first = np.datetime64(start, 'm')
+    stop = (np.datetime64(start, 'M') + months).astype('datetime64[m]')
+    timestamps = np.arange(first, stop, np.timedelta64(step, 'm'))
+    n = len(timestamps)
+    # correlations of the sample are for its own sampling interval
+    scale = step / statistics.step
+    wind_speed = np.interp(correlated_uniform(rng, n, statistics.wind_speed_correlation ** scale), QUANTILES,
+                           statistics.wind_speed_quantiles) * wind_scale
+    direction = np.interp(correlated_uniform(rng, n, statistics.direction_correlation ** scale), QUANTILES,
+                          statistics.direction_quantiles)
+    month = timestamps.astype('datetime64[M]').astype(np.int64) % 12
+    anomaly = scipy.special.ndtri(np.clip(correlated_uniform(rng, n, statistics.temperature_correlation ** scale), 1e-9, 1 - 1e-9))
+    temperature = statistics.temperature_mean[month] + statistics.temperature_std[month] * anomaly
+
+    speed_bin = np.minimum(np.floor(wind_speed / POWER_CURVE_BIN).astype(np.int64), len(statistics.power_curve) - 1)
+    gain = 1.0 + 0.04 * np.sin(np.radians(direction))
+    power = statistics.power_curve[speed_bin] * gain + rng.standard_normal(n) * statistics.power_scatter[speed_bin] * 0.5
+    power = np.clip(power, 0.0, statistics.rated_power)
+
+    fault = random_runs(rng, n, statistics.fault_share, statistics.fault_length / step)
+    status_stop = random_runs(rng, n, statistics.stop_share, statistics.stop_length / step)
+    ice = np.zeros(n, dtype=bool)
+    ips = np.zeros(n, dtype=bool)
+    cold = np.flatnonzero(temperature < 0.0)
+    episodes = rng.poisson(icing * months) if len(cold) > 0 else 0
+    for episode_start in np.sort(rng.choice(cold, episodes)) if episodes > 0 else []:
+        length = max(1, int(rng.exponential(episode_hours * 60.0 / step)))
+        episode = slice(episode_start, min(n, episode_start + length))
+        kind = rng.random()
+        if kind < 0.6:
+            power[episode] *= rng.uniform(0.2, 0.8)
+        elif kind < 0.9:
+            power[episode] = 0.0
+        else:
+            power[episode] = np.minimum(power[episode] * 1.3, statistics.rated_power)
+        ice[episode] = True
+        if rng.random() < 0.5:
+            ips[episode_start:min(n, episode_start + length // 2 + 1)] = True
+    power[fault | status_stop] = 0.0
+
+    keep = ~random_runs(rng, n, statistics.gap_share, statistics.gap_length * statistics.step / step)
+    keep[0] = True
+    return {'timestamps': timestamps[keep], 'wind speed': np.round(wind_speed[keep], 1),
+            'direction': np.round(direction[keep], 1), 'temperature': np.round(temperature[keep], 1),
+            'power': np.round(power[keep]), 'fault': fault[keep], 'stop': status_stop[keep], 'ice': ice[keep], 'ips': ips[keep]}
+
+
+def format_timestamps(timestamps):
+    """
+    :param timestamps: datetime64 array
+    :return: list of time stamps in the format of the sample, e.g. 1.1.2003 0:00
+    """
+    minutes = timestamps.astype('datetime64[m]')
+    days = minutes.astype('datetime64[D]')
+    months = minutes.astype('datetime64[M]')
+    years = minutes.astype('datetime64[Y]').astype(np.int64) + 1970
+    month_numbers = months.astype(np.int64) % 12 + 1
+    day_numbers = (days - months.astype('datetime64[D]')).astype(np.int64) + 1
+    minute_of_day = (minutes - days.astype('datetime64[m]')).astype(np.int64)
+    return ['{0}.{1}.{2} {3}:{4:02d}'.format(day, month, year, minute // 60, minute % 60)
+            for day, month, year, minute in zip(day_numbers.tolist(), month_numbers.tolist(), years.tolist(), minute_of_day.tolist())]
+
+
+def write_csv(filename, statistics, columns, chunk_size=100000):
+    """
+    write generated data into a .csv file with the columns of the sample
+    """
+    codes = statistics.codes
+    with open(filename, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(statistics.headers)
+        for start in range(0, len(columns['timestamps']), chunk_size):
+            part = {key: values[start:start + chunk_size] for key, values in columns.items()}
+            texts = [np.where(part[key], codes[index][1], codes[index][0]).tolist()
+                     for key, index in (('fault', STATE), ('stop', STATUS), ('ice', ICE), ('ips', IPS))]
+            writer.writerows(zip(format_timestamps(part['timestamps']), part['wind speed'].tolist(),
+                                 part['direction'].tolist(), part['temperature'].tolist(),
+                                 part['power'].astype(np.int64).tolist(), *texts))
+
+
+def write_config(filename, data_filename, turbine_id, result_dir, sectors=1, plot=False, all_outputs=False):
+    """
+    write an .ini file for a generated data file, based on example.ini
+
+    :param sectors: number of wind direction sectors of the power curves
+    :param plot: draw the plots
+    :param all_outputs: also write the alarm time series, which takes a long time on long data sets
+    """
+    config = configparser.ConfigParser()
+    config.read(EXAMPLE_CONFIG)
+    config.set('Source file', 'id', turbine_id)
+    config.set('Source file', 'filename', os.path.abspath(data_filename))
+    config.set('Output', 'result directory', os.path.join(os.path.abspath(result_dir), ''))
+    config.set('Output', 'plot', str(plot))
+    config.set('Output', 'alarm time series', str(all_outputs))
+    # the stage profiler of the benchmark times the writers in the calling thread
+    config.set('Output', 'background writing', 'False')
+    config.set('Binning', 'wind direction bin size', repr(360.0 / sectors))
+    # every run calculates the power curves, otherwise the benchmark measures the cache
+    if not config.has_section('Cache'):
+        config.add_section('Cache')
+    config.set('Cache', 'power curve cache', 'False')
+    with open(filename, 'w') as config_file:
+        config.write(config_file)
+
+
+def dataset_name(start, months, step, sectors, icing, seed):
+    return 'synthetic_{0:%Y%m}_{1}m_{2}min_{3}s_{4}i_{5}'.format(start, months, step, sectors, icing, seed)
+
+
+def generate_turbines(directory, start='2003-01', months=12, step=10, sectors=1, icing=3.0, turbines=1, seed=1, plot=False,
+                      all_outputs=False, statistics=None):
+    """
+    write the data and .ini files of a set of turbines, files that already exist are reused
+
+    :param directory: directory for the data, the results go into its results subdirectory
+    :param start: first month of the data as YYYY-MM, the reference data set needs some data above the reference
+                  temperature (3 degrees in example.ini), so data shorter than a year should start in spring or autumn
+    :param turbines: number of turbines, every turbine gets its own seed and a slightly different wind
+    :param plot: draw the plots
+    :param all_outputs: also write the alarm time series
+    :param statistics: SiteStatistics, measured from fake_data2.csv if None
+    :return: list of .ini filenames
+    """
+    os.makedirs(directory, exist_ok=True)
+    start = datetime.datetime.strptime(start, '%Y-%m')
+    config_filenames = []
+    for turbine in range(turbines):
+        name = dataset_name(start, months, step, sectors, icing, seed + turbine)
+        data_filename = os.path.join(directory, name + '.csv')
+        config_filename = os.path.join(directory, name + '.ini')
+        if not os.path.exists(data_filename):
+            if statistics is None:
+                statistics = SiteStatistics()
+            columns = generate(statistics, start, months, step=step, icing=icing, seed=seed + turbine,
+                               wind_scale=1.0 + 0.1 * np.sin(turbine))
+            # write under a temporary name so that an interrupted run does not leave a partial file behind
+            write_csv(data_filename + '.tmp', statistics, columns)
+            os.replace(data_filename + '.tmp', data_filename)
+        write_config(config_filename, data_filename, name, os.path.join(directory, 'results', name), sectors, plot,
+                     all_outputs)
+        config_filenames.append(config_filename)
+    return config_filenames
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic SCADA data for the Task 19 ice loss counter')
+    parser.add_argument('directory', help='directory of the generated .csv and .ini files')
+    parser.add_argument('--start', default='2003-01', help='first month of the data as YYYY-MM')
+    parser.add_argument('--months', type=int, default=12, help='length of the data in months')
+    parser.add_argument('--step', type=int, default=10, help='sampling interval in minutes')
+    parser.add_argument('--sectors', type=int, default=1, help='number of wind direction sectors in the .ini')
+    parser.add_argument('--icing', type=float, default=3.0, help='mean number of icing episodes per month')
+    parser.add_argument('--turbines', type=int, default=1, help='number of turbines')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the first turbine')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    for config_filename in generate_turbines(args.directory, args.start, args.months, args.step, args.sectors, args.icing,
+                                             args.turbines, args.seed):
+        print("{0} : Written {1}".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), config_filename))
+
+
+if __name__ == '__main__':
+    main()
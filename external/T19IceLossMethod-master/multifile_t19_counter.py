@@ -1,9 +1,16 @@
 import os
+import sys
+import argparse
+import traceback
+import functools
 import t19_counter
 import collections
 import fileinput
 import configparser
+import datetime as dt
 from multiprocessing import Pool
+from t19_ice_loss import instrumentation as instr
+from t19_ice_loss import result_bundle
 
 
 def find_value_by_tag(filename, option):
@@ -74,48 +81,247 @@ def get_keys_for_printing(results):
 
 
 def results_to_file(filename, results, separator='\t'):
+    # summaries of heated and unheated sites have different fields, use all of them
     keys = get_keys_for_printing(results[0])
+    for summary in results[1:]:
+        keys.extend(key for key in get_keys_for_printing(summary) if key not in keys)
     with open(filename, 'w') as outfile:
         for key in keys:
             line = key
             for summary in results:
                 line += separator
-                line += summary[key]
+                line += summary.get(key, '')
             line += '\n'
             outfile.write(line)
 
 
 
 def combined_summary(result_directory):
+    # the summaries are read from the result bundles, the text files are parsed only for datasets without a bundle
     results = []
-    for f in [result_directory + f for f in os.listdir(result_directory) if 'summary.txt' in f]:
-        results.append(parse_summary_file_into_dict(f))
+    bundled = set()
+    for f in sorted(os.listdir(result_directory)):
+        if f.endswith(result_bundle.BUNDLE_TRUNK):
+            summary = result_bundle.read_summary(os.path.join(result_directory, f))
+            if len(summary) > 0:
+                results.append(summary)
+                bundled.add(f[:-len(result_bundle.BUNDLE_TRUNK)])
+    for f in sorted(os.listdir(result_directory)):
+        if f.endswith('_summary.txt') and f[:-len('_summary.txt')] not in bundled:
+            results.append(parse_summary_file_into_dict(os.path.join(result_directory, f)))
     output_filename = os.path.join(result_directory,'_combined_summary.csv')
     results_to_file(output_filename,results)
 
 
-def main():
-    # directory containing all .ini files for individual turbines
-    source_directory = './data/siteconfigs/'
+def available_cores():
+    """
+    number of cores this process is allowed to use
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def read_turbine_config(config_filename):
+    """
+    read the values the scheduler needs from the .ini file of one turbine
+
+    :param config_filename: .ini file of the turbine
+    :return: dictionary with the config filename, dataset id, data file, size of the data file, summary filename and
+             result bundle filename
+    """
+    config = configparser.ConfigParser()
+    config.read(config_filename)
+    dataset_id = config.get('Source file', 'id', fallback=os.path.basename(config_filename))
+    data_filename = config.get('Source file', 'filename', fallback='')
+    result_dir = config.get('Output', 'result directory', fallback='.')
+    try:
+        data_size = os.path.getsize(data_filename)
+    except OSError:
+        data_size = 0
+    summary_filename = ''
+    if config.getboolean('Output', 'summary', fallback=True):
+        summary_filename = result_dir + dataset_id + '_summary.txt'
+    bundle_filename = ''
+    if config.getboolean('Output', 'result bundle', fallback=False):
+        bundle_filename = result_bundle.bundle_filename(result_dir, dataset_id)
+    return {'config': config_filename,
+            'id': dataset_id,
+            'data file': data_filename,
+            'size': data_size,
+            'summary file': summary_filename,
+            'bundle file': bundle_filename}
+
+
+def is_up_to_date(turbine):
+    """
+    the results of a turbine are up to date if its summary file is newer than both the .ini file and the data file
+    """
+    if turbine['summary file'] == '':
+        return False
+    try:
+        result_time = os.path.getmtime(turbine['summary file'])
+        source_time = max(os.path.getmtime(turbine['config']), os.path.getmtime(turbine['data file']))
+    except OSError:
+        return False
+    return result_time >= source_time
+
+
+def read_turbine_summary(turbine):
+    """
+    read the summary of a processed turbine, from its result bundle if there is one
+
+    :param turbine: turbine dictionary as returned by read_turbine_config
+    :return: summary dictionary
+    """
+    if turbine['bundle file'] != '' and os.path.exists(turbine['bundle file']):
+        summary = result_bundle.read_summary(turbine['bundle file'])
+        if len(summary) > 0:
+            return summary
+    return parse_summary_file_into_dict(turbine['summary file'])
+
+
+def run_turbine(config_filename, metrics_filename=''):
+    """
+    process one turbine, errors are returned instead of raised so that one failing turbine does not stop the others
+
+    :param config_filename: .ini file of the turbine
+    :param metrics_filename: JSON lines file the stage records are appended to, empty string to use the
+                             "metrics file" option of the .ini file
+    :return: config filename, summary dictionary (None if not available), error message ('' if successful)
+    """
+    try:
+        instrumentation = instr.instrumentation_from_file(config_filename)
+        if metrics_filename != '':
+            instrumentation.sinks = [instr.JsonLinesSink(metrics_filename)]
+        summary = t19_counter.main(config_filename, instrumentation)
+    except (Exception, SystemExit):
+        return config_filename, None, traceback.format_exc()
+    return config_filename, summary, ''
+
+
+def run_fleet(turbines, workers, retries=1, combined_filename='', summaries=None, metrics_filename=''):
+    """
+    process a set of turbines in parallel
+
+    Turbines with the largest data files are started first, so that a large dataset does not end up running alone
+    at the end of the batch. Every turbine runs in a fresh worker process. Failed turbines are retried after the
+    others have been processed. Summaries are collected as turbines finish and the combined summary file is
+    rewritten after each of them.
 
+    :param turbines: list of turbine dictionaries as returned by read_turbine_config
+    :param workers: number of parallel worker processes
+    :param retries: how many times a failed turbine is tried again
+    :param combined_filename: file for the combined summary, empty string to skip writing
+    :param summaries: summaries of turbines that are not processed again, included in the combined summary
+    :param metrics_filename: JSON lines file for the stage records of all turbines, empty string to use the
+                             "metrics file" options of the .ini files
+    :return: summaries keyed by config filename, error messages of the failed turbines keyed by config filename
+    """
+    if summaries is None:
+        summaries = {}
+    errors = collections.OrderedDict()
+    pending = sorted(turbines, key=lambda t: t['size'], reverse=True)
+    for attempt in range(retries + 1):
+        if len(pending) == 0:
+            break
+        if attempt > 0:
+            print("{0} : Retrying {1} failed datasets".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), len(pending)))
+        failed = []
+        with Pool(max(1, min(workers, len(pending))), maxtasksperchild=1) as p:
+            for config_filename, summary, error in p.imap_unordered(functools.partial(run_turbine, metrics_filename=metrics_filename),
+                                                                       [turbine['config'] for turbine in pending]):
+                if error != '':
+                    print("{0} : Processing {1} failed:\n{2}".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), config_filename, error))
+                    failed.append(config_filename)
+                    errors[config_filename] = error
+                    continue
+                errors.pop(config_filename, None)
+                summaries[config_filename] = summary
+                if combined_filename != '':
+                    write_combined_summary(combined_filename, summaries)
+            # workers may still be drawing plots after returning their summary, leaving the block would kill them
+            p.close()
+            p.join()
+        pending = [turbine for turbine in pending if turbine['config'] in failed]
+    return summaries, errors
+
+
+def write_combined_summary(filename, summaries):
+    # keep the column order independent of the order the turbines finished in
+    results = [summaries[config_filename] for config_filename in sorted(summaries) if summaries[config_filename] is not None]
+    if len(results) > 0:
+        results_to_file(filename, results)
+
+
+def print_metrics_summary(metrics_filename, count=5):
+    """
+    print the stages and turbines that took the most time
+
+    :param metrics_filename: JSON lines file written by the turbines
+    :param count: number of turbines to list
+    """
+    records = instr.read_records(metrics_filename)
+    print("{0} : Time by stage, wall / cpu seconds:".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    for stage, wall, cpu in instr.totals(records, 'stage'):
+        print("    {0:<12} {1:10.1f} {2:10.1f}".format(stage, wall, cpu))
+    print("{0} : Slowest datasets, wall / cpu seconds:".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    for dataset, wall, cpu in instr.totals(records, 'dataset')[:count]:
+        print("    {0:<12} {1:10.1f} {2:10.1f}".format(dataset, wall, cpu))
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Run the T19 icing loss calculation for a set of turbines')
+    # directory containing all .ini files for individual turbines
+    parser.add_argument('source_directory', nargs='?', default='./data/siteconfigs/',
+                        help='directory of the .ini files, files with "blank" in the name are skipped')
     # result_directory, needs to be defined in .ini files as well
-    result_directory = './results/'
-    
+    parser.add_argument('result_directory', nargs='?', default='./results/',
+                        help='directory of the combined summary file')
+    parser.add_argument('-j', '--workers', type=int, default=available_cores(),
+                        help='number of parallel processes, defaults to the number of available cores')
+    parser.add_argument('-r', '--retries', type=int, default=1,
+                        help='how many times a failed turbine is tried again')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='process all turbines, also the ones with up to date results')
+    parser.add_argument('-m', '--metrics', default='',
+                        help='JSON lines file the stage timings of every turbine are appended to')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    source_directory = args.source_directory
+    result_directory = args.result_directory
+
     #get list of .ini files
-    
-    turbines = [source_directory + filename for filename in os.listdir(source_directory) if ('.ini' in filename) and ('blank') not in filename]
-    
-    ## run the script sequentially
-    # for turb in turbines:
-    #     t19_counter.main(turb)
-    ## use all 4 cores
-    with Pool(4) as p:
-        p.map(t19_counter.main,turbines)
+    turbines = [read_turbine_config(os.path.join(source_directory, filename)) for filename in sorted(os.listdir(source_directory))
+                if ('.ini' in filename) and ('blank') not in filename]
+
+    # resume an interrupted run, reuse the summaries of turbines that do not need to be processed again
+    up_to_date = []
+    if not args.force:
+        up_to_date = [turbine for turbine in turbines if is_up_to_date(turbine)]
+    to_run = [turbine for turbine in turbines if turbine not in up_to_date]
+    print("{0} : {1} datasets to process with {2} workers, {3} up to date".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), len(to_run), args.workers, len(up_to_date)))
+
+    if not os.path.exists(result_directory):
+        os.makedirs(result_directory)
+    combined_filename = os.path.join(result_directory, '_combined_summary.csv')
+    summaries = {turbine['config']: read_turbine_summary(turbine) for turbine in up_to_date}
+    summaries, errors = run_fleet(to_run, args.workers, args.retries, combined_filename, summaries, args.metrics)
+    write_combined_summary(combined_filename, summaries)
+    if args.metrics != '' and os.path.exists(args.metrics):
+        print_metrics_summary(args.metrics)
 
-    # combine summaryfiles into one large set
-    combined_summary(result_directory)
-    
+    if len(errors) > 0:
+        print("{0} : {1} datasets failed:".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), len(errors)))
+        for config_filename in errors:
+            print(config_filename)
+        return 1
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import os
+import sys
+import collections
+import datetime as dt
+from t19_ice_loss import chunked
+from t19_ice_loss import data_file_handler as dfh
+from t19_ice_loss import instrumentation as instr
+from t19_ice_loss import result_bundle
+
+
+def main(configfile_name, instrumentation=None):
+    """
+    Process a dataset that does not fit in memory and write the outputfiles.
+
+    The data is read twice, "chunk size" lines at a time: the first pass builds the power curves, the second one
+    finds the events. The results are the same as those of t19_counter.py, options of the [Chunked] section of the
+    config file select how the power curve statistics are kept. The data file has to be in time order.
+
+    :param configfile_name: .ini file of the dataset
+    :param instrumentation: instr.Instrumentation that records the stages of the processing, by default the records
+                            are written into the "metrics file" of the Output section if it is set
+    :return: summary values as an ordered dictionary, None if the summary was not written
+    """
+    reader = dfh.CSVimporter()
+    reader.read_file_options_from_file(configfile_name)
+    print("{0} : Processing dataset {1} in chunks of {2} lines".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), reader.id, reader.chunk_size))
+    if instrumentation is None:
+        instrumentation = instr.instrumentation_from_file(configfile_name)
+    if instrumentation.dataset == '':
+        instrumentation.dataset = reader.id
+    if not os.path.exists(reader.result_dir):
+        os.makedirs(reader.result_dir)
+    # the fault codes are needed for the options, they are read once before the passes over the data
+    if reader.replace_faults:
+        if dfh.is_column_store(reader.filename):
+            reader.store_fault_codes(dfh.ColumnStore(reader.filename))
+        else:
+            reader.process_fault_codes()
+
+    aepc = chunked.ChunkedAEPcounter()
+    if reader.replace_faults:
+        aepc.fault_dict = reader.fault_dict
+    aepc.set_data_options_from_file(configfile_name)
+    aepc.set_binning_options_from_file(configfile_name)
+    aepc.set_filtering_options_from_file(configfile_name)
+    aepc.set_ips_options_from_file(configfile_name)
+    aepc.set_chunked_options_from_file(configfile_name)
+    if aepc.refinement_passes > 0:
+        print("{0} : Reference refinement is not available in chunked mode, using the reference dataset as is".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+    with instrumentation.stage('power curve') as stage:
+        pc = aepc.chunked_power_curves(reader.read_sorted_chunks())
+        stage['rows_in'] = aepc.data_sizes[0]
+        stage['rows_out'] = pc.shape[0] * pc.shape[1]
+    if reader.unsorted_lines > 0:
+        print("{0} : {1} lines of {2} are not in time order and were left out".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), reader.unsorted_lines, reader.filename))
+
+    rfw = dfh.Result_file_writer()
+    rfw.set_output_file_options(configfile_name)
+    with instrumentation.stage('alarms', rows_in=aepc.data_sizes[0]) as stage:
+        aepc.chunked_alarms(reader.read_sorted_chunks(), pc, rfw.production_stats_periods)
+        alarm_timings = aepc.event_timings('losses')
+        stop_timings = aepc.event_timings('stops')
+        over_timings = aepc.event_timings('over')
+        status_timings = aepc.event_timings('status')
+        ips_timings = aepc.event_timings('ips')
+        ice_timings = aepc.event_timings('ice detection')
+        stage['rows_out'] = sum(len(timings) for timings in (status_timings, ips_timings, ice_timings, alarm_timings, stop_timings, over_timings)
+                                if timings is not None)
+
+    writer = result_bundle.BackgroundWriter(rfw.background_writing)
+    with instrumentation.stage('writers'):
+        totals = aepc.summary_totals()
+        if rfw.summaryfile_write and totals is None:
+            print("{0} : Not enough data for the summary".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        elif rfw.summaryfile_write:
+            writer.submit(rfw.summary_statistics, (aepc, None, None, pc, alarm_timings, stop_timings, over_timings, status_timings, ice_timings, ips_timings, aepc.data_sizes, totals),
+                          'Summary written successfully into: ', 'Problem writing summary: ')
+
+        if rfw.power_curve_write:
+            writer.submit(rfw.write_power_curve, (aepc, pc), 'Power curve written successfully into: ', 'Problem writing power curve: ')
+
+        # event tables by the name of their file, as in t19_counter.py
+        events = collections.OrderedDict([('losses', alarm_timings), ('stops', stop_timings)])
+        if aepc.status_stop_index[0] > 0:
+            events['status'] = status_timings
+        if aepc.heated_site:
+            events['ips'] = ips_timings
+        if aepc.ice_detection:
+            events['ice_det'] = ice_timings
+        if rfw.icing_events_write:
+            descriptions = {'losses': 'Icing loss statistics', 'stops': 'Icing stops statistics'}
+            for name, timings in events.items():
+                events_filename = aepc.result_dir + aepc.id + '_' + name + '.csv'
+                description = descriptions.get(name, 'Status Code statistics')
+                writer.submit(rfw.write_alarm_timings, (events_filename, timings), description + ' written successfully into: ',
+                              'Error writing ' + description + ': ', events_filename)
+            for period in rfw.production_stats_periods:
+                writer.submit(rfw.write_monthly_stats, (None, pc, aepc, None, None, None, None, None, period, None, aepc.production_statistics(period)),
+                              'Icing loss timeseries by {0} written into: '.format(period), 'Error writing loss timeseries: ')
+
+        if rfw.alarm_time_series_file_write or rfw.filtered_raw_data_write or rfw.pc_plot_picture:
+            print("{0} : Alarm time series, filtered raw data and plots are not written in chunked mode".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+        if rfw.result_bundle:
+            # submitted after the summary and the statistics it contains
+            writer.submit(rfw.write_result_bundle, (aepc, pc, events), 'Result bundle written into: ', 'Error writing result bundle: ')
+
+    with instrumentation.stage('flush'):
+        writer.close()
+
+    instrumentation.finish(aepc.data_sizes[0])
+    return rfw.summary
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
@@ -1,6 +1,10 @@
 import os
+import collections
 from t19_ice_loss import aep_counter as aep
 from t19_ice_loss import data_file_handler as dfh
+from t19_ice_loss import instrumentation as instr
+from t19_ice_loss import pc_cache
+from t19_ice_loss import result_bundle
 import sys
 import configparser
 import datetime as dt
@@ -9,12 +13,16 @@ import numpy as np
 
 
 
-def main(configfile_name):
+def main(configfile_name, instrumentation=None):
     """
     Process the data and write the outputfiles.
 
     Outputfiles are named based on the dataset id.
 
+    :param configfile_name: .ini file of the dataset
+    :param instrumentation: instr.Instrumentation that records the stages of the processing, by default the records
+                            are written into the "metrics file" of the Output section if it is set
+    :return: summary values as an ordered dictionary, None if the summary was not written
     """
     # # # get the configfile as a command-line parameter
     #configfile_name = sys.argv[1]
@@ -22,6 +30,10 @@ def main(configfile_name):
     config = configparser.ConfigParser()
     config.read(configfile_name)
     print("{0} : Processing dataset {1}".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), config.get('Source file', 'id')))
+    if instrumentation is None:
+        instrumentation = instr.instrumentation_from_file(configfile_name)
+    if instrumentation.dataset == '':
+        instrumentation.dataset = config.get('Source file', 'id')
 
     # first read the data in
     reader = dfh.CSVimporter()
@@ -38,8 +50,11 @@ def main(configfile_name):
     # set filename separately
     #reader.filename = '../data/full_mean_dataset.csv'
     #read data
-    reader.read_data()
-    data = reader.full_data
+    with instrumentation.stage('read') as stage:
+        reader.read_data()
+        # the typed columns are not converted into rows here, see preprocess_columns
+        data = reader.column_data if reader.column_data is not None else reader.full_data
+        stage['rows_out'] = len(data)
     headers = reader.headers
 
     # print(headers)
@@ -60,163 +75,162 @@ def main(configfile_name):
     aepc.set_ips_options_from_file(configfile_name)
     # aepc.starttimestamp = dt.datetime(2015, 1, 1, 0, 0, 0)
     # aepc.stoptimestamp = dt.datetime(2015, 10, 1, 0, 0, 0)
-    # calculate air density correction based on site height using the formula from the spec
-    temperature_corrected_data = aepc.air_density_correction(data)
-    # temperature_corrected_data = data.copy()
-    # filter the corrected data based on state variable values
-    #state_filtered_data = aepc.state_filter_data(temperature_corrected_data)
-    time_limited_data = aepc.time_filter_data(temperature_corrected_data)
-    state_filtered_data = aepc.state_filter_data(time_limited_data)
-
-    # filter the data based on power level,
-    # remove datapoints where output power is below 0.01 * aepc.rated_power
-    #power_level_filtered_data = aepc.power_level_filter(state_filtered_data, 0.01)
-    power_level_filtered_data = aepc.power_level_filter(state_filtered_data)
-    # create power curves. This bins the data according to wind speed and direction and does some
-    # filtering and interpolation to fill over gaps on source data.
-
-    # only use the part of data where temperature is above 3 degrees celsius for the power curve
-    # use the full dataset for refernce use time limited for loss calculation
-    s_reference_data = aepc.state_filter_data(temperature_corrected_data)
-    d_reference_data = aepc.temperature_filter_data(s_reference_data)
-    reference_data = aepc.power_level_filter(d_reference_data)
-    #reference_data = aepc.diff_filter(pd_reference_data)
-    pc = aepc.count_power_curves(reference_data)
+    # calculate air density correction based on site height using the formula from the spec and evaluate
+    # every filter once, the corrected wind speeds overwrite the ones in data to avoid another copy of the data
+    rfw = dfh.Result_file_writer()
+    rfw.set_output_file_options(configfile_name)
+    with instrumentation.stage('correct', rows_in=len(data)) as stage:
+        if reader.column_data is not None:
+            # only the lines that are used are converted into rows, the plots use all of them
+            preprocessed = aepc.preprocess_columns(data, keep_all=rfw.pc_plot_picture)
+        else:
+            preprocessed = aepc.preprocess(data, in_place=True)
+        stage['rows_out'] = len(preprocessed.data)
+    temperature_corrected_data = preprocessed.data
+    with instrumentation.stage('filter', rows_in=len(temperature_corrected_data)) as stage:
+        # filter the corrected data based on state variable values
+        time_limited_data = preprocessed.select('time')
+        state_filtered_data = preprocessed.select('time', 'state')
+
+        # filter the data based on power level,
+        # remove datapoints where output power is below 0.01 * aepc.rated_power
+        power_level_filtered_data = preprocessed.select('time', 'state', 'power level')
+        # create power curves. This bins the data according to wind speed and direction and does some
+        # filtering and interpolation to fill over gaps on source data.
+
+        # only use the part of data where temperature is above 3 degrees celsius for the power curve
+        # use the full dataset for refernce use time limited for loss calculation
+        reference_data = preprocessed.select('state', 'temperature', 'power level')
+        #reference_data = aepc.diff_filter(pd_reference_data)
+        stage['rows_out'] = len(time_limited_data)
+    with instrumentation.stage('power curve', rows_in=len(reference_data)) as stage:
+        # reuse the power curves of an earlier run if the reference data and the options are the same
+        curve_cache = pc_cache.PowerCurveCache()
+        curve_cache.set_cache_options_from_file(configfile_name, aepc)
+        pc = curve_cache.power_curves(aepc, reference_data)
+        if aepc.refinement_passes > 0:
+            # add the non-iced data below the reference temperature into the reference dataset
+            pc, reference_data, passes = aepc.refine_power_curves(preprocessed, pc, lambda refined: curve_cache.power_curves(aepc, refined))
+            print("{0} : Power curve refined in {1} passes, reference dataset has {2} lines".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), passes, len(reference_data)))
+        # one row per wind speed and direction bin
+        stage['rows_out'] = pc.shape[0] * pc.shape[1]
     # rfw.write_power_curve_file('../results/power_curve.txt', pc, aepc)
     # save data sizes into a list in order, original, filtered, reference
     data_sizes = [len(data), len(state_filtered_data), len(reference_data)]
 
-    # find stoppages as defined in the specification
     # find power drops and flag them
-    if aepc.stop_filter_type == 0:
-        stops = aepc.find_icing_related_stops(state_filtered_data, pc)
-        pow_alms1 = aepc.power_alarms(power_level_filtered_data, pc)
-        status_timings = None
-        status_stops = None
-    elif (aepc.stop_filter_type == 2) or (aepc.stop_filter_type == 1):
-        status_stops = aepc.status_code_stops(time_limited_data, pc)
-        stops = aepc.find_icing_related_stops(state_filtered_data, pc)
-        pow_alms1 = aepc.power_alarms(power_level_filtered_data, pc)
-        status_timings = aepc.power_loss_during_alarm(status_stops)
-    else:
-        stops = None
-        status_stops = None
-        status_timings = None
-        pow_alms1 = aepc.power_alarms(power_level_filtered_data, pc)
-    if aepc.heated_site:
-        ips_on_flags = aepc.status_code_stops(time_limited_data, pc, filter_type='ips')
-        ips_timings = aepc.power_loss_during_alarm(ips_on_flags, ips_alarm=True)
-    else:
-        ips_on_flags = None
-        ips_timings = None
-    if aepc.ice_detection:
-        ice_detected = aepc.status_code_stops(time_limited_data, pc, filter_type='icing')
-        ice_timings = aepc.power_loss_during_alarm(ice_detected)
-    else:
-        ice_detected = None
-        ice_timings = None
-    # find over production incidents and flag them
-    pow_alms2 = aepc.power_alarms(power_level_filtered_data, pc, over=True)
-    # find start and stop times of alarms in the structure containing the power drop flags
-    alarm_timings = aepc.power_loss_during_alarm(pow_alms1)
-    stop_timings = aepc.power_loss_during_alarm(stops)
-    over_timings = aepc.power_loss_during_alarm(pow_alms2)
-
-    # re-do the reference dataset
-    #new_ref = aepc.increase_reference_dataset(time_limited_data, stop_timings, alarm_timings, over_timings)
-    #new_pc = aepc.count_power_curves(new_ref)
-
-    rfw = dfh.Result_file_writer()
-    rfw.set_output_file_options(configfile_name)
-
-    if rfw.summaryfile_write:
-        summary_status, summary_filename, summary_error = rfw.summary_statistics(aepc, time_limited_data, reference_data, pc, alarm_timings, stop_timings, over_timings, status_timings, ice_timings, ips_timings, data_sizes)
-        if summary_status:
-            print("{0} : Summary written successfully into: {1}".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), summary_filename))
-        else:
-            print("{0} : Problem writing summary: {1}".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), summary_error))
-
-    if rfw.power_curve_write:
-        power_curve_status, pc_filename, pc_error = rfw.write_power_curve(aepc,pc)
-        if power_curve_status:
-            print('{0} : Power curve written successfully into: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), pc_filename))
+    with instrumentation.stage('alarms', rows_in=len(power_level_filtered_data)) as stage:
+        # interpolate the reference power only once for both the P10 and P90 power alarms
+        power_reference = aepc.interpolate_power_curves(power_level_filtered_data, pc)
+        pow_alms1 = aepc.power_alarms(power_level_filtered_data, pc, reference=power_reference)
+        # find over production incidents and flag them
+        pow_alms2 = aepc.power_alarms(power_level_filtered_data, pc, over=True, reference=power_reference)
+        stage['rows_out'] = len(pow_alms1)
+    # find stoppages as defined in the specification
+    with instrumentation.stage('stops', rows_in=len(time_limited_data)) as stage:
+        if aepc.stop_filter_type == 0:
+            stops = aepc.find_icing_related_stops(state_filtered_data, pc)
+            status_stops = None
+        elif (aepc.stop_filter_type == 2) or (aepc.stop_filter_type == 1):
+            status_stops = aepc.status_code_stops(time_limited_data, pc)
+            stops = aepc.find_icing_related_stops(state_filtered_data, pc)
         else:
-            print('{0} : Problem writing power curve: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), pc_error))
-
-    if rfw.icing_events_write:
-        # TODO: write these to one file
-        prod_loss_trunk = '_losses.csv'
-        stops_trunk = '_stops.csv'
-        status_trunk = '_status.csv'
-        ips_trunk = '_ips.csv'
-        icing_trunk = '_ice_det.csv'
-        losses_filename = aepc.result_dir + aepc.id + prod_loss_trunk
-        stops_filename = aepc.result_dir + aepc.id + stops_trunk
-        status_filename = aepc.result_dir + aepc.id + status_trunk
-        ips_filename = aepc.result_dir + aepc.id + ips_trunk
-        icing_filename = aepc.result_dir + aepc.id + icing_trunk
-        loss_status, loss_write_error = rfw.write_alarm_timings(losses_filename, alarm_timings)
-        if loss_status:
-            print('{0} : Icing loss statistics written successfully into: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), losses_filename))
+            stops = None
+            status_stops = None
+        if aepc.heated_site:
+            ips_on_flags = aepc.status_code_stops(time_limited_data, pc, filter_type='ips')
         else:
-            print('{0} : Error writing icing loss statistics: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), loss_write_error))
-        stop_status, stop_write_error = rfw.write_alarm_timings(stops_filename, stop_timings)
-        if stop_status:
-            print('{0} : Icing stops statistics written successfully into: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), stops_filename))
+            ips_on_flags = None
+        if aepc.ice_detection:
+            ice_detected = aepc.status_code_stops(time_limited_data, pc, filter_type='icing')
         else:
-            print('{0} : Error writing icing stop statistics: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), stop_write_error))
+            ice_detected = None
+        stage['rows_out'] = len(stops) if stops is not None else 0
+    # find start and stop times of alarms in the structures containing the power drop and stop flags
+    with instrumentation.stage('timings', rows_in=len(pow_alms1)) as stage:
+        # all the alarm series on the lines of the analysed period, used for the combined time series, the
+        # production statistics and the plots
+        aligned = aepc.align_alarms(time_limited_data, pc, [('losses', pow_alms1), ('stops', stops), ('over', pow_alms2),
+                                                            ('status', status_stops), ('ips', ips_on_flags),
+                                                            ('ice detection', ice_detected)])
+        status_timings = aepc.power_loss_during_alarm(status_stops) if status_stops is not None else None
+        ips_timings = aepc.power_loss_during_alarm(ips_on_flags, ips_alarm=True) if ips_on_flags is not None else None
+        ice_timings = aepc.power_loss_during_alarm(ice_detected) if ice_detected is not None else None
+        alarm_timings = aepc.power_loss_during_alarm(pow_alms1)
+        stop_timings = aepc.power_loss_during_alarm(stops)
+        over_timings = aepc.power_loss_during_alarm(pow_alms2)
+        # number of events found
+        stage['rows_out'] = sum(len(timings) for timings in (status_timings, ips_timings, ice_timings, alarm_timings, stop_timings, over_timings)
+                                if timings is not None)
+
+    # the result files are written on a background thread while the rest is calculated
+    writer = result_bundle.BackgroundWriter(rfw.background_writing)
+    with instrumentation.stage('writers', rows_in=len(time_limited_data)):
+        if rfw.summaryfile_write:
+            writer.submit(rfw.summary_statistics, (aepc, time_limited_data, reference_data, pc, alarm_timings, stop_timings, over_timings, status_timings, ice_timings, ips_timings, data_sizes),
+                          'Summary written successfully into: ', 'Problem writing summary: ')
+
+        if rfw.power_curve_write:
+            writer.submit(rfw.write_power_curve, (aepc, pc), 'Power curve written successfully into: ', 'Problem writing power curve: ')
+
+        # event tables by the name of their file
+        events = collections.OrderedDict([('losses', alarm_timings), ('stops', stop_timings)])
         if aepc.status_stop_index[0] > 0:
-            status_status, status_write_error = rfw.write_alarm_timings(status_filename, status_timings)
-            if status_status:
-                print('{0} : Status Code statistics written successfully into: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), status_filename))
-            else:
-                print('{0} : Error writing Status Code statistics: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), status_write_error))
+            events['status'] = status_timings
         if aepc.heated_site:
-            ips_status, ips_write_error = rfw.write_alarm_timings(ips_filename, ips_timings)
-            if ips_status:
-                print('{0} : Status Code statistics written successfully into: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), ips_filename))
-            else:
-                print('{0} : Error writing Status Code statistics: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), ips_write_error))
+            events['ips'] = ips_timings
         if aepc.ice_detection:
-            icing_status, icing_write_error = rfw.write_alarm_timings(icing_filename, ice_timings)
-            if icing_status:
-                print('{0} : Status Code statistics written successfully into: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), icing_filename))
+            events['ice_det'] = ice_timings
+        if rfw.icing_events_write:
+            descriptions = {'losses': 'Icing loss statistics', 'stops': 'Icing stops statistics'}
+            for name, timings in events.items():
+                events_filename = aepc.result_dir + aepc.id + '_' + name + '.csv'
+                description = descriptions.get(name, 'Status Code statistics')
+                writer.submit(rfw.write_alarm_timings, (events_filename, timings), description + ' written successfully into: ',
+                              'Error writing ' + description + ': ', events_filename)
+
+            #TODO: make ice detector and IPS OPTIONAL, Now the code inserts dummy values for IPS. Not a clean solution
+            # the production and loss series are calculated once and summed into every wanted period
+            production = aepc.production_series(time_limited_data, pc, pow_alms1, stops, status_stops, ips_on_flags, ice_detected, aligned)
+            for period in rfw.production_stats_periods:
+                writer.submit(rfw.write_monthly_stats, (time_limited_data, pc, aepc, pow_alms1, stops, status_stops, ips_on_flags, ice_detected, period, production),
+                              'Icing loss timeseries by {0} written into: '.format(period), 'Error writing loss timeseries: ')
+
+        if rfw.alarm_time_series_file_write:
+            # write out the results
+            combined_ts = aepc.combine_timeseries(pow_alms1, stops, pow_alms2, aligned)
+            alarm_timeseries_filename = aepc.result_dir + aepc.id + '_alarms.csv'
+            writer.submit(rfw.write_alarm_file, (alarm_timeseries_filename, combined_ts),
+                          'Time series written successfully into: ', 'Error writing time series file: ', alarm_timeseries_filename)
+
+        if rfw.filtered_raw_data_write:
+            filtered_data_filename = aepc.result_dir + aepc.id + '_filtered.csv'
+            # insert_fault_codes writes into the lines it gets, give it a selection of its own
+            new_data = rfw.insert_fault_codes(preprocessed.select('time'), aepc, reader)
+            writer.submit(rfw.write_time_series_file, (filtered_data_filename, new_data, list(headers), aepc, pc),
+                          'Filtered data written succesfully to: ', 'Error writeing raw data: ', filtered_data_filename)
+
+        if rfw.result_bundle:
+            # submitted after the summary and the statistics it contains
+            writer.submit(rfw.write_result_bundle, (aepc, pc, events), 'Result bundle written into: ', 'Error writing result bundle: ')
+
+    if rfw.pc_plot_picture:
+        # the plots are drawn by a separate process, the results above are already complete. The stage only covers
+        # preparing the plot data and starting the process
+        with instrumentation.stage('plots', rows_in=len(temperature_corrected_data)):
+            if aepc.heated_site:
+                rfw.generate_standard_plots(temperature_corrected_data, pc, aepc, pow_alms1, pow_alms2, stops, data_sizes,
+                                            alarm_timings, over_timings, stop_timings, ips_on_flags, True, background=True, aligned=aligned, writer=writer)
             else:
-                print('{0} : Error writing Status Code statistics: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), icing_write_error))
+                rfw.generate_standard_plots(temperature_corrected_data, pc, aepc, pow_alms1, pow_alms2, stops, data_sizes,
+                                            alarm_timings, over_timings, stop_timings, None, True, background=True, aligned=aligned, writer=writer)
 
-        #TODO: make ice detector and IPS OPTIONAL, Now the code inserts dummy values for IPS. Not a clean solution
-        monthly_stat_status, stat_filename, stat_write_error = rfw.write_monthly_stats(time_limited_data, pc, aepc, pow_alms1, stops, status_stops, ips_on_flags, ice_detected)
-        if monthly_stat_status:
-            print('{0} : Monthly icing loss timeseries written into: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), stat_filename))
-        else:
-            print('{0} : Error writing loss timeseries: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), stat_write_error))
-
-    if rfw.alarm_time_series_file_write:
-        # write out the results
-        combined_ts = aepc.combine_timeseries(pow_alms1,stops,pow_alms2)
-        alarm_timeseries_filename = aepc.result_dir + aepc.id + '_alarms.csv'
-        ts_write_status, ts_write_error = rfw.write_alarm_file(alarm_timeseries_filename, combined_ts)
-        if ts_write_status:
-            print('{0} : Time series written successfully into: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), alarm_timeseries_filename))
-        else:
-            print('{0} : Error writing time series file: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), ts_write_error))
-
-    if rfw.filtered_raw_data_write:
-        filtered_data_filename = aepc.result_dir + aepc.id + '_filtered.csv'
-        new_data = rfw.insert_fault_codes(aepc.time_filter_data(temperature_corrected_data), aepc, reader)
-        raw_write_status, raw_write_error = rfw.write_time_series_file(filtered_data_filename, new_data, headers,aepc,pc)
-        if raw_write_status:
-            print('{0} : Filtered data written succesfully to: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),filtered_data_filename))
-        else:
-            print('{0} : Error writeing raw data: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),raw_write_error))
+    # the results are complete once the background writes have finished
+    with instrumentation.stage('flush'):
+        writer.close()
 
-    if rfw.pc_plot_picture:
-        if aepc.heated_site:
-            rfw.generate_standard_plots(temperature_corrected_data, pc, aepc, pow_alms1, pow_alms2, stops, data_sizes,
-                                        alarm_timings, over_timings, stop_timings, ips_on_flags, True)
-        else:
-            rfw.generate_standard_plots(temperature_corrected_data, pc, aepc, pow_alms1, pow_alms2, stops, data_sizes,
-                                        alarm_timings, over_timings, stop_timings, None, True)
+    instrumentation.finish(len(data))
+    return rfw.summary
 
 
 
@@ -1,3 +1,6 @@
 from .data_file_handler import CSVimporter
 from .data_file_handler import Result_file_writer
 from .aep_counter import AEPcounter
+from .incremental import IncrementalAEPcounter
+from .pc_cache import PowerCurveCache
+from .column_store import ColumnStore, ColumnStoreWriter
@@ -4,9 +4,11 @@
 
 import datetime
 import numpy as np
-import scipy.stats as ss
 import configparser
 import sys
+from . import aggregation
+from . import alignment
+from . import fault_codes
 
 class TimingError(Exception):
     def __init__(self, starttime, stoptime, index):
@@ -16,6 +18,42 @@ class TimingError(Exception):
         self.dateformat = "%Y-%m-%d %H:%M:%S"
 
 
+class PreprocessedData:
+    """
+    air density corrected data and the filter masks computed from it by AEPcounter.preprocess
+    """
+    def __init__(self, data, masks, size=None):
+        """
+        :param data: corrected data
+        :param masks: dictionary of boolean arrays, one value per line of data
+        :param size: number of lines in the input data, if data only contains some of them
+        """
+        self.data = data
+        self.masks = masks
+        self.size = len(data) if size is None else size
+
+    def mask(self, *names):
+        """
+        :param names: names of the masks to combine
+        :return: boolean array, True for the lines that pass all the named filters
+        """
+        combined = np.ones(len(self.data), dtype=bool)
+        for name in names:
+            combined &= self.masks[name]
+        return combined
+
+    def select(self, *names):
+        """
+        select the lines that pass all the named filters
+
+        The result refers to the same values as the corrected data, only the row index is new.
+
+        :param names: names of the masks to combine
+        :return: filtered data
+        """
+        return self.data[self.mask(*names)]
+
+
 class AEPcounter:
     """
     set of functions to calculate AEP losses from structured data
@@ -50,6 +88,8 @@ class AEPcounter:
         self.icing_temperature_limit = 3
         self.pc_binsize = 36 # bin size filter for power curve
         self.pc_dist_filter = True # filter out obviously wrong values from power curves.
+        self.refinement_passes = 0 # maximum number of reference dataset refinement passes, 0 to skip the refinement
+        self.refinement_tolerance = 0.005 # refinement ends when the power curve changes less than this * rated power
         self.site_elevation = 0.0
         self.fault_dict = {} # used in case fault codes need to be replaced very non-elegant solution, but...
         self.result_dir = '.'
@@ -110,6 +150,27 @@ class AEPcounter:
                            'wind speed bin size': '1',
                            'wind direction bin size': '360'}
             return b_fallbacks[config_var]
+        elif section == 'Incremental':
+            inc_fallbacks = {'state file': 'None',
+                             'sketch buckets': '200',
+                             'sketch power range': '1.25'}
+            return inc_fallbacks[config_var]
+        elif section == 'Chunked':
+            ch_fallbacks = {'quantiles': 'exact',
+                            'sketch buckets': '200',
+                            'sketch power range': '1.25',
+                            'spill directory': 'None'}
+            return ch_fallbacks[config_var]
+        elif section == 'Cache':
+            c_fallbacks = {'power curve cache': 'False',
+                           'cache directory': 'None',
+                           'max size': '100',
+                           'max age': '30'}
+            return c_fallbacks[config_var]
+        elif section == 'Sweep':
+            s_fallbacks = {'workers': '0',
+                           'result file': 'None'}
+            return s_fallbacks[config_var]
         elif section == 'Filtering':
             f_fallbacks = {'power drop limit': '10',
                            'overproduction limit': '90',
@@ -124,7 +185,9 @@ class AEPcounter:
                            'min bin size': '36',
                            'distance filter': 'True',
                            'start time': 'None',
-                           'stop time': 'None'}
+                           'stop time': 'None',
+                           'reference refinement passes': '0',
+                           'refinement tolerance': '0.005'}
             return f_fallbacks[config_var]
         else:
             print('section "{0}" does not exist in config file'.format(section))
@@ -233,6 +296,8 @@ class AEPcounter:
                 self.icing_temperature_limit = float(config.get('Filtering', 'temperature filter', fallback=self.get_fallback_value('Filtering',  'temperature filter')))
                 self.reference_temperature_limit = float(config.get('Filtering', 'reference temperature', fallback=self.get_fallback_value('Filtering',  'reference temperature')))
                 self.stop_filter_type = int(config.get('Filtering', 'stop filter type', fallback=self.get_fallback_value('Filtering',  'stop filter type')))
+                self.refinement_passes = int(config.get('Filtering', 'reference refinement passes', fallback=self.get_fallback_value('Filtering', 'reference refinement passes')))
+                self.refinement_tolerance = float(config.get('Filtering', 'refinement tolerance', fallback=self.get_fallback_value('Filtering', 'refinement tolerance')))
                 dt_format = config.get('Source file', 'datetime format', raw=True, fallback=self.get_fallback_value('Source file', 'datetime format'))
                 starttime_str = config.get('Filtering', 'Start time', fallback=self.get_fallback_value('Filtering', 'start time'))
                 if starttime_str.upper() != 'NONE':
@@ -303,40 +368,36 @@ class AEPcounter:
         :param data: data to be filtered
         :return: filtered data with the filterd liens removed
         """
+        return data[self.state_mask(data)]
 
-        if self.state_filter_type == 2:
-            exclude = True
-        else:
-            exclude = False
-
-        #if exclude:
-            #return data[data[:, self.state_index] != self.normal_state, :]
-            #return np.array([line for line in data if line[self.state_index] not in self.normal_state])
-        #else:
-            #return data[data[:, self.state_index] == self.normal_state, :]
-            #return np.array([line for line in data if line[self.state_index] in self.normal_state])
-        #TODO:
-            # fix this mess, remove exclude from where it iss and have all filter type switches in the same place
-        filtered_data = []
-        for line in data:
-            # state_vals = [line[i] for i in self.state_index]
-            # state_val_check = all([j in self.normal_state for j in state_vals]) # if all in state_vals are in normal state evaluates as True
-            state_val_check_vars = []
-            for normal_state_index,value_index in enumerate(self.state_index):
+    def state_mask(self, data):
+        """
+        find the lines kept by state_filter_data
+
+        state_filter_type 0 and 1 keep the lines where every state column equals its normal_state value, type 2
+        the lines where any of them differs, type 3 the lines where every state column is at least and type 4 at
+        most its normal_state value.
+
+        :param data: input data
+        :return: boolean array, True for the lines to keep
+        """
+        keep = np.ones(len(data), dtype=bool)
+        if len(data) == 0:
+            return keep
+        # nans cause the comparisons to evaluate as false, which is what we want
+        with np.errstate(invalid='ignore'):
+            for normal_state_index, value_index in enumerate(self.state_index):
+                column = data[:, value_index]
                 if self.state_filter_type == 3:
-                    state_val_check_vars.append(line[value_index] >= self.normal_state[normal_state_index])
+                    check = column >= self.normal_state[normal_state_index]
                 elif self.state_filter_type == 4:
-                    state_val_check_vars.append(line[value_index] <= self.normal_state[normal_state_index])
+                    check = column <= self.normal_state[normal_state_index]
                 else:
-                    state_val_check_vars.append(line[value_index] == self.normal_state[normal_state_index])
-            state_val_check = all(state_val_check_vars)
-            if exclude:
-                if not state_val_check:
-                    filtered_data.append(line)
-            else:
-                if state_val_check:
-                    filtered_data.append(line)
-        return np.array(filtered_data)
+                    check = column == self.normal_state[normal_state_index]
+                keep &= np.asarray(check, dtype=bool)
+        if self.state_filter_type == 2:
+            keep = ~keep
+        return keep
 
     def temperature_filter_data(self, data):
         """
@@ -345,10 +406,17 @@ class AEPcounter:
         :param data: input data
         :return: data set containing only the data in previously specified range
         """
+        return data[self.temperature_mask(data)]
+
+    def temperature_mask(self, data):
+        """
+        :param data: input data
+        :return: boolean array, True where the temperature is at least reference_temperature_limit
+        """
         # suppress the runtimewarning caused by nans in data
         # the result is what we want: nans case the comparison to evaluate as false
         with np.errstate(invalid = 'ignore'):
-            return data[data[:, self.temp_index] >= self.reference_temperature_limit, :]
+            return self.float_column(data, self.temp_index) >= self.reference_temperature_limit
 
     def power_level_filter(self, data):
         """
@@ -360,10 +428,15 @@ class AEPcounter:
         :param limit_level: filtering level as fraction of rated
         :return: data with the unwanted timestamps removed
         """
-        # suppress the runtimewarning caused by nans in data
-        # the result is what we want: nans case the comparison to evaluate as false
+        return data[self.power_level_mask(data)]
+
+    def power_level_mask(self, data):
+        """
+        :param data: input data
+        :return: boolean array, True where the power is at least power_level_filter_limit * rated_power
+        """
         with np.errstate(invalid = 'ignore'):
-            return data[data[:, self.pow_index] >= (self.power_level_filter_limit * self.rated_power), :]
+            return self.float_column(data, self.pow_index) >= (self.power_level_filter_limit * self.rated_power)
 
     def wind_speed_filter(self,data,limit_level):
         """
@@ -386,8 +459,63 @@ class AEPcounter:
         :param stop: stop time as datetime.datetime
         :return: filtered dataset
         """
-        return data[np.logical_and(data[:, self.ts_index] >= self.starttimestamp, data[:, self.ts_index] < self.stoptimestamp), :]
+        return data[self.time_mask(data)]
 
+    def time_mask(self, data):
+        """
+        :param data: input data
+        :return: boolean array, True for the lines from starttimestamp up to but not including stoptimestamp
+        """
+        if len(data) == 0:
+            return np.ones(0, dtype=bool)
+        timestamps = self.timestamp_array(data[:, self.ts_index])
+        return (timestamps >= np.datetime64(self.starttimestamp, 'us')) & (timestamps < np.datetime64(self.stoptimestamp, 'us'))
+
+    def preprocess(self, data, in_place=False):
+        """
+        air density correction and all the filter masks in one pass
+
+        Every filter is evaluated once on the corrected data. The filtered datasets are then selected from the
+        corrected data with a combination of the masks, e.g. preprocessed.select('time', 'state') gives the same
+        lines as state_filter_data(time_filter_data(corrected data)).
+
+        :param data: input data
+        :param in_place: correct the wind speed column of data itself instead of a copy
+        :return: PreprocessedData with the masks 'time', 'state', 'temperature' and 'power level'
+        """
+        corrected_data = self.air_density_correction(data, in_place)
+        masks = {'time': self.time_mask(corrected_data),
+                 'state': self.state_mask(corrected_data),
+                 'temperature': self.temperature_mask(corrected_data),
+                 'power level': self.power_level_mask(corrected_data)}
+        return PreprocessedData(corrected_data, masks)
+
+    def preprocess_columns(self, column_data, keep_all=False):
+        """
+        preprocess for data read into typed columns, e.g. from a column store
+
+        The masks are evaluated on the columns. Only the lines that pass the time filter or belong to the reference
+        dataset are converted into the row matrix that the rest of AEPcounter works on, which are all the lines
+        that select and refine_power_curves can return. The result is the same as preprocess(column_data.to_rows())
+        for those lines.
+
+        :param column_data: data_file_handler.ColumnarData
+        :param keep_all: convert every line, e.g. for the plots of the whole dataset
+        :return: PreprocessedData, its size is the number of lines in column_data
+        """
+        masks = {'time': self.time_mask(column_data),
+                 'state': self.state_mask(column_data),
+                 'temperature': self.temperature_mask(column_data),
+                 'power level': self.power_level_mask(column_data)}
+        if keep_all:
+            keep = np.ones(len(column_data), dtype=bool)
+        else:
+            keep = masks['time'] | (masks['state'] & masks['temperature'] & masks['power level'])
+        wind_speed = self.corrected_wind_speed(self.float_column(column_data, self.ws_index)[keep],
+                                               self.float_column(column_data, self.temp_index)[keep])
+        rows = column_data.select(keep).to_rows()
+        rows[:, self.ws_index] = wind_speed
+        return PreprocessedData(rows, {name: mask[keep] for name, mask in masks.items()}, len(column_data))
 
     def expand_array(self, arr, n):
         """
@@ -434,18 +562,13 @@ class AEPcounter:
         :param a: array of wind direction measurements in degrees
         :return: mean of the array
         """
-        y = []
-        x = []
-        for item in a:
-            if not np.isnan(item):
-                y.append(np.sin(np.radians(item)))
-                x.append(np.cos(np.radians(item)))
-
-        if np.size(y) == 0 or np.size(x) == 0:
+        a = np.asarray(a, dtype=float)
+        a = a[~np.isnan(a)]
+        if np.size(a) == 0:
             return np.nan
         else:
-            my = np.nanmean(y)
-            mx = np.nanmean(x)
+            my = np.nanmean(np.sin(np.radians(a)))
+            mx = np.nanmean(np.cos(np.radians(a)))
             angle = np.degrees(np.arctan2(my,mx))
 
             #wd_mean = np.remainder(360.0 + np.degrees(np.arctan2(my,mx)),360.0)
@@ -608,20 +731,97 @@ class AEPcounter:
         :return: a boolean matrix that can be used to mark too small bin as empty
         """
 
-        (x, y, z) = np.shape(pc)
         too_smalls = np.zeros(np.shape(pc)).astype('bool')
-        for speed_bin in range(x):
-            for direction_bin in range(y):
-                if pc[speed_bin, direction_bin, 7] < size_limit:
-                    too_smalls[speed_bin, direction_bin, 2] = True
-                    too_smalls[speed_bin, direction_bin, 3] = True
-                    too_smalls[speed_bin, direction_bin, 4] = True
-                    too_smalls[speed_bin, direction_bin, 5] = True
-                    too_smalls[speed_bin, direction_bin, 6] = True
-                    too_smalls[speed_bin, direction_bin, 8] = True
-                    too_smalls[speed_bin, direction_bin, 9] = True
+        small_bins = pc[:, :, 7] < size_limit
+        for variable_index in [2, 3, 4, 5, 6, 8, 9]:
+            too_smalls[:, :, variable_index] = small_bins
         return too_smalls
 
+    def float_column(self, data, index):
+        """
+        pick one column of the data matrix as a float array
+
+        :param data: input data
+        :param index: index of the wanted column
+        :return: column values as a float array, booleans are converted to 0.0 and 1.0
+        """
+        return np.asarray(data[:, index], dtype=float)
+
+    def direction_bin_indices(self, directions, chunk_size=65536):
+        """
+        pick the index of the closest direction bin for every value in directions
+
+        gives the same result as running np.argmin(np.abs(direction - self.direction_bins)) separately for
+        every value, nan values end up in the first bin. The distance matrix is built in chunks of chunk_size
+        values so that the memory use stays bounded for long time series.
+
+        :param directions: array of wind directions
+        :param chunk_size: number of values processed at once
+        :return: integer array of direction bin indices
+        """
+        directions = np.asarray(directions, dtype=float)
+        dirbins = np.zeros(len(directions), dtype=int)
+        for start in range(0, len(directions), chunk_size):
+            chunk = directions[start:start + chunk_size]
+            dirbins[start:start + chunk_size] = np.argmin(np.abs(chunk[:, np.newaxis] - self.direction_bins), axis=1)
+        return dirbins
+
+    def interpolate_power_curves(self, data, power_curves, columns=(2, 3, 4)):
+        """
+        interpolate values from the power curves for every line in data based on the measured wind speed
+
+        The lines are grouped by their direction bin and every wanted power curve column of a direction sector
+        is interpolated for all the wind speeds in that sector with a single np.interp call.
+
+        :param data: input data
+        :param power_curves: calculated power curves, binned based on wind speed and direction
+        :param columns: power curve columns to interpolate, by default P50, P10 and P90
+        :return: float array of shape (len(data), len(columns)), columns in the order given in columns
+        """
+        if len(data) == 0:
+            return np.empty((0, len(columns)))
+        wind_speeds = self.float_column(data, self.ws_index)
+        dirbins = self.direction_bin_indices(self.float_column(data, self.wd_index))
+        reference = np.empty((len(wind_speeds), len(columns)))
+        order = np.argsort(dirbins, kind='stable')
+        sectors, sector_starts = np.unique(dirbins[order], return_index=True)
+        sector_stops = np.append(sector_starts[1:], len(order))
+        for dirbin, start, stop in zip(sectors, sector_starts, sector_stops):
+            rows = order[start:stop]
+            for i, column in enumerate(columns):
+                reference[rows, i] = np.interp(wind_speeds[rows], power_curves[:, dirbin, 0], power_curves[:, dirbin, column])
+        return reference
+
+    def timestamp_array(self, timestamps):
+        """
+        convert a column of datetime objects into a datetime64 array
+
+        The offsets from the first timestamp are calculated with timedelta arithmetic, which is considerably
+        faster than letting numpy convert every datetime object separately.
+
+        :param timestamps: timestamps of the data
+        :return: datetime64[us] array
+        """
+        return aggregation.to_datetime64(timestamps)
+
+    def continuity_mask(self, timestamps, max_gap=datetime.timedelta(seconds=601)):
+        """
+        check the integrity of the time series
+
+        A timestamp is continuous when both the previous and the next timestamp are closer than max_gap.
+        The first and the last timestamp are never continuous.
+
+        :param timestamps: timestamps of the data
+        :param max_gap: largest accepted time difference between consecutive timestamps
+        :return: boolean array, True where the data is continuous
+        """
+        timestamps = self.timestamp_array(timestamps)
+        continuous = np.zeros(len(timestamps), dtype=bool)
+        if len(timestamps) > 2:
+            short_gaps = np.diff(timestamps) < np.timedelta64(max_gap)
+            continuous[1:-1] = short_gaps[:-1] & short_gaps[1:]
+        return continuous
+
     def theoretical_output_power(self, data, power_curves):
         """
         calculates the theoretical, expected output power based on power curve and measured wind speed
@@ -630,17 +830,17 @@ class AEPcounter:
         :param power_curve:
         :return: rerference power, in structure [timestamp, interpolated reference power, actual measured output power]
         """
-        reference = []
         time_limited_data = self.time_filter_data(data)
-        for line in time_limited_data:
-            dirbin = np.argmin(np.abs(self.direction_bins - line[self.wd_index]))
-            int_pow = np.interp(line[self.ws_index], power_curves[:, dirbin, 0], power_curves[:, dirbin, 2])
-            int_pow_p10 = np.interp(line[self.ws_index], power_curves[:, dirbin, 0], power_curves[:, dirbin, 3])
-            int_pow_p90 = np.interp(line[self.ws_index], power_curves[:, dirbin, 0], power_curves[:, dirbin, 4])
-            uncert_lower_lim = np.interp(line[self.ws_index], power_curves[:, dirbin, 0], power_curves[:, dirbin, 8])
-            uncert_upper_lim = np.interp(line[self.ws_index], power_curves[:, dirbin, 0], power_curves[:, dirbin, 9])
-            reference.append((line[self.ts_index], int_pow, line[self.pow_index], int_pow_p10, int_pow_p90, uncert_lower_lim, uncert_upper_lim))
-        return np.array(reference)
+        if len(time_limited_data) == 0:
+            return np.array([])
+        # P50, P10, P90, lower and upper uncertainty limits
+        interpolated = self.interpolate_power_curves(time_limited_data, power_curves, columns=(2, 3, 4, 8, 9))
+        reference = np.empty((len(time_limited_data), 7), dtype=object)
+        reference[:, 0] = time_limited_data[:, self.ts_index]
+        reference[:, 1] = interpolated[:, 0]
+        reference[:, 2] = time_limited_data[:, self.pow_index]
+        reference[:, 3:] = interpolated[:, 1:]
+        return reference
 
     def calculate_production(self,data,index,delta=datetime.timedelta(seconds=10*60)):
         """
@@ -652,22 +852,34 @@ class AEPcounter:
         :param data: input data, containing the measured output
         :param index: index of the production measurement
         :param delta: difference between two timestamps defaults to ten minutes
-        :return: structure containing [end timestep, production]
-        """
-        output_data = []
-        for i in range(len(data)):
-            if i != 0:
-                # integrity check
-                if ((data[i,0] - data[i-1,0]) > delta) or np.isnan(data[i,index]) or np.isnan(data[i-1,index]) or (data[i,index] <=0.0) or (data[i-1,index] <= 0.0):
-                    prod = 0
-                else:
-                    dur = (data[i,0]-data[i-1,0]).total_seconds()/60.0/60.0 # length in hours
-                    pow_at_start = data[i-1,index]
-                    pow_at_stop = data[i,index]
-                    prod = dur * ((pow_at_start+pow_at_stop) / 2.0)
-                output_data.append((data[i,0],prod))
-        output_datalen = len(output_data)
-        return np.array(output_data)
+        :return: structure containing [end timestep, production] for every line except the first one
+        """
+        if len(data) < 2:
+            return np.zeros((0, 2), dtype=object)
+        output_data = np.empty((len(data) - 1, 2), dtype=object)
+        output_data[:, 0] = data[1:, 0]
+        output_data[:, 1] = self.production_steps(self.timestamp_array(data[:, 0]), self.float_column(data, index), delta)
+        return output_data
+
+    def production_steps(self, timestamps, power, delta=datetime.timedelta(seconds=10*60)):
+        """
+        energy of every step between consecutive timestamps, see calculate_production
+
+        :param timestamps: datetime64 array
+        :param power: float array of power values
+        :param delta: longest accepted step
+        :return: float array with one value less than there are timestamps
+        """
+        if len(timestamps) < 2:
+            return np.zeros(0)
+        durations = np.diff(timestamps)
+        pow_at_start = power[:-1]
+        pow_at_stop = power[1:]
+        # integrity check, nans compare as false so they are caught by the comparisons with 0.0
+        with np.errstate(invalid='ignore'):
+            valid = (durations <= np.timedelta64(delta)) & (pow_at_start > 0.0) & (pow_at_stop > 0.0)
+        hours = durations / np.timedelta64(1, 's') / 60.0 / 60.0 # length in hours
+        return np.where(valid, hours * ((pow_at_start + pow_at_stop) / 2.0), 0.0)
 
     def count_power_curves(self, data):
         """
@@ -709,9 +921,94 @@ class AEPcounter:
         # direction_bins = np.array([0])
         # st_data = self.state_filter_data(data, self.normal_state)
         # ref_data = self.temperature_filter_data(data, temperature_filter_level)
-        pc = np.zeros((len(self.wind_bins), len(self.direction_bins), 10))
-        dir_data = self.put_data_into_bins(data, self.direction_bins, self.wd_index,direction=True)
-        binned_data = self.put_data_into_bins(dir_data, self.wind_bins, self.ws_index)
+        pc = self.binned_statistics(data)
+        return self.finalize_power_curves(pc)
+
+    def bin_indices(self, data, chunk_size=65536):
+        """
+        find the wind speed and wind direction bin of every line in data
+
+        Vectorized version of put_data_into_bins. The wind speed bin is the one with the closest center, the
+        direction bin the one with the smallest chord distance on the unit circle. Lines with nan values end
+        up in the first bin. The distance matrices are built in chunks of chunk_size lines.
+
+        :param data: input data
+        :param chunk_size: number of lines processed at once
+        :return: integer arrays of wind speed bin indices and direction bin indices
+        """
+        if len(data) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        wind_speeds = self.float_column(data, self.ws_index)
+        directions = np.radians(self.float_column(data, self.wd_index))
+        x = np.cos(directions)
+        y = np.sin(directions)
+        bin_x = np.cos(np.radians(self.direction_bins))
+        bin_y = np.sin(np.radians(self.direction_bins))
+        speed_bins = np.zeros(len(data), dtype=int)
+        direction_bins = np.zeros(len(data), dtype=int)
+        for start in range(0, len(data), chunk_size):
+            stop = start + chunk_size
+            speed_bins[start:stop] = np.argmin(np.abs(wind_speeds[start:stop, np.newaxis] - self.wind_bins), axis=1)
+            chord = np.sqrt((x[start:stop, np.newaxis] - bin_x) ** 2 + (y[start:stop, np.newaxis] - bin_y) ** 2)
+            direction_bins[start:stop] = np.argmin(chord, axis=1)
+        return speed_bins, direction_bins
+
+    def sorted_bins(self, data):
+        """
+        sort the lines of data by their wind speed and direction bin
+
+        The contents of every bin are then a contiguous slice of the sorted columns. The result depends only on the
+        data and the bins, it can be shared by power curves calculated with different percentile limits.
+
+        :param data: input data time series
+        :return: bin keys (speed bin * number of direction bins + direction bin) of the non-empty bins, start and
+                 stop of every bin in the sorted columns, sorted wind speeds, directions and powers
+        """
+        speed_bins, direction_bins = self.bin_indices(data)
+        bin_keys = speed_bins * len(self.direction_bins) + direction_bins
+        order = np.argsort(bin_keys, kind='stable')
+        keys, bin_starts = np.unique(bin_keys[order], return_index=True)
+        bin_stops = np.append(bin_starts[1:], len(order))
+        wind_speeds = self.float_column(data, self.ws_index)[order]
+        directions = self.float_column(data, self.wd_index)[order]
+        powers = self.float_column(data, self.pow_index)[order]
+        return keys, bin_starts, bin_stops, wind_speeds, directions, powers
+
+    def binned_statistics(self, data, binned=None):
+        """
+        bin the data according to wind speed and direction and calculate the statistics of every bin
+
+        The lines are sorted once by their bin, after which the contents of every bin are a contiguous
+        slice of the sorted data. Empty bins get the bin center as wind speed and direction and nan
+        (0 for the lowest wind speed bin) for the other values.
+
+        :param data: input data time series
+        :param binned: sorted_bins of data if already calculated
+        :return pc: unfiltered power curve matrix with the same layout as returned by count_power_curves
+        """
+        pc = self.empty_power_curves()
+        if len(data) == 0:
+            return pc
+        if binned is None:
+            binned = self.sorted_bins(data)
+        keys, bin_starts, bin_stops, wind_speeds, directions, powers = binned
+        for key, start, stop in zip(keys, bin_starts, bin_stops):
+            speed_bin_index, direction_bin_index = divmod(key, len(self.direction_bins))
+            self.bin_statistics(pc[speed_bin_index, direction_bin_index], wind_speeds[start:stop],
+                                directions[start:stop], powers[start:stop])
+        return pc
+
+    def bin_statistics(self, bin_pc, bin_speeds, bin_directions, bin_powers):
+        """
+        calculate the statistics of one power curve bin
+
+        :param bin_pc: the values of the bin in the power curve matrix, set in place
+        :param bin_speeds: wind speeds of the lines in the bin
+        :param bin_directions: wind directions of the lines in the bin
+        :param bin_powers: powers of the lines in the bin
+        """
+        # scipy takes a good while to import, only load it when power curves are actually calculated
+        import scipy.stats as ss
         wind_speed_index = 0
         wind_dir_index = 1
         power_index = 2
@@ -719,71 +1016,76 @@ class AEPcounter:
         high_limit_index = 4
         bin_standard_dev_index = 5
         bin_uncertainty = 6
+        bin_size_index = 7
+        bin_uncertainty_lower_lim_index = 8
+        bin_uncertainty_upper_lim_index = 9
+        value_indexes = [power_index, low_limit_index, high_limit_index, bin_standard_dev_index, bin_uncertainty,
+                         bin_uncertainty_lower_lim_index, bin_uncertainty_upper_lim_index]
+        # suppress runtime errors caused by bins with nothing but nans
+        if np.isnan(bin_speeds).all():
+            bin_pc[wind_speed_index] = np.nan
+        else:
+            bin_pc[wind_speed_index] = np.nanmedian(bin_speeds)
+        bin_pc[wind_dir_index] = self.wind_dir_mean(bin_directions)
+        if np.isnan(bin_powers).all():
+            bin_pc[value_indexes] = np.nan
+        else:
+            mean_power = np.nanmedian(bin_powers)
+            power_std_dev = np.nanstd(bin_powers)
+            bin_pc[power_index] = mean_power
+            bin_pc[low_limit_index] = ss.scoreatpercentile(bin_powers, self.pc_low_limit)
+            bin_pc[high_limit_index] = ss.scoreatpercentile(bin_powers, self.pc_high_limit)
+            bin_pc[bin_standard_dev_index] = power_std_dev
+            # divide by zero possible
+            if mean_power != 0.0:
+                bin_pc[bin_uncertainty] = power_std_dev / mean_power * 100.0
+            else:
+                bin_pc[bin_uncertainty] = 0.0
+            # upper and lower limits needed for production uncertainty
+            bin_pc[bin_uncertainty_lower_lim_index] = max(0.0, mean_power - power_std_dev)
+            # prevent upper liimt from going below lower limit
+            if mean_power > self.rated_power:
+                power_upper_limit = mean_power + power_std_dev
+            else:
+                power_upper_limit = min(mean_power + power_std_dev, self.rated_power)
+            bin_pc[bin_uncertainty_upper_lim_index] = power_upper_limit
+        bin_pc[bin_size_index] = len(bin_powers)
+
+    def empty_power_curves(self):
+        """
+        create a power curve matrix where every bin is empty
+
+        Empty bins get the bin center as wind speed and direction and nan for the other values.
+        Power is forced to 0 in the lowest wind speed bin, which helps with interpolation
+        and other tricks used to cover missing data.
+
+        :return pc: power curve matrix with the same layout as returned by count_power_curves
+        """
+        value_indexes = [2, 3, 4, 5, 6, 8, 9]
+        pc = np.zeros((len(self.wind_bins), len(self.direction_bins), 10))
+        pc[:, :, 0] = self.wind_bins[:, np.newaxis]
+        pc[:, :, 1] = self.direction_bins[np.newaxis, :]
+        pc[:, :, value_indexes] = np.nan
+        pc[0, :, value_indexes] = 0
+        return pc
+
+    def finalize_power_curves(self, pc):
+        """
+        filter the binned power curves and fill the gaps left by empty bins
+
+        bins with too few measurements are emptied, the missing values are interpolated over and
+        if there are several direction bins, obviously wrong values are replaced by the distance filter
+
+        :param pc: power curve matrix as returned by binned_statistics
+        :return pc: final power curves
+        """
+        power_index = 2
+        low_limit_index = 3
+        high_limit_index = 4
+        bin_standard_dev_index = 5
+        bin_uncertainty = 6
         bin_uncertainty_lower_lim_index = 8
         bin_uncertainty_upper_lim_index = 9
-        bin_size_index = 7
-        #print(binned_data)
-        for speed_bin_index in range(len(self.wind_bins)):
-            for direction_bin_index in range(len(self.direction_bins)):
-                bin_contents = self.fetch_bin_contents_2d(binned_data, -1, speed_bin_index, -2, direction_bin_index)
-                if bin_contents.size == 0:
-                    pc[speed_bin_index, direction_bin_index, wind_speed_index] = self.wind_bins[speed_bin_index]
-                    pc[speed_bin_index, direction_bin_index, wind_dir_index] = self.direction_bins[direction_bin_index]
-                    # force power to be 0 at wind speed 0, helps with interpolation
-                    # and other tricks used to cover missing data
-                    if speed_bin_index == 0:
-                        replacement = 0
-                    else:
-                        replacement = np.nan
-                    pc[speed_bin_index, direction_bin_index, power_index] = replacement
-                    pc[speed_bin_index, direction_bin_index, low_limit_index] = replacement
-                    pc[speed_bin_index, direction_bin_index, high_limit_index] = replacement
-                    pc[speed_bin_index, direction_bin_index, bin_standard_dev_index] = replacement
-                    pc[speed_bin_index, direction_bin_index, bin_uncertainty] = replacement
-                    pc[speed_bin_index, direction_bin_index, bin_uncertainty_lower_lim_index] = replacement
-                    pc[speed_bin_index, direction_bin_index, bin_uncertainty_upper_lim_index] = replacement
-                    pc[speed_bin_index, direction_bin_index, bin_size_index] = bin_contents.size
-                else:
-                    # suppress runtime errors caused by bins with nothing but nans
-                    if np.isnan(bin_contents[:, self.ws_index].astype('float')).all():
-                        pc[speed_bin_index, direction_bin_index, wind_speed_index] = np.nan
-                    else:
-                        pc[speed_bin_index, direction_bin_index, wind_speed_index] = np.nanmedian(bin_contents[:, self.ws_index].astype('float'))
-                    if np.isnan(bin_contents[:, self.wd_index].astype('float')).all():
-                        pc[speed_bin_index, direction_bin_index, wind_dir_index] = np.nan
-                    else:
-                        pc[speed_bin_index, direction_bin_index, wind_dir_index] = self.wind_dir_mean(bin_contents[:, self.wd_index].astype('float'))
-                    if np.isnan(bin_contents[:, self.pow_index].astype('float')).all():
-                        pc[speed_bin_index, direction_bin_index, power_index] = np.nan
-                        pc[speed_bin_index, direction_bin_index, low_limit_index] = np.nan
-                        pc[speed_bin_index, direction_bin_index, high_limit_index] = np.nan
-                        pc[speed_bin_index, direction_bin_index, bin_standard_dev_index] = np.nan
-                        pc[speed_bin_index, direction_bin_index, bin_uncertainty] = np.nan
-                        pc[speed_bin_index, direction_bin_index, bin_uncertainty_lower_lim_index] = np.nan
-                        pc[speed_bin_index, direction_bin_index, bin_uncertainty_upper_lim_index] = np.nan
-                    else:
-                        #pc[speed_bin_index, direction_bin_index, power_index] = np.nanmean(bin_contents[:, self.pow_index].astype('float'))
-                        mean_power = np.nanmedian(bin_contents[:, self.pow_index].astype('float'))
-                        power_std_dev = np.nanstd(bin_contents[:, self.pow_index].astype('float'))
-                        pc[speed_bin_index, direction_bin_index, power_index] = mean_power
-                        pc[speed_bin_index, direction_bin_index, low_limit_index] = ss.scoreatpercentile(bin_contents[:, self.pow_index], self.pc_low_limit)
-                        pc[speed_bin_index, direction_bin_index, high_limit_index] = ss.scoreatpercentile(bin_contents[:, self.pow_index], self.pc_high_limit)
-                        pc[speed_bin_index, direction_bin_index, bin_standard_dev_index] = power_std_dev
-                        # divide by zero possible
-                        if pc[speed_bin_index, direction_bin_index, power_index] != 0.0:
-                            pc[speed_bin_index, direction_bin_index, bin_uncertainty] = power_std_dev / mean_power * 100.0
-                        else:
-                            pc[speed_bin_index, direction_bin_index, bin_uncertainty] = 0.0
-                        # upper and lower limits needed for production uncertainty
-                        pc[speed_bin_index, direction_bin_index, bin_uncertainty_lower_lim_index] = max(0.0, mean_power - power_std_dev)
-                        # prevent upper liimt from going below lower limit
-                        if mean_power > self.rated_power:
-                            power_upper_limit = mean_power + power_std_dev
-                        else:
-                            power_upper_limit = min(mean_power + power_std_dev, self.rated_power)
-                        pc[speed_bin_index, direction_bin_index, bin_uncertainty_upper_lim_index] = power_upper_limit
-                    bin_rows, bin_columns = bin_contents.shape
-                    pc[speed_bin_index, direction_bin_index, bin_size_index] = bin_rows
 
         #TODO:
             # make filtering optional, on by default
@@ -893,24 +1195,72 @@ class AEPcounter:
         :param window: length of hte filtering window
         :return data: reformatted data, with individual events removed
         """
-        max_index = len(data)-window
-        data_index = 0
-        while data_index < max_index:
-            consecutive_alarms = 0
-            try:
-                while data[data_index + consecutive_alarms, 1] != 0:
-                    consecutive_alarms += 1
-            except IndexError:  # would raise error if this reaches the final index in the data, we can ignore this
-                pass
-            if consecutive_alarms > 0:
-                if consecutive_alarms < window:
-                    data[data_index:(data_index + consecutive_alarms), 1] = 0
-                data_index += consecutive_alarms
-            else:
-                data_index += 1
+        if len(data) == 0:
+            return data
+        run_starts, run_stops = self.alarm_runs(data[:, 1])
+        # runs beginning within the last window samples are left as they are
+        short_runs = (run_stops - run_starts < window) & (run_starts < len(data) - window)
+        data[self.runs_to_mask(run_starts[short_runs], run_stops[short_runs], len(data)), 1] = 0
         return data
 
-    def power_alarms(self, data, power_curves, time_filter=True, over=False):
+    def alarm_runs(self, flags):
+        """
+        find the runs of consecutive non-zero values in an alarm flag vector
+
+        :param flags: alarm flags, e.g. the alarm column of the data produced by power_alarms
+        :return: index of the first sample of every run and the index after the last sample of every run
+        """
+        active = np.asarray(flags != 0, dtype=bool)
+        edges = np.diff(np.concatenate(([False], active, [False])).astype(np.int8))
+        return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    def runs_to_mask(self, run_starts, run_stops, length):
+        """
+        convert non-overlapping runs into a boolean mask
+
+        :param run_starts: index of the first sample of every run
+        :param run_stops: index after the last sample of every run
+        :param length: length of the mask
+        :return: boolean array, True inside the runs
+        """
+        edges = np.zeros(length + 1, dtype=int)
+        np.add.at(edges, run_starts, 1)
+        np.add.at(edges, run_stops, -1)
+        return np.cumsum(edges[:-1]) > 0
+
+    def segment_sums(self, values, starts, stops):
+        """
+        sum values[start:stop] for every pair of starts and stops with one indexed reduction
+
+        :param values: float array
+        :param starts: start indexes of the segments
+        :param stops: stop indexes of the segments, every segment must be non-empty
+        :return: float array of segment sums
+        """
+        if len(starts) == 0:
+            return np.zeros(0, dtype=values.dtype)
+        # pad so that a segment may end at the very end of values
+        padded = np.append(values, np.zeros(1, dtype=values.dtype))
+        bounds = np.column_stack((starts, stops)).ravel()
+        return np.add.reduceat(padded, bounds)[::2]
+
+    def segment_nanmeans(self, values, starts, stops):
+        """
+        mean of the non-nan values in values[start:stop] for every pair of starts and stops
+
+        :param values: float array
+        :param starts: start indexes of the segments
+        :param stops: stop indexes of the segments, every segment must be non-empty
+        :return: array of segment means in the dtype of values, nan for segments with nothing but nans
+        """
+        valid = ~np.isnan(values)
+        sums = self.segment_sums(np.where(valid, values, 0.0), starts, stops)
+        counts = self.segment_sums(valid.astype(int), starts, stops)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts > 0, sums / counts, np.nan)
+        return means.astype(values.dtype)
+
+    def power_alarms(self, data, power_curves, time_filter=True, over=False, reference=None):
         """
         flag timestamps that match wanted power alarm criteria.
 
@@ -940,46 +1290,38 @@ class AEPcounter:
         :param time_filter: if True, an additional time filter is applied to the data
         :param time_filter_length: number of consecutive values below the alarm limit required to trigger the icing alarm
         :param over: if True, flags the timestamps where the power is above P90 instead
+        :param reference: P50, P10 and P90 values interpolated for data by interpolate_power_curves, calculated
+            here if not given. Allows sharing the interpolation between the P10 and P90 checks.
         :return: an array of the format [timestamp, alarm, wind speed, reference power, temperature, power, limit]
         """
-        pow_alarms = []
-        timed = datetime.timedelta(seconds=601)
-        for index,line in enumerate(data):
-            # integrity check for the data
-            if (index != 0) and (index != len(data)-1):
-                continuous = (line[self.ts_index] - data[index-1,self.ts_index]) < timed and (data[index+1,self.ts_index] - line[self.ts_index]) < timed
-            else:
-                continuous = False
-            # pick index of active direction bin
-            dirbin = np.argmin(np.abs(line[self.wd_index]-self.direction_bins))
-            # pick the active wind speed bin
-            windbin = np.argmin(np.abs(line[self.ws_index]-self.wind_bins))
-            #wind and power at active bin
-
-            # interpolate the value from power and limit (P10) curve to matches the current wind speed
-            # np.interp does piecewise linear interpolation that can be assumed to be good enough in this
-            # case. The power curve is close to linear between any two bins
-            if over:
-                int_lim = np.interp(line[self.ws_index], power_curves[:, dirbin, 0], power_curves[:, dirbin, 4])
-            else:
-                int_lim = np.interp(line[self.ws_index], power_curves[:, dirbin, 0], power_curves[:, dirbin, 3])
-            int_pow = np.interp(line[self.ws_index], power_curves[:, dirbin, 0], power_curves[:, dirbin, 2])
-
-            if continuous:
-                if over:
-                    if (line[self.pow_index] >= int_lim) and (line[self.temp_index] <= self.icing_temperature_limit):
-                        pow_alrm = 3.0
-                    else:
-                        pow_alrm = 0.0
-                else:
-                    if (line[self.pow_index] <= int_lim) and (line[self.temp_index] <= self.icing_temperature_limit):
-                        pow_alrm = 1.0
-                    else:
-                        pow_alrm = 0.0
-            else:
-                pow_alrm = 0.0
-            pow_alarms.append((line[self.ts_index], pow_alrm, line[self.ws_index], int_pow, line[self.temp_index], line[self.pow_index], int_lim))
-        alarms = np.array(pow_alarms)
+        if len(data) == 0:
+            return np.array([])
+        if reference is None:
+            reference = self.interpolate_power_curves(data, power_curves)
+        power = self.float_column(data, self.pow_index)
+        # interpolate the value from power and limit (P10) curve to matches the current wind speed
+        # np.interp does piecewise linear interpolation that can be assumed to be good enough in this
+        # case. The power curve is close to linear between any two bins
+        int_pow = reference[:, 0]
+        if over:
+            int_lim = reference[:, 2]
+            alarm_value = 3.0
+            flagged = power >= int_lim
+        else:
+            int_lim = reference[:, 1]
+            alarm_value = 1.0
+            flagged = power <= int_lim
+        flagged &= self.float_column(data, self.temp_index) <= self.icing_temperature_limit
+        # integrity check for the data
+        flagged &= self.continuity_mask(data[:, self.ts_index])
+        alarms = np.empty((len(data), 7), dtype=object)
+        alarms[:, 0] = data[:, self.ts_index]
+        alarms[:, 1] = np.where(flagged, alarm_value, 0.0)
+        alarms[:, 2] = data[:, self.ws_index]
+        alarms[:, 3] = int_pow
+        alarms[:, 4] = data[:, self.temp_index]
+        alarms[:, 5] = data[:, self.pow_index]
+        alarms[:, 6] = int_lim
         if time_filter:
             filtered_alarms = self.timefilter_ice_alarms(alarms, self.icing_time)
             return filtered_alarms
@@ -1000,85 +1342,75 @@ class AEPcounter:
         """
 
         datalen = np.shape(data)[0]
-        alarm_stats = []
-        if datalen > 0:
-            # calculate the times when the alarm changes on and off
-            # numpy.diff calculates array[n+1] - array[n]
-            alarm_diff = np.diff(data[:, 1])
-            # pad a zero to the beginning, unless data[0] is an alarm
-            if data[0,1] != 0.0:
-                alarm_diff = np.hstack((np.array(1), alarm_diff))
+        if datalen == 0:
+            return np.array([], dtype=object)
+        # calculate the times when the alarm changes on and off
+        # numpy.diff calculates array[n+1] - array[n]
+        alarm_diff = np.diff(self.float_column(data, 1))
+        # pad a zero to the beginning, unless data[0] is an alarm
+        if data[0,1] != 0.0:
+            alarm_diff = np.hstack((np.array(1), alarm_diff))
+        else:
+            alarm_diff = np.hstack((np.array(0), alarm_diff))
+
+        # now icing starts at indexes where diff == 1 and stops when diff == -1
+        start_indexes = np.flatnonzero(alarm_diff > 0)
+        stop_indexes = np.flatnonzero(alarm_diff < 0)
+        event_count = min(len(start_indexes), len(stop_indexes))
+        start_indexes = start_indexes[:event_count]
+        stop_indexes = stop_indexes[:event_count]
+
+        timestamps = self.timestamp_array(data[:, 0])
+        bad_timings = (timestamps[start_indexes] > timestamps[stop_indexes]) | (start_indexes >= stop_indexes)
+        for index in np.flatnonzero(bad_timings):
+            e = TimingError(data[start_indexes[index], 0], data[stop_indexes[index], 0], index)
+            print("Start after stop at index {0} in {1}".format(e.index, self.id))
+            print("start: {0}; stop: {1}".format(e.start.strftime(e.dateformat), e.stop.strftime(e.dateformat)))
+        start_indexes = start_indexes[~bad_timings]
+        stop_indexes = stop_indexes[~bad_timings]
+        if len(start_indexes) == 0:
+            return np.array([], dtype=object)
+
+        # step durations in hours, step i is the step between samples i and i+1
+        step_seconds = np.diff(timestamps).astype(np.int64) / 1e6
+        step_duration = step_seconds / 60.0 / 60.0
+        reference = self.float_column(data, 3)
+        power = self.float_column(data, 5)
+        loss = reference - power
+        # integrate the losses using trapezoidal rule, if either end of a step is np.nan the step adds a zero
+        valid_steps = ~(np.isnan(loss[:-1]) | np.isnan(loss[1:]))
+        loss_steps = np.where(valid_steps, step_duration * ((loss[:-1] + loss[1:]) / 2.0), 0.0)
+        # every event is integrated up to the first sample after the alarm
+        loss_sums = self.segment_sums(loss_steps, start_indexes, stop_indexes)
+
+        mean_power_drop = self.segment_nanmeans(reference.astype(np.float32) - power.astype(np.float32), start_indexes, stop_indexes)
+        mean_power = self.segment_nanmeans(power.astype(np.float32), start_indexes, stop_indexes)
+        mean_reference_power = self.segment_nanmeans(reference.astype(np.float32), start_indexes, stop_indexes)
+        mean_wind_speed = self.segment_nanmeans(self.float_column(data, 2).astype(np.float32), start_indexes, stop_indexes)
+        mean_temperature = self.segment_nanmeans(self.float_column(data, 4).astype(np.float32), start_indexes, stop_indexes)
+        event_length = (timestamps[stop_indexes] - timestamps[start_indexes]).astype(np.int64) / 1e6 / 60.0 / 60.0
+
+        alarm_stats = np.empty((len(start_indexes), 10 if ips_alarm else 9), dtype=object)
+        alarm_stats[:, 0] = data[start_indexes, 0]
+        alarm_stats[:, 1] = data[stop_indexes, 0]
+        alarm_stats[:, 2] = loss_sums
+        alarm_stats[:, 3] = event_length
+        # lists keep the means as float32 values
+        alarm_stats[:, 4] = list(mean_power_drop)
+        alarm_stats[:, 5] = list(mean_power)
+        alarm_stats[:, 6] = list(mean_reference_power)
+        alarm_stats[:, 7] = list(mean_wind_speed)
+        alarm_stats[:, 8] = list(mean_temperature)
+        if ips_alarm:
+            if self.heating_power_index < 0:
+                alarm_stats[:, 9] = 0.0
             else:
-                alarm_diff = np.hstack((np.array(0), alarm_diff))
-
-
-            # now icing starts at times when diff == 1 and stops when diff == -1
-            starts = data[alarm_diff > 0, 0]
-            stops = data[alarm_diff < 0, 0]
+                ips_power = self.float_column(data, 7)
+                ips_steps = np.where(valid_steps, step_duration * ((ips_power[:-1] + ips_power[1:]) / 2.0), 0.0)
+                alarm_stats[:, 9] = self.segment_sums(ips_steps, start_indexes, stop_indexes)
+        return alarm_stats
 
-            num_starts = len(starts)
-            num_stops = len(stops)
-
-            max_index = min((num_starts, num_stops))
-            index = 0
-
-            # sort starts and stops into an array
-            try:
-                while (index < max_index) and (datalen > 0):
-                    try:
-                        starttime = starts[index]
-                        stoptime = stops[index]
-                        if starttime > stoptime:
-                            raise TimingError(starttime,stoptime,index)
-
-                        # pull thecorresponding start and stoptimes from real data
-                        start_index = np.argmin(np.abs(data[:, 0]-starttime))
-                        stop_index = np.argmin(np.abs(data[:, 0]-stoptime))
-
-                        loss_sum = 0
-                        ips_sum = 0
-                        for i in range(start_index, stop_index, 1):
-                            # step duration in hours
-                            step_duration = (data[i+1, 0]-data[i, 0]).total_seconds()/60.0/60.0
-                            loss_at_start = data[i, 3]-data[i, 5]
-                            loss_at_stop = data[i+1, 3]-data[i+1, 5]
-                            # if either of these is np.nan add a zero to the loss sum
-                            if np.isnan(loss_at_start) or np.isnan(loss_at_stop):
-                                loss_sum += 0.0
-                                if ips_alarm:
-                                    ips_sum += 0
-                            else:
-                                # integrate the losses using trapezoidal rule
-                                loss_sum += step_duration * ((loss_at_start + loss_at_stop)/2.0)
-                                if ips_alarm:
-                                    ips_sum += step_duration * ((data[i,7] + data[i+1,7])/2.0)
-                        mean_power_drop = np.nanmean(data[start_index:stop_index,3].astype(np.float32)-data[start_index:stop_index,5].astype(np.float32))
-                        mean_power = np.nanmean(data[start_index:stop_index,5].astype(np.float32))
-                        mean_reference_power = np.nanmean(data[start_index:stop_index,3].astype(np.float32))
-                        mean_wind_speed = np.nanmean(data[start_index:stop_index,2].astype(np.float32))
-                        mean_temperature = np.nanmean(data[start_index:stop_index,4].astype(np.float32))
-                        event_length = (data[stop_index,0]- data[start_index,0]).total_seconds()/60.0/60.0
-                        #alarm_stats.append((starttime, stoptime, loss_sum, event_length , mean_power_drop, mean_power, mean_reference_power, mean_wind_speed, mean_temperature))
-                        if ips_alarm:
-                            if self.heating_power_index < 0:
-                                alarm_stats.append((starttime, stoptime, loss_sum, event_length , mean_power_drop, mean_power, mean_reference_power, mean_wind_speed, mean_temperature ,0.0))
-                            else:
-                                alarm_stats.append((starttime, stoptime, loss_sum, event_length , mean_power_drop, mean_power, mean_reference_power, mean_wind_speed, mean_temperature,ips_sum))
-                        else:
-                            alarm_stats.append((starttime, stoptime, loss_sum, event_length , mean_power_drop, mean_power, mean_reference_power, mean_wind_speed, mean_temperature))
-                    except TimingError as e:
-                        import pdb;pdb.set_trace()
-                        print("Start after stop at index {0} in {1}".format(e.index, self.id))
-                        print("start: {0}; stop: {1}".format(e.start.strftime(e.dateformat), e.stop.strftime(e.dateformat)))
-                    index += 1
-            except IndexError:
-                print("out of bounds at index: {0}".format(index))
-                print("num starts: {0}; num stops: {1}".format(num_starts, num_stops))
-
-
-        return np.array(alarm_stats, dtype=object)
-
-    def air_density_correction(self, data):
+    def air_density_correction(self, data, in_place=False):
         """
         Calculate air density correction for wind speed according to specifications in the IEA document
         returns a new array with corrected wind speed in place of the measured one
@@ -1094,30 +1426,34 @@ class AEPcounter:
         | temp_std is the standard temperature of 15 C (288.15 K)
         | h is site height in meters
 
-        :param data:
+        :param data: input data
+        :param in_place: overwrite the wind speed column of data instead of correcting a copy
         :return: corrected data
         """
 
-        p_std = 101325
+        corrected_data = data if in_place else data.copy()
+        if len(data) == 0:
+            return corrected_data
+        corrected_data[:, self.ws_index] = self.corrected_wind_speed(self.float_column(data, self.ws_index),
+                                                                     self.float_column(data, self.temp_index))
+        return corrected_data
+
+    def corrected_wind_speed(self, wind_speed, temperature):
+        """
+        air density corrected wind speed, see air_density_correction
+
+        :param wind_speed: measured wind speeds as a float array
+        :param temperature: temperatures of the same lines
+        :return: corrected wind speeds, nan where the correction cannot be calculated
+        """
         temp_std = 288.15
         kelvin = 273.15
-        new_data = []
-        for i, line in enumerate(data):
-            new_line = []
-            for j, item in enumerate(line):
-                if j != self.ws_index:
-                    new_line.append(item)
-                else:
-                    # density_correction = ((line[self.temp_index]+kelvin)*p_std)/(temp_std*(p_std*((1-self.site_elevation*2.2557e-5)**5.25588)))
-                    density_correction = (temp_std/(line[self.temp_index]+kelvin))*((1-self.site_elevation*2.2557e-5)**5.25588)
-                    if np.isnan(density_correction):
-                        ws_site = np.nan
-                    else:
-                        sign = np.sign(density_correction)
-                        ws_site = line[self.ws_index] * sign * (np.abs(density_correction))**(1/3)
-                    new_line.append(ws_site)
-            new_data.append(new_line)
-        return np.array(new_data)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # density_correction = ((temperature+kelvin)*p_std)/(temp_std*(p_std*((1-self.site_elevation*2.2557e-5)**5.25588)))
+            density_correction = (temp_std / (temperature + kelvin)) * ((1 - self.site_elevation * 2.2557e-5) ** 5.25588)
+            ws_site = wind_speed * np.sign(density_correction) * np.abs(density_correction) ** (1 / 3)
+        ws_site[np.isnan(density_correction)] = np.nan
+        return ws_site
 
     def count_availability(self, data):
         """
@@ -1146,7 +1482,7 @@ class AEPcounter:
 
 
 
-    def find_icing_related_stops(self, data, power_curve):
+    def find_icing_related_stops(self, data, power_curve, time_filter=True):
         """
         Finds timestamps from the data, when the turbine has stopped for whatever reason
 
@@ -1158,33 +1494,29 @@ class AEPcounter:
 
         :param data: timeseries data of output
         :param power_curve: power curve array used
+        :param time_filter: if True, stops shorter than self.stop_time are discarded
         :return: filtered data with stops flagged
         """
-        filtered_data = []
         stop_limit = self.stop_level * self.rated_power
         # [timestamp, alarm, wind speed, reference power, temperature, power]
         pow_alarms = self.power_alarms(data, power_curve, False) # do time filtering only once
-        for index, line in enumerate(pow_alarms):
-            # if (line[1] == 1) and (line[5] <= stop_limit) and (line[3] >= stop_limit):
-            #     line[1] = 2.0
-            # power level filter is here to avoid double classifying points to two different classes
-            if (line[1] == 1) and (line[5] <= (self.rated_power * self.power_level_filter_limit)):
-            # change this to look forward so tha tif the turbine will stop within a window of mark also the points where we
-            # are above the stop limit to belonging into the stop
-                stops = 0
-                for i in range(index, min(len(pow_alarms), index+self.stop_time)):
-                    templine = pow_alarms[i, :]
-                    if (templine[5] <= stop_limit) and (templine[3] >= stop_limit):
-                        stops += 1
-                if stops > 0:
-                    line[1] = 2.0
-                else:
-                    line[1] = 0
-            else:
-                line[1] = 0
-            filtered_data.append(line)
-
-        time_filtered_data = self.timefilter_ice_alarms(np.array(filtered_data), self.stop_time)
+        if len(pow_alarms) == 0:
+            return pow_alarms
+        power = self.float_column(pow_alarms, 5)
+        # power level filter is here to avoid double classifying points to two different classes
+        candidates = (self.float_column(pow_alarms, 1) == 1) & (power <= (self.rated_power * self.power_level_filter_limit))
+        # look forward so that if the turbine will stop within a window of stop_time samples mark also the points
+        # where we are above the stop limit to belonging into the stop
+        stopped = (power <= stop_limit) & (self.float_column(pow_alarms, 3) >= stop_limit)
+        stopped_count = np.concatenate(([0], np.cumsum(stopped)))
+        window_ends = np.minimum(np.arange(len(pow_alarms)) + self.stop_time, len(pow_alarms))
+        stops_ahead = stopped_count[window_ends] - stopped_count[:len(pow_alarms)]
+        pow_alarms[:, 1] = 0
+        pow_alarms[candidates & (stops_ahead > 0), 1] = 2.0
+        if not time_filter:
+            return pow_alarms
+
+        time_filtered_data = self.timefilter_ice_alarms(pow_alarms, self.stop_time)
         return time_filtered_data
 
     def status_code_stops(self, data, power_curves, filter_type="stop"):
@@ -1195,64 +1527,78 @@ class AEPcounter:
         :param data: input data to be processed
         :return [timestamp, alarm, wind speed, reference power, temperature, power, limit]:
         """
-        output = []
-        for line in data:
-            flag = False
-            # for item in self.ice_stop_index:
-            #     if line[item] in self.stopcodes:
-            #         flag = True
-            if filter_type == 'stop':
-                # if (self.stop_filter_type == 2 and line[self.status_stop_index] not in self.stopcodes) or \
-                #         (self.stop_filter_type == 1 and line[self.status_stop_index] in self.stopcodes):
-                #     flag = True
-                if self.stop_filter_type == 2:
-                    flag = any([line[i] not in self.stopcodes for i in self.status_stop_index])
-                elif self.stop_filter_type == 1:
-                    flag = any([line[i] in self.stopcodes for i in self.status_stop_index])
-                else:
-                    pass
-            elif filter_type == 'ips':
-                # if (self.heating_status_type == 2 and line[self.heating_status_index] != self.heating_status_value) or \
-                #         (self.heating_status_type == 1 and line[self.heating_status_index] == self.heating_status_value):
-                #     flag=True
-                if self.heating_status_type == 2:
-                    flag = any([line[i] not in self.heating_status_value for i in self.heating_status_index])
-                elif self.heating_status_type == 1:
-                    flag = any([line[i] in self.heating_status_value for i in self.heating_status_index])
-                else:
-                    pass
-            elif filter_type == 'icing':
-                if line[self.ice_alarm_index] == self.ice_alarm_value:
-                    flag = True
-            output_line =[]
-            output_line.append(line[self.ts_index]) # 0
-            if flag:
-                if filter_type == 'stop':
-                    output_line.append(4.0)
-                elif filter_type == 'ips':
-                    output_line.append(5.0)
-                elif filter_type == 'icing':
-                    output_line.append(6.0)
+        if len(data) == 0:
+            return np.array([])
+        flagged = np.zeros(len(data), dtype=bool)
+        if filter_type == 'stop':
+            if self.stop_filter_type == 2:
+                flagged = self.status_code_flags(data, self.status_stop_index, self.stopcodes, False)
+            elif self.stop_filter_type == 1:
+                flagged = self.status_code_flags(data, self.status_stop_index, self.stopcodes, True)
+            alarm_value = 4.0
+        elif filter_type == 'ips':
+            if self.heating_status_type == 2:
+                flagged = self.status_code_flags(data, self.heating_status_index, self.heating_status_value, False)
+            elif self.heating_status_type == 1:
+                flagged = self.status_code_flags(data, self.heating_status_index, self.heating_status_value, True)
+            alarm_value = 5.0
+        elif filter_type == 'icing':
+            flagged = self.float_column(data, self.ice_alarm_index) == self.ice_alarm_value
+            alarm_value = 6.0
+        else:
+            alarm_value = 0.0
+        reference = self.interpolate_power_curves(data, power_curves, columns=(2, 3))
+        output = np.empty((len(data), 8 if filter_type == 'ips' else 7), dtype=object)
+        output[:, 0] = data[:, self.ts_index]
+        output[:, 1] = np.where(flagged, alarm_value, 0.0)
+        output[:, 2] = data[:, self.ws_index]
+        output[:, 3] = reference[:, 0]
+        output[:, 4] = data[:, self.temp_index]
+        output[:, 5] = data[:, self.pow_index]
+        output[:, 6] = reference[:, 1]
+        if filter_type == 'ips':
+            if self.heating_power_index < 0:
+                output[:, 7] = 0.0
             else:
-                output_line.append(0.0) # 1
-            output_line.append(line[self.ws_index]) # 2
-            # pick index of active direction bin
-            dirbin = np.argmin(np.abs(line[self.wd_index] - self.direction_bins))
-            int_lim = np.interp(line[self.ws_index], power_curves[:, dirbin, 0], power_curves[:, dirbin, 3])
-            int_pow = np.interp(line[self.ws_index], power_curves[:, dirbin, 0], power_curves[:, dirbin, 2])
-            output_line.append(int_pow) # 3
-            output_line.append(line[self.temp_index]) # 4
-            output_line.append(line[self.pow_index]) # 5
-            output_line.append(int_lim) # 6
-            if filter_type == 'ips':
-                if self.heating_power_index < 0:
-                    output_line.append(0.0)
-                else:
-                    output_line.append(line[self.heating_power_index]) # 7
-            output.append(np.array(output_line))
-        return np.array(output)
+                output[:, 7] = data[:, self.heating_power_index]
+        return output
 
-    def combine_timeseries(self, pow_alms1,stops,pow_alms2):
+    def status_code_flags(self, data, indexes, codes, inclusive):
+        """
+        flag the lines of data where any of the status columns matches the given codes
+
+        :param data: input data
+        :param indexes: indexes of the status columns
+        :param codes: list of status codes
+        :param inclusive: if True, flag the lines where any status is in codes, otherwise
+            flag the lines where any status is not in codes
+        :return: boolean array of flags
+        """
+        flagged = np.zeros(len(data), dtype=bool)
+        code_set = fault_codes.CodeSet(codes)
+        for index in indexes:
+            in_codes = code_set.contains(self.float_column(data, index))
+            flagged |= in_codes if inclusive else ~in_codes
+        return flagged
+
+    def align_alarms(self, data, pc, series):
+        """
+        align alarm and flag series on the lines of data
+
+        :param data: time limited data, every series has to be calculated from a subset of its lines
+        :param pc: power curves used for the reference power
+        :param series: list of (name, alarm series) pairs, series that are None are skipped
+        :return: alignment.AlignedSeries
+        """
+        reference = self.interpolate_power_curves(data, pc, columns=(2,))[:, 0]
+        timestamps = data[:, self.ts_index] if len(data) > 0 else np.zeros(0, dtype=aggregation.TIMESTAMP_UNIT)
+        aligned = alignment.AlignedSeries(timestamps, self.float_column(data, self.ws_index),
+                                          self.float_column(data, self.pow_index), reference)
+        for name, values in series:
+            aligned.add(name, values)
+        return aligned
+
+    def combine_timeseries(self, pow_alms1, stops, pow_alms2, aligned=None):
         """
         combine all different types of alarms into one big timeseries
 
@@ -1262,84 +1608,230 @@ class AEPcounter:
         2 = stop
         3 = overproduction
 
-        :param pow_alms1:
-        :param stops:
-        :param pow_alms2:
-        :return:
+        The lines are the lines of the stops, the power alarms are matched to them by their timestamps.
+
+        :param pow_alms1: power drop alarms
+        :param stops: icing related stops
+        :param pow_alms2: overproduction alarms
+        :param aligned: alignment.AlignedSeries with the series 'losses', 'stops' and 'over', aligned here on the
+                        lines of the stops if not given
+        :return: copy of stops with the combined alarm values in column 1
+        """
+        if len(stops) == 0:
+            return stops.copy()
+        if aligned is None:
+            aligned = alignment.AlignedSeries(stops[:, 0], self.float_column(stops, 2), self.float_column(stops, 5),
+                                              self.float_column(stops, 3))
+            for name, values in (('losses', pow_alms1), ('stops', stops), ('over', pow_alms2)):
+                aligned.add(name, values)
+        rows = aligned.rows['stops']
+        combined_ts = stops.copy()
+        # stops outside the base lines keep their own flag
+        combined_ts[:, 1] = np.where(rows >= 0, aligned.combined_flags(('stops', 'losses', 'over'))[rows], self.float_column(stops, 1))
+        return combined_ts
+
+    def event_intervals(self, *timings):
         """
+        merge the events of any number of event lists into sorted, non-overlapping time intervals
 
-        # stops timeseries longer because it uses different source data
+        Every interval covers the time from the start of an event up to but not including its stop, overlapping and
+        adjacent events are merged into one interval.
 
-        common_indexes1 = [index1 for index1, line1 in enumerate(stops) if line1[0] in pow_alms1[:,0]]
-        common_indexes2 = [index2 for index2, line2 in enumerate(stops) if line2[0] in pow_alms2[:,0]]
-        combined_ts = stops
-        combined_ts[common_indexes1,1] += pow_alms1[:,1]
-        combined_ts[common_indexes2,1] += pow_alms2[:,1]
-        return combined_ts
+        :param timings: event lists as returned by power_loss_during_alarm, None values are skipped
+        :return: datetime64 arrays of the interval starts and stops, both increasing
+        """
+        event_lists = [events for events in timings if events is not None and len(events) > 0]
+        if len(event_lists) == 0:
+            empty = np.zeros(0, dtype=aggregation.TIMESTAMP_UNIT)
+            return empty, empty
+        starts = np.concatenate([self.timestamp_array(events[:, 0]) for events in event_lists])
+        stops = np.concatenate([self.timestamp_array(events[:, 1]) for events in event_lists])
+        order = np.argsort(starts, kind='stable')
+        starts = starts[order]
+        # the latest stop so far, an event that starts after it begins a new interval
+        reach = np.maximum.accumulate(stops[order])
+        first = np.flatnonzero(np.append(True, starts[1:] > reach[:-1]))
+        last = np.append(first[1:] - 1, len(starts) - 1)
+        return starts[first], reach[last]
 
+    def interval_mask(self, timestamps, starts, stops):
+        """
+        :param timestamps: timestamps of the data
+        :param starts: increasing interval starts as returned by event_intervals
+        :param stops: interval stops
+        :return: boolean array, True for the timestamps inside an interval
+        """
+        timestamps = self.timestamp_array(timestamps)
+        index = np.searchsorted(starts, timestamps, side='right') - 1
+        inside = index >= 0
+        inside[inside] = timestamps[inside] < stops[index[inside]]
+        return inside
 
-    def define_removable_indexes(self,data,timings):
+    def define_removable_indexes(self, data, timings):
         """
-        calculate the start and stop indexes in data to remove all data defined in the array timings
+        calculate the indexes of the lines in data that fall inside the events in the array timings
 
         :param data: original dataset
         :param timings: array containg the incident starts and stops
-        :return: indexes that can be used to filter the original data, a list of ranges
+        :return: indexes that can be used to filter the original data, increasing
         """
-        removed_indexes = []
-        for event in timings:
-            event_start = event[0]
-            event_stop = event[1]
-            event_start_index = np.fromiter(map(datetime.timedelta.total_seconds,np.abs(data[:,self.ts_index]-event_start)),dtype='float').argmin()
-            event_stop_index = np.fromiter(map(datetime.timedelta.total_seconds,np.abs(data[:,self.ts_index]-event_stop)),dtype='float').argmin()
-            removed_indexes.extend(list(range(event_start_index,event_stop_index,1)))
-        return removed_indexes
+        starts, stops = self.event_intervals(timings)
+        return np.flatnonzero(self.interval_mask(data[:, self.ts_index], starts, stops))
 
     def increase_reference_dataset(self, data, stop_timings, alarm_timings, over_timings):
         """
         re-increase the size of reference dataset to include all the non-iced datapoints.
 
+        The lines from the start of an event up to but not including its stop are removed, the events of all three
+        lists are merged first so every line is checked once.
+
         :param data: original dataset
         :param stop_timings: stops calculated from the data
         :param alarm_timings: alarm incidents calculated from the data
         :param over_timigns: overproduction incidents from the data
         :return: new reference dataset
         """
-        stop_removal = self.define_removable_indexes(data,stop_timings)
-        alarm_removal = self.define_removable_indexes(data,alarm_timings)
-        over_removal = self.define_removable_indexes(data,over_timings)
-        removed_indexes = [*stop_removal,*alarm_removal,*over_removal]
-        new_ref = []
-        for index,line in enumerate(data):
-            if index not in removed_indexes:
-                new_ref.append(line)
-        return np.array(new_ref)
-
+        if len(data) == 0:
+            return data
+        starts, stops = self.event_intervals(stop_timings, alarm_timings, over_timings)
+        return data[~self.interval_mask(data[:, self.ts_index], starts, stops)]
 
+    def power_curve_change(self, pc, new_pc):
+        """
+        :return: largest absolute change of the power curve (P50) in any bin, 0.0 if all the bins are empty
+        """
+        change = np.abs(new_pc[:, :, 2] - pc[:, :, 2])
+        if np.all(np.isnan(change)):
+            return 0.0
+        return float(np.nanmax(change))
+
+    def refine_power_curves(self, preprocessed, pc, power_curves=None):
+        """
+        improve the power curves by increasing the reference dataset with the non-iced data below the reference
+        temperature
+
+        On every pass production losses, stops and overproduction are searched for with the latest power curves.
+        The refined reference dataset contains the lines of the normal reference dataset and the lines of the
+        analysed period measured below the reference temperature, minus the lines during the events found. New
+        power curves are then calculated from it. The passes end when the largest change of the power curve is at
+        most refinement_tolerance * rated_power or after refinement_passes passes.
+
+        :param preprocessed: PreprocessedData of the dataset
+        :param pc: power curves calculated from the normal reference dataset
+        :param power_curves: function that calculates the power curves from a reference dataset, e.g.
+                             PowerCurveCache.power_curves, defaults to count_power_curves
+        :return: refined power curves, refined reference dataset (None if no passes were made), number of passes
+        """
+        if power_curves is None:
+            power_curves = self.count_power_curves
+        # lines of the analysed period are checked for icing, the others can only be used above the reference temperature
+        candidates = preprocessed.data[preprocessed.mask('state', 'power level')
+                                       & (preprocessed.masks['temperature'] | preprocessed.masks['time'])]
+        state_filtered_data = preprocessed.select('time', 'state')
+        power_level_filtered_data = preprocessed.select('time', 'state', 'power level')
+        reference_data = None
+        passes = 0
+        while passes < self.refinement_passes:
+            passes += 1
+            power_reference = self.interpolate_power_curves(power_level_filtered_data, pc)
+            alarms = self.power_alarms(power_level_filtered_data, pc, reference=power_reference)
+            over = self.power_alarms(power_level_filtered_data, pc, over=True, reference=power_reference)
+            if self.stop_filter_type in (0, 1, 2):
+                stop_timings = self.power_loss_during_alarm(self.find_icing_related_stops(state_filtered_data, pc))
+            else:
+                stop_timings = None
+            reference_data = self.increase_reference_dataset(candidates, stop_timings,
+                                                             self.power_loss_during_alarm(alarms),
+                                                             self.power_loss_during_alarm(over))
+            new_pc = power_curves(reference_data)
+            change = self.power_curve_change(pc, new_pc)
+            pc = new_pc
+            if change <= self.refinement_tolerance * self.rated_power:
+                break
+        return pc, reference_data, passes
 
     def one_year_month_sums(self, data, wanted_year, index):
         """
         Helper function, calculates the monthly sums of any timeseries data  for a given year
-        :param data:
-        :param wanted_year:
-        :param index:
-        :return:
+        :param data: time series with the timestamps in the first column
+        :param wanted_year: year of the sums
+        :param index: column to sum
+        :return: structure containing [first day of the month, sum] for all 12 months
+        """
+        edges = aggregation.period_edges(datetime.datetime(wanted_year, 1, 1), datetime.datetime(wanted_year, 12, 1), 'month')
+        series = (data[:, 0], self.float_column(data, index)) if len(data) > 0 else ([], [])
+        monthly_sums = aggregation.aggregate([series], edges)[:, 0]
+        dated_sums = np.empty((12, 2), dtype=object)
+        dated_sums[:, 0] = [datetime.datetime(wanted_year, month, 1) for month in range(1, 13)]
+        dated_sums[:, 1] = monthly_sums
+        return dated_sums
+
+    def event_production(self, aligned, name, event_flag):
+        """
+        lost production during the lines of an aligned alarm series that have the wanted alarm flag
+
+        :param aligned: alignment.AlignedSeries
+        :param name: name of the series
+        :param event_flag: alarm flag value of the lines to use
+        :return: (end timestamps, lost production) of the steps between the flagged lines, None if there is no
+                 such series
+        """
+        if name not in aligned:
+            return None
+        flagged = aligned.flagged(name, event_flag)
+        return (aligned.timestamps[flagged][1:],
+                self.production_steps(aligned.timestamps[flagged], aligned.reference[flagged] - aligned.power[flagged]))
+
+    def production_series(self, data, pc, ice_alarms, ice_stops, status_stops, ips_on, ice_detection, aligned=None):
         """
-        months = np.arange(1, 13)
-        monthly_sums = np.zeros(12)
-        for line in data:
-            if line[0].year == wanted_year:
-                monthly_sums[line[0].month-1] += line[index]
-        dated_sums = []
-        for i, s in enumerate(monthly_sums):
-            dated_sums.append((datetime.datetime(wanted_year, months[i], 1), s))
-        return np.array(dated_sums)
+        energy of every interval between consecutive lines for the production and loss categories used in the
+        production statistics
 
+        The series only depend on the data, not on the period used for the statistics, so they can be calculated
+        once and summed into several periods with calculate_production_stats. All of them are calculated from the
+        alarm series aligned on the lines of data.
 
-    def calculate_production_stats(self, data, pc, ice_alarms, ice_stops, status_stops, ips_on, ice_detection):
+        :param data: input data used to asses production
+        :param pc: power curve used to calculate theoretical production
+        :param ice_alarms: time series of icing alarms
+        :param ice_stops: time series of icing induced stops
+        :param status_stops: time series of stops as indicated by a statuscode in the scada
+        :param ips_on: time series of IPS operation, None if the site has no IPS
+        :param ice_detection: timeseries of icing events as detected by an ice detector
+        :param aligned: the alarm series aligned on the time limited data by align_alarms, aligned here if not given
+        :return: list of (category, production) pairs, production as (end timestamps, energies) of the steps between
+                 consecutive lines or None if the category is not available
+        """
+        if aligned is None:
+            aligned = self.align_alarms(self.time_filter_data(data), pc, [('losses', ice_alarms), ('stops', ice_stops),
+                                                                ('status', status_stops), ('ips', ips_on),
+                                                                ('ice detection', ice_detection)])
+        end_timestamps = aligned.timestamps[1:]
+        theoretical_production = (end_timestamps, self.production_steps(aligned.timestamps, aligned.reference))
+        actual_production = (end_timestamps, self.production_steps(aligned.timestamps, aligned.power))
+        if ips_on is not None and self.heating_power_index >= 0:
+            heating_power = self.float_column(data, self.heating_power_index)[self.time_mask(data)]
+            ips_self_consumption = (end_timestamps, self.production_steps(aligned.timestamps, heating_power))
+        else:
+            ips_self_consumption = None
+        return [('theoretical', theoretical_production),
+                ('actual', actual_production),
+                ('iced power drops', self.event_production(aligned, 'losses', 1.0)),
+                ('iced stops', self.event_production(aligned, 'stops', 2.0)),
+                ('status stops', self.event_production(aligned, 'status', 4.0)),
+                ('ips on', self.event_production(aligned, 'ips', 5.0)),
+                ('ice detection', self.event_production(aligned, 'ice detection', 6.0)),
+                ('ips consumption', ips_self_consumption)]
+
+    def calculate_production_stats(self, data, pc, ice_alarms, ice_stops, status_stops, ips_on, ice_detection, period='month', production=None):
         """
         Calculates month-by-month statistics from the data.
 
+        All the production and loss categories are summed into the periods at once. With period 'month' every
+        year that has data gets all 12 months, with the other calendar periods the statistics cover every period
+        from the first to the last line of data. Categories that are not available, e.g. IPS losses on a site
+        without IPS, are zero.
+
         :param data: input data used to asses production
         :param pc: power curve used to calculate theoretical production
         :param ice_alarms: time series of icing alarms
@@ -1347,100 +1839,48 @@ class AEPcounter:
         :param status_stops: time series of stops as indicated by a statuscode in the scada
         :param ips_on: toggle if IPS is available or not
         :param ice_detection: timeseries of icing events as detected by an ice detector
-        :return:
+        :param period: 'year', 'month', 'week', 'day' or a sequence of time window boundaries
+        :param production: result of production_series for the same arguments, calculated if not given
+        :return: one line per period: [period start, theoretical production, actual production, total losses,
+                 relative losses, and the loss and its relative value for iced power drops, iced stops, status
+                 stops, IPS operation, ice detection and all of icing, IPS consumption]
+        """
+        if production is None:
+            production = self.production_series(data, pc, ice_alarms, ice_stops, status_stops, ips_on, ice_detection)
+        if len(data) == 0:
+            return np.zeros((0, 18), dtype=object)
+        series = [values if values is not None else ([], []) for category, values in production]
+        timestamps = self.timestamp_array(data[:, self.ts_index])
+        if isinstance(period, str) and period == 'month':
+            years = np.unique(timestamps.astype('datetime64[Y]'))
+            starts, sums = aggregation.period_sums(series, 'month', years[0], years[-1] + np.timedelta64(1, 'Y') - np.timedelta64(1, 'D'))
+            in_data_years = np.isin(starts.astype('datetime64[Y]'), years)
+            starts = starts[in_data_years]
+            sums = sums[in_data_years]
+        else:
+            starts, sums = aggregation.period_sums(series, period, timestamps.min(), timestamps.max())
+        return self.production_stats_table(starts, sums)
+
+    def production_stats_table(self, starts, sums):
         """
+        build the lines of the production statistics out of the sums of the production series by period
 
-        power_reference = self.theoretical_output_power(data,pc)
-        theoretical_production = self.calculate_production(power_reference,1)
-        actual_production = self.calculate_production(power_reference,2)
-        #pow_alarms.append((line[0], pow_alrm, line[self.ws_index], int_pow, line[self.temp_index], line[self.pow_index], int_lim))
-        iced_power_drop_events = ice_alarms[ice_alarms[:,1] == 1.0, :]
-        # iced_power_drops = np.hstack((iced_power_drop_events[:,0], iced_power_drop_events[:,3]-iced_power_drop_events[:,5]))
-        iced_power_drops_power = np.c_[iced_power_drop_events[:,0], iced_power_drop_events[:,3]-iced_power_drop_events[:,5]]
-        iced_power_drops = self.calculate_production(iced_power_drops_power,1)
-        ice_stop_events = ice_stops[ice_stops[:,1] == 2.0]
-        # iced_stops = np.hstack((ice_stop_events[:,0], ice_stop_events[:,3]-ice_stop_events[:,5]))
-        iced_stops_power = np.c_[ice_stop_events[:,0], ice_stop_events[:,3]-ice_stop_events[:,5]]
-        iced_stops = self.calculate_production(iced_stops_power,1)
-        # status
-        if status_stops is not None:
-            status_stop_events = status_stops[status_stops[:, 1] == 4.0]
-            # iced_stops = np.hstack((ice_stop_events[:,0], ice_stop_events[:,3]-ice_stop_events[:,5]))
-            status_stops_power = np.c_[status_stop_events[:,0], status_stop_events[:,3]-status_stop_events[:,5]]
-            status_stops_prod = self.calculate_production(status_stops_power,1)
-        else:
-            status_stop_events = None
-            status_stops_power = None
-            status_stops_prod = None
-
-        ##############
-        # IPS section
-        ##############
-        if ips_on is not None: # If there is no icing section IPS statistics are not calculated
-            ips_stop_events = ips_on[ips_on[:, 1] == 5.0]
-            # iced_stops = np.hstack((ice_stop_events[:,0], ice_stop_events[:,3]-ice_stop_events[:,5]))
-            ips_on_power = np.c_[ips_stop_events[:,0], ips_stop_events[:,3]-ips_stop_events[:,5]]
-            ips_on_prod = self.calculate_production(ips_on_power,1)
-            ice_detection_events = ice_detection[ice_detection[:, 1] == 6.0]
-
-            #ips consumption
-            if self.heating_power_index < 0:
-                ips_self_consumption = 0.0
-            else:
-                ips_self_consumption = self.calculate_production(data,self.heating_power_index)
-
-            # iced_stops = np.hstack((ice_stop_events[:,0], ice_stop_events[:,3]-ice_stop_events[:,5]))
-            ice_detection_power = np.c_[ice_detection_events[:, 0], ice_detection_events[:, 3] - ice_detection_events[:, 5]]
-            ice_detection_prod = self.calculate_production(ice_detection_power, 1)
-
-        # print(iced_power_drops)
-        years = set([point[0].year for point in data])
-        production_statistics = []
-        for year in years:
-            theoretical_production_sums = self.one_year_month_sums(theoretical_production,year,1)
-            actual_production_sums = self.one_year_month_sums(actual_production,year,1)
-            iced_power_sums = self.one_year_month_sums(iced_power_drops,year,1)
-            ice_stop_sums = self.one_year_month_sums(iced_stops,year,1)
-            if status_stops is not None:
-                status_stop_sums = self.one_year_month_sums(status_stops_prod,year,1)
-            else:
-                status_stop_sums = np.copy(theoretical_production_sums)
-                status_stop_sums[:, 1] = 0.0
+        :param starts: start of every period as datetime64 array
+        :param sums: array of sums with one line per period and one column per category of production_series
+        :return: production statistics in the format returned by calculate_production_stats
+        """
+        theoretical, actual, iced_power, ice_stop, status_stop, ips_on_sums, ice_detection_sums, ips_consumption = sums.T
+        ice_loss = iced_power + ice_stop + ips_on_sums + ice_detection_sums
 
-            if ips_on is not None:
-                ips_on_sums = self.one_year_month_sums(ips_on_prod,year,1)
-                ice_detection_sums = self.one_year_month_sums(ice_detection_prod, year,1)
-                ips_consumption_sums = self.one_year_month_sums(ips_self_consumption,year,1)
-            else:
-                print("Dummy IPS Values")
-                ips_on_sums = np.copy(theoretical_production_sums)
-                ips_on_sums[:,1] = 0.0
-                ice_detection_sums = ips_on_sums
-                ips_self_consumption = 0.0
-            for index, stat_month in enumerate(theoretical_production_sums):
-                # if theoretical_production_sums[index,0] == actual_production_sums[index,0]:
-                ice_loss = iced_power_sums[index,1] + ice_stop_sums[index,1] + ips_on_sums[index,1] + ice_detection_sums[index,1]
-                if theoretical_production_sums[index,1] == 0.0:
-                    reldiff = 0.0
-                    total_icediff = 0.0
-                    icediff = 0.0
-                    stopdiff = 0.0
-                    statusdiff = 0.0
-                    ipsdiff = 0.0
-                    iddiff = 0.0
-                else:
-                    reldiff = (theoretical_production_sums[index, 1] - actual_production_sums[index,1])/theoretical_production_sums[index, 1]
-                    icediff = (theoretical_production_sums[index, 1] - iced_power_sums[index,1])/theoretical_production_sums[index, 1]
-                    stopdiff = (theoretical_production_sums[index, 1] - ice_stop_sums[index,1])/theoretical_production_sums[index, 1]
-                    statusdiff = (theoretical_production_sums[index, 1] - status_stop_sums[index,1])/theoretical_production_sums[index, 1]
-                    ipsdiff = (theoretical_production_sums[index, 1] - ips_on_sums[index,1])/theoretical_production_sums[index, 1]
-                    iddiff = (theoretical_production_sums[index, 1] - ice_detection_sums[index,1])/theoretical_production_sums[index, 1]
-                    total_icediff = (theoretical_production_sums[index, 1] - ice_loss)/theoretical_production_sums[index, 1]
-                production_statistics.append(
-                    [theoretical_production_sums[index, 0], theoretical_production_sums[index, 1],
-                     actual_production_sums[index, 1],
-                     theoretical_production_sums[index, 1] - actual_production_sums[index, 1], reldiff,
-                     iced_power_sums[index, 1], icediff, ice_stop_sums[index, 1], stopdiff, status_stop_sums[index, 1],
-                     statusdiff, ips_on_sums[index,1], ipsdiff, ice_detection_sums[index, 1], iddiff,ice_loss, total_icediff, ips_consumption_sums[index,1]])
-        return np.array(production_statistics)
+        def relative(values):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(theoretical == 0.0, 0.0, (theoretical - values) / theoretical)
 
+        production_statistics = np.empty((len(starts), 18), dtype=object)
+        production_statistics[:, 0] = starts.astype(datetime.datetime)
+        columns = [theoretical, actual, theoretical - actual, relative(actual), iced_power, relative(iced_power),
+                   ice_stop, relative(ice_stop), status_stop, relative(status_stop), ips_on_sums, relative(ips_on_sums),
+                   ice_detection_sums, relative(ice_detection_sums), ice_loss, relative(ice_loss), ips_consumption]
+        for column_index, values in enumerate(columns, start=1):
+            production_statistics[:, column_index] = values
+        return production_statistics
@@ -0,0 +1,128 @@
+"""
+Calendar aggregation of time series.
+
+Values of any number of time series are summed into calendar periods (years, months, ISO weeks starting on Monday
+or days) or into arbitrary time windows. Every value is placed into its period with a binary search over the period
+boundaries and all the sums are calculated with a single np.bincount call, so the cost does not depend on the number
+of periods or series. Values inside a period are added in their original order, the sums are the same as the ones
+given by adding the values one by one.
+"""
+
+import datetime
+
+import numpy as np
+
+PERIODS = ('year', 'month', 'week', 'day')
+
+# strftime formats for period labels
+PERIOD_FORMATS = {'year': '%Y', 'month': '%Y-%m', 'week': '%Y-%m-%d', 'day': '%Y-%m-%d'}
+
+TIMESTAMP_UNIT = 'datetime64[us]'
+
+
+def to_datetime64(timestamps):
+    """
+    :param timestamps: sequence of datetime objects or datetime64 values
+    :return: datetime64[us] array
+    """
+    timestamps = np.asarray(timestamps)
+    if timestamps.dtype != object or len(timestamps) == 0:
+        return timestamps.astype(TIMESTAMP_UNIT)
+    # timedelta arithmetic is considerably faster than converting every datetime object separately
+    origin = timestamps[0]
+    offsets = ((timestamps - origin) / datetime.timedelta(microseconds=1)).astype(np.int64)
+    return np.datetime64(origin, 'us') + offsets.astype('timedelta64[us]')
+
+
+def period_start(timestamps, period):
+    """
+    start of the calendar period of every timestamp
+
+    :param timestamps: datetime64 array
+    :param period: 'year', 'month', 'week' or 'day'
+    :return: datetime64[us] array
+    """
+    timestamps = np.asarray(timestamps, dtype=TIMESTAMP_UNIT)
+    if period == 'year':
+        return timestamps.astype('datetime64[Y]').astype(TIMESTAMP_UNIT)
+    if period == 'month':
+        return timestamps.astype('datetime64[M]').astype(TIMESTAMP_UNIT)
+    days = timestamps.astype('datetime64[D]')
+    if period == 'week':
+        # 1970-01-01 was a Thursday, three days after the start of its week
+        days = days - (days.astype(np.int64) + 3) % 7
+    elif period != 'day':
+        raise ValueError('Unknown period {0}, use one of {1}'.format(period, ', '.join(PERIODS)))
+    return days.astype(TIMESTAMP_UNIT)
+
+
+def period_edges(first, last, period):
+    """
+    boundaries of the consecutive calendar periods from the period of first to the period of last
+
+    :param first: first timestamp to cover
+    :param last: last timestamp to cover
+    :param period: 'year', 'month', 'week' or 'day'
+    :return: datetime64[us] array, one more value than there are periods
+    """
+    first, last = period_start(np.array([first, last], dtype=TIMESTAMP_UNIT), period)
+    if period == 'year':
+        edges = np.arange(first.astype('datetime64[Y]'), last.astype('datetime64[Y]') + 2)
+    elif period == 'month':
+        edges = np.arange(first.astype('datetime64[M]'), last.astype('datetime64[M]') + 2)
+    else:
+        step = 7 if period == 'week' else 1
+        edges = np.arange(first.astype('datetime64[D]'), last.astype('datetime64[D]') + step + 1, step)
+    return edges.astype(TIMESTAMP_UNIT)
+
+
+def aggregate(series, edges):
+    """
+    sum the values of every series into the windows between consecutive edges
+
+    Values outside [edges[0], edges[-1]) are ignored.
+
+    :param series: list of (timestamps, values) pairs, timestamps as datetime objects or datetime64 values
+    :param edges: increasing datetime64 window boundaries
+    :return: array of sums, shape (number of windows, number of series)
+    """
+    edges = np.asarray(edges, dtype=TIMESTAMP_UNIT)
+    windows = max(len(edges) - 1, 0)
+    keys = []
+    weights = []
+    for column, (timestamps, values) in enumerate(series):
+        if len(timestamps) == 0:
+            continue
+        window_index = np.searchsorted(edges, to_datetime64(timestamps), side='right') - 1
+        inside = (window_index >= 0) & (window_index < windows)
+        keys.append(window_index[inside] * len(series) + column)
+        weights.append(np.asarray(values, dtype=float)[inside])
+    if windows == 0 or not keys:
+        return np.zeros((windows, len(series)))
+    sums = np.bincount(np.concatenate(keys), weights=np.concatenate(weights), minlength=windows * len(series))
+    return sums.reshape(windows, len(series))
+
+
+def period_sums(series, period, first=None, last=None):
+    """
+    sum the values of every series by calendar period or by time window
+
+    :param series: list of (timestamps, values) pairs
+    :param period: 'year', 'month', 'week', 'day' or an increasing sequence of window boundaries
+    :param first: first timestamp to cover with calendar periods, defaults to the earliest timestamp in the series
+    :param last: last timestamp to cover with calendar periods, defaults to the latest timestamp in the series
+    :return: start of every period as datetime64[us] array, array of sums with one column per series
+    """
+    if not isinstance(period, str):
+        edges = np.asarray(period, dtype=TIMESTAMP_UNIT)
+        return edges[:-1], aggregate(series, edges)
+    if first is None or last is None:
+        timestamps = [to_datetime64(timestamps) for timestamps, values in series if len(timestamps) > 0]
+        if not timestamps:
+            return np.zeros(0, dtype=TIMESTAMP_UNIT), np.zeros((0, len(series)))
+        if first is None:
+            first = min(values.min() for values in timestamps)
+        if last is None:
+            last = max(values.max() for values in timestamps)
+    edges = period_edges(first, last, period)
+    return edges[:-1], aggregate(series, edges)
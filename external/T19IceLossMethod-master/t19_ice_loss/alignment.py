@@ -0,0 +1,141 @@
+"""
+Alignment of alarm and flag series on a common time index.
+
+The alarm series of the counter (power drops, stops, overproduction, status code stops, IPS operation and ice
+detection) are calculated from differently filtered subsets of the same data, so a line of one series has no fixed
+position in another. AlignedSeries matches the lines of every series to the lines of one base dataset with a sorted
+merge join of int64 timestamps. The flags of all the series are then plain float arrays of the length of the base,
+and the combined alarm time series, the production statistics and the plots are all calculated from them.
+
+Both inputs of the merge are sorted already in practice, a stable sort of their concatenation then only merges two
+runs, which takes linear time. Unsorted timestamps are sorted first.
+"""
+
+import collections
+
+import numpy as np
+
+from . import aggregation
+
+
+def sorted_with_order(values):
+    """
+    :param values: int64 array
+    :return: values in increasing order, the order that sorts values or None if they were sorted already
+    """
+    if len(values) < 2 or np.all(values[1:] >= values[:-1]):
+        return values, None
+    order = np.argsort(values, kind='stable')
+    return values[order], order
+
+
+def merge_positions(index, keys):
+    """
+    find the position of every key in index with a sorted merge join
+
+    If index has the same timestamp several times, keys are matched to the last of them.
+
+    :param index: int64 timestamps of the base lines
+    :param keys: int64 timestamps to look up
+    :return: int64 array, position of every key in index or -1 for keys that are not in index
+    """
+    sorted_index, index_order = sorted_with_order(index)
+    sorted_keys, key_order = sorted_with_order(keys)
+    merged = np.concatenate((sorted_index, sorted_keys))
+    # timsort merges the two runs, on equal values the index comes first
+    order = np.argsort(merged, kind='stable')
+    from_index = order < len(sorted_index)
+    # position of the last index value at or before every merged value, the keys keep their order
+    last_index = (np.cumsum(from_index) - 1)[~from_index]
+    found = last_index >= 0
+    found[found] = sorted_index[last_index[found]] == sorted_keys[found]
+    positions = np.where(found, last_index, -1)
+    if index_order is not None:
+        positions[found] = index_order[positions[found]]
+    if key_order is not None:
+        unsorted = np.empty_like(positions)
+        unsorted[key_order] = positions
+        positions = unsorted
+    return positions
+
+
+class AlignedSeries:
+    """
+    alarm and flag series aligned on the lines of a base dataset
+
+    The base columns are float arrays with one value per base line. For every added series rows holds the position
+    of each of its lines in the base, flags its flag values on the base lines (0.0 where the series has no line) and
+    present tells which base lines the series has.
+    """
+
+    def __init__(self, timestamps, wind_speed, power, reference):
+        """
+        :param timestamps: timestamps of the base lines
+        :param wind_speed: wind speeds of the base lines
+        :param power: measured power of the base lines
+        :param reference: reference power (P50) of the base lines
+        """
+        self.timestamps = aggregation.to_datetime64(timestamps)
+        self.index = self.timestamps.astype(np.int64)
+        self.wind_speed = np.asarray(wind_speed, dtype=float)
+        self.power = np.asarray(power, dtype=float)
+        self.reference = np.asarray(reference, dtype=float)
+        self.rows = collections.OrderedDict()
+        self.flags = collections.OrderedDict()
+        self.present = collections.OrderedDict()
+
+    def __contains__(self, name):
+        return name in self.rows
+
+    def add(self, name, series):
+        """
+        align a series, lines with timestamps that are not in the base are left out
+
+        :param name: name of the series
+        :param series: alarm series with timestamps in column 0 and flags in column 1, None if not available
+        """
+        if series is None:
+            return
+        if len(series) == 0:
+            positions = np.zeros(0, dtype=np.int64)
+        else:
+            positions = merge_positions(self.index, aggregation.to_datetime64(series[:, 0]).astype(np.int64))
+        found = positions >= 0
+        flags = np.zeros(len(self.index))
+        present = np.zeros(len(self.index), dtype=bool)
+        if len(series) > 0:
+            flags[positions[found]] = np.asarray(series[found, 1], dtype=float)
+        present[positions[found]] = True
+        self.rows[name] = positions
+        self.flags[name] = flags
+        self.present[name] = present
+
+    def flagged(self, name, flag=None):
+        """
+        :param name: name of the series
+        :param flag: wanted flag value, None for any non-zero flag
+        :return: boolean array, True for the base lines where the series has the flag
+        """
+        if flag is None:
+            return self.present[name] & (self.flags[name] != 0.0)
+        return self.present[name] & (self.flags[name] == flag)
+
+    def combined_flags(self, names):
+        """
+        :param names: names of the series to combine, missing series are skipped
+        :return: sum of the flags of the series on the base lines
+        """
+        combined = np.zeros(len(self.index))
+        for name in names:
+            if name in self:
+                combined += self.flags[name]
+        return combined
+
+    def points(self, mask, x='wind speed'):
+        """
+        :param mask: boolean array selecting base lines
+        :param x: 'wind speed' or 'time'
+        :return: x values and measured power of the selected lines
+        """
+        x_values = self.wind_speed if x == 'wind speed' else self.timestamps
+        return x_values[mask], self.power[mask]
@@ -0,0 +1,443 @@
+"""
+Chunked version of the icing loss calculation for data sets that do not fit in memory.
+
+ChunkedAEPcounter goes through the data twice, one chunk of time ordered lines at a time (see
+CSVimporter.read_sorted_chunks):
+
+1. The reference lines of every chunk are added into the statistics of the power curve bins. With exact quantiles
+   the wind speed, direction and power of the reference lines are spilled into one file per bin, and the bins are
+   calculated one at a time with AEPcounter.bin_statistics. The power curves are then the same as the ones of
+   t19_counter.py. With sketch quantiles the bins are kept in a PowerCurveSketch (see incremental.py), which has a
+   fixed size and the accuracy described there.
+2. The alarms are evaluated chunk by chunk. Every chunk is evaluated together with the lines carried over from the
+   earlier chunks. The alarm value of a line is final once the lines its continuity check, the stop look-ahead
+   (stop time filter) and the time filter (icing time, stop time filter) depend on have been read. An event is final
+   once the line after it is final. Events, summary sums and production statistics are collected from final lines
+   only, so the results do not depend on the chunk size. Sums are added up chunk by chunk, which can change their
+   last digits.
+
+Memory use is set by the chunk size ('chunk size' in the [Source file] section) and the carried over lines. Those are
+the lines of the longest alarm run that is still going on at the end of a chunk, e.g. a status code stop, plus the
+lines of the time filter. With exact quantiles the first pass also holds the lines of one power curve bin at a time.
+
+Refinement of the reference dataset, the power curve cache and the outputs written line by line (alarm time
+series, filtered raw data and plots) are not available in this mode.
+"""
+
+import collections
+import configparser
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from . import aggregation
+from .aep_counter import AEPcounter
+from .incremental import PowerCurveSketch
+
+# columns of the production sums, in the order of AEPcounter.production_series
+PRODUCTION_CATEGORIES = ['theoretical', 'actual', 'iced power drops', 'iced stops', 'status stops', 'ips on',
+                         'ice detection', 'ips consumption']
+
+# production category of the event types
+EVENT_CATEGORIES = {'losses': 'iced power drops', 'stops': 'iced stops', 'status': 'status stops', 'ips': 'ips on',
+                    'ice detection': 'ice detection'}
+
+
+class ReferenceBins:
+    """
+    reference lines spilled to disk by power curve bin
+
+    The wind speed, direction and power of every line are appended into the file of its bin as float64 values.
+    Drop-in replacement of PowerCurveSketch that gives the exact statistics: power_curves reads one bin at a time,
+    the lines of a bin in the order they were added.
+    """
+    def __init__(self, wind_bins, direction_bins, directory=None):
+        """
+        :param wind_bins: wind speed bins
+        :param direction_bins: direction bins
+        :param directory: directory for the bin files, None for the system temporary directory
+        """
+        self.shape = (len(wind_bins), len(direction_bins))
+        self.counts = np.zeros(self.shape, dtype=np.int64)
+        self.directory = tempfile.mkdtemp(prefix='t19_bins_', dir=directory)
+
+    def bin_filename(self, key):
+        return os.path.join(self.directory, '{0}.bin'.format(key))
+
+    def add(self, speed_bins, direction_bins, wind_speeds, directions, powers):
+        """
+        add measurements into the bins
+
+        :param speed_bins: wind speed bin index of every measurement
+        :param direction_bins: direction bin index of every measurement
+        :param wind_speeds: wind speeds
+        :param directions: wind directions in degrees
+        :param powers: output powers
+        """
+        keys = speed_bins * self.shape[1] + direction_bins
+        order = np.argsort(keys, kind='stable')
+        values = np.column_stack((wind_speeds, directions, powers))[order]
+        bin_keys, bin_starts = np.unique(keys[order], return_index=True)
+        bin_stops = np.append(bin_starts[1:], len(order))
+        for key, start, stop in zip(bin_keys, bin_starts, bin_stops):
+            with open(self.bin_filename(key), 'ab') as bin_file:
+                values[start:stop].tofile(bin_file)
+        self.counts += np.bincount(keys, minlength=self.counts.size).reshape(self.shape)
+
+    def power_curves(self, aepc):
+        """
+        calculate the statistics of the bins
+
+        :param aepc: AEPcounter, used for the bin statistics
+        :return pc: unfiltered power curve matrix with the same layout as returned by AEPcounter.binned_statistics
+        """
+        pc = aepc.empty_power_curves()
+        for key in np.flatnonzero(self.counts):
+            values = np.fromfile(self.bin_filename(key), dtype=np.float64).reshape(-1, 3)
+            speed_bin_index, direction_bin_index = divmod(key, self.shape[1])
+            aepc.bin_statistics(pc[speed_bin_index, direction_bin_index], values[:, 0], values[:, 1], values[:, 2])
+        return pc
+
+    def close(self):
+        """
+        remove the bin files
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ChunkedAEPcounter(AEPcounter):
+    """
+    AEPcounter that processes the data one chunk at a time
+
+    chunked_power_curves is the first pass over the data, chunked_alarms the second one. The results are then read
+    with event_timings, summary_totals and production_statistics.
+    """
+    def __init__(self):
+        super().__init__()
+        self.quantiles = 'exact' # 'exact' or 'sketch'
+        self.sketch_buckets = 200
+        self.sketch_power_range = 1.25 # upper end of the power histogram as a multiple of rated power
+        self.spill_dir = None # directory of the spilled reference lines, None for the system temporary directory
+        self.data_sizes = [0, 0, 0] # lines in the data, after the time and state filters, in the reference dataset
+        self.reference_start = None
+        self.reference_stop = None
+        self.timings = collections.OrderedDict() # per event type, event tables of the final lines
+        self.finished = {} # per event type, timestamp of the last final line
+        self.last_flagged = {} # per event type, timestamp and power loss of the last final line with the event flag
+        self.period_sums = collections.OrderedDict() # per period, production sums by period start
+        self.production_totals = np.zeros(6)
+        self.data_years = set()
+        self.first_timestamps = [] # timestamps of the first two time limited lines
+        self.last_line = None # last time limited line
+
+    def set_chunked_options_from_file(self, filename):
+        """
+        read the options of the chunked mode from the config file
+        """
+        config = configparser.ConfigParser()
+        config.read(filename)
+        try:
+            self.quantiles = config.get('Chunked', 'quantiles', fallback=self.get_fallback_value('Chunked', 'quantiles')).strip().lower()
+            if self.quantiles not in ('exact', 'sketch'):
+                raise ValueError('quantiles has to be exact or sketch, not {0}'.format(self.quantiles))
+            self.sketch_buckets = int(config.get('Chunked', 'sketch buckets', fallback=self.get_fallback_value('Chunked', 'sketch buckets')))
+            self.sketch_power_range = float(config.get('Chunked', 'sketch power range', fallback=self.get_fallback_value('Chunked', 'sketch power range')))
+            spill_dir = config.get('Chunked', 'spill directory', fallback=self.get_fallback_value('Chunked', 'spill directory'))
+            self.spill_dir = None if spill_dir.upper() == 'NONE' else spill_dir
+        except ValueError as wrong_value:
+            print("Wrong type of value in {0}: {1}".format(filename, wrong_value))
+            sys.exit(1)
+
+    def new_bins(self):
+        """
+        :return: ReferenceBins or PowerCurveSketch, depending on the quantiles option
+        """
+        if self.quantiles == 'sketch':
+            return PowerCurveSketch(self.wind_bins, self.direction_bins, 0.0, self.sketch_power_range * self.rated_power,
+                                    self.sketch_buckets)
+        return ReferenceBins(self.wind_bins, self.direction_bins, self.spill_dir)
+
+    def chunked_power_curves(self, chunks):
+        """
+        first pass: build the power curves out of the reference lines of every chunk
+
+        The data sizes and the time span of the reference dataset used in the summary are counted as well.
+
+        :param chunks: iterable of ColumnarData in time order, e.g. CSVimporter.read_sorted_chunks()
+        :return: final power curves
+        """
+        self.data_sizes = [0, 0, 0]
+        self.reference_start = None
+        self.reference_stop = None
+        bins = self.new_bins()
+        try:
+            for chunk in chunks:
+                preprocessed = self.preprocess(chunk.to_rows(), in_place=True)
+                # same reference data as in t19_counter
+                reference_data = preprocessed.select('state', 'temperature', 'power level')
+                self.data_sizes[0] += len(preprocessed.data)
+                self.data_sizes[1] += int(np.count_nonzero(preprocessed.mask('time', 'state')))
+                self.data_sizes[2] += len(reference_data)
+                if len(reference_data) == 0:
+                    continue
+                if self.reference_start is None:
+                    self.reference_start = reference_data[0, self.ts_index]
+                self.reference_stop = reference_data[-1, self.ts_index]
+                speed_bins, direction_bins = self.bin_indices(reference_data)
+                bins.add(speed_bins, direction_bins, self.float_column(reference_data, self.ws_index),
+                         self.float_column(reference_data, self.wd_index),
+                         self.float_column(reference_data, self.pow_index))
+            pc = bins.power_curves(self)
+        finally:
+            if isinstance(bins, ReferenceBins):
+                bins.close()
+        return self.finalize_power_curves(pc)
+
+    def chunked_alarms(self, chunks, pc, periods=('month',)):
+        """
+        second pass: evaluate the alarms chunk by chunk
+
+        The lines of every chunk are evaluated together with the lines carried over from the earlier chunks, see
+        evaluate_window.
+
+        :param chunks: iterable of ColumnarData in time order, the same data as in chunked_power_curves
+        :param pc: power curves
+        :param periods: periods of the production statistics
+        """
+        self.timings = collections.OrderedDict((name, []) for name in self.series_names())
+        self.finished = {}
+        self.last_flagged = {}
+        self.period_sums = collections.OrderedDict((period, {}) for period in periods)
+        self.production_totals = np.zeros(6)
+        self.data_years = set()
+        self.first_timestamps = []
+        self.last_line = None
+        carried = None
+        for chunk in chunks:
+            preprocessed = self.preprocess(chunk.to_rows(), in_place=True)
+            in_period = preprocessed.masks['time']
+            window = preprocessed.data[in_period]
+            if len(window) == 0:
+                continue
+            self.add_lines(window, pc)
+            state = preprocessed.masks['state'][in_period]
+            power_level = preprocessed.masks['power level'][in_period]
+            if carried is not None:
+                window = np.vstack((carried[0], window))
+                state = np.concatenate((carried[1], state))
+                power_level = np.concatenate((carried[2], power_level))
+            carry = self.evaluate_window(window, state, power_level, pc, False)
+            carried = (window[carry], state[carry], power_level[carry])
+        if carried is not None and len(carried[0]) > 0:
+            self.evaluate_window(carried[0], carried[1], carried[2], pc, True)
+
+    def series_names(self):
+        """
+        :return: names of the alarm series evaluated with the current options
+        """
+        names = ['losses', 'over']
+        if self.stop_filter_type in (0, 1, 2):
+            names.append('stops')
+        if self.stop_filter_type in (1, 2):
+            names.append('status')
+        if self.heated_site:
+            names.append('ips')
+        if self.ice_detection:
+            names.append('ice detection')
+        return names
+
+    def evaluate_window(self, window, state, power_level, pc, final):
+        """
+        evaluate the alarms of the carried over lines and the lines of a new chunk
+
+        :param window: time limited lines in time order
+        :param state: state filter mask of the lines
+        :param power_level: power level filter mask of the lines
+        :param pc: power curves
+        :param final: True if there are no more lines after the window
+        :return: boolean array, True for the lines to carry over into the next window
+        """
+        state_lines = np.flatnonzero(state)
+        power_lines = np.flatnonzero(state & power_level)
+        all_lines = np.arange(len(window))
+        state_filtered_data = window[state_lines]
+        power_level_filtered_data = window[power_lines]
+        reference = self.interpolate_power_curves(power_level_filtered_data, pc)
+        # [event type, lines of the window in the series, alarms without time filtering, time filter window,
+        # number of following lines the alarm value of a line depends on, event flag, ips]
+        series = [('losses', power_lines, self.power_alarms(power_level_filtered_data, pc, False, reference=reference), self.icing_time, 1, 1.0, False),
+                  ('over', power_lines, self.power_alarms(power_level_filtered_data, pc, False, True, reference), self.icing_time, 1, None, False)]
+        if 'stops' in self.timings:
+            series.append(('stops', state_lines, self.find_icing_related_stops(state_filtered_data, pc, False), self.stop_time, max(1, self.stop_time), 2.0, False))
+        if 'status' in self.timings:
+            series.append(('status', all_lines, self.status_code_stops(window, pc), 0, 0, 4.0, False))
+        if 'ips' in self.timings:
+            series.append(('ips', all_lines, self.status_code_stops(window, pc, filter_type='ips'), 0, 0, 5.0, True))
+        if 'ice detection' in self.timings:
+            series.append(('ice detection', all_lines, self.status_code_stops(window, pc, filter_type='icing'), 0, 0, 6.0, False))
+
+        carry = np.zeros(len(window), dtype=bool)
+        for name, lines, alarms, time_filter, look_ahead, event_flag, ips_alarm in series:
+            first_carried = self.finish_series(name, alarms, time_filter, look_ahead, event_flag, ips_alarm, final)
+            carry[lines[first_carried:]] = True
+        return carry
+
+    def finish_series(self, name, alarms, time_filter, look_ahead, event_flag, ips_alarm, final):
+        """
+        collect the events and the lost production of the lines of one alarm series that have become final
+
+        The lines are final up to the first alarm run that ends in the last look_ahead + time_filter lines of the
+        window, unless the window is the last one. The line before the first line that is not final is not in an
+        alarm run. It is carried over with the lines after it, so that the next window starts with a line that is
+        known not to be an alarm.
+
+        :param name: event type
+        :param alarms: alarm series of the window, without time filtering
+        :param time_filter: minimum number of consecutive alarms in an event, 0 if the series is not time filtered
+        :param look_ahead: number of following lines the alarm value of a line depends on
+        :param event_flag: alarm value of the lines counted into the production statistics, None to count none
+        :param ips_alarm: passed on to power_loss_during_alarm
+        :param final: True if there are no more lines after the window
+        :return: index of the first line of the series to carry over
+        """
+        if len(alarms) == 0:
+            return 0
+        timestamps = self.timestamp_array(alarms[:, 0])
+        # lines up to the last final line of the previous window were collected already
+        first_new = 0
+        if name in self.finished:
+            first_new = int(np.searchsorted(timestamps, self.finished[name], side='right'))
+        run_starts, run_stops = self.alarm_runs(alarms[:, 1])
+        if time_filter > 0:
+            alarms = self.timefilter_ice_alarms(alarms, time_filter)
+        if final:
+            first_open = len(alarms)
+        else:
+            final_limit = max(len(alarms) - look_ahead - time_filter, 0)
+            open_runs = run_starts[run_stops >= final_limit]
+            first_open = min(final_limit, open_runs[0]) if len(open_runs) > 0 else final_limit
+        first_open = max(first_open, first_new)
+        if first_open > first_new:
+            final_alarms = alarms[first_new:first_open]
+            timings = self.power_loss_during_alarm(final_alarms, ips_alarm)
+            if len(timings) > 0:
+                self.timings[name].append(timings)
+            if event_flag is not None:
+                self.add_event_production(name, final_alarms, event_flag)
+            self.finished[name] = timestamps[first_open - 1]
+        return max(first_open - 1, 0)
+
+    def add_event_production(self, name, alarms, event_flag):
+        """
+        add the lost production between the lines with the event flag into the production sums, see
+        AEPcounter.event_production
+
+        :param name: event type
+        :param alarms: final lines of the series
+        :param event_flag: alarm value of the lines to count
+        """
+        flagged = self.float_column(alarms, 1) == event_flag
+        timestamps = self.timestamp_array(alarms[flagged, 0])
+        losses = self.float_column(alarms, 3)[flagged] - self.float_column(alarms, 5)[flagged]
+        if name in self.last_flagged:
+            previous_timestamp, previous_loss = self.last_flagged[name]
+            timestamps = np.append(previous_timestamp, timestamps)
+            losses = np.append(previous_loss, losses)
+        if len(timestamps) > 0:
+            self.last_flagged[name] = (timestamps[-1], losses[-1])
+        self.add_production(PRODUCTION_CATEGORIES.index(EVENT_CATEGORIES[name]), timestamps[1:], self.production_steps(timestamps, losses))
+
+    def add_lines(self, lines, pc):
+        """
+        add the production of the time limited lines of a chunk into the summary and production statistics sums
+
+        :param lines: time limited lines of a chunk
+        :param pc: power curves
+        """
+        self.first_timestamps = (self.first_timestamps + list(lines[:2, self.ts_index]))[:2]
+        if self.last_line is not None:
+            # the step from the last line of the previous chunk
+            lines = np.vstack((self.last_line, lines))
+        self.last_line = lines[-1:]
+        timestamps = self.timestamp_array(lines[:, self.ts_index])
+        self.data_years.update(np.unique(timestamps.astype('datetime64[Y]')).tolist())
+        # [timestamp, P50, power, P10, P90, lower and upper limit]
+        tmax_power = self.theoretical_output_power(lines, pc)
+        for index in range(6):
+            self.production_totals[index] += np.nansum(self.calculate_production(tmax_power, index + 1)[:, 1])
+        self.add_production(0, timestamps[1:], self.production_steps(timestamps, self.float_column(tmax_power, 1)))
+        self.add_production(1, timestamps[1:], self.production_steps(timestamps, self.float_column(tmax_power, 2)))
+        if self.heated_site and self.heating_power_index >= 0:
+            self.add_production(7, timestamps[1:], self.production_steps(timestamps, self.float_column(lines, self.heating_power_index)))
+
+    def add_production(self, category, end_timestamps, energies):
+        """
+        add the energies of some steps into the production sums of every period
+
+        :param category: index of the category in PRODUCTION_CATEGORIES
+        :param end_timestamps: datetime64 timestamps at the end of the steps
+        :param energies: energy of every step
+        """
+        if len(end_timestamps) == 0:
+            return
+        for period, sums in self.period_sums.items():
+            starts, inverse = np.unique(aggregation.period_start(end_timestamps, period), return_inverse=True)
+            period_energies = np.bincount(inverse.reshape(-1), weights=energies, minlength=len(starts))
+            for start, energy in zip(starts, period_energies):
+                if start not in sums:
+                    sums[start] = np.zeros(len(PRODUCTION_CATEGORIES))
+                sums[start][category] += energy
+
+    def event_timings(self, name):
+        """
+        :param name: event type
+        :return: event table as returned by power_loss_during_alarm, None if the series was not evaluated
+        """
+        if name not in self.timings:
+            return None
+        if len(self.timings[name]) == 0:
+            return np.array([], dtype=object)
+        return np.concatenate(self.timings[name])
+
+    def summary_totals(self):
+        """
+        :return: totals of the summary in the format of Result_file_writer.summary_totals, None if there is not enough
+                 data for the summary
+        """
+        if len(self.first_timestamps) < 2 or self.reference_start is None:
+            return None
+        totals = {'start': self.first_timestamps[0] if self.starttimestamp == datetime.datetime.min else self.starttimestamp,
+                  'stop': self.last_line[0, self.ts_index] if self.stoptimestamp == datetime.datetime.max else self.stoptimestamp,
+                  'step': self.first_timestamps[1] - self.first_timestamps[0],
+                  'reference start': self.reference_start,
+                  'reference stop': self.reference_stop,
+                  'production': list(self.production_totals)}
+        return totals
+
+    def production_statistics(self, period='month'):
+        """
+        production statistics in the format of calculate_production_stats
+
+        :param period: one of the periods given to chunked_alarms
+        :return: one line per period
+        """
+        if self.last_line is None:
+            return np.zeros((0, 18), dtype=object)
+        if period == 'month':
+            years = np.array(sorted(self.data_years), dtype='datetime64[Y]')
+            starts = aggregation.period_edges(years[0], years[-1] + np.timedelta64(1, 'Y') - np.timedelta64(1, 'D'), 'month')[:-1]
+            starts = starts[np.isin(starts.astype('datetime64[Y]'), years)]
+        else:
+            first = np.datetime64(self.first_timestamps[0], 'us')
+            last = np.datetime64(self.last_line[0, self.ts_index], 'us')
+            starts = aggregation.period_edges(first, last, period)[:-1]
+        sums = self.period_sums[period]
+        table = np.zeros((len(starts), len(PRODUCTION_CATEGORIES)))
+        for line, start in enumerate(starts):
+            if start in sums:
+                table[line] = sums[start]
+        return self.production_stats_table(starts, table)
@@ -0,0 +1,226 @@
+"""
+Binary column store for time series data.
+
+A store is a directory that contains a manifest.json and one binary file per column. The manifest lists the
+columns in the same order as the columns of a source .csv file, their numpy dtypes and the number of rows.
+Text columns are stored as int32 codes, the manifest holds the list of texts (categories) in the order they
+first appeared in the data.
+
+Rows are kept in timestamp order. Appended rows that are not newer than the last row of the store are dropped,
+so the same data can be appended again without creating duplicates. Column files are written before the
+manifest, the row count in the manifest is the authoritative length and any extra bytes left by an interrupted
+append are overwritten by the next one.
+"""
+
+import json
+import os
+
+import numpy as np
+
+MANIFEST_NAME = 'manifest.json'
+STORE_VERSION = 1
+TIMESTAMP_DTYPE = np.dtype('<M8[us]')
+FLOAT_DTYPE = np.dtype('<f8')
+BOOL_DTYPE = np.dtype('|b1')
+CODE_DTYPE = np.dtype('<i4')
+
+
+def is_column_store(path):
+    """
+    :param path: file or directory name
+    :return: True if path is a column store directory
+    """
+    return os.path.isdir(path) and os.path.isfile(os.path.join(path, MANIFEST_NAME))
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_NAME), 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get('version') != STORE_VERSION:
+        raise ValueError('Unsupported column store version {0} in {1}'.format(manifest.get('version'), path))
+    return manifest
+
+
+def write_manifest(path, manifest):
+    manifest_filename = os.path.join(path, MANIFEST_NAME)
+    temp_filename = manifest_filename + '.tmp'
+    with open(temp_filename, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+        manifest_file.flush()
+        os.fsync(manifest_file.fileno())
+    os.replace(temp_filename, manifest_filename)
+
+
+class ColumnStore:
+    """
+    read only, memory mapped access to a column store
+
+    The row count is read from the manifest when the store is opened, rows appended after that are not visible.
+    """
+    def __init__(self, path):
+        """
+        :param path: directory of the store
+        """
+        self.path = path
+        self.manifest = read_manifest(path)
+        self.rows = self.manifest['rows']
+        self.timestamp_index = self.manifest['timestamp index']
+        self.headers = [column['name'] for column in self.manifest['columns']]
+
+    def __len__(self):
+        return self.rows
+
+    def is_text(self, index):
+        return 'categories' in self.manifest['columns'][index]
+
+    def categories(self, index):
+        """
+        :param index: column index
+        :return: texts of a text column, code n means categories[n]
+        """
+        return self.manifest['columns'][index]['categories']
+
+    def column(self, index, start=0, stop=None):
+        """
+        memory mapped view of a column, no data is read until it is used
+
+        :param index: column index
+        :param start: first row
+        :param stop: row after the last one, defaults to the end of the store
+        :return: read only numpy array, codes for text columns
+        """
+        column = self.manifest['columns'][index]
+        dtype = np.dtype(column['dtype'])
+        if stop is None:
+            stop = self.rows
+        start = min(max(start, 0), self.rows)
+        stop = min(max(stop, start), self.rows)
+        if stop == start:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, column['file']), dtype=dtype, mode='r',
+                         offset=start * dtype.itemsize, shape=(stop - start,))
+
+    def timestamps(self, start=0, stop=None):
+        return self.column(self.timestamp_index, start, stop)
+
+    def time_range(self, start_time=None, stop_time=None):
+        """
+        find the rows between two timestamps with a binary search
+
+        :param start_time: first included timestamp (datetime or datetime64), None for the beginning
+        :param stop_time: last included timestamp, None for the end
+        :return: first row, row after the last one
+        """
+        timestamps = self.timestamps()
+        start = 0
+        stop = self.rows
+        if start_time is not None:
+            start = int(np.searchsorted(timestamps, np.datetime64(start_time, 'us'), side='left'))
+        if stop_time is not None:
+            stop = int(np.searchsorted(timestamps, np.datetime64(stop_time, 'us'), side='right'))
+        return start, max(start, stop)
+
+    def last_timestamp(self):
+        """
+        :return: timestamp of the last row as datetime64, None for an empty store
+        """
+        if self.rows == 0:
+            return None
+        return self.timestamps(self.rows - 1)[0]
+
+
+class ColumnStoreWriter:
+    """
+    appends rows into a column store, creates the store if it does not exist
+    """
+    def __init__(self, path, headers=None, timestamp_index=0):
+        """
+        :param path: directory of the store
+        :param headers: column names, needed when the store is created
+        :param timestamp_index: index of the timestamp column, used when the store is created
+        """
+        self.path = path
+        if is_column_store(path):
+            self.manifest = read_manifest(path)
+            if headers is not None and list(headers) != [column['name'] for column in self.manifest['columns']]:
+                raise ValueError('Columns {0} do not match the columns of the store {1}'.format(headers, path))
+        else:
+            if headers is None:
+                raise ValueError('Column names are needed to create a column store')
+            os.makedirs(path, exist_ok=True)
+            self.manifest = {'version': STORE_VERSION,
+                             'rows': 0,
+                             'timestamp index': timestamp_index,
+                             'columns': [{'name': name, 'file': 'column_{0}.bin'.format(index), 'dtype': None}
+                                         for index, name in enumerate(headers)]}
+
+    def column_values(self, column, values):
+        """
+        convert appended values to the dtype of the column, the dtype of a new column is chosen from the values
+        """
+        values = np.asarray(values)
+        if column['dtype'] is None:
+            if np.issubdtype(values.dtype, np.datetime64):
+                column['dtype'] = TIMESTAMP_DTYPE.str
+            elif values.dtype == bool:
+                column['dtype'] = BOOL_DTYPE.str
+            elif np.issubdtype(values.dtype, np.number):
+                column['dtype'] = FLOAT_DTYPE.str
+            else:
+                column['dtype'] = CODE_DTYPE.str
+                column['categories'] = []
+        if 'categories' in column:
+            texts, inverse = np.unique(values.astype(str), return_inverse=True)
+            # keep the categories in the order they first appear in the data
+            first_seen = np.full(len(texts), len(values))
+            np.minimum.at(first_seen, inverse, np.arange(len(values)))
+            lookup = {text: code for code, text in enumerate(column['categories'])}
+            codes = np.zeros(len(texts), dtype=CODE_DTYPE)
+            for text_index in np.argsort(first_seen, kind='stable'):
+                text = str(texts[text_index])
+                if text not in lookup:
+                    lookup[text] = len(column['categories'])
+                    column['categories'].append(text)
+                codes[text_index] = lookup[text]
+            return codes[inverse.reshape(-1)]
+        if column['dtype'] == TIMESTAMP_DTYPE.str:
+            return values.astype(TIMESTAMP_DTYPE)
+        return values.astype(np.dtype(column['dtype']))
+
+    def append(self, columns):
+        """
+        append rows to the store
+
+        Rows are sorted by timestamp, rows with a timestamp that is already in the store or repeated within the
+        appended data are dropped (the first one is kept).
+
+        :param columns: list of columns in the order of the store columns, every column a sequence of the same length
+        :return: number of rows added
+        """
+        timestamp_index = self.manifest['timestamp index']
+        if len(columns) != len(self.manifest['columns']):
+            raise ValueError('Expected {0} columns, got {1}'.format(len(self.manifest['columns']), len(columns)))
+        timestamps = np.asarray(columns[timestamp_index]).astype(TIMESTAMP_DTYPE)
+        order = np.argsort(timestamps, kind='stable')
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = timestamps[order][1:] != timestamps[order][:-1]
+        if self.manifest['rows'] > 0:
+            keep &= timestamps[order] > ColumnStore(self.path).last_timestamp()
+        selection = order[keep]
+        if len(selection) == 0:
+            return 0
+        rows = self.manifest['rows']
+        for index, (column, values) in enumerate(zip(self.manifest['columns'], columns)):
+            if index == timestamp_index:
+                values = timestamps
+            converted = self.column_values(column, np.asarray(values)[selection])
+            filename = os.path.join(self.path, column['file'])
+            with open(filename, 'ab') as column_file:
+                # drop whatever an interrupted append left after the last complete row
+                column_file.truncate(rows * converted.dtype.itemsize)
+                column_file.write(np.ascontiguousarray(converted).tobytes())
+                column_file.flush()
+                os.fsync(column_file.fileno())
+        self.manifest['rows'] = rows + len(selection)
+        write_manifest(self.path, self.manifest)
+        return len(selection)
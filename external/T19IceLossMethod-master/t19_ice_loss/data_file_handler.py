@@ -1,11 +1,171 @@
-import matplotlib.pyplot as plt
-import matplotlib
 import datetime
+import collections
 import csv
+import itertools
+import re
 import numpy as np
+import io
 import json
 import configparser
+import os
 
+from .column_store import ColumnStore, ColumnStoreWriter, is_column_store
+from .fault_codes import FaultCodes
+from . import result_bundle
+from . import aggregation
+from . import plotting
+
+
+# columns of the production statistics after the period start
+PRODUCTION_STATS_FIELDS = ['Theoretical production', 'Actual production', 'Total losses', 'Total losses (%)',
+                           'Production losses due to icing', 'Relative icing production loss',
+                           'Losses due to icing induced stops', 'Relative losses due to iced stops',
+                           'Losses during SCADA stops', 'Relative losses during SCADA stops',
+                           'Losses during IPS operation', 'Relative losses during IPS operation',
+                           'Losses during ice detection', 'Relative losses during ice detection',
+                           'Total icing losses', 'Relative icing losses', 'IPS consumption']
+
+# timestamp directives that can be converted into datetime64 values without calling strptime row by row, with the
+# patterns datetime.strptime matches them with
+TIMESTAMP_PATTERNS = {'Y': r'\d\d\d\d',
+                      'y': r'\d\d',
+                      'm': r'1[0-2]|0[1-9]|[1-9]',
+                      'd': r'3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9]',
+                      'H': r'2[0-3]|[0-1]\d|\d',
+                      'M': r'[0-5]\d|\d',
+                      'S': r'6[0-1]|[0-5]\d|\d',
+                      'f': r'[0-9]{1,6}'}
+
+
+def timestamp_regex(dt_format):
+    """
+    regular expression that matches the timestamps of a datetime format the same way datetime.strptime does
+
+    :param dt_format: datetime format, e.g. '%d.%m.%Y %H:%M'
+    :return: compiled regular expression with one named group per directive, None if the format contains other
+             directives than the ones in TIMESTAMP_PATTERNS or the same directive twice
+    """
+    parts = []
+    directives = set()
+    index = 0
+    while index < len(dt_format):
+        char = dt_format[index]
+        if char == '%':
+            directive = dt_format[index + 1:index + 2]
+            if directive == '%':
+                parts.append('%')
+            elif directive in TIMESTAMP_PATTERNS and directive not in directives:
+                parts.append('(?P<{0}>{1})'.format(directive, TIMESTAMP_PATTERNS[directive]))
+                directives.add(directive)
+            else:
+                return None
+            index += 2
+        elif char.isspace():
+            # strptime matches a run of whitespace in the format with any amount of whitespace
+            if not parts or parts[-1] != r'\s+':
+                parts.append(r'\s+')
+            index += 1
+        else:
+            parts.append(re.escape(char))
+            index += 1
+    return re.compile(''.join(parts), re.IGNORECASE)
+
+
+class ColumnarData:
+    """
+    column oriented container for a dataset read by CSVimporter.read_data_columns
+
+    timestamps are stored as a numpy.datetime64 vector, every other column of the source file as
+    its own one dimensional array:
+
+        * float64 for measurements
+        * int64 for replaced fault/status codes
+        * bool for columns that contain nothing but TRUE/FALSE values
+
+    Columns are indexed the same way as in the source file, the slot at timestamp_index holds the timestamps.
+    """
+    def __init__(self, headers, timestamps, columns, timestamp_index=0):
+        """
+        :param headers: header row of the source file
+        :param timestamps: numpy.ndarray of datetime64 values
+        :param columns: list of numpy.ndarrays, one per source file column
+        :param timestamp_index: column index of the timestamp in the source file
+        """
+        self.headers = headers
+        self.timestamps = timestamps
+        self.columns = columns
+        self.timestamp_index = timestamp_index
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def column(self, index):
+        """
+        return a single column of the data
+
+        :param index: column index in the source file
+        :return: the column as numpy.ndarray
+        """
+        if index == self.timestamp_index:
+            return self.timestamps
+        return self.columns[index]
+
+    def __getitem__(self, key):
+        """
+        numpy style indexing, so that the AEPcounter filters can be evaluated on the typed columns:
+        data[:, index] is a column, data[selection] a ColumnarData of the selected rows
+
+        :param key: row selection, or a tuple of a row selection and a column index
+        :return: numpy.ndarray or ColumnarData
+        """
+        if isinstance(key, tuple):
+            rows, index = key
+            return self.column(index)[rows]
+        return self.select(key)
+
+    def select(self, selection):
+        """
+        pick a subset of rows from all columns at once
+
+        :param selection: boolean mask, index array or slice
+        :return: new ColumnarData containing only the selected rows
+        """
+        columns = [column[selection] for column in self.columns]
+        if len(columns) > self.timestamp_index:
+            timestamps = columns[self.timestamp_index]
+        else:
+            timestamps = self.timestamps[selection]
+        return ColumnarData(self.headers, timestamps, columns, self.timestamp_index)
+
+    def time_slice(self, start_time=None, stop_time=None):
+        """
+        pick the rows between two timestamps, data has to be sorted by timestamp
+
+        The columns of the result are views of the original columns, nothing is copied.
+
+        :param start_time: first included timestamp, None for the beginning
+        :param stop_time: last included timestamp, None for the end
+        :return: new ColumnarData
+        """
+        start = 0
+        stop = len(self)
+        if start_time is not None:
+            start = int(np.searchsorted(self.timestamps, np.datetime64(start_time, 'us'), side='left'))
+        if stop_time is not None:
+            stop = int(np.searchsorted(self.timestamps, np.datetime64(stop_time, 'us'), side='right'))
+        return self.select(slice(start, max(start, stop)))
+
+    def to_rows(self):
+        """
+        adapter for AEPcounter: build the row matrix produced by CSVimporter.read_data i.e. an object
+        array where timestamps are datetime.datetime objects and values are python floats/ints/bools
+
+        :return: numpy.ndarray of dtype object
+        """
+        rows = np.empty((len(self), len(self.columns)), dtype=object)
+        for index in range(len(self.columns)):
+            rows[:, index] = self.column(index).astype(object)
+        return rows
 
 
 class CSVimporter:
@@ -41,7 +201,7 @@ class CSVimporter:
         self.full_data = []
         self.replace_faults = False # Data processing chokes on non-numeric values so textual fault codes need to be replaced
         self.fault_columns = []
-        self.fault_dict = {}
+        self.fault_codes = FaultCodes() # textual fault codes and their replacement numbers
         self.result_dir = '.'
         self.timestamp_index = 0
         self.summaryfile_write = True
@@ -50,6 +210,38 @@ class CSVimporter:
         self.filtered_raw_data_write = False
         self.icing_events_write = False
         self.power_curve_write = True
+        self.skip_columns = []
+        self.columnar_read = False # read the file column by column in chunks, see read_data_columns
+        self.chunk_size = 100000 # rows per chunk when reading columns
+        self.column_data = None
+        self.start_time = None # when reading a column store, only rows between these timestamps are read
+        self.stop_time = None
+        self.unsorted_lines = 0 # lines left out by read_sorted_chunks because they were out of time order
+
+    @property
+    def full_data(self):
+        """
+        row matrix of the data. If the data was read into self.column_data, the matrix is built from the columns
+        the first time it is used.
+        """
+        if self._full_data is None and self.column_data is not None:
+            self._full_data = self.column_data.to_rows()
+        return self._full_data
+
+    @full_data.setter
+    def full_data(self, rows):
+        self._full_data = rows
+
+    @property
+    def fault_dict(self):
+        """
+        dictionary of the fault code texts and the numbers they are replaced with, the codes of self.fault_codes
+        """
+        return self.fault_codes.codes
+
+    @fault_dict.setter
+    def fault_dict(self, codes):
+        self.fault_codes = FaultCodes(codes)
 
     def read_file_options_from_file(self,config_filename):
         """
@@ -84,6 +276,8 @@ class CSVimporter:
                 self.skip_columns = []
             else:
                 self.skip_columns = [int(column_index) for column_index in skip_column_string.split(',')]
+            self.columnar_read = config.getboolean('Source file', 'columnar read', fallback=False)
+            self.chunk_size = int(config.get('Source file', 'chunk size', fallback=100000))
             self.result_dir = config.get('Output','result directory',fallback='.')
             self.summaryfile_write = config.getboolean('Output', 'summary', fallback=True)
             self.pc_plot_picture = config.getboolean('Output', 'plot', fallback=True)
@@ -111,28 +305,9 @@ class CSVimporter:
         :return: fault_dict a python dictionary containig all discovered fault codes (dictionary keys) and numbers to replace them with (dictionary values)
         
         """
-        inputfile = open(self.filename,'r')
-        file_reader = csv.reader(inputfile,delimiter = self.delim, quotechar = self.quote_char)
-        textdata = []
-        headers = next(file_reader)
-        columns = len(headers)
-        fault_codes = []
-        while True:
-            try:
-                # data_row = (list(map(str.strip,next(file_reader))))
-                data_row = next(file_reader)
-                if data_row[column_num] not in fault_codes:
-                    fault_codes.append(data_row[column_num].strip())
-            except StopIteration:
-                break
-        inputfile.close()
-        # rows=len(textdata)
-        # ndata = np.array(textdata)
-        # print(ndata[1])
-        # fault_codes = np.unique(ndata[:,column_num])
-        fault_dict = {}
-        for index,code in enumerate(fault_codes):
-            fault_dict[code] = index
+        fault_codes = FaultCodes()
+        fault_codes.add(self.distinct_text_columns([column_num])[0])
+        fault_dict = fault_codes.codes
         if write_to_file:
             self.write_fault_dict(outfilename, fault_dict)
         return fault_dict
@@ -211,9 +386,59 @@ class CSVimporter:
         faultfilename = self.result_dir + self.id + '_faults.json'
         return faultfilename
 
+    def read_text_columns(self, column_nums):
+        """
+        read the texts of some columns of the source file in one pass
+
+        :param column_nums: column indexes
+        :return: list of lists of texts, one per column
+        """
+        columns = [[] for column_num in column_nums]
+        with open(self.filename, 'r') as inputfile:
+            file_reader = csv.reader(inputfile, delimiter=self.delim, quotechar=self.quote_char)
+            next(file_reader)
+            width = max(column_nums) + 1 if len(column_nums) > 0 else 0
+            for data_row in self.iter_data_lines(file_reader):
+                if len(data_row) < width:
+                    continue
+                for column, column_num in zip(columns, column_nums):
+                    column.append(data_row[column_num])
+        return columns
+
+    def distinct_text_columns(self, column_nums):
+        """
+        read the distinct texts of some columns of the source file in one pass
+
+        The file is read self.chunk_size lines at a time and only the distinct texts are kept, so the memory use
+        does not depend on the length of the file. Adding the texts into FaultCodes gives the same codes as adding
+        all the texts returned by read_text_columns.
+
+        :param column_nums: column indexes
+        :return: list of lists of texts in the order they first appear, one per column
+        """
+        columns = [{} for column_num in column_nums]
+        with open(self.filename, 'r') as inputfile:
+            file_reader = csv.reader(inputfile, delimiter=self.delim, quotechar=self.quote_char)
+            next(file_reader)
+            width = max(column_nums) + 1 if len(column_nums) > 0 else 0
+            rows = (data_row for data_row in self.iter_data_lines(file_reader) if len(data_row) >= width)
+            while True:
+                chunk = list(itertools.islice(rows, self.chunk_size))
+                if len(chunk) == 0:
+                    break
+                for texts, column_num in zip(columns, column_nums):
+                    # texts seen before keep their place
+                    texts.update(dict.fromkeys(data_row[column_num] for data_row in chunk))
+        return [list(texts) for texts in columns]
+
     def process_fault_codes(self):
         """
         create a data structure that can be used to replace textual fault codes in the data that is read in for processing
+
+        The codes in the fault file of an earlier run are kept, so a text gets the same code every time the dataset
+        is processed. Texts that are not in the fault file are numbered in the order they first appear in the fault
+        columns and the file is updated.
+
         TODO: Currently, only acceptable values are those that are found in the file itself. This should be changed
                 to allow seeding of the values that are set in the .ini file. You can't set a value for this
                 that is not found in a file. i.e. if you have a fault indicator value "FAULT" and the data does not have any
@@ -222,14 +447,10 @@ class CSVimporter:
                 if not then you add it. Requires ability to manually add values to fault_dict.
         """
         fault_code_filename = self.create_faultfile()
-        if len(self.fault_columns) == 1:
-            self.fault_dict = self.create_new_faultcodes(self.fault_columns[0], True, fault_code_filename)
-        else:
-            for i,col in enumerate(self.fault_columns):
-                if i == 0:
-                    self.fault_dict = self.create_new_faultcodes(col, True, fault_code_filename)
-                else:
-                    self.fault_dict = self.update_fault_codes(col, fault_code_filename, True, fault_code_filename)
+        self.fault_codes = FaultCodes.read(fault_code_filename)
+        for texts in self.distinct_text_columns(self.fault_columns):
+            self.fault_codes.add(texts)
+        self.fault_codes.write(fault_code_filename)
 
 
     def read_data(self):
@@ -242,7 +463,22 @@ class CSVimporter:
 
 
         [timestamp, value, ...]
+
+        if self.filename is a column store directory (see column_store.py), the data is read with read_store.
+        if self.columnar_read is set, the file is parsed with read_data_columns instead. In both cases
+        self.column_data holds the typed columns and self.full_data is only built from them when it is used, see
+        AEPcounter.preprocess_columns for processing the columns without building the whole row matrix.
         """
+        if is_column_store(self.filename):
+            self.column_data = self.read_store(self.start_time, self.stop_time)
+            self.headers = self.column_data.headers
+            self.full_data = None
+            return
+        if self.columnar_read:
+            self.column_data = self.read_data_columns()
+            self.headers = self.column_data.headers
+            self.full_data = None
+            return
         datafile = open(self.filename,'r')
         inputdata = csv.reader(datafile,delimiter = self.delim,quotechar=self.quote_char)
         # TODO:
@@ -309,6 +545,343 @@ class CSVimporter:
         self.headers = headers
         self.full_data = full_data_au
 
+    def parse_timestamps(self, ts_strings):
+        """
+        convert a list of timestamp strings into datetime64 values in bulk
+
+        The strings are matched with timestamp_regex of self.dt_format, the date is then assembled from the
+        matched fields with array arithmetic.
+        Formats with other directives than year, month, day, hours, minutes, seconds and microseconds
+        fall back to strptime row by row, as do strings the bulk path can not handle.
+
+        :param ts_strings: list of timestamp strings as they are in the file
+        :return: datetime64[us] array, boolean mask of the strings that could be parsed
+        """
+        if self.dt_extra_char != 0:
+            ts_strings = [ts_string[:-self.dt_extra_char] for ts_string in ts_strings]
+        count = len(ts_strings)
+        timestamps = np.zeros(count, dtype='datetime64[us]')
+        valid = np.zeros(count, dtype=bool)
+        regex = timestamp_regex(self.dt_format)
+        if regex is not None:
+            matches = list(map(regex.match, ts_strings))
+            # strptime does not accept trailing characters either
+            matched = np.fromiter((match is not None and match.end() == len(ts_string)
+                                   for match, ts_string in zip(matches, ts_strings)), dtype=bool, count=count)
+            placeholder = ('0',) * regex.groups
+            group_values = [match.groups() if ok else placeholder for match, ok in zip(matches, matched)]
+            group_columns = list(zip(*group_values)) if count > 0 else [()] * regex.groups
+            fields = {}
+            for name, group_index in regex.groupindex.items():
+                values = np.array(group_columns[group_index - 1], dtype=str)
+                if name == 'f':
+                    values = np.char.ljust(values, 6, '0')
+                fields[name] = values.astype(np.int64)
+            ones = np.ones(count, dtype=np.int64)
+            zeros = np.zeros(count, dtype=np.int64)
+            if 'Y' in fields:
+                years = fields['Y']
+            elif 'y' in fields:
+                # same pivot as strptime
+                years = np.where(fields['y'] <= 68, fields['y'] + 2000, fields['y'] + 1900)
+            else:
+                years = ones * 1900
+            months = fields.get('m', ones)
+            days = fields.get('d', ones)
+            hours = fields.get('H', zeros)
+            minutes = fields.get('M', zeros)
+            seconds = fields.get('S', zeros)
+            microseconds = fields.get('f', zeros)
+            month_start = ((years - 1970) * 12 + (months - 1)).astype('datetime64[M]')
+            dates = month_start.astype('datetime64[D]') + (days - 1)
+            # reject the dates strptime would reject, e.g. 30.2. or year 0
+            matched &= dates < (month_start + 1).astype('datetime64[D]')
+            matched &= years >= datetime.MINYEAR
+            matched &= seconds < 60
+            timestamps = (dates.astype('datetime64[us]') + hours * 3600000000 + minutes * 60000000 +
+                          seconds * 1000000 + microseconds)
+            valid = matched
+        for i in np.nonzero(~valid)[0]:
+            try:
+                timestamps[i] = np.datetime64(datetime.datetime.strptime(ts_strings[i], self.dt_format), 'us')
+                valid[i] = True
+            except ValueError as e:
+                print("{0} : Error {1} while reading file {2}".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),e,self.filename))
+        return timestamps, valid
+
+    def parse_value_column(self, values, column_index):
+        """
+        convert one column of text values into a numeric array
+
+        same rules as in read_data: numbers are read as floats, fault codes replaced using self.fault_dict,
+        text containing TRUE or FALSE is read as a boolean and anything else becomes nan
+
+        :param values: column values as strings
+        :param column_index: index of the column in the file
+        :return: the converted array, True if the column contained only boolean values
+        """
+        if column_index in self.skip_columns:
+            return np.full(len(values), np.nan), False
+        if self.replace_faults and (column_index in self.fault_columns):
+            return self.fault_codes.encode(values), False
+        try:
+            return np.array(values, dtype=np.float64), False
+        except ValueError:
+            pass
+        converted = np.empty(len(values), dtype=np.float64)
+        only_booleans = True
+        for i, value in enumerate(values):
+            if self.is_float(value):
+                converted[i] = float(value)
+                only_booleans = False
+            elif 'FALSE' in value.upper():
+                converted[i] = 0.0
+            elif 'TRUE' in value.upper():
+                converted[i] = 1.0
+            else:
+                converted[i] = np.nan
+                only_booleans = False
+        if only_booleans:
+            return converted.astype(bool), True
+        return converted, False
+
+    def read_data_column_chunks(self, process_faults=True):
+        """
+        generator that reads the datafile self.chunk_size lines at a time and yields every chunk as ColumnarData
+
+        Chunks are in file order, timestamps are not sorted and duplicates are not removed.
+        Lines that do not have as many fields as the header row or have an unreadable timestamp are skipped.
+        The boolean_columns attribute of the yielded chunks lists the columns that contained only TRUE/FALSE values.
+
+        :param process_faults: if False, the fault codes have to be processed already
+        :return: generator of ColumnarData
+        """
+        if self.replace_faults and process_faults:
+            self.process_fault_codes()
+        with open(self.filename, 'r') as datafile:
+            inputdata = csv.reader(datafile, delimiter=self.delim, quotechar=self.quote_char)
+            headers = next(inputdata)
+            width = len(headers)
+            line_number = 1
+            rows = self.iter_data_lines(inputdata)
+            while True:
+                chunk = []
+                for dataline in itertools.islice(rows, self.chunk_size):
+                    line_number += 1
+                    if len(dataline) != width:
+                        print("{0} : Error wrong number of fields while reading file {1}".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),self.filename))
+                        print("Error on line: {0}".format(line_number))
+                        print(dataline)
+                    else:
+                        chunk.append(dataline)
+                if len(chunk) == 0:
+                    break
+                text_columns = list(zip(*chunk))
+                timestamps, valid = self.parse_timestamps(text_columns[self.timestamp_index])
+                columns = []
+                boolean_columns = []
+                for index, values in enumerate(text_columns):
+                    if index == self.timestamp_index:
+                        columns.append(timestamps)
+                    else:
+                        column, only_booleans = self.parse_value_column(values, index)
+                        columns.append(column)
+                        if only_booleans:
+                            boolean_columns.append(index)
+                chunk_data = ColumnarData(headers, timestamps, columns, self.timestamp_index)
+                if not valid.all():
+                    chunk_data = chunk_data.select(valid)
+                chunk_data.boolean_columns = boolean_columns
+                yield chunk_data
+        print("{0} : File {1} read".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),self.filename))
+
+    def iter_data_lines(self, inputdata):
+        """
+        iterate over the lines of a csv.reader, report and skip the lines the reader chokes on
+
+        :param inputdata: csv.reader
+        :return: generator of lines as lists of strings
+        """
+        while True:
+            try:
+                yield next(inputdata)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                print("{0} : Error {1} while reading file {2}".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),e,self.filename))
+
+    def read_data_columns(self):
+        """
+        read the pre-specified datafile into typed columns
+
+        Columnar version of read_data: the file is read in chunks of self.chunk_size lines and every column
+        is converted in bulk instead of cell by cell. Data is sorted by timestamp and for duplicate timestamps
+        the first line in the file is kept.
+
+        :return: ColumnarData
+        """
+        chunks = []
+        headers = []
+        boolean_columns = None
+        for chunk in self.read_data_column_chunks():
+            headers = chunk.headers
+            chunks.append(chunk)
+            if boolean_columns is None:
+                boolean_columns = set(chunk.boolean_columns)
+            else:
+                boolean_columns &= set(chunk.boolean_columns)
+        if len(chunks) == 0:
+            return ColumnarData(headers, np.zeros(0, dtype='datetime64[us]'), [], self.timestamp_index)
+        columns = []
+        for index in range(len(chunks[0].columns)):
+            parts = [chunk.columns[index] for chunk in chunks]
+            if index not in boolean_columns:
+                parts = [part.astype(np.float64) if part.dtype == bool else part for part in parts]
+            columns.append(np.concatenate(parts))
+        timestamps = columns[self.timestamp_index]
+        # remove duplicate timestamps, keep the first occurrence
+        order = np.argsort(timestamps, kind='stable')
+        sorted_timestamps = timestamps[order]
+        unique = np.ones(len(order), dtype=bool)
+        unique[1:] = sorted_timestamps[1:] != sorted_timestamps[:-1]
+        data = ColumnarData(headers, timestamps, columns, self.timestamp_index)
+        return data.select(order[unique])
+
+    def store_fault_codes(self, store):
+        """
+        create the fault code dictionary from the texts of the fault columns in a column store
+
+        The codes in the fault file are kept and new texts are numbered in the order they first appear in the fault
+        columns, the same way process_fault_codes numbers them when reading a .csv file. The dictionary is written
+        into the fault file as well.
+
+        :param store: ColumnStore
+        """
+        fault_code_filename = self.create_faultfile()
+        self.fault_codes = FaultCodes.read(fault_code_filename)
+        for column_index in self.fault_columns:
+            if store.is_text(column_index):
+                self.fault_codes.add(store.categories(column_index))
+        self.fault_codes.write(fault_code_filename)
+
+    def read_store(self, start_time=None, stop_time=None):
+        """
+        read the data from a column store written by column_store.ColumnStoreWriter
+
+        Numeric and timestamp columns are memory mapped, only the rows between start_time and stop_time are
+        accessed. Text columns are converted with the same rules as the columns of a .csv file, fault codes
+        are replaced if self.replace_faults is set.
+
+        :param start_time: first included timestamp, None for the beginning of the data
+        :param stop_time: last included timestamp, None for the end of the data
+        :return: ColumnarData
+        """
+        store = ColumnStore(self.filename)
+        if store.timestamp_index != self.timestamp_index:
+            print("{0} : Timestamp index {1} does not match the timestamp column {2} of {3}".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), self.timestamp_index, store.timestamp_index, self.filename))
+        if self.replace_faults:
+            self.store_fault_codes(store)
+        start, stop = store.time_range(start_time, stop_time)
+        data = self.store_rows(store, start, stop, self.store_text_values(store))
+        print("{0} : Column store {1} read".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), self.filename))
+        return data
+
+    def store_text_values(self, store):
+        """
+        convert the texts of the text columns of a column store with the same rules as the columns of a .csv file
+
+        :param store: ColumnStore
+        :return: dictionary of the converted texts by column index, code n of a column is converted into value n
+        """
+        text_values = {}
+        for index in range(len(store.headers)):
+            if index != store.timestamp_index and index not in self.skip_columns and store.is_text(index):
+                converted, only_booleans = self.parse_value_column(store.categories(index), index)
+                if len(converted) == 0:
+                    converted = np.zeros(0, dtype=np.float64)
+                text_values[index] = converted
+        return text_values
+
+    def store_rows(self, store, start, stop, text_values):
+        """
+        :param store: ColumnStore
+        :param start: first row
+        :param stop: row after the last one
+        :param text_values: store_text_values of the store
+        :return: the rows as ColumnarData
+        """
+        columns = []
+        for index in range(len(store.headers)):
+            column = store.column(index, start, stop)
+            if index == store.timestamp_index:
+                columns.append(column)
+            elif index in self.skip_columns:
+                columns.append(np.full(stop - start, np.nan))
+            elif index in text_values:
+                columns.append(text_values[index][column])
+            else:
+                columns.append(column)
+        return ColumnarData(store.headers, columns[store.timestamp_index], columns, store.timestamp_index)
+
+    def read_sorted_chunks(self):
+        """
+        generator that reads the data self.chunk_size lines at a time in time order, for data sets that do not fit
+        in memory
+
+        Every chunk is sorted by timestamp and for duplicate timestamps the first line is kept, as in
+        read_data_columns. The file itself has to be in time order: lines that are older than the last line of an
+        earlier chunk are left out and counted in self.unsorted_lines. Boolean columns are read as 0.0 and 1.0.
+        A column store is read from self.start_time to self.stop_time.
+
+        Fault codes are not processed here, call process_fault_codes or store_fault_codes first.
+
+        :return: generator of ColumnarData
+        """
+        self.unsorted_lines = 0
+        if is_column_store(self.filename):
+            store = ColumnStore(self.filename)
+            start, stop = store.time_range(self.start_time, self.stop_time)
+            text_values = self.store_text_values(store)
+            chunks = (self.store_rows(store, chunk_start, min(chunk_start + self.chunk_size, stop), text_values)
+                      for chunk_start in range(start, stop, self.chunk_size))
+        else:
+            chunks = self.read_data_column_chunks(process_faults=False)
+        last_timestamp = None
+        for chunk in chunks:
+            order = np.argsort(chunk.timestamps, kind='stable')
+            sorted_timestamps = chunk.timestamps[order]
+            keep = np.ones(len(order), dtype=bool)
+            keep[1:] = sorted_timestamps[1:] != sorted_timestamps[:-1]
+            if last_timestamp is not None:
+                self.unsorted_lines += int(np.count_nonzero(sorted_timestamps < last_timestamp))
+                keep &= sorted_timestamps > last_timestamp
+            if not keep.any():
+                continue
+            chunk = chunk.select(order[keep])
+            columns = [column.astype(np.float64) if column.dtype == bool else column for column in chunk.columns]
+            last_timestamp = chunk.timestamps[-1]
+            yield ColumnarData(chunk.headers, chunk.timestamps, columns, chunk.timestamp_index)
+
+    def write_column_store(self, path):
+        """
+        write the data into a column store, appends to the store if it already exists
+
+        Uses self.column_data if the data has been read with the columnar reader, otherwise the file is read
+        with read_data_columns. Replaced fault codes are written as the original texts, so reading the store
+        gives the same data as reading the .csv file.
+
+        :param path: directory of the column store
+        :return: number of rows added to the store
+        """
+        data = self.column_data if self.column_data is not None else self.read_data_columns()
+        columns = []
+        for index in range(len(data.headers)):
+            column = data.column(index)
+            if self.replace_faults and (index in self.fault_columns) and index != self.timestamp_index:
+                column = self.fault_codes.decode(column).astype(str)
+            columns.append(column)
+        return ColumnStoreWriter(path, data.headers, self.timestamp_index).append(columns)
+
 class Result_file_writer():
     """
     sets up a writer to deal with results of the counter
@@ -321,6 +894,12 @@ class Result_file_writer():
         self.filtered_raw_data_write = False
         self.icing_events_write = False
         self.power_curve_write = True
+        self.production_stats_periods = ['month']
+        self.summary = None # values of the latest summary written by summary_statistics
+        self.production_stats = collections.OrderedDict() # statistics written by write_monthly_stats by period
+        self.result_bundle = False # write the results into one .npz file as well, see result_bundle.py
+        self.compress_bundle = True
+        self.background_writing = True # write the result files on a background thread
 
 
     def set_output_file_options(self, config_filename):
@@ -339,6 +918,13 @@ class Result_file_writer():
             self.filtered_raw_data_write = config.getboolean('Output', 'filtered raw data', fallback=False)
             self.icing_events_write = config.getboolean('Output', 'icing events', fallback=False)
             self.power_curve_write = config.getboolean('Output', 'power curve', fallback=True)
+            self.production_stats_periods = [period.strip() for period in config.get('Output', 'production stats periods', fallback='month').split(',') if period.strip()]
+            for period in self.production_stats_periods:
+                if period not in aggregation.PERIODS:
+                    raise ValueError('unknown production stats period {0}'.format(period))
+            self.result_bundle = config.getboolean('Output', 'result bundle', fallback=False)
+            self.compress_bundle = config.getboolean('Output', 'compress bundle', fallback=True)
+            self.background_writing = config.getboolean('Output', 'background writing', fallback=True)
             self.power_curve_plot_max = int(config.get('Data Structure', 'maximum wind speed', fallback='20'))
         except configparser.NoOptionError as missing_value:
             print("missing config option: {0} in {1}".format(missing_value, config_filename))
@@ -415,7 +1001,60 @@ class Result_file_writer():
             return False, e
         
     
-    def summary_statistics(self, aepc, data, reference_data, pc, alarm_timings, stop_timings, over_timings, status_timings, ice_timings, ips_timings, data_sizes):
+    def write_event_updates(self, result_filepath, events):
+        """
+        appends icing event updates of the incremental mode into a file, writes the header into a new file
+
+        :param result_filepath: path of result file
+        :param events: list of events as returned by IncrementalAEPcounter.update
+        :return:  status of writing, error
+
+        """
+        headers = ['event type', 'status', 'start', 'stop', 'loss', 'duration', 'mean power drop', 'mean_power',
+                   'mean_reference_power', 'mean wind speed', 'mean temperature', 'ips consumption']
+        try:
+            new_file = not os.path.exists(result_filepath)
+            with open(result_filepath, 'a', newline='') as result_file:
+                writer = csv.writer(result_file, delimiter=';')
+                if new_file:
+                    writer.writerow(headers)
+                writer.writerows(events)
+            return True, ''
+        except IOError as e:
+            return False, e
+
+    def summary_totals(self, aepc, data, reference_data, pc):
+        """
+        time span and production sums of the data used in the summary
+
+        :param aepc: the active aeoc object
+        :param data: time limited data
+        :param reference_data: the reference dataset used to calculate power curve
+        :param pc: power curve structure
+        :return: dictionary of 'start' and 'stop' of the analysed period, 'step' between the first two lines,
+                 'reference start' and 'reference stop' and 'production': the theoretical, actual, P10, P90, lower
+                 and upper limit production sums, None if there is no data
+        """
+        totals = {}
+        if aepc.starttimestamp == datetime.datetime.min:
+            totals['start'] = data[0,aepc.ts_index]
+        else:
+            totals['start'] = aepc.starttimestamp
+        if aepc.stoptimestamp == datetime.datetime.max:
+            totals['stop'] = data[-1,aepc.ts_index]
+        else:
+            totals['stop'] = aepc.stoptimestamp
+        totals['step'] = data[1, aepc.ts_index] - data[0, aepc.ts_index]
+        totals['reference start'] = reference_data[0,aepc.ts_index]
+        totals['reference stop'] = reference_data[-1,aepc.ts_index]
+        tmax_power = aepc.theoretical_output_power(data, pc)
+        if np.shape(tmax_power) == (0,):
+            totals['production'] = None
+        else:
+            totals['production'] = [np.nansum(aepc.calculate_production(tmax_power, index)[:, 1]) for index in range(1, 7)]
+        return totals
+
+    def summary_statistics(self, aepc, data, reference_data, pc, alarm_timings, stop_timings, over_timings, status_timings, ice_timings, ips_timings, data_sizes, totals=None):
         """
         Calculate summary statistics for the dataset. contains:
             availability
@@ -436,22 +1075,20 @@ class Result_file_writer():
         :param stop_timings: icing induced stops
         :param over_timings: overproduction incidents
         :param data_sizes: sizes after each filtering step
+        :param totals: summary_totals of data and reference_data if already calculated, data and reference_data are
+                       not used then
         :return: status of the write operation, full filename ,possible error
         
         """
-        if aepc.starttimestamp == datetime.datetime.min:
-            start_time = data[0,aepc.ts_index]
-        else:
-            start_time = aepc.starttimestamp
-        if aepc.stoptimestamp == datetime.datetime.max:
-            stop_time = data[-1,aepc.ts_index]
-        else:
-            stop_time = aepc.stoptimestamp
+        if totals is None:
+            totals = self.summary_totals(aepc, data, reference_data, pc)
+        start_time = totals['start']
+        stop_time = totals['stop']
         data_period = (stop_time-start_time).total_seconds()/60.0/60.0
-        reference_start = reference_data[0,aepc.ts_index]
-        reference_stop = reference_data[-1,aepc.ts_index]
+        reference_start = totals['reference start']
+        reference_stop = totals['reference stop']
         reference_data_period = (reference_stop-reference_start).total_seconds()/60.0/60.0
-        step_size = data[1, aepc.ts_index] - data[0, aepc.ts_index]
+        step_size = totals['step']
         #check for empty array (no stops)
         if np.shape(stop_timings) == (0,):
             stop_losses = 0.0
@@ -495,8 +1132,7 @@ class Result_file_writer():
 
         uncertainty = aepc.power_curve_uncertainty_average(pc)
         
-        tmax_power = aepc.theoretical_output_power(data, pc)
-        if np.shape(tmax_power) == (0,):
+        if totals['production'] is None:
             theoretical_production_sum = 0.0
             actual_production_sum = 0.0
             min_production_sum = 0.0
@@ -515,18 +1151,8 @@ class Result_file_writer():
             ips_on_duration_perc = 0.0
             ips_on_loss_perc = 0.0
         else:
-            theoretical_production = aepc.calculate_production(tmax_power, 1)
-            actual_production = aepc.calculate_production(tmax_power, 2)
-            production_p10 = aepc.calculate_production(tmax_power, 3)
-            production_p90 = aepc.calculate_production(tmax_power, 4)
-            min_production = aepc.calculate_production(tmax_power, 5)
-            max_production = aepc.calculate_production(tmax_power, 6)
-            theoretical_production_sum = np.nansum(theoretical_production[:, 1])
-            actual_production_sum = np.nansum(actual_production[:, 1])
-            min_production_sum = np.nansum(min_production[:, 1])
-            max_production_sum = np.nansum(max_production[:, 1])
-            production_sum_p10 = np.nansum(production_p10[:, 1])
-            production_sum_p90 = np.nansum(production_p90[:, 1])
+            theoretical_production_sum, actual_production_sum, production_sum_p10, production_sum_p90, \
+                min_production_sum, max_production_sum = totals['production']
             production_upper_limit = max_production_sum / theoretical_production_sum * 100.0
             production_lower_limit = min_production_sum / theoretical_production_sum * 100.0
             production_p10_limit = production_sum_p10 / theoretical_production_sum * 100.0
@@ -554,7 +1180,7 @@ class Result_file_writer():
         filename_trunk = '_summary.txt'
         full_filename = aepc.result_dir + aepc.id + filename_trunk
         try:
-            with open(full_filename,'w') as f:
+            with io.StringIO() as f:
                 # f.write("Statistics from the dataset: {} \n".format(aepc.id))
                 # f.write("\n")
                 # f.write("[Generic statistics] \n")
@@ -634,15 +1260,31 @@ class Result_file_writer():
                 f.write("{heading: <{fill1}}\t {value:>{fill2}.1f} \t{unit}\n".format(heading='Reference dataset as % of original data',fill1=50, value=reference_data_size, fill2=20, unit='%'))
                 f.write(" \t \t \n")
                 f.write(" \t \t \n")
-                
-                
-                
+                summary_text = f.getvalue()
+            with open(full_filename, 'w') as summary_file:
+                summary_file.write(summary_text)
+            self.summary = self.parse_summary_lines(summary_text.splitlines(True))
             return True, full_filename , ''
         except IOError as e:
             return False, full_filename, e
     
     
     
+    def parse_summary_lines(self, lines):
+        """
+        read the lines of a summary file into an ordered dictionary
+
+        :param lines: lines of the summary file, written by summary_statistics
+        :return: summary values keyed by the field names, 'Field' contains the column header
+        """
+        results = collections.OrderedDict()
+        for line in lines:
+            tokens = line.split('\t')
+            if len(tokens) < 2:
+                break
+            results[tokens[0].strip()] = tokens[1].strip()
+        return results
+
     def write_power_curve(self, aepc, pc, pc_id=''):
         """
         Write power curve, P10 and P90 into a file
@@ -692,46 +1334,66 @@ class Result_file_writer():
         except IOError as e:
             return False, filename, e
     
-    def write_monthly_stats(self, data, pc, aepc, ice_events, ice_stops, status_stops, ips_on_flags, ice_detected):
+    def write_monthly_stats(self, data, pc, aepc, ice_events, ice_stops, status_stops, ips_on_flags, ice_detected, period='month', production=None, production_statistics=None):
         """
         write production loss statistics to file
+
+        Monthly statistics are written into <id>_production_stats.txt, the statistics of other periods into
+        <id>_production_stats_<period>.txt
         
         :param data: input data
         :param pc: calculated power curve
         :param aepc: aep counter used to calculate the stats
+        :param period: 'year', 'month', 'week' or 'day'
+        :param production: result of aepc.production_series, reused for several periods
+        :param production_statistics: the statistics to write if already calculated, the data and alarms are not
+                                      used then
         :return: status of the write operation, filename, error
         """
-        production_statistics = aepc.calculate_production_stats(data, pc,ice_events, ice_stops, status_stops, ips_on_flags, ice_detected)
-        filename_trunk = '_production_stats.txt'
+        if production_statistics is None:
+            production_statistics = aepc.calculate_production_stats(data, pc,ice_events, ice_stops, status_stops, ips_on_flags, ice_detected, period, production)
+        if period == 'month':
+            filename_trunk = '_production_stats.txt'
+        else:
+            filename_trunk = '_production_stats_{0}.txt'.format(period)
         filename = aepc.result_dir + aepc.id + filename_trunk
-        headers = ['month', 'Theoretical production', 'Actual production', 'Total losses', 'Total losses (%)',
-                   'Production losses due to icing', 'Relative icing production loss',
-                   'Losses due to icing induced stops', 'Relative losses due to iced stops',
-                   'Losses during SCADA stops', 'Relative losses during SCADA stops',
-                   'Losses during IPS operation', 'Relative losses during IPS operation',
-                   'Losses during ice detection', 'Relative losses during ice detection',
-                   'Total icing losses', 'Relative icing losses', 'IPS consumption']
+        date_format = aggregation.PERIOD_FORMATS[period]
+        headers = [period] + PRODUCTION_STATS_FIELDS
+        self.production_stats[period] = (production_statistics, headers)
+        # every field is followed by a tab
+        lines = ['\t'.join(headers) + '\t\n']
+        if len(production_statistics) > 0:
+            values = np.asarray(production_statistics[:, 1:]).astype(str)
+            for start, line in zip(production_statistics[:, 0], values):
+                lines.append(start.strftime(date_format) + '\t' + '\t'.join(line) + '\t\n')
         try:
             with open(filename,'w') as f:
-                for item in headers:
-                    f.write(item)
-                    f.write('\t')
-                f.write('\n')
-                for line in production_statistics:
-                    for item in line:
-                        if type(item) == datetime.datetime:
-                            f.write(item.strftime('%Y-%m'))
-                            f.write('\t')
-                        else:
-                            f.write(str(item))
-                            f.write('\t')
-                    f.write('\n')
+                f.write(''.join(lines))
             return True, filename, ''
         except IOError as e:
             return False, filename, e
         
         
     
+    def write_result_bundle(self, aepc, pc, events):
+        """
+        write the summary, the power curve, the event tables and the production statistics into one .npz file
+
+        The summary and the statistics are the ones written last by summary_statistics and write_monthly_stats.
+
+        :param aepc: aep counter used to calculate the results
+        :param pc: power curve
+        :param events: ordered dictionary of the event tables by name, e.g. 'losses' and 'stops'
+        :return: status of the write operation, filename, error
+        """
+        filename = result_bundle.bundle_filename(aepc.result_dir, aepc.id)
+        try:
+            result_bundle.write_bundle(filename, self.summary, pc, aepc.wind_bins, aepc.direction_bins, events,
+                                       self.production_stats, self.compress_bundle)
+            return True, filename, ''
+        except IOError as e:
+            return False, filename, e
+
     def insert_fault_codes(self, data,aepc,reader):
         """
         re-insert the textual fault codes into the data time series table
@@ -742,18 +1404,15 @@ class Result_file_writer():
         :return: the filtered data as numpy.ndarray
         
         """
-        for k,line in enumerate(data):
-            for i,item in enumerate(line):
-                if i in reader.fault_columns:
-                    for code,val in reader.fault_dict.items():
-                        if val == item:
-                            data[k,i] = code
+        for i in reader.fault_columns:
+            if i < np.shape(data)[1]:
+                data[:, i] = reader.fault_codes.decode(data[:, i])
         return data
     
-    def generate_standard_plots(self, data, pc, aepc, red_power, overprod, stops, data_sizes, alarm_timings, over_timings, stop_timings, ips_on_flags, write=False):
+    def standard_plot_data(self, data, pc, aepc, red_power, overprod, stops, data_sizes, alarm_timings, over_timings, stop_timings, ips_on_flags, aligned=None):
         """
-        create two predefined plots from the time series data
-        
+        collect everything the standard plots show into plain numpy arrays and texts
+
         :param data: input data
         :param pc: power curve structure
         :param aepc: active AEP Counter object
@@ -765,8 +1424,8 @@ class Result_file_writer():
         :param over_timings: statistics for over production
         :param stop timigns: statistics of icing induced stop events
         :param ips_on_flags: IPS stops, only valid for heated systems, will be None if not heated
-        :param write: if True, write to disk, otherwise run matplotlib.pyplot.show()
-         
+        :param aligned: the alarm series aligned by aepc.align_alarms, aligned on the time limited data if not given
+        :return: dictionary used by plotting.draw_standard_plots
         """
         # # calculate mean power curve (mean of power curves from different directions), useful for plotting
         mpc = aepc.mean_power_curve(pc)
@@ -779,16 +1438,9 @@ class Result_file_writer():
         else:
             stop_time = aepc.stoptimestamp
         data_period = (stop_time-start_time).total_seconds()/60.0/60.0
-        reference_start = data[0,aepc.ts_index]
-        reference_stop = data[-1,aepc.ts_index]
-        reference_data_period = (reference_stop-reference_start).total_seconds()/60.0/60.0
         tmax_power = aepc.theoretical_output_power(data, pc)
-        theoretical_production = aepc.calculate_production(tmax_power, 1)
         actual_production = aepc.calculate_production(tmax_power, 2)
-        theoretical_production_sum = np.nansum(theoretical_production[:, 1])
         actual_production_sum = np.nansum(actual_production[:, 1])
-        total_losses = theoretical_production_sum - actual_production_sum
-        total_losses_perc = ((theoretical_production_sum - actual_production_sum)/theoretical_production_sum) * 100.0
         # check for empty
         if np.shape(alarm_timings) == (0,):
             icing_loss_production = 0.0
@@ -805,8 +1457,6 @@ class Result_file_writer():
             stop_losses  = np.nansum(stop_timings[:, 2])
             stop_duration = np.nansum(stop_timings[:, 3])
         stop_loss_perc = (stop_losses/actual_production_sum) * 100.0
-        icing_duration_perc = (icing_duration / data_period) * 100.0
-        stop_duration_perc = (stop_duration / data_period) * 100.0
         # check for empty
         if np.shape(over_timings) == (0,):
             over_prod_duration = 0.0
@@ -814,88 +1464,65 @@ class Result_file_writer():
             over_prod_duration = np.nansum(over_timings[:, 3])
         over_prod_duration_perc = (over_prod_duration / data_period) * 100.0
         availability = aepc.count_availability(data) * 100.0
-        
-        data_loss = ((data_sizes[0]-data_sizes[1])/data_sizes[0]) * 100.0
-        reference_loss = ((data_sizes[0]-data_sizes[2])/data_sizes[0]) * 100.0
-        # few exmaple plots
-        
-        ## scatterplot the data overlay the power curve
-        # plot wind speed on x-axis and power on y-axis
-        production_loss_label = "Lost production due to icing: {0:.1f} %".format(icing_loss_perc)
-        stop_label = "Stops due to icing: {0:.1f} %".format(stop_loss_perc)
-        overprod_label = "Overproduction: {0:.1f} % of total time".format(over_prod_duration_perc)
-
-        matplotlib.rcParams.update({'font.size': 22})
-        # plt.style.use('bmh')
-        fig0 = plt.figure(0)
-        ax = fig0.gca()
-        ax.plot(red_power[:, 2], red_power[:, 5], 'bo',label='standard production', alpha=0.5, markersize=6)
-        # mark all cases where an alarm has been triggered with a red 'x'
-        ax.plot(red_power[red_power[:,1] == 1.0, 2], red_power[red_power[:,1] == 1.0, 5], 'ro', label=production_loss_label, alpha=0.5, markersize=6)
-        ax.plot(stops[stops[:,1] == 2.0, 2], stops[stops[:,1] == 2.0, 5], 'ko', label=stop_label, alpha=0.5, markersize=6)
-        ax.plot(overprod[overprod[:,1] == 3.0, 2], overprod[overprod[:,1] == 3.0, 5], 'go', label=overprod_label, alpha=0.5, markersize=6)
-        if ips_on_flags is not None:
-            ips_label = "IPS ON"
-            ax.plot(ips_on_flags[ips_on_flags[:, 1] != 0.0, 2], ips_on_flags[ips_on_flags[:, 1] != 0.0, 5], 'yo', label=ips_label, alpha=0.5, markersize=6)
-
-        # plot a mean power curve and the P10 curve on top of the data
-        ax.plot(mpc[:,0], mpc[:,2], 'c-', lw=4, label='Power curve') # linewidth 2
-        ax.plot(mpc[:,0], mpc[:,3], 'c--', lw=4, label='P10')
-        ax.plot(mpc[:,0], mpc[:,4], 'c-.', lw=4, label='P90')
-        ax.set_title('Dataset: {0}\n start time: {1}, stop time: {2} \n data availability: {3:.1f}'
-          .format(aepc.id,start_time.strftime("%Y-%m-%d %H:%M:%S"),stop_time.strftime("%Y-%m-%d %H:%M:%S"),availability))
-        ax.set_xlabel('Wind speed [m/s]')
-        ax.set_ylabel('Power [kW]')
-        tick_size = 2
-        ax.set_xticks((list(range(0, self.power_curve_plot_max + tick_size, tick_size))))
-        ax.set_xlim((0, self.power_curve_plot_max))
-        ax.legend(loc='upper left', framealpha=0.3)
-        #     plt.show()
-        # hide yaxis to obfuscate the true power values
-        # ax = plt.gca()
-        ax.axes.get_yaxis().set_visible(False)
-        
-        # # # plot the timeseries flag the ice cases
-        # fig1 = plt.figure(1)
-        # plt.title('Dataset: {0}, start time: {1}, stop time: {2}, data availability: {3:.1f}'
-        #   .format(aepc.id,start_time.strftime("%Y-%m-%d %H:%M:%S"),stop_time.strftime("%Y-%m-%d %H:%M:%S"),availability))
-        # # # plot the original timeseries on green
-        # plt.plot_date(data[:, 0], data[:, aepc.pow_index], 'g-', label='observed power')
-        # # # plot the reference data on black (this could also be red_power[:,3], its pretty much the same data)
-        # plt.plot_date(stops[:, 0], stops[:, 3], 'k-', label='reference data')
-        # # # mark all stops with red
-        # plt.plot_date(stops[stops[:, 1] == 2.0, 0], stops[stops[:, 1] == 2.0, 5], 'r.', label='stops')
-        # # # mark all cases where production has gone down with blue
-        # plt.plot_date(red_power[red_power[:,1] == 1.0, 0], red_power[red_power[:,1] == 1.0, 5], 'b.', label='production loss')
-        # plt.legend(loc='best')
-
-
-
-        if write:
-            pc_filename = aepc.result_dir +aepc.id + '_pc.png'
-            fig0.set_size_inches(18.5, 10.5)
-            fig0.savefig(pc_filename, bbox_inches='tight', dpi=300)
-            # ts_filename = aepc.result_dir + aepc.id + '_ts.png'
-            # fig1.set_size_inches(18.5, 10.5)
-            # fig1.savefig(ts_filename, bbox_inches='tight', dpi=300)
-            plt.close(0)
-            # plt.close(1)
-            print("{0} : Power curve plots written to : {1}"
-                  .format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), pc_filename))
-        else:
-            plt.show()
-        #==============================================================================
-        #          # # plot all directional power curves in one figure
-        #          plt.figure(2)
-        #          for i in range(len(aepc.direction_bins)):
-        #              lbl = "{0}".format(aepc.direction_bins[i])
-        #              plt.plot(pc[:,i,0],pc[:,i,2],'-',label=lbl)
-        #              plt.plot(pc[:,i,0],pc[:,i,3],'--',label=lbl)
-        #          #     plt.plot(pc[:,i,0],pc[:,i,4],'.-',label=lbl)
-        #          plt.legend()
-        #          plt.show()
-        #==============================================================================
-    
+        if aligned is None:
+            aligned = aepc.align_alarms(aepc.time_filter_data(data), pc, [('losses', red_power), ('stops', stops),
+                                                                          ('over', overprod), ('ips', ips_on_flags)])
+
+        return {'title': 'Dataset: {0}\n start time: {1}, stop time: {2} \n data availability: {3:.1f}'
+                         .format(aepc.id, start_time.strftime("%Y-%m-%d %H:%M:%S"), stop_time.strftime("%Y-%m-%d %H:%M:%S"), availability),
+                'production loss label': "Lost production due to icing: {0:.1f} %".format(icing_loss_perc),
+                'stop label': "Stops due to icing: {0:.1f} %".format(stop_loss_perc),
+                'overproduction label': "Overproduction: {0:.1f} % of total time".format(over_prod_duration_perc),
+                'maximum wind speed': self.power_curve_plot_max,
+                'power curve': mpc[:, [0, 2, 3, 4]].astype(float),
+                'production': aligned.points(aligned.present['losses']),
+                'icing losses': aligned.points(aligned.flagged('losses', 1.0)),
+                'icing stops': aligned.points(aligned.flagged('stops', 2.0)),
+                'overproduction': aligned.points(aligned.flagged('over', 3.0)),
+                'ips on': aligned.points(aligned.flagged('ips')) if 'ips' in aligned and ips_on_flags is not None else None,
+                'observed power': (aggregation.to_datetime64(data[:, aepc.ts_index]), aepc.float_column(data, aepc.pow_index)),
+                'reference power': (aligned.timestamps[aligned.present['stops']], aligned.reference[aligned.present['stops']]),
+                'stop times': aligned.points(aligned.flagged('stops', 2.0), 'time'),
+                'loss times': aligned.points(aligned.flagged('losses', 1.0), 'time')}
+
+    def generate_standard_plots(self, data, pc, aepc, red_power, overprod, stops, data_sizes, alarm_timings, over_timings, stop_timings, ips_on_flags, write=False, background=False, aligned=None, writer=None):
+        """
+        create two predefined plots from the time series data: the power curve with a scatter plot of the data and
+        the time series, both with the icing events marked
+
+        Long time series are downsampled for drawing, see the plotting module.
+
+        :param data: input data
+        :param pc: power curve structure
+        :param aepc: active AEP Counter object
+        :param red_power: timeseries of reduced power
+        :param overprod: timeseries of overproduction
+        :param stops: timeseries of stops
+        :param data_sizes: lengths of differently filtered datasets
+        :param alarm_timings: statistics of reduced power incidents
+        :param over_timings: statistics for over production
+        :param stop timigns: statistics of icing induced stop events
+        :param ips_on_flags: IPS stops, only valid for heated systems, will be None if not heated
+        :param write: if True, write to disk, otherwise run matplotlib.pyplot.show()
+        :param background: if True, the plots are written by a separate process and this returns right away
+        :param aligned: the alarm series aligned by aepc.align_alarms, aligned on the time limited data if not given
+        :param writer: result_bundle.BackgroundWriter to wait for before the plot process is started
+        :return: the process (or thread) writing the plots when background is True, otherwise None
+        """
+        plot_data = self.standard_plot_data(data, pc, aepc, red_power, overprod, stops, data_sizes, alarm_timings, over_timings, stop_timings, ips_on_flags, aligned)
+        if not write:
+            plotting.draw_standard_plots(plot_data)
+            return None
+        pc_filename = aepc.result_dir + aepc.id + '_pc.png'
+        ts_filename = aepc.result_dir + aepc.id + '_ts.png'
+        if background:
+            # the process must not be forked while the writer thread is writing
+            if writer is not None:
+                writer.wait()
+            return plotting.start_in_background(plotting.draw_standard_plots, plot_data, pc_filename, ts_filename)
+        plotting.draw_standard_plots(plot_data, pc_filename, ts_filename)
+        return None
+
     def read_powercurve_from_file(self,filename):
         """
         read powercurve from file produced by the program
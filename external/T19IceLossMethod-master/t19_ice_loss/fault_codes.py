@@ -0,0 +1,178 @@
+"""
+Categorical encoding of textual fault and status codes.
+
+The counter needs numbers, so the texts of the fault columns are replaced with integer codes. FaultCodes keeps the
+mapping between the texts and the codes. The codes are stable: they are written into the fault file of the dataset
+(<id>_faults.json) and the next run of the same dataset starts from the codes in the file, texts that are not in it
+get the next free codes. Encoding and decoding work on whole columns, every distinct text is looked up once and the
+column is converted with array indexing.
+
+CodeSet is a lookup table of a set of codes, e.g. the stop codes of the site. Testing which lines of a column have
+one of the codes is then a single array index, however many codes there are.
+"""
+
+import json
+import os
+
+import numpy as np
+
+# largest range of codes a CodeSet keeps in a lookup table, larger ranges are tested with numpy.isin
+MAX_TABLE_SIZE = 1 << 20
+
+
+class FaultCodes(object):
+    """
+    mapping between fault code texts and integer codes
+
+    :param codes: dictionary of texts and their codes, used as is, not copied
+    """
+
+    def __init__(self, codes=None):
+        self.codes = codes if codes is not None else {}
+        self._texts = None
+        self._texts_size = -1
+
+    @classmethod
+    def read(cls, filename):
+        """
+        read the codes from a fault file, the codes are empty if the file does not exist or cannot be read
+
+        :param filename: .json fault file written by write
+        :return: FaultCodes
+        """
+        if not os.path.exists(filename):
+            return cls()
+        try:
+            with open(filename, 'r') as infile:
+                codes = json.load(infile)
+        except ValueError as error:
+            print("Fault file {0} is not valid JSON, numbering the codes again: {1}".format(filename, error))
+            return cls()
+        return cls({text: int(code) for text, code in codes.items()})
+
+    def write(self, filename):
+        """
+        :param filename: name of the .json fault file
+        """
+        with open(filename, 'w') as outfile:
+            json.dump(self.codes, outfile, indent=4, sort_keys=True)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, text):
+        return text in self.codes
+
+    def code(self, text):
+        """
+        :param text: fault code text
+        :return: code of the text, a new text gets the next free code
+        """
+        text = text.strip()
+        if text not in self.codes:
+            self.codes[text] = max(self.codes.values()) + 1 if len(self.codes) > 0 else 0
+        return self.codes[text]
+
+    def encode(self, texts):
+        """
+        replace a column of texts with their codes, new texts are numbered in the order they first appear
+
+        :param texts: sequence of texts
+        :return: int64 array of codes
+        """
+        values = np.asarray(texts, dtype=str)
+        if len(values) == 0:
+            return np.zeros(0, dtype=np.int64)
+        distinct, first, inverse = np.unique(values, return_index=True, return_inverse=True)
+        table = np.empty(len(distinct), dtype=np.int64)
+        for position in np.argsort(first, kind='stable'):
+            table[position] = self.code(distinct[position])
+        return table[inverse.reshape(-1)]
+
+    def add(self, texts):
+        """
+        add the texts that do not have a code yet
+
+        :param texts: sequence of texts
+        """
+        self.encode(texts)
+
+    def texts(self):
+        """
+        :return: object array of the texts indexed by their codes, None for unused codes
+        """
+        # codes are only ever added, the size tells if the table is up to date
+        if self._texts_size != len(self.codes):
+            size = max(self.codes.values()) + 1 if len(self.codes) > 0 else 0
+            self._texts = np.full(size, None, dtype=object)
+            for text, code in self.codes.items():
+                if code >= 0:
+                    self._texts[code] = text
+            self._texts_size = len(self.codes)
+        return self._texts
+
+    def decode(self, values):
+        """
+        replace codes with their texts, values that are not codes are kept as they are
+
+        :param values: column of codes, numbers of any type
+        :return: object array
+        """
+        decoded = np.array(values, dtype=object)
+        texts = self.texts()
+        if len(decoded) == 0 or len(texts) == 0:
+            return decoded
+        try:
+            numbers = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            # already contains texts
+            return decoded
+        lines = code_positions(numbers, 0, len(texts))
+        found = texts[numbers[lines].astype(np.int64)]
+        known = np.not_equal(found, None)
+        decoded[lines[known]] = found[known]
+        return decoded
+
+
+def code_positions(numbers, low, size):
+    """
+    :param numbers: float array
+    :param low: smallest accepted code
+    :param size: number of accepted codes
+    :return: indexes of the lines of numbers that are whole numbers from low to low + size - 1
+    """
+    with np.errstate(invalid='ignore'):
+        candidates = np.flatnonzero((numbers >= low) & (numbers < low + size))
+    whole = numbers[candidates] == np.floor(numbers[candidates])
+    return candidates[whole]
+
+
+class CodeSet(object):
+    """
+    lookup table of a set of codes
+
+    :param codes: codes in the set
+    """
+
+    def __init__(self, codes):
+        self.codes = np.unique(np.asarray(codes, dtype=np.float64).reshape(-1))
+        self.table = None
+        self.low = 0
+        whole = np.all(np.isfinite(self.codes) & (self.codes == np.floor(self.codes)))
+        if len(self.codes) > 0 and whole and self.codes[-1] - self.codes[0] < MAX_TABLE_SIZE:
+            self.low = int(self.codes[0])
+            self.table = np.zeros(int(self.codes[-1]) - self.low + 1, dtype=bool)
+            self.table[self.codes.astype(np.int64) - self.low] = True
+
+    def contains(self, values):
+        """
+        :param values: float array
+        :return: boolean array, True for the values in the set
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if self.table is None:
+            return np.isin(values, self.codes)
+        member = np.zeros(len(values), dtype=bool)
+        lines = code_positions(values, self.low, len(self.table))
+        member[lines] = self.table[values[lines].astype(np.int64) - self.low]
+        return member
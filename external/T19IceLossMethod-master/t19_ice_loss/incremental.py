@@ -0,0 +1,459 @@
+"""
+Incremental version of the icing loss calculation.
+
+IncrementalAEPcounter keeps the statistics of the power curve bins and the unfinished end of the time series
+between runs, so that newly arrived SCADA data can be processed without going through the whole history again.
+
+Differences to a full recalculation with t19_counter.py are bounded as follows:
+
+* P10, P50 and P90 of every bin are read from a fixed width histogram. The estimate is within one bucket width,
+  (sketch power range * rated power) / sketch buckets, of the measurement at the lower of the two ranks the exact
+  percentile is interpolated from. Measurements outside the histogram range are counted in the first or last bucket.
+* The wind speed of a bin is the mean of the wind speeds in the bin instead of the median, so the difference is
+  at most the wind speed bin size.
+* Alarm values are final once the lines following them have arrived (one line for power alarms, stop time filter
+  lines for stops). Final lines are not evaluated again when the power curve changes later. The interpolated
+  reference and limit values of such lines differ from the ones of the current curve by at most curve_drift(),
+  the largest difference between the current P10, P50 and P90 curves and the curves used in any earlier update.
+
+The first update should contain enough history to build proper power curves, events found with curves built from
+a few days of data are not corrected later.
+"""
+
+import configparser
+import datetime
+import json
+import os
+import sys
+
+import numpy as np
+
+from .aep_counter import AEPcounter
+
+
+class PowerCurveSketch:
+    """
+    streaming statistics of the power curve bins
+
+    For every wind speed and direction bin the sketch keeps the number of measurements, sums for the wind speed and
+    direction means, the running mean and sum of squared differences of power for the standard deviation and a fixed
+    width histogram of power for the percentiles. Sketches of separate data sets can be combined by adding the
+    measurements one data set after another.
+    """
+    def __init__(self, wind_bins, direction_bins, min_power, max_power, buckets):
+        self.wind_bins = np.asarray(wind_bins, dtype=float)
+        self.direction_bins = np.asarray(direction_bins, dtype=float)
+        self.min_power = float(min_power)
+        self.max_power = float(max_power)
+        self.buckets = int(buckets)
+        shape = (len(self.wind_bins), len(self.direction_bins))
+        self.counts = np.zeros(shape, dtype=np.int64)
+        self.wind_speed_counts = np.zeros(shape, dtype=np.int64)
+        self.wind_speed_sums = np.zeros(shape)
+        self.direction_counts = np.zeros(shape, dtype=np.int64)
+        self.direction_sin_sums = np.zeros(shape)
+        self.direction_cos_sums = np.zeros(shape)
+        self.power_counts = np.zeros(shape, dtype=np.int64)
+        self.power_means = np.zeros(shape)
+        self.power_m2 = np.zeros(shape)
+        self.power_min = np.full(shape, np.inf)
+        self.power_max = np.full(shape, -np.inf)
+        self.histogram = np.zeros(shape + (self.buckets,), dtype=np.int64)
+
+    def bucket_width(self):
+        """
+        :return: width of one histogram bucket, the accuracy of the percentiles
+        """
+        return (self.max_power - self.min_power) / self.buckets
+
+    def bin_sums(self, keys, weights=None, dtype=float):
+        """
+        sum weights (or count lines if weights is None) per bin
+
+        :param keys: flat bin index of every line
+        :param weights: values to sum
+        :return: array shaped as the bins
+        """
+        sums = np.bincount(keys, weights, minlength=self.counts.size)
+        return sums.reshape(self.counts.shape).astype(dtype)
+
+    def add(self, speed_bins, direction_bins, wind_speeds, directions, powers):
+        """
+        add measurements into the sketch
+
+        :param speed_bins: wind speed bin index of every measurement
+        :param direction_bins: direction bin index of every measurement
+        :param wind_speeds: wind speeds
+        :param directions: wind directions in degrees
+        :param powers: output powers
+        """
+        keys = speed_bins * len(self.direction_bins) + direction_bins
+        self.counts += self.bin_sums(keys, dtype=np.int64)
+
+        valid = ~np.isnan(wind_speeds)
+        self.wind_speed_counts += self.bin_sums(keys[valid], dtype=np.int64)
+        self.wind_speed_sums += self.bin_sums(keys[valid], wind_speeds[valid])
+
+        valid = ~np.isnan(directions)
+        radians = np.radians(directions[valid])
+        self.direction_counts += self.bin_sums(keys[valid], dtype=np.int64)
+        self.direction_sin_sums += self.bin_sums(keys[valid], np.sin(radians))
+        self.direction_cos_sums += self.bin_sums(keys[valid], np.cos(radians))
+
+        valid = ~np.isnan(powers)
+        keys = keys[valid]
+        powers = powers[valid]
+        batch_counts = self.bin_sums(keys, dtype=np.int64)
+        batch_means = np.divide(self.bin_sums(keys, powers), batch_counts, out=np.zeros(self.counts.shape),
+                                where=batch_counts > 0)
+        batch_m2 = self.bin_sums(keys, (powers - batch_means.ravel()[keys]) ** 2)
+        # combine the batch with the earlier measurements (Chan et al. parallel variance)
+        total_counts = self.power_counts + batch_counts
+        delta = batch_means - self.power_means
+        nonzero = total_counts > 0
+        self.power_means[nonzero] += delta[nonzero] * batch_counts[nonzero] / total_counts[nonzero]
+        self.power_m2[nonzero] += batch_m2[nonzero] + delta[nonzero] ** 2 * self.power_counts[nonzero] * \
+            batch_counts[nonzero] / total_counts[nonzero]
+        self.power_counts = total_counts
+        np.minimum.at(self.power_min.ravel(), keys, powers)
+        np.maximum.at(self.power_max.ravel(), keys, powers)
+
+        buckets = np.floor((powers - self.min_power) / self.bucket_width())
+        buckets = np.clip(buckets, 0, self.buckets - 1).astype(np.int64)
+        histogram = np.bincount(keys * self.buckets + buckets, minlength=self.histogram.size)
+        self.histogram += histogram.reshape(self.histogram.shape)
+
+    def percentile(self, percentile):
+        """
+        estimate a percentile of power in every bin from the histogram
+
+        Uses the same rank as scipy.stats.scoreatpercentile, the measurements inside a bucket are
+        assumed to be evenly spread over the bucket. The estimates are limited to the smallest and largest
+        measurement of the bin, which keeps e.g. the percentiles at rated power exact.
+
+        :param percentile: wanted percentile, 0-100
+        :return: array of estimates shaped as the bins, nan for empty bins
+        """
+        cumulative = np.cumsum(self.histogram, axis=2)
+        totals = cumulative[:, :, -1]
+        rank = percentile / 100.0 * (totals - 1)
+        bucket = np.minimum((cumulative <= rank[:, :, np.newaxis]).sum(axis=2), self.buckets - 1)
+        bucket_counts = np.take_along_axis(self.histogram, bucket[:, :, np.newaxis], axis=2)[:, :, 0]
+        preceding = np.take_along_axis(cumulative, bucket[:, :, np.newaxis], axis=2)[:, :, 0] - bucket_counts
+        with np.errstate(invalid='ignore', divide='ignore'):
+            position = np.clip((rank - preceding + 0.5) / bucket_counts, 0.0, 1.0)
+        estimate = self.min_power + (bucket + position) * self.bucket_width()
+        estimate = np.clip(estimate, self.power_min, self.power_max)
+        return np.where(totals > 0, estimate, np.nan)
+
+    def power_curves(self, aepc):
+        """
+        build power curves out of the sketch
+
+        :param aepc: AEPcounter, used for the bin centers, percentile limits and rated power
+        :return pc: unfiltered power curve matrix with the same layout as returned by AEPcounter.binned_statistics
+        """
+        pc = aepc.empty_power_curves()
+        filled = self.counts > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            wind_speed = np.where(self.wind_speed_counts > 0, self.wind_speed_sums / self.wind_speed_counts, np.nan)
+            angle = np.degrees(np.arctan2(self.direction_sin_sums / self.direction_counts,
+                                          self.direction_cos_sums / self.direction_counts))
+            direction = np.where(self.direction_counts > 0, (angle + 360) % 360, np.nan)
+            median = self.percentile(50)
+            std = np.sqrt(self.power_m2 / self.power_counts)
+            uncertainty = np.where(median != 0.0, std / median * 100.0, 0.0)
+        upper = np.where(median > aepc.rated_power, median + std, np.minimum(median + std, aepc.rated_power))
+        values = np.stack((median, self.percentile(aepc.pc_low_limit), self.percentile(aepc.pc_high_limit), std,
+                           uncertainty, np.maximum(0.0, median - std), upper), axis=2)
+        values[self.power_counts == 0] = np.nan
+        pc[filled, 0] = wind_speed[filled]
+        pc[filled, 1] = direction[filled]
+        for position, variable_index in enumerate([2, 3, 4, 5, 6, 8, 9]):
+            pc[filled, variable_index] = values[filled, position]
+        pc[:, :, 7] = self.counts
+        return pc
+
+    def to_arrays(self):
+        """
+        :return: dictionary of the sketch arrays, used for saving the state
+        """
+        return {'sketch_' + name: getattr(self, name) for name in self.array_names()}
+
+    def from_arrays(self, arrays):
+        """
+        restore the sketch arrays saved with to_arrays
+
+        :param arrays: dictionary like object containing the saved arrays
+        """
+        for name in self.array_names():
+            setattr(self, name, np.array(arrays['sketch_' + name]))
+
+    def array_names(self):
+        return ['counts', 'wind_speed_counts', 'wind_speed_sums', 'direction_counts', 'direction_sin_sums',
+                'direction_cos_sums', 'power_counts', 'power_means', 'power_m2', 'power_min', 'power_max', 'histogram']
+
+
+class IncrementalAEPcounter(AEPcounter):
+    """
+    AEPcounter that processes the data in increments
+
+    Every call to update takes the lines newer than the previous update, adds the reference lines to the power
+    curve sketch and evaluates the alarms of the new lines together with the unfinished end of the earlier data.
+    Events are reported when they change: open events while they are still ongoing, closed events once when they
+    end and removed events if an open event disappears when its lines are evaluated again.
+
+    The state is kept in a .npz file between runs, see save_state and load_state.
+    """
+    def __init__(self):
+        super().__init__()
+        self.state_file = ''
+        self.sketch_buckets = 200
+        self.sketch_power_range = 1.25 # upper end of the power histogram as a multiple of rated power
+        self.sketch = None
+        self.pending = None # lines needed to finish the evaluation of the open events
+        self.finalized = {} # per event type, timestamp of the last line with a final alarm value
+        self.open_events = {} # per event type, last reported version of every open event
+        self.last_timestamp = None
+        self.curve_envelope = None # elementwise minimum and maximum of the P50, P10 and P90 curves used so far
+
+    def set_incremental_options_from_file(self, filename):
+        """
+        read the options of the incremental mode from the config file, call after set_data_options_from_file
+        """
+        config = configparser.ConfigParser()
+        config.read(filename)
+        try:
+            state_file = config.get('Incremental', 'state file', fallback=self.get_fallback_value('Incremental', 'state file'))
+            if state_file.upper() == 'NONE':
+                self.state_file = self.result_dir + self.id + '_state.npz'
+            else:
+                self.state_file = state_file
+            self.sketch_buckets = int(config.get('Incremental', 'sketch buckets', fallback=self.get_fallback_value('Incremental', 'sketch buckets')))
+            self.sketch_power_range = float(config.get('Incremental', 'sketch power range', fallback=self.get_fallback_value('Incremental', 'sketch power range')))
+        except ValueError as wrong_value:
+            print("Wrong type of value in {0}: {1}".format(filename, wrong_value))
+            sys.exit(1)
+
+    def new_sketch(self):
+        return PowerCurveSketch(self.wind_bins, self.direction_bins, 0.0, self.sketch_power_range * self.rated_power,
+                                self.sketch_buckets)
+
+    def power_curves(self):
+        """
+        :return: power curves built from the current sketch
+        """
+        return self.finalize_power_curves(self.sketch.power_curves(self))
+
+    def curve_drift(self):
+        """
+        largest difference between the current P50, P10 and P90 curves and the curves used in earlier updates
+
+        :return: drift in units of power, 0.0 if there is no curve yet
+        """
+        if self.curve_envelope is None or self.sketch is None:
+            return 0.0
+        current = self.power_curves()[:, :, 2:5]
+        difference = np.maximum(np.abs(current - self.curve_envelope[0]), np.abs(self.curve_envelope[1] - current))
+        if np.isnan(difference).all():
+            return 0.0
+        return float(np.nanmax(difference))
+
+    def update(self, data):
+        """
+        process new lines of data
+
+        :param data: data in the format read by CSVimporter, lines at or before the last processed timestamp are ignored
+        :return: list of changed events formatted as [event type, status, start, stop, loss, duration, mean power drop,
+                 mean power, mean reference power, mean wind speed, mean temperature(, ips consumption)]
+        """
+        if self.sketch is None:
+            self.sketch = self.new_sketch()
+        if len(data) > 0 and self.last_timestamp is not None:
+            data = data[self.timestamp_array(data[:, self.ts_index]) > np.datetime64(self.last_timestamp, 'us')]
+        if len(data) == 0:
+            return []
+        self.last_timestamp = data[-1, self.ts_index]
+        preprocessed = self.preprocess(data)
+
+        # same reference data as in t19_counter
+        reference_data = preprocessed.select('state', 'temperature', 'power level')
+        if len(reference_data) > 0:
+            speed_bins, direction_bins = self.bin_indices(reference_data)
+            self.sketch.add(speed_bins, direction_bins, self.float_column(reference_data, self.ws_index),
+                            self.float_column(reference_data, self.wd_index),
+                            self.float_column(reference_data, self.pow_index))
+        pc = self.power_curves()
+        if self.curve_envelope is None:
+            self.curve_envelope = np.stack((pc[:, :, 2:5], pc[:, :, 2:5]))
+        else:
+            self.curve_envelope[0] = np.fmin(self.curve_envelope[0], pc[:, :, 2:5])
+            self.curve_envelope[1] = np.fmax(self.curve_envelope[1], pc[:, :, 2:5])
+
+        window = preprocessed.select('time')
+        if self.pending is not None and len(self.pending) > 0:
+            window = np.vstack((self.pending, window)) if len(window) > 0 else self.pending
+        if len(window) == 0:
+            return []
+        events, keep_from = self.evaluate_window(window, pc)
+        if keep_from is None:
+            self.pending = None
+        else:
+            self.pending = window[self.timestamp_array(window[:, self.ts_index]) >= np.datetime64(keep_from, 'us')]
+        return events
+
+    def evaluate_window(self, window, pc):
+        """
+        evaluate the alarms of all event types in window
+
+        :param window: lines to evaluate
+        :param pc: power curves
+        :return: list of changed events, timestamp of the first line needed by the next update
+        """
+        state_filtered_data = self.state_filter_data(window)
+        power_level_filtered_data = self.power_level_filter(state_filtered_data)
+        reference = self.interpolate_power_curves(power_level_filtered_data, pc)
+        # [event type, alarms, minimum length, number of lines at the end whose alarm value may still change, ips]
+        series = [('losses', self.power_alarms(power_level_filtered_data, pc, False, reference=reference), self.icing_time, 1, False),
+                  ('over', self.power_alarms(power_level_filtered_data, pc, False, True, reference), self.icing_time, 1, False)]
+        if self.stop_filter_type in (0, 1, 2):
+            series.append(('stops', self.find_icing_related_stops(state_filtered_data, pc, False), self.stop_time, max(1, self.stop_time), False))
+        if self.stop_filter_type in (1, 2):
+            series.append(('status', self.status_code_stops(window, pc), 1, 0, False))
+        if self.heated_site:
+            series.append(('ips', self.status_code_stops(window, pc, filter_type='ips'), 1, 0, True))
+        if self.ice_detection:
+            series.append(('ice detection', self.status_code_stops(window, pc, filter_type='icing'), 1, 0, False))
+
+        events = []
+        keep_from = None
+        for name, alarms, min_length, provisional, ips_alarm in series:
+            series_events, series_keep_from = self.series_events(name, alarms, min_length, provisional, ips_alarm)
+            events.extend(series_events)
+            if series_keep_from is not None and (keep_from is None or series_keep_from < keep_from):
+                keep_from = series_keep_from
+        return events, keep_from
+
+    def series_events(self, name, alarms, min_length, provisional, ips_alarm):
+        """
+        find the changed events of one event type
+
+        :param name: event type
+        :param alarms: alarm array as produced by power_alarms or status_code_stops, without time filtering
+        :param min_length: minimum number of consecutive alarms in an event
+        :param provisional: number of lines at the end of alarms whose alarm value can still change
+        :param ips_alarm: passed on to power_loss_during_alarm
+        :return: list of changed events, timestamp of the first line needed by the next update
+        """
+        if len(alarms) == 0:
+            return [], None
+        previous_open = self.open_events.get(name, {})
+        finalized = self.finalized.get(name)
+        if finalized is not None:
+            # final lines were already reported
+            timestamps = self.timestamp_array(alarms[:, 0])
+            alarms[timestamps <= np.datetime64(finalized, 'us'), 1] = 0
+        run_starts, run_stops = self.alarm_runs(alarms[:, 1])
+        final_limit = len(alarms) - provisional
+        closed = run_stops < final_limit
+        long_enough = run_stops - run_starts >= min_length
+
+        events = []
+        for start, stop in zip(run_starts[closed & long_enough], run_stops[closed & long_enough]):
+            event = self.event_timing(alarms[start:stop + 1], ips_alarm)
+            if event is not None:
+                events.append((name, 'closed') + event)
+        current_open = {}
+        for start, stop in zip(run_starts[~closed & long_enough], run_stops[~closed & long_enough]):
+            segment = alarms[start:stop + 1].copy()
+            if stop == len(alarms):
+                # still ongoing, count the event up to the last line
+                segment[-1, 1] = 0
+            event = self.event_timing(segment, ips_alarm)
+            if event is None:
+                continue
+            key = event[0].isoformat()
+            current_open[key] = repr(event)
+            if previous_open.get(key) != current_open[key]:
+                events.append((name, 'open') + event)
+        closed_starts = {alarms[start, 0].isoformat() for start in run_starts[closed & long_enough]}
+        for key in previous_open:
+            if key not in current_open and key not in closed_starts:
+                events.append((name, 'removed', datetime.datetime.fromisoformat(key)))
+        self.open_events[name] = current_open
+
+        first_open = run_starts[~closed].min() if (~closed).any() else len(alarms)
+        last_final = min(first_open, final_limit) - 1
+        if last_final < 0:
+            return events, alarms[0, 0]
+        self.finalized[name] = alarms[last_final, 0]
+        return events, alarms[last_final, 0]
+
+    def event_timing(self, segment, ips_alarm):
+        """
+        :param segment: alarm lines of one event followed by the first line after the event
+        :return: event statistics from power_loss_during_alarm as a tuple, None if there is no event
+        """
+        timings = self.power_loss_during_alarm(segment, ips_alarm)
+        if len(timings) == 0:
+            return None
+        return tuple(timings[0])
+
+    def save_state(self, filename):
+        """
+        save the sketch, the pending lines and the event bookkeeping into a .npz file
+
+        The pending lines are stored as floats, timestamps separately as datetime64.
+        """
+        arrays = self.sketch.to_arrays()
+        if self.pending is not None and len(self.pending) > 0:
+            value_columns = [i for i in range(np.shape(self.pending)[1]) if i != self.ts_index]
+            arrays['pending_timestamps'] = self.timestamp_array(self.pending[:, self.ts_index])
+            arrays['pending_values'] = np.asarray(self.pending[:, value_columns], dtype=float)
+        if self.curve_envelope is not None:
+            arrays['curve_envelope'] = self.curve_envelope
+        meta = {'wind bins': self.wind_bins.tolist(),
+                'direction bins': self.direction_bins.tolist(),
+                'sketch buckets': self.sketch_buckets,
+                'sketch power range': self.sketch_power_range,
+                'rated power': self.rated_power,
+                'last timestamp': self.last_timestamp.isoformat() if self.last_timestamp is not None else None,
+                'finalized': {name: timestamp.isoformat() for name, timestamp in self.finalized.items()},
+                'open events': self.open_events}
+        arrays['meta'] = np.array(json.dumps(meta))
+        with open(filename, 'wb') as state_file:
+            np.savez_compressed(state_file, **arrays)
+
+    def load_state(self, filename):
+        """
+        load a state saved with save_state
+
+        The state is only used if it was created with the same binning and sketch settings.
+
+        :return: True if the state was loaded
+        """
+        if not os.path.exists(filename):
+            return False
+        with np.load(filename) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            if meta['wind bins'] != self.wind_bins.tolist() or meta['direction bins'] != self.direction_bins.tolist() or \
+                    meta['sketch buckets'] != self.sketch_buckets or meta['sketch power range'] != self.sketch_power_range or \
+                    meta['rated power'] != self.rated_power:
+                print("state in {0} was created with different settings, starting over".format(filename))
+                return False
+            self.sketch = self.new_sketch()
+            self.sketch.from_arrays(arrays)
+            self.curve_envelope = np.array(arrays['curve_envelope']) if 'curve_envelope' in arrays else None
+            if 'pending_values' in arrays:
+                timestamps = arrays['pending_timestamps'].astype(datetime.datetime)
+                values = arrays['pending_values']
+                self.pending = np.empty((len(timestamps), np.shape(values)[1] + 1), dtype=object)
+                self.pending[:, self.ts_index] = timestamps
+                self.pending[:, [i for i in range(np.shape(self.pending)[1]) if i != self.ts_index]] = values
+            else:
+                self.pending = None
+        if meta['last timestamp'] is not None:
+            self.last_timestamp = datetime.datetime.fromisoformat(meta['last timestamp'])
+        self.finalized = {name: datetime.datetime.fromisoformat(timestamp) for name, timestamp in meta['finalized'].items()}
+        self.open_events = meta['open events']
+        return True
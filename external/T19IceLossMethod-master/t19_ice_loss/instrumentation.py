@@ -0,0 +1,172 @@
+"""
+Instrumentation of the processing stages of t19_counter.py.
+
+Every stage of the processing (read, correct, filter, power curve, alarms, stops, timings, writers, plots, flush) is
+run inside Instrumentation.stage, which records the wall time, CPU time, number of rows going in and out of the
+stage and the memory high-water mark of the process at the end of the stage. When the dataset has been processed a total
+record of the whole run is added.
+
+The records are plain dictionaries. They are kept in Instrumentation.records and passed to every sink, a sink is any
+callable taking one record. JsonLinesSink appends the records into a JSON lines file, the API feeds them into its
+metrics registry.
+"""
+
+import collections
+import configparser
+import contextlib
+import datetime
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows, memory is not recorded there
+    resource = None
+
+STAGES = ('read', 'correct', 'filter', 'power curve', 'alarms', 'stops', 'timings', 'writers', 'plots', 'flush')
+
+
+def max_rss_mb():
+    """
+    :return: memory high-water mark of the current process in megabytes, None if it is not available
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == 'darwin':
+        max_rss /= 1024.0
+    return max_rss / 1024.0
+
+
+class JsonLinesSink(object):
+    """
+    appends every record as one line of JSON into a file
+
+    Every record is written with a single write into a file opened in append mode, so several processes can share the
+    same file, e.g. the workers of multifile_t19_counter.py.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __call__(self, record):
+        line = json.dumps(record) + '\n'
+        with open(self.filename, 'a') as metrics_file:
+            metrics_file.write(line)
+
+
+class Instrumentation(object):
+    """
+    records the stages of processing one dataset
+
+    :param dataset: dataset id added to every record, t19_counter.py sets it from the .ini file if it is empty
+    :param sinks: callables that get every record
+    """
+
+    def __init__(self, dataset='', sinks=None):
+        self.dataset = dataset
+        self.sinks = list(sinks) if sinks is not None else []
+        self.records = []
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def emit(self, record):
+        self.records.append(record)
+        for sink in self.sinks:
+            sink(record)
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        """
+        record one stage, the block sets the number of rows it produced into the yielded record::
+
+            with instrumentation.stage('read') as record:
+                data = read()
+                record['rows_out'] = len(data)
+
+        Nothing is recorded if the block raises an exception.
+
+        :param name: name of the stage
+        :param rows_in: number of rows going into the stage, None if not applicable
+        """
+        record = collections.OrderedDict([('dataset', self.dataset),
+                                          ('stage', name),
+                                          ('started', datetime.datetime.now().isoformat()),
+                                          ('rows_in', rows_in),
+                                          ('rows_out', None)])
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        yield record
+        record['wall_s'] = time.perf_counter() - start_wall
+        record['cpu_s'] = time.process_time() - start_cpu
+        record['max_rss_mb'] = max_rss_mb()
+        self.emit(record)
+
+    def finish(self, rows=None):
+        """
+        record the totals of the whole run
+
+        :param rows: number of rows in the dataset
+        :return: the total record
+        """
+        record = collections.OrderedDict([('dataset', self.dataset),
+                                          ('stage', 'total'),
+                                          ('started', None),
+                                          ('rows_in', rows),
+                                          ('rows_out', None),
+                                          ('wall_s', time.perf_counter() - self.start_wall),
+                                          ('cpu_s', time.process_time() - self.start_cpu),
+                                          ('max_rss_mb', max_rss_mb())])
+        self.emit(record)
+        return record
+
+
+def instrumentation_from_file(configfile_name):
+    """
+    instrumentation for the "metrics file" option of the Output section, without sinks if the option is not set
+
+    :param configfile_name: .ini file of the dataset
+    """
+    config = configparser.ConfigParser()
+    config.read(configfile_name)
+    metrics_filename = config.get('Output', 'metrics file', fallback='').strip()
+    instrumentation = Instrumentation(config.get('Source file', 'id', fallback=''))
+    if metrics_filename != '':
+        directory = os.path.dirname(metrics_filename)
+        if directory != '' and not os.path.exists(directory):
+            os.makedirs(directory)
+        instrumentation.add_sink(JsonLinesSink(metrics_filename))
+    return instrumentation
+
+
+def read_records(filename):
+    """
+    :param filename: JSON lines file written by JsonLinesSink
+    :return: list of records
+    """
+    with open(filename, 'r') as metrics_file:
+        return [json.loads(line) for line in metrics_file if line.strip() != '']
+
+
+def totals(records, key):
+    """
+    sum the wall and CPU times of the records by stage or by dataset
+
+    :param records: list of records
+    :param key: 'stage' to sum the stages of all datasets, 'dataset' to get the total of every dataset
+    :return: list of (name, wall time, cpu time) tuples, largest wall time first
+    """
+    sums = collections.OrderedDict()
+    for record in records:
+        # the total records already contain the stages of their dataset
+        if (record['stage'] == 'total') != (key == 'dataset'):
+            continue
+        wall, cpu = sums.get(record[key], (0.0, 0.0))
+        sums[record[key]] = (wall + record['wall_s'], cpu + record['cpu_s'])
+    return sorted(((name, wall, cpu) for name, (wall, cpu) in sums.items()), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,206 @@
+"""
+On-disk cache for power curves.
+
+Power curves are stored as .npy files named after a fingerprint of the reference data and of every option that
+affects count_power_curves, so a curve is only reused if it would be calculated from exactly the same input.
+Several processes can share the same cache directory, files are written into a temporary file first and then
+renamed in place.
+"""
+
+import configparser
+import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+
+class PowerCurveCache:
+    """
+    content addressed store of power curve arrays
+
+    Entries are evicted when they are older than max_age_days or, oldest first, when the cache grows over
+    max_size_mb. Reading an entry counts as using it, so the least recently used entries are removed first.
+    """
+    # change this if the power curve calculation changes so that old entries are not used anymore
+    format_version = 1
+
+    def __init__(self, cache_dir='', max_size_mb=100.0, max_age_days=30.0):
+        """
+        :param cache_dir: directory of the cache files, empty string disables the cache
+        :param max_size_mb: maximum total size of the cache files in megabytes
+        :param max_age_days: entries not used in this many days are removed
+        """
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+
+    def set_cache_options_from_file(self, filename, aepc):
+        """
+        read the Cache section of the config file, call after aepc.set_data_options_from_file
+
+        :param filename: name of the config file
+        :param aepc: AEPcounter used for the fallback values and the result directory
+        """
+        config = configparser.ConfigParser()
+        config.read(filename)
+        try:
+            # the fallback values are strings, getboolean would return 'False' as is
+            use_cache = config.getboolean('Cache', 'power curve cache', fallback=aepc.get_fallback_value('Cache', 'power curve cache').upper() == 'TRUE')
+            cache_dir = config.get('Cache', 'cache directory', fallback=aepc.get_fallback_value('Cache', 'cache directory'))
+            self.max_size_mb = float(config.get('Cache', 'max size', fallback=aepc.get_fallback_value('Cache', 'max size')))
+            self.max_age_days = float(config.get('Cache', 'max age', fallback=aepc.get_fallback_value('Cache', 'max age')))
+        except ValueError as wrong_value:
+            print("Wrong type of value in {0}: {1}".format(filename, wrong_value))
+            sys.exit(1)
+        if not use_cache:
+            self.cache_dir = ''
+        elif cache_dir.upper() == 'NONE':
+            self.cache_dir = os.path.join(aepc.result_dir, 'pc_cache')
+        else:
+            self.cache_dir = cache_dir
+
+    def enabled(self):
+        return self.cache_dir != ''
+
+    def fingerprint(self, aepc, reference_data):
+        """
+        hash of the reference data and the options count_power_curves depends on
+
+        Only the wind speed, wind direction and power columns of the reference data are used for the curves.
+        The filter options that select the reference data are included as well, even though their effect is
+        already visible in the data, so that the key changes whenever the configuration does.
+
+        :param aepc: AEPcounter with the options set
+        :param reference_data: reference data the curves would be calculated from
+        :return: hexadecimal sha256 digest
+        """
+        options = {'version': self.format_version,
+                   'wind bins': [float(value) for value in aepc.wind_bins],
+                   'direction bins': [float(value) for value in aepc.direction_bins],
+                   'power drop limit': aepc.pc_low_limit,
+                   'overproduction limit': aepc.pc_high_limit,
+                   'min bin size': aepc.pc_binsize,
+                   'distance filter': aepc.pc_dist_filter,
+                   'rated power': aepc.rated_power,
+                   'site elevation': aepc.site_elevation,
+                   'state index': [str(value) for value in aepc.state_index],
+                   'normal state': [str(value) for value in aepc.normal_state],
+                   'statefilter type': aepc.state_filter_type,
+                   'power level filter': aepc.power_level_filter_limit,
+                   'reference temperature': aepc.reference_temperature_limit,
+                   'columns': [aepc.ws_index, aepc.wd_index, aepc.pow_index],
+                   'lines': len(reference_data)}
+        digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode('utf-8'))
+        if len(reference_data) > 0:
+            for index in (aepc.ws_index, aepc.wd_index, aepc.pow_index):
+                digest.update(np.ascontiguousarray(aepc.float_column(reference_data, index)).tobytes())
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key + '.npy')
+
+    def load(self, key):
+        """
+        :param key: fingerprint of the wanted power curves
+        :return: cached power curves or None if there is no entry for the key
+        """
+        if not self.enabled():
+            return None
+        path = self.entry_path(key)
+        try:
+            pc = np.load(path, allow_pickle=False)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pc
+
+    def store(self, key, pc):
+        """
+        write power curves into the cache and evict old entries
+
+        :param key: fingerprint of the power curves
+        :param pc: power curve array
+        """
+        if not self.enabled():
+            return
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = os.path.join(self.cache_dir, '{0}.{1}.tmp'.format(key, os.getpid()))
+        with open(temp_path, 'wb') as cache_file:
+            np.save(cache_file, pc, allow_pickle=False)
+        os.replace(temp_path, self.entry_path(key))
+        self.evict()
+
+    def entries(self):
+        """
+        :return: list of (last used, size, path) of the cache files, least recently used first
+        """
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.npy'):
+                continue
+            path = os.path.join(self.cache_dir, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """
+        remove entries older than max_age_days and the least recently used entries until the cache is
+        smaller than max_size_mb
+
+        :return: number of removed entries
+        """
+        if not self.enabled() or not os.path.exists(self.cache_dir):
+            return 0
+        oldest_allowed = time.time() - self.max_age_days * 24 * 3600
+        max_size = self.max_size_mb * 1024 * 1024
+        entries = self.entries()
+        total_size = sum(size for last_used, size, path in entries)
+        removed = 0
+        for last_used, size, path in entries:
+            if last_used >= oldest_allowed and total_size <= max_size:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+            total_size -= size
+        return removed
+
+    def power_curves(self, aepc, reference_data):
+        """
+        return cached power curves for the reference data or calculate and cache them
+
+        :param aepc: AEPcounter with the options set
+        :param reference_data: reference data for the power curves
+        :return: power curves as returned by aepc.count_power_curves
+        """
+        if not self.enabled():
+            return aepc.count_power_curves(reference_data)
+        key = self.fingerprint(aepc, reference_data)
+        pc = self.load(key)
+        if pc is None:
+            pc = aepc.count_power_curves(reference_data)
+            try:
+                self.store(key, pc)
+            except OSError as write_error:
+                print("{0} : Could not write power curve cache: {1}".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), write_error))
+            print("{0} : Power curve cache miss, curves stored as {1}".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), key))
+        else:
+            print("{0} : Power curve cache hit, curves read from {1}".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), key))
+        return pc
@@ -0,0 +1,209 @@
+"""
+Plots of the counter results.
+
+matplotlib is imported only when a plot is drawn, importing the package does not load it. Long time series are
+downsampled before plotting: lines with the largest triangle three buckets (LTTB) method, which keeps the peaks and
+dips that are visible in the full resolution plot, and scatter plots by keeping one point in every cell of a fine
+grid over the plot area. The time to draw a plot stays about the same regardless of the length of the data.
+
+The figures are drawn from a dictionary of plain numpy arrays and texts made by
+Result_file_writer.standard_plot_data, so they can be drawn in a separate process after the results have been
+written.
+"""
+
+import datetime
+import multiprocessing
+import threading
+
+import numpy as np
+
+# number of points kept of a line drawn over the whole time series
+LINE_POINTS = 5000
+# number of grid cells along the x and y axes used to thin the scatter plots, a marker covers several cells
+SCATTER_GRID = (2000, 1000)
+
+
+def lttb(x, y, threshold=LINE_POINTS):
+    """
+    downsample a line with the largest triangle three buckets method
+
+    The points between the first and the last one are split into threshold - 2 buckets of equal size. From every
+    bucket the point that makes the largest triangle with the point selected from the previous bucket and the
+    average of the next bucket is kept. Points with nan values are never selected unless the whole bucket is nan.
+
+    :param x: increasing x values
+    :param y: y values
+    :param threshold: number of points to keep
+    :return: indices of the kept points, the first and the last point are always kept
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    edges = np.append((np.arange(threshold - 1) * every).astype(np.int64) + 1, n)
+    valid = np.isfinite(x) & np.isfinite(y)
+    # averages of the valid points of every bucket, the last "bucket" is the last point
+    counts = np.add.reduceat(valid.astype(float), edges[:-1])
+    mean_x = np.add.reduceat(np.where(valid, x, 0.0), edges[:-1]) / np.maximum(counts, 1.0)
+    mean_y = np.add.reduceat(np.where(valid, y, 0.0), edges[:-1]) / np.maximum(counts, 1.0)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_x, next_y = mean_x[bucket + 1], mean_y[bucket + 1]
+        # twice the triangle area, the constant factor does not change the maximum
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        areas[~np.isfinite(areas)] = -1.0
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def thin_scatter(x, y, grid=SCATTER_GRID):
+    """
+    thin a scatter plot by keeping the first point in every occupied cell of a regular grid
+
+    Points with nan values are dropped, matplotlib does not draw them anyway.
+
+    :param x: x values
+    :param y: y values
+    :param grid: number of cells along the x and y axes
+    :return: indices of the kept points in their original order
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if len(finite) <= 1:
+        return finite
+    cells = []
+    for values, size in zip((x[finite], y[finite]), grid):
+        low, high = values.min(), values.max()
+        scale = (size - 1) / (high - low) if high > low else 0.0
+        cells.append(((values - low) * scale).astype(np.int64))
+    _, first = np.unique(cells[0] * grid[1] + cells[1], return_index=True)
+    return finite[np.sort(first)]
+
+
+def plot_values(values):
+    """
+    :return: values as a numpy array, datetime64 values as int64 so that their distances can be calculated
+    """
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype(np.int64)
+    return values
+
+
+def thinned(x, y):
+    """
+    :return: x and y of the points kept by thin_scatter
+    """
+    kept = thin_scatter(plot_values(x), y)
+    return np.asarray(x)[kept], np.asarray(y)[kept]
+
+
+def downsampled(x, y):
+    """
+    :return: x and y of the points kept by lttb
+    """
+    kept = lttb(plot_values(x), y)
+    return np.asarray(x)[kept], np.asarray(y)[kept]
+
+
+def new_figure(write):
+    """
+    :param write: True for a figure that is written to a file, False for an interactive pyplot figure
+    """
+    if write:
+        # a bare Figure does not need a GUI backend and is safe to draw outside the main thread
+        from matplotlib.figure import Figure
+        return Figure()
+    import matplotlib.pyplot as plt
+    return plt.figure()
+
+
+def power_curve_figure(plot_data, write):
+    figure = new_figure(write)
+    ax = figure.gca()
+    for key, style, label in (('production', 'bo', 'standard production'),
+                              ('icing losses', 'ro', plot_data['production loss label']),
+                              ('icing stops', 'ko', plot_data['stop label']),
+                              ('overproduction', 'go', plot_data['overproduction label']),
+                              ('ips on', 'yo', 'IPS ON')):
+        if plot_data[key] is not None:
+            ax.plot(*thinned(*plot_data[key]), style, label=label, alpha=0.5, markersize=6)
+    # plot a mean power curve and the P10 curve on top of the data
+    power_curve = plot_data['power curve']
+    ax.plot(power_curve[:, 0], power_curve[:, 1], 'c-', lw=4, label='Power curve')
+    ax.plot(power_curve[:, 0], power_curve[:, 2], 'c--', lw=4, label='P10')
+    ax.plot(power_curve[:, 0], power_curve[:, 3], 'c-.', lw=4, label='P90')
+    ax.set_title(plot_data['title'])
+    ax.set_xlabel('Wind speed [m/s]')
+    ax.set_ylabel('Power [kW]')
+    tick_size = 2
+    ax.set_xticks((list(range(0, plot_data['maximum wind speed'] + tick_size, tick_size))))
+    ax.set_xlim((0, plot_data['maximum wind speed']))
+    ax.legend(loc='upper left', framealpha=0.3)
+    # hide yaxis to obfuscate the true power values
+    ax.axes.get_yaxis().set_visible(False)
+    return figure
+
+
+def time_series_figure(plot_data, write):
+    figure = new_figure(write)
+    ax = figure.gca()
+    ax.plot(*downsampled(*plot_data['observed power']), 'g-', label='observed power')
+    ax.plot(*downsampled(*plot_data['reference power']), 'k-', label='reference data')
+    ax.plot(*thinned(*plot_data['stop times']), 'r.', label='stops')
+    ax.plot(*thinned(*plot_data['loss times']), 'b.', label='production loss')
+    ax.set_title(plot_data['title'])
+    ax.set_ylabel('Power [kW]')
+    ax.legend(loc='best')
+    ax.axes.get_yaxis().set_visible(False)
+    return figure
+
+
+def draw_standard_plots(plot_data, pc_filename=None, ts_filename=None):
+    """
+    draw the power curve and time series plots
+
+    :param plot_data: dictionary returned by Result_file_writer.standard_plot_data
+    :param pc_filename: file for the power curve plot, if None the plots are shown with matplotlib.pyplot.show()
+    :param ts_filename: file for the time series plot, None to skip it when writing
+    """
+    import matplotlib
+    write = pc_filename is not None
+    with matplotlib.rc_context({'font.size': 22}):
+        figures = [(power_curve_figure(plot_data, write), pc_filename)]
+        if not write or ts_filename is not None:
+            figures.append((time_series_figure(plot_data, write), ts_filename))
+        if not write:
+            import matplotlib.pyplot as plt
+            plt.show()
+            return
+        for figure, filename in figures:
+            figure.set_size_inches(18.5, 10.5)
+            figure.savefig(filename, bbox_inches='tight', dpi=300)
+            print("{0} : Plot written to : {1}".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), filename))
+
+
+def start_in_background(target, *args):
+    """
+    run target(*args) in a separate process
+
+    Worker processes of multiprocessing.Pool are not allowed to start processes of their own, in them a thread is
+    used instead. Neither is a daemon, the interpreter waits for them to finish before exiting.
+
+    :return: the started process or thread, join() waits until it has finished
+    """
+    if multiprocessing.current_process().daemon:
+        worker = threading.Thread(target=target, args=args)
+    else:
+        worker = multiprocessing.Process(target=target, args=args)
+    worker.start()
+    return worker
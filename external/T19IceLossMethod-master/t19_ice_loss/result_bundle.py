@@ -0,0 +1,209 @@
+"""
+Result bundles and background writing of the result files.
+
+A result bundle holds the results of one dataset in a single .npz file next to the text result files: the summary,
+the power curve, the icing event tables and the production statistics. Everything in it is a plain numpy array, so
+it is read without pickling and without parsing text, and numpy.load only reads the arrays that are accessed.
+multifile_t19_counter.py builds the combined summary of a fleet from the bundles.
+
+Arrays of a bundle:
+
+    summary/fields, summary/values          fields and values of <id>_summary.txt as texts
+    power_curve                             power curve array of the AEPcounter
+    wind_bins, direction_bins               bins of the power curve
+    events/names                            names of the event tables, e.g. losses and stops
+    events/<name>/start, events/<name>/stop start and stop times of the events as datetime64
+    events/<name>/values                    the other columns of the event table as floats
+    events/<name>/fields                    names of all the columns of the table
+    stats/periods                           periods of the production statistics, e.g. month
+    stats/<period>/start                    start times of the periods as datetime64
+    stats/<period>/values                   the other columns of the statistics as floats
+    stats/<period>/fields                   names of all the columns of the statistics
+
+BackgroundWriter runs the writers on one background thread in the order they were submitted, so the result files
+are written while the counter carries on with the rest of the calculation.
+"""
+
+import collections
+import concurrent.futures
+import datetime
+
+import numpy as np
+
+from . import aggregation
+
+BUNDLE_TRUNK = '_results.npz'
+
+EVENT_FIELDS = ['start', 'stop', 'loss', 'duration', 'mean power drop', 'mean_power', 'mean_reference_power',
+                'mean wind speed', 'mean temperature', 'ips consumption']
+
+
+def bundle_filename(result_dir, dataset_id):
+    """
+    :param result_dir: result directory of the dataset
+    :param dataset_id: id of the dataset
+    :return: filename of the result bundle
+    """
+    return result_dir + dataset_id + BUNDLE_TRUNK
+
+
+def timed_rows(rows, time_columns, width):
+    """
+    split an object array of result rows into time columns and a float array of the other columns
+
+    :param rows: object array with datetimes in the first columns, may be empty
+    :param time_columns: number of datetime columns at the start of every row
+    :param width: number of columns of an empty table
+    :return: list of datetime64 arrays, 2-D float array
+    """
+    rows = np.asarray(rows, dtype=object)
+    if rows.size == 0:
+        empty_times = [np.zeros(0, dtype=aggregation.TIMESTAMP_UNIT) for index in range(time_columns)]
+        return empty_times, np.zeros((0, width - time_columns))
+    times = [aggregation.to_datetime64(rows[:, index]) for index in range(time_columns)]
+    return times, rows[:, time_columns:].astype(np.float64)
+
+
+def write_bundle(filename, summary=None, power_curve=None, wind_bins=None, direction_bins=None, events=None,
+                 stats=None, compress=True):
+    """
+    write the results of a dataset into a bundle, parts that are None are left out
+
+    :param filename: name of the .npz file
+    :param summary: ordered dictionary of the summary fields and values
+    :param power_curve: power curve array
+    :param wind_bins: wind speed bins of the power curve
+    :param direction_bins: direction bins of the power curve
+    :param events: ordered dictionary of event tables as returned by AEPcounter.power_loss_during_alarm
+    :param stats: ordered dictionary of the production statistics of every period and their column names, e.g.
+                  {'month': (rows, fields)}
+    :param compress: if True the arrays are compressed
+    """
+    arrays = collections.OrderedDict()
+    if summary is not None:
+        arrays['summary/fields'] = np.array(list(summary.keys()), dtype=str)
+        arrays['summary/values'] = np.array(list(summary.values()), dtype=str)
+    if power_curve is not None:
+        arrays['power_curve'] = np.asarray(power_curve, dtype=np.float64)
+        arrays['wind_bins'] = np.asarray(wind_bins, dtype=np.float64)
+        arrays['direction_bins'] = np.asarray(direction_bins, dtype=np.float64)
+    if events is not None:
+        arrays['events/names'] = np.array(list(events.keys()), dtype=str)
+        for name, timings in events.items():
+            (start, stop), values = timed_rows(timings, 2, 9)
+            arrays['events/{0}/start'.format(name)] = start
+            arrays['events/{0}/stop'.format(name)] = stop
+            arrays['events/{0}/values'.format(name)] = values
+            arrays['events/{0}/fields'.format(name)] = np.array(EVENT_FIELDS[:values.shape[1] + 2], dtype=str)
+    if stats is not None:
+        arrays['stats/periods'] = np.array(list(stats.keys()), dtype=str)
+        for period, (rows, fields) in stats.items():
+            (start,), values = timed_rows(rows, 1, len(fields))
+            arrays['stats/{0}/start'.format(period)] = start
+            arrays['stats/{0}/values'.format(period)] = values
+            arrays['stats/{0}/fields'.format(period)] = np.array(fields, dtype=str)
+    # a file object keeps numpy from adding .npz to the name
+    with open(filename, 'wb') as bundle_file:
+        if compress:
+            np.savez_compressed(bundle_file, **arrays)
+        else:
+            np.savez(bundle_file, **arrays)
+
+
+def read_summary(filename):
+    """
+    :param filename: result bundle
+    :return: ordered dictionary of the summary fields and values, empty if the bundle has no summary
+    """
+    with np.load(filename) as bundle:
+        if 'summary/fields' not in bundle.files:
+            return collections.OrderedDict()
+        return collections.OrderedDict(zip(bundle['summary/fields'].tolist(), bundle['summary/values'].tolist()))
+
+
+def read_bundle(filename):
+    """
+    read all the parts of a result bundle
+
+    :param filename: result bundle
+    :return: dictionary with the parts found in the bundle: 'summary', 'power_curve', 'wind_bins', 'direction_bins',
+             'events' and 'stats'. Every event table and statistics period is a dictionary of its arrays.
+    """
+    results = {'summary': read_summary(filename)}
+    with np.load(filename) as bundle:
+        for name in ('power_curve', 'wind_bins', 'direction_bins'):
+            if name in bundle.files:
+                results[name] = bundle[name]
+        for part, names_key in (('events', 'events/names'), ('stats', 'stats/periods')):
+            tables = collections.OrderedDict()
+            names = bundle[names_key].tolist() if names_key in bundle.files else []
+            for name in names:
+                prefix = '{0}/{1}/'.format(part, name)
+                tables[name] = {key[len(prefix):]: bundle[key] for key in bundle.files if key.startswith(prefix)}
+            results[part] = tables
+    return results
+
+
+class BackgroundWriter(object):
+    """
+    runs result writers one at a time on a background thread
+
+    The writers follow the convention of Result_file_writer: they return a tuple with the status of the write first
+    and the possible error last, with the filename in between if the writer returns it. The outcome of every write
+    is printed when it is done.
+
+    A process must not be forked while the thread is writing, call wait before starting one.
+
+    :param background: if False the writers are run right away in the calling thread
+    """
+
+    def __init__(self, background=True):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) if background else None
+        self.futures = []
+
+    def submit(self, writer, args, success, failure, filename=''):
+        """
+        :param writer: the writer function
+        :param args: arguments of the writer
+        :param success: message printed before the filename after a successful write
+        :param failure: message printed before the error if the write failed
+        :param filename: filename printed if the writer does not return one
+        :return: concurrent.futures.Future of the result of the writer
+        """
+        if self.executor is not None:
+            future = self.executor.submit(self.run, writer, args, success, failure, filename)
+        else:
+            # exceptions are raised right away
+            future = concurrent.futures.Future()
+            future.set_result(self.run(writer, args, success, failure, filename))
+        self.futures.append(future)
+        return future
+
+    def run(self, writer, args, success, failure, filename):
+        result = writer(*args)
+        status, error = result[0], result[-1]
+        if len(result) > 2:
+            filename = result[1]
+        if status:
+            print("{0} : {1}{2}".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), success, filename))
+        else:
+            print("{0} : {1}{2}".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), failure, error))
+        return result
+
+    def wait(self):
+        """
+        wait until everything submitted so far has been written, exceptions raised by the writers are raised here
+        """
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        """
+        wait for the writes and stop the thread
+        """
+        try:
+            self.wait()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
@@ -0,0 +1,346 @@
+"""
+Parameter sweeps over the filtering options of the counter.
+
+A sweep runs the loss calculation of one dataset for every combination of a grid of option values, e.g. to
+calibrate the options of a new site. The data is read, corrected and filtered once. The rest of the calculation is
+split into stages, and every stage is calculated once per distinct value of the options it depends on:
+
+    power curve bins      sorted once, the options do not change the bins
+    bin statistics        once per power drop limit and overproduction limit
+    power curves          once per power drop limit, overproduction limit and min bin size
+    losses and over-      once per power curve, temperature filter and icing time
+    production
+    stops                 once per power curve, temperature filter and stop time filter
+
+With reference refinement the power curves depend on the alarm options as well, they are then refined once per
+combination. The stages of every round are calculated in parallel worker processes. The workers are forked after
+the data has been prepared, so they share it with the main process instead of receiving a copy.
+
+The results are a table with one row per combination: the option values followed by the losses, the number and
+duration of the events and the production.
+"""
+
+import collections
+import configparser
+import copy
+import datetime
+import itertools
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+# options of the Filtering section that can be swept and the AEPcounter attributes they set
+SWEEP_PARAMETERS = collections.OrderedDict([('power drop limit', ('pc_low_limit', int)),
+                                            ('overproduction limit', ('pc_high_limit', int)),
+                                            ('min bin size', ('pc_binsize', int)),
+                                            ('temperature filter', ('icing_temperature_limit', float)),
+                                            ('icing time', ('icing_time', int)),
+                                            ('stop time filter', ('stop_time', int))])
+
+# attributes each stage depends on
+PERCENTILE_PARAMETERS = ('pc_low_limit', 'pc_high_limit')
+CURVE_PARAMETERS = PERCENTILE_PARAMETERS + ('pc_binsize',)
+ALARM_PARAMETERS = ('icing_temperature_limit', 'icing_time')
+STOP_PARAMETERS = ('icing_temperature_limit', 'stop_time')
+
+RESULT_FIELDS = list(SWEEP_PARAMETERS.keys()) + ['icing loss', 'icing events', 'icing hours', 'stop loss',
+                                                 'stop events', 'stop hours', 'overproduction events',
+                                                 'overproduction hours', 'theoretical production', 'production',
+                                                 'icing loss %', 'stop loss %']
+
+# data prepared by the main process, set before the workers are forked
+_shared = {}
+# interpolated reference power of the power level filtered data, by curve key, kept by every worker
+_references = {}
+
+
+def parse_values(text, value_type):
+    """
+    :param text: comma separated values, e.g. '3, 6, 9'
+    :param value_type: type of the values
+    :return: list of the distinct values in the order given
+    """
+    values = []
+    for token in text.split(','):
+        if token.strip() != '':
+            value = value_type(token.strip())
+            if value not in values:
+                values.append(value)
+    return values
+
+
+def stage_key(point, attributes):
+    """
+    :param point: dictionary of AEPcounter attributes and their values
+    :param attributes: attributes the stage depends on
+    :return: hashable key of the stage
+    """
+    return tuple((attribute, point[attribute]) for attribute in attributes)
+
+
+def configured_counter(key):
+    """
+    :param key: stage key
+    :return: copy of the shared AEPcounter with the options of the key
+    """
+    counter = copy.copy(_shared['aepc'])
+    for attribute, value in key:
+        setattr(counter, attribute, value)
+    return counter
+
+
+def event_totals(timings):
+    """
+    :param timings: event table returned by power_loss_during_alarm
+    :return: total loss, number of events, total duration in hours
+    """
+    if np.shape(timings) == (0,):
+        return 0.0, 0, 0.0
+    return float(np.nansum(timings[:, 2].astype(float))), len(timings), float(np.nansum(timings[:, 3].astype(float)))
+
+
+def curve_task(args):
+    """
+    power curves of a pair of percentile limits for every min bin size, the bin statistics are calculated once
+
+    :param args: percentile key, list of min bin sizes
+    :return: dictionary of the power curves by curve key
+    """
+    key, binsizes = args
+    counter = configured_counter(key)
+    statistics = counter.binned_statistics(_shared['reference'], _shared['binned'])
+    curves = {}
+    for binsize in binsizes:
+        counter.pc_binsize = binsize
+        curves[key + (('pc_binsize', binsize),)] = counter.finalize_power_curves(statistics.copy())
+    return curves
+
+
+def refine_task(args):
+    """
+    :param args: key of all the curve and alarm options, power curves before the refinement
+    :return: key, refined power curves
+    """
+    key, pc = args
+    counter = configured_counter(key)
+    return key, counter.refine_power_curves(_shared['preprocessed'], pc)[0]
+
+
+def power_reference(curve_key, pc):
+    if curve_key not in _references:
+        _references[curve_key] = _shared['aepc'].interpolate_power_curves(_shared['power level filtered'], pc)
+    return _references[curve_key]
+
+
+def alarm_task(args):
+    """
+    :param args: curve key, alarm key, power curves
+    :return: icing loss, events and hours, overproduction events and hours
+    """
+    curve_key, key, pc = args
+    counter = configured_counter(key)
+    data = _shared['power level filtered']
+    reference = power_reference(curve_key, pc)
+    losses = event_totals(counter.power_loss_during_alarm(counter.power_alarms(data, pc, reference=reference)))
+    over = event_totals(counter.power_loss_during_alarm(counter.power_alarms(data, pc, over=True, reference=reference)))
+    return losses + over[1:]
+
+
+def stop_task(args):
+    """
+    :param args: curve key, stop key, power curves
+    :return: stop loss, events and hours
+    """
+    curve_key, key, pc = args
+    counter = configured_counter(key)
+    if counter.stop_filter_type not in (0, 1, 2):
+        return 0.0, 0, 0.0
+    return event_totals(counter.power_loss_during_alarm(counter.find_icing_related_stops(_shared['state filtered'], pc)))
+
+
+def production_task(args):
+    """
+    :param args: curve key, power curves
+    :return: theoretical production and production of the analysed period
+    """
+    curve_key, pc = args
+    counter = _shared['aepc']
+    output_power = counter.theoretical_output_power(_shared['time limited'], pc)
+    if np.shape(output_power) == (0,):
+        return 0.0, 0.0
+    return (float(np.nansum(counter.calculate_production(output_power, 1)[:, 1])),
+            float(np.nansum(counter.calculate_production(output_power, 2)[:, 1])))
+
+
+def run_task(task):
+    function, args = task
+    return function(args)
+
+
+class ParameterSweep:
+    """
+    loss calculation for every combination of a grid of option values
+    """
+    def __init__(self, grid=None, workers=0, result_file=''):
+        """
+        :param grid: ordered dictionary of option names (keys of SWEEP_PARAMETERS) and lists of their values,
+                     options that are not in the grid keep the value of the AEPcounter
+        :param workers: number of worker processes, 0 for the number of available cores
+        :param result_file: name of the result table
+        """
+        self.grid = grid if grid is not None else collections.OrderedDict()
+        self.workers = workers
+        self.result_file = result_file
+
+    def set_sweep_options_from_file(self, filename, aepc):
+        """
+        read the Sweep section of the config file, call after aepc.set_data_options_from_file
+
+        :param filename: name of the config file
+        :param aepc: AEPcounter used for the fallback values and the result directory
+        """
+        config = configparser.ConfigParser()
+        config.read(filename)
+        try:
+            for option, (attribute, value_type) in SWEEP_PARAMETERS.items():
+                if config.has_option('Sweep', option):
+                    self.grid[option] = parse_values(config.get('Sweep', option), value_type)
+            self.workers = int(config.get('Sweep', 'workers', fallback=aepc.get_fallback_value('Sweep', 'workers')))
+            result_file = config.get('Sweep', 'result file', fallback=aepc.get_fallback_value('Sweep', 'result file'))
+        except ValueError as wrong_value:
+            print("Wrong type of value in {0}: {1}".format(filename, wrong_value))
+            sys.exit(1)
+        if result_file.upper() == 'NONE':
+            self.result_file = aepc.result_dir + aepc.id + '_sweep.csv'
+        else:
+            self.result_file = result_file
+
+    def points(self, aepc):
+        """
+        :param aepc: AEPcounter with the options of the dataset
+        :return: list of dictionaries of AEPcounter attributes, one for every combination of the grid
+        """
+        values = []
+        for option, (attribute, value_type) in SWEEP_PARAMETERS.items():
+            values.append(self.grid.get(option) or [getattr(aepc, attribute)])
+        attributes = [attribute for attribute, value_type in SWEEP_PARAMETERS.values()]
+        return [dict(zip(attributes, combination)) for combination in itertools.product(*values)]
+
+    def worker_count(self, tasks):
+        workers = self.workers
+        if workers <= 0:
+            try:
+                workers = len(os.sched_getaffinity(0))
+            except AttributeError:
+                workers = os.cpu_count() or 1
+        return max(1, min(workers, tasks))
+
+    def run(self, aepc, preprocessed, reference_data):
+        """
+        calculate the results of every combination
+
+        :param aepc: AEPcounter with the options of the dataset
+        :param preprocessed: PreprocessedData of the dataset
+        :param reference_data: reference dataset of the power curves
+        :return: list of result rows as ordered dictionaries with the keys of RESULT_FIELDS
+        """
+        points = self.points(aepc)
+        refined = aepc.refinement_passes > 0
+        curve_parameters = (CURVE_PARAMETERS + ALARM_PARAMETERS + ('stop_time',)) if refined else CURVE_PARAMETERS
+        _shared.clear()
+        _references.clear()
+        _shared.update({'aepc': aepc,
+                        'preprocessed': preprocessed,
+                        'reference': reference_data,
+                        'binned': aepc.sorted_bins(reference_data) if len(reference_data) > 0 else None,
+                        'time limited': preprocessed.select('time'),
+                        'state filtered': preprocessed.select('time', 'state'),
+                        'power level filtered': preprocessed.select('time', 'state', 'power level')})
+        binsizes = collections.OrderedDict()
+        for point in points:
+            sizes = binsizes.setdefault(stage_key(point, PERCENTILE_PARAMETERS), [])
+            if point['pc_binsize'] not in sizes:
+                sizes.append(point['pc_binsize'])
+        curve_tasks = [(curve_task, item) for item in binsizes.items()]
+        workers = self.worker_count(len(points))
+        print("{0} : Sweeping {1} combinations with {2} workers".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), len(points), workers))
+        try:
+            if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+                # forked workers see the data in _shared without copying it
+                with multiprocessing.get_context('fork').Pool(workers) as pool:
+                    return self.run_stages(points, curve_parameters, curve_tasks, lambda tasks: pool.map(run_task, tasks, chunksize=1))
+            return self.run_stages(points, curve_parameters, curve_tasks, lambda tasks: [run_task(task) for task in tasks])
+        finally:
+            _shared.clear()
+            _references.clear()
+
+    def run_stages(self, points, curve_parameters, curve_tasks, map_tasks):
+        """
+        :param points: combinations returned by points
+        :param curve_parameters: attributes the power curves depend on
+        :param curve_tasks: tasks of the power curve stage
+        :param map_tasks: function that runs a list of tasks and returns their results in order
+        :return: result rows
+        """
+        curves = {}
+        for result in map_tasks(curve_tasks):
+            curves.update(result)
+        print("{0} : {1} power curves calculated".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), len(curves)))
+        if curve_parameters != CURVE_PARAMETERS:
+            refine_tasks = collections.OrderedDict()
+            for point in points:
+                refine_tasks[stage_key(point, curve_parameters)] = curves[stage_key(point, CURVE_PARAMETERS)]
+            curves = dict(map_tasks([(refine_task, item) for item in refine_tasks.items()]))
+            print("{0} : {1} power curves refined".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), len(curves)))
+
+        # the stages that only need the power curves, every distinct key once
+        tasks = collections.OrderedDict()
+        for point in points:
+            curve_key = stage_key(point, curve_parameters)
+            pc = curves[curve_key]
+            alarm_key = stage_key(point, ALARM_PARAMETERS)
+            stop_key = stage_key(point, STOP_PARAMETERS)
+            tasks.setdefault(('alarms', curve_key, alarm_key), (alarm_task, (curve_key, alarm_key, pc)))
+            tasks.setdefault(('stops', curve_key, stop_key), (stop_task, (curve_key, stop_key, pc)))
+            tasks.setdefault(('production', curve_key), (production_task, (curve_key, pc)))
+        results = dict(zip(tasks.keys(), map_tasks(list(tasks.values()))))
+        print("{0} : {1} alarm, stop and production stages calculated".format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), len(results)))
+
+        rows = []
+        for point in points:
+            curve_key = stage_key(point, curve_parameters)
+            icing_loss, icing_events, icing_hours, over_events, over_hours = results[('alarms', curve_key, stage_key(point, ALARM_PARAMETERS))]
+            stop_loss, stop_events, stop_hours = results[('stops', curve_key, stage_key(point, STOP_PARAMETERS))]
+            theoretical_production, production = results[('production', curve_key)]
+            row = collections.OrderedDict((option, point[attribute]) for option, (attribute, value_type) in SWEEP_PARAMETERS.items())
+            row.update([('icing loss', icing_loss), ('icing events', icing_events), ('icing hours', icing_hours),
+                        ('stop loss', stop_loss), ('stop events', stop_events), ('stop hours', stop_hours),
+                        ('overproduction events', over_events), ('overproduction hours', over_hours),
+                        ('theoretical production', theoretical_production), ('production', production),
+                        ('icing loss %', icing_loss / production * 100.0 if production != 0.0 else 0.0),
+                        ('stop loss %', stop_loss / production * 100.0 if production != 0.0 else 0.0)])
+            rows.append(row)
+        return rows
+
+    def write_results(self, filename, rows):
+        """
+        :param filename: name of the .csv file
+        :param rows: result rows returned by run
+        :return: status of the write operation, possible error
+        """
+        try:
+            with open(filename, 'w') as outfile:
+                outfile.write(','.join(RESULT_FIELDS) + '\n')
+                for row in rows:
+                    outfile.write(','.join(format_value(row[field]) for field in RESULT_FIELDS) + '\n')
+        except (OSError, IOError) as e:
+            return False, e
+        return True, None
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return '{0:.2f}'.format(value)
+    return str(value)
@@ -0,0 +1,57 @@
+import os
+from t19_ice_loss import incremental as inc
+from t19_ice_loss import data_file_handler as dfh
+import sys
+import datetime as dt
+
+
+def main(configfile_name):
+    """
+    Process the data that has arrived after the previous run and append the changed icing events into a file.
+
+    State between runs is kept in the file set with 'state file' in the [Incremental] section of the config file.
+    Remove the state file to start over from the beginning of the data.
+
+    """
+    reader = dfh.CSVimporter()
+    reader.read_file_options_from_file(configfile_name)
+    print("{0} : Processing new data of dataset {1}".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), reader.id))
+    if not os.path.exists(reader.result_dir):
+        os.makedirs(reader.result_dir)
+    from_store = dfh.is_column_store(reader.filename)
+    if not from_store:
+        reader.read_data()
+    elif reader.replace_faults:
+        # the fault codes are needed for the options, the data itself is read once the state is known
+        reader.store_fault_codes(dfh.ColumnStore(reader.filename))
+
+    aepc = inc.IncrementalAEPcounter()
+    if reader.replace_faults:
+        aepc.fault_dict = reader.fault_dict
+    aepc.set_data_options_from_file(configfile_name)
+    aepc.set_binning_options_from_file(configfile_name)
+    aepc.set_filtering_options_from_file(configfile_name)
+    aepc.set_ips_options_from_file(configfile_name)
+    aepc.set_incremental_options_from_file(configfile_name)
+    if aepc.load_state(aepc.state_file):
+        print("{0} : Continuing after {1}".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), aepc.last_timestamp))
+    if from_store:
+        # only the lines after the last processed one are read from a column store
+        reader.start_time = aepc.last_timestamp
+        reader.read_data()
+
+    events = aepc.update(reader.full_data)
+
+    rfw = dfh.Result_file_writer()
+    events_filename = aepc.result_dir + aepc.id + '_event_updates.csv'
+    event_status, event_write_error = rfw.write_event_updates(events_filename, events)
+    if event_status:
+        print('{0} : {1} icing event updates written into: {2}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), len(events), events_filename))
+    else:
+        print('{0} : Error writing icing event updates: {1}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), event_write_error))
+    aepc.save_state(aepc.state_file)
+    print('{0} : Power curve drift: {1:.2f}'.format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), aepc.curve_drift()))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
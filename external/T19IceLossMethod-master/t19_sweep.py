@@ -0,0 +1,80 @@
+import os
+import sys
+import argparse
+import datetime as dt
+from t19_ice_loss import aep_counter as aep
+from t19_ice_loss import data_file_handler as dfh
+from t19_ice_loss import sweep as sw
+
+
+def main(configfile_name, workers=None, result_file='', values=()):
+    """
+    Calculate the losses of a dataset for every combination of the option values of the Sweep section and write
+    them into one table.
+
+    The data is read, corrected and filtered once, the other stages are calculated once per distinct value of the
+    options they depend on.
+
+    :param configfile_name: .ini file of the dataset
+    :param workers: number of worker processes, None to use the "workers" option of the Sweep section
+    :param result_file: name of the result table, empty string to use the "result file" option of the Sweep section
+    :param values: option values that replace the ones of the Sweep section, e.g. ['icing time=3,6,9']
+    :return: result rows as ordered dictionaries
+    """
+    reader = dfh.CSVimporter()
+    reader.read_file_options_from_file(configfile_name)
+    print("{0} : Sweeping the options of dataset {1}".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), reader.id))
+    if not os.path.exists(reader.result_dir):
+        os.makedirs(reader.result_dir)
+    reader.read_data()
+
+    aepc = aep.AEPcounter()
+    if reader.replace_faults:
+        aepc.fault_dict = reader.fault_dict
+    aepc.set_data_options_from_file(configfile_name)
+    aepc.set_binning_options_from_file(configfile_name)
+    aepc.set_filtering_options_from_file(configfile_name)
+    aepc.set_ips_options_from_file(configfile_name)
+
+    sweep = sw.ParameterSweep()
+    sweep.set_sweep_options_from_file(configfile_name, aepc)
+    for value in values:
+        option, _, text = value.partition('=')
+        option = option.strip()
+        if option not in sw.SWEEP_PARAMETERS:
+            print("Unknown sweep option '{0}', the options are: {1}".format(option, ', '.join(sw.SWEEP_PARAMETERS)))
+            sys.exit(1)
+        sweep.grid[option] = sw.parse_values(text, sw.SWEEP_PARAMETERS[option][1])
+    if workers is not None:
+        sweep.workers = workers
+    if result_file != '':
+        sweep.result_file = result_file
+
+    # the same data and reference dataset as in t19_counter.py
+    preprocessed = aepc.preprocess(reader.full_data, in_place=True)
+    reference_data = preprocessed.select('state', 'temperature', 'power level')
+    rows = sweep.run(aepc, preprocessed, reference_data)
+
+    status, error = sweep.write_results(sweep.result_file, rows)
+    if status:
+        print("{0} : Results of {1} combinations written into: {2}".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), len(rows), sweep.result_file))
+    else:
+        print("{0} : Error writing sweep results: {1}".format(dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), error))
+    return rows
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Calculate the icing losses of a dataset for a grid of filtering options')
+    parser.add_argument('config', help='.ini file of the dataset, the values to sweep are read from its Sweep section')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of parallel processes, defaults to the "workers" option of the Sweep section')
+    parser.add_argument('-o', '--output', default='',
+                        help='result table, defaults to the "result file" option of the Sweep section')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='OPTION=VALUES',
+                        help='values of an option, e.g. -s "icing time=3,6,9", replaces the Sweep section')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    main(args.config, args.workers, args.output, args.set)
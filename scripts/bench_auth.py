@@ -0,0 +1,158 @@
+"""
+Load test of the auth endpoints with SQLite (aiosqlite), showing how logins affect the event loop.
+
+    python scripts/bench_auth.py --logins 40 --concurrency 8 --rounds 12
+
+Runs concurrent logins while a probe task measures how late the event loop wakes it up and a client keeps
+calling /me. "inline" checks the passwords on the event loop as a plain call, "executor" is the app code
+that checks them on the bcrypt threads. The last lines compare /me with and without the token cache.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.api.v1.endpoints import auth  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.core import security  # noqa: E402
+from app.core.dependancies import get_db  # noqa: E402
+from app.db.base import Base  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import auth_service  # noqa: E402
+
+PASSWORD = "correct horse"
+
+
+async def verify_inline(password: str, hashed_password: str) -> bool:
+    """The password check as a plain call, it holds the event loop while bcrypt runs."""
+    return security.verify_password(password, hashed_password)
+
+
+def make_app(db_path: Path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def get_bench_db():
+        async with session_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(auth.router, prefix="/api/v1/auth")
+    app.dependency_overrides[get_db] = get_bench_db
+    return app, engine
+
+
+def percentiles(values):
+    values = sorted(values)
+    return {
+        "p50 ms": 1000 * statistics.median(values),
+        "p95 ms": 1000 * values[int(0.95 * (len(values) - 1))],
+        "max ms": 1000 * values[-1],
+    }
+
+
+async def run_logins(app: FastAPI, users: int, logins: int, concurrency: int, token: str):
+    lags = []
+    me_latencies = []
+    queue = [{"username": f"user{n % users}", "password": PASSWORD} for n in range(logins)]
+    done = asyncio.Event()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def probe():
+            # wakes up every 5 ms, anything later is time the loop spent on something else
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lags.append(time.perf_counter() - start - 0.005)
+
+        async def me():
+            headers = {"Authorization": f"Bearer {token}"}
+            while not done.is_set():
+                start = time.perf_counter()
+                response = await client.get("/api/v1/auth/me", headers=headers)
+                me_latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        async def worker():
+            while queue:
+                credentials = queue.pop()
+                response = await client.post("/api/v1/auth/token", json=credentials)
+                response.raise_for_status()
+
+        background = [asyncio.create_task(probe()), asyncio.create_task(me())]
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await asyncio.gather(*background)
+    return elapsed, lags, me_latencies
+
+
+async def run_me(app: FastAPI, token: str, requests: int):
+    latencies = []
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = await client.get("/api/v1/auth/me", headers=headers)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+    return percentiles(latencies)
+
+
+def report(name: str, result) -> None:
+    print(f"{name:<32}" + "  ".join(f"{key} {value:9.1f}" for key, value in result.items()))
+
+
+async def main(args) -> None:
+    settings.BCRYPT_ROUNDS = args.rounds
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = Path(directory) / "users.db"
+        engine = create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(engine)
+        hashed = security.hash_password(PASSWORD)
+        with engine.begin() as connection:
+            connection.execute(
+                User.__table__.insert(), [{"username": f"user{n}", "hashed_password": hashed} for n in range(args.users)]
+            )
+        engine.dispose()
+
+        app, app_engine = make_app(db_path)
+        token = security.create_access_token(1)
+        executor_verify = auth_service.verify_password_async
+        for name, verify in (("inline", verify_inline), ("executor", executor_verify)):
+            auth_service.verify_password_async = verify
+            elapsed, lags, me_latencies = await run_logins(app, args.users, args.logins, args.concurrency, token)
+            report(f"logins, {name}", {"logins/s": args.logins / elapsed})
+            report(f"  event loop lag, {name}", percentiles(lags))
+            report(f"  /me during logins, {name}", percentiles(me_latencies))
+        auth_service.verify_password_async = executor_verify
+
+        report("/me, token cache", await run_me(app, token, args.requests))
+        security.token_cache = security.TokenCache(max_entries=0)
+        report("/me, no token cache", await run_me(app, token, args.requests))
+        security.shutdown_password_executor()
+        # the aiosqlite connection threads keep the process alive until the pool is closed
+        await app_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost of the stored hashes")
+    parser.add_argument("--requests", type=int, default=1000, help="/me requests of the token cache comparison")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,124 @@
+"""
+Load test of the camera endpoints with SQLite (aiosqlite) and an in-process Redis stand-in (fakeredis).
+
+    python scripts/bench_cameras.py --cameras 10000 --requests 2000 --concurrency 50
+
+Compares reads that go to the database on every request with reads through the cache,
+and the first page of the camera list with a page deep into the table.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import fakeredis
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.api.v1.endpoints import cameras  # noqa: E402
+from app.core.dependancies import get_db  # noqa: E402
+from app.db.base import Base  # noqa: E402
+from app.db.redis.client import get_redis  # noqa: E402
+from app.models.camera import Camera  # noqa: E402
+
+
+class NoCache:
+    """Redis stand-in that never has the key, every read goes to the database."""
+
+    async def get(self, key):
+        return None
+
+    async def set(self, key, value, ex=None):
+        return True
+
+    async def delete(self, key):
+        return 0
+
+
+def make_app(db_path: Path, r):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def get_bench_db():
+        async with session_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(cameras.router, prefix="/api/v1/cameras")
+    app.dependency_overrides[get_db] = get_bench_db
+    app.dependency_overrides[get_redis] = lambda: r
+    return app, engine
+
+
+async def run_load(app: FastAPI, paths, concurrency: int):
+    latencies = []
+    queue = list(paths)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def worker():
+            while queue:
+                path = queue.pop()
+                start = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests/s": len(latencies) / elapsed,
+        "p50 ms": 1000 * statistics.median(latencies),
+        "p95 ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+def report(name: str, result) -> None:
+    print(f"{name:<28}" + "  ".join(f"{key} {value:9.1f}" for key, value in result.items()))
+
+
+async def main(args) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = Path(directory) / "cameras.db"
+        engine = create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(Camera.__table__.insert(), [{"name": f"Camera {n}"} for n in range(args.cameras)])
+        engine.dispose()
+
+        # a small set of hot cameras, like dashboards polling the same ones
+        rng = random.Random(0)
+        hot = [rng.randint(1, args.cameras) for _ in range(100)]
+        paths = [f"/api/v1/cameras/{rng.choice(hot)}" for _ in range(args.requests)]
+
+        uncached_app, uncached_engine = make_app(db_path, NoCache())
+        cached_app, cached_engine = make_app(db_path, fakeredis.aioredis.FakeRedis(decode_responses=True))
+        report("get, database", await run_load(uncached_app, paths, args.concurrency))
+        report("get, read-through cache", await run_load(cached_app, paths, args.concurrency))
+
+        deep = max(args.cameras - 100, 0)
+        first_pages = ["/api/v1/cameras/?limit=100"] * (args.requests // 10)
+        deep_pages = [f"/api/v1/cameras/?after_id={deep}&limit=100"] * (args.requests // 10)
+        report("list, first page", await run_load(cached_app, first_pages, args.concurrency))
+        report(f"list, after id {deep}", await run_load(cached_app, deep_pages, args.concurrency))
+        # the aiosqlite connection threads keep the process alive until the pools are closed
+        await uncached_engine.dispose()
+        await cached_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cameras", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
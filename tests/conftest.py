@@ -0,0 +1,128 @@
+import configparser
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import fakeredis
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+from app.core.dependancies import get_db
+from app.db.base import Base
+from app.db.redis.client import get_redis
+from app.models import camera, scada, user  # noqa: F401, registers the tables
+from app.services.t19_service import T19JobService
+
+T19_DIR = Path(settings.T19_REPO_DIR)
+# the T19 package and scripts are imported the same way run_t19_job imports them
+if str(T19_DIR) not in sys.path:
+    sys.path.insert(0, str(T19_DIR))
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """sqlite database file with all the tables of the app"""
+    path = tmp_path / "app.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def session_factory(db_path):
+    # NullPool, connections are not kept between the event loops of the test clients
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+
+@pytest.fixture
+def fake_redis():
+    return fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture
+def make_client(session_factory, fake_redis):
+    """
+    Return a factory for test clients of an app with the given routers.
+
+    The database and redis dependencies are replaced with db_path and fake_redis,
+    overrides replaces any other dependencies, e.g. {get_t19_service: lambda: service}.
+    """
+
+    async def get_test_db():
+        async with session_factory() as db:
+            yield db
+
+    def make(*routers, overrides=None):
+        test_app = FastAPI()
+        for router, prefix in routers:
+            test_app.include_router(router, prefix=prefix)
+        test_app.dependency_overrides[get_db] = get_test_db
+        test_app.dependency_overrides[get_redis] = lambda: fake_redis
+        test_app.dependency_overrides.update(overrides or {})
+        return TestClient(test_app)
+
+    return make
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """T19 data directory with a one line dataset scada.csv"""
+    directory = tmp_path / "data"
+    directory.mkdir()
+    (directory / "scada.csv").write_text("Timestamp,Wind speed\n1.1.2003 0:00,5.0\n")
+    return directory
+
+
+@pytest.fixture
+def t19_service(tmp_path, data_dir):
+    """Return a factory for T19JobServices with one worker on data_dir and the given runner."""
+
+    def make(runner, metrics=None):
+        return T19JobService(
+            ThreadPoolExecutor(max_workers=1),
+            max_workers=1,
+            runner=runner,
+            data_dir=str(data_dir),
+            work_dir=str(tmp_path / "work"),
+            metrics=metrics,
+        )
+
+    return make
+
+
+@pytest.fixture
+def t19_config(tmp_path):
+    """
+    Write example.ini of the T19 repository into tmp_path and return its path.
+
+    The results go into tmp_path/<name>/ and plots are off. Options are changed
+    with {section: {option: value}}, e.g. {"Filtering": {"icing time": "6"}}.
+    """
+
+    def write(options=None, name="example"):
+        parser = configparser.ConfigParser(interpolation=None)
+        parser.read(T19_DIR / "example.ini")
+        parser.set("Source file", "filename", str(T19_DIR / "fake_data2.csv"))
+        result_dir = tmp_path / name
+        result_dir.mkdir(exist_ok=True)
+        parser.set("Output", "result directory", os.path.join(str(result_dir), ""))
+        parser.set("Output", "plot", "False")
+        for section, values in (options or {}).items():
+            if not parser.has_section(section):
+                parser.add_section(section)
+            for option, value in values.items():
+                parser.set(section, option, value)
+        path = tmp_path / f"{name}.ini"
+        with open(path, "w") as f:
+            parser.write(f)
+        return str(path)
+
+    return write
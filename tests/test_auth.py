@@ -0,0 +1,111 @@
+import pytest
+from jose import jwt
+
+from app.api.v1.endpoints import auth
+from app.config import settings
+from app.core import security
+from app.core.security import TokenCache, create_access_token, decode_access_token, hash_password, verify_password
+
+
+@pytest.fixture(autouse=True)
+def fast_bcrypt(monkeypatch):
+    # the cheapest cost bcrypt accepts, the tests check the flow and not the strength
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    security.token_cache.clear()
+    yield
+    security.token_cache.clear()
+
+
+ROUTER = (auth.router, "/api/v1/auth")
+CREDENTIALS = {"username": "operator", "password": "correct horse"}
+
+
+def test_register_and_login(make_client):
+    with make_client(ROUTER) as client:
+        response = client.post("/api/v1/auth/register", json=CREDENTIALS)
+        assert response.status_code == 200
+        user = response.json()
+        assert user["username"] == "operator"
+
+        assert client.post("/api/v1/auth/register", json=CREDENTIALS).status_code == 409
+
+        response = client.post("/api/v1/auth/token", json=CREDENTIALS)
+        assert response.status_code == 200
+        token = response.json()
+        assert token["token_type"] == "bearer"
+        assert token["expires_in"] == settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+        headers = {"Authorization": f"Bearer {token['access_token']}"}
+        response = client.get("/api/v1/auth/me", headers=headers)
+        assert response.status_code == 200
+        assert response.json() == user
+
+
+def test_login_rejects_wrong_credentials(make_client):
+    with make_client(ROUTER) as client:
+        client.post("/api/v1/auth/register", json=CREDENTIALS)
+
+        wrong_password = dict(CREDENTIALS, password="wrong horse")
+        assert client.post("/api/v1/auth/token", json=wrong_password).status_code == 401
+        unknown_user = dict(CREDENTIALS, username="nobody")
+        assert client.post("/api/v1/auth/token", json=unknown_user).status_code == 401
+
+
+def test_me_rejects_bad_tokens(make_client):
+    with make_client(ROUTER) as client:
+        assert client.get("/api/v1/auth/me").status_code == 401
+
+        forged = jwt.encode({"sub": "1"}, "another key", algorithm=settings.ALGORITHM)
+        response = client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {forged}"})
+        assert response.status_code == 401
+
+        expired = create_access_token(1, expires_minutes=-1)
+        response = client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {expired}"})
+        assert response.status_code == 401
+
+        # signed with the right key, but the subject is not a user ID
+        for claims in ({"sub": "operator"}, {}):
+            token = jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+            response = client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == 401
+
+
+def test_password_hashes():
+    hashed = hash_password("correct horse")
+    assert hashed.startswith("$2b$04$")
+    assert verify_password("correct horse", hashed)
+    assert not verify_password("wrong horse", hashed)
+    assert not verify_password("correct horse", "not a hash")
+    # only the first 72 bytes count, as with passlib
+    assert verify_password("x" * 72 + "tail", hash_password("x" * 80))
+
+
+def test_decode_uses_cache():
+    token = create_access_token(7)
+    assert decode_access_token(token)["sub"] == "7"
+    # a cached token is not verified again
+    security.token_cache.put(token, {"sub": "cached", "exp": 2 ** 40})
+    assert decode_access_token(token)["sub"] == "cached"
+
+
+def test_token_cache_expiry_and_size():
+    now = [1000.0]
+    cache = TokenCache(max_entries=2, ttl_seconds=60, clock=lambda: now[0])
+
+    cache.put("a", {"sub": "1", "exp": 1010})
+    cache.put("b", {"sub": "2", "exp": 5000})
+    now[0] = 1010.0
+    # the token expired before the TTL ran out
+    assert cache.get("a") is None
+    assert cache.get("b") == {"sub": "2", "exp": 5000}
+    now[0] = 1060.0
+    assert cache.get("b") is None
+
+    cache.put("c", {"sub": "3"})
+    cache.put("d", {"sub": "4"})
+    cache.get("c")
+    cache.put("e", {"sub": "5"})
+    # d was the least recently used
+    assert cache.get("d") is None
+    assert cache.get("c") == {"sub": "3"}
+    assert cache.get("e") == {"sub": "5"}
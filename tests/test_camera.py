@@ -1,45 +1,96 @@
-import pytest
-from fastapi.testclient import TestClient
-from app.main import app
-from app.db.session import SessionLocal
+from sqlalchemy import create_engine
+
+from app.api.v1.endpoints import cameras
 from app.models.camera import Camera
+from app.services.camera_service import CAMERA_KEY
+
+ROUTER = (cameras.router, "/api/v1/cameras")
+
+
+def add_cameras(db_path, names):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as connection:
+        connection.execute(Camera.__table__.insert(), [{"name": name} for name in names])
+    engine.dispose()
+
+
+def test_create_camera(make_client):
+    with make_client(ROUTER) as client:
+        response = client.post("/api/v1/cameras/", json={"name": "entrance camera"})
+        assert response.status_code == 200
+        data = response.json()
+        assert "id" in data
+        assert data["name"] == "Entrance Camera"
+
+        response = client.post("/api/v1/cameras/", json={"name": "Entrance Camera"})
+        assert response.status_code == 409
+
+
+def rename_in_db(db_path, camera_id, name):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as connection:
+        connection.execute(Camera.__table__.update().where(Camera.id == camera_id).values(name=name))
+    engine.dispose()
+
+
+def test_get_camera(make_client, db_path, fake_redis):
+    with make_client(ROUTER) as client:
+        camera = client.post("/api/v1/cameras/", json={"name": "Test Camera"}).json()
+
+        response = client.get(f"/api/v1/cameras/{camera['id']}")
+        assert response.status_code == 200
+        assert response.json() == camera
+        assert client.portal.call(fake_redis.ttl, CAMERA_KEY.format(camera["id"])) > 0
+
+        # served from the cache, the database is not read again
+        rename_in_db(db_path, camera["id"], "Renamed Behind The Cache")
+        assert client.get(f"/api/v1/cameras/{camera['id']}").json() == camera
+
+
+def test_update_and_delete_invalidate_cache(make_client):
+    with make_client(ROUTER) as client:
+        camera = client.post("/api/v1/cameras/", json={"name": "Gate"}).json()
+        other = client.post("/api/v1/cameras/", json={"name": "Yard"}).json()
+        client.get(f"/api/v1/cameras/{camera['id']}")
+
+        response = client.patch(f"/api/v1/cameras/{camera['id']}", json={"name": "  North Gate "})
+        assert response.status_code == 200
+        assert response.json() == {"id": camera["id"], "name": "North Gate"}
+        assert client.get(f"/api/v1/cameras/{camera['id']}").json()["name"] == "North Gate"
+
+        assert client.patch(f"/api/v1/cameras/{camera['id']}", json={"name": "Yard"}).status_code == 409
+        assert client.patch("/api/v1/cameras/9999", json={"name": "Nowhere"}).status_code == 404
+
+        assert client.delete(f"/api/v1/cameras/{camera['id']}").status_code == 200
+        assert client.get(f"/api/v1/cameras/{camera['id']}").status_code == 404
+        assert client.delete(f"/api/v1/cameras/{camera['id']}").status_code == 404
+        assert client.get(f"/api/v1/cameras/{other['id']}").json() == other
+
+
+def test_list_cameras_by_pages(make_client, db_path):
+    add_cameras(db_path, [f"Camera {number}" for number in range(5)])
+    with make_client(ROUTER) as client:
+        names = []
+        after_id = 0
+        pages = 0
+        while after_id is not None:
+            page = client.get("/api/v1/cameras/", params={"after_id": after_id, "limit": 2}).json()
+            names.extend(camera["name"] for camera in page["items"])
+            after_id = page["next_after"]
+            pages += 1
+        assert names == [f"Camera {number}" for number in range(5)]
+        assert pages == 3
+
+        # a page that is exactly full is followed by an empty one
+        page = client.get("/api/v1/cameras/", params={"limit": 5}).json()
+        assert len(page["items"]) == 5
+        last = client.get("/api/v1/cameras/", params={"after_id": page["next_after"], "limit": 5}).json()
+        assert last == {"items": [], "next_after": None}
+        assert client.get("/api/v1/cameras/", params={"limit": 0}).status_code == 422
+
 
-client = TestClient(app)
-
-# Fixture for creating a temporary camera in the DB
-@pytest.fixture
-def db_camera():
-    db = SessionLocal()
-    camera = Camera(name="Test Camera")
-    db.add(camera)
-    db.commit()
-    db.refresh(camera)
-    yield camera
-    db.delete(camera)
-    db.commit()
-    db.close()
-
-
-def test_create_camera():
-    response = client.post(
-        "/api/v1/cameras/",
-        json={"name": "Entrance Camera"}
-    )
-    assert response.status_code == 200
-    data = response.json()
-    assert "id" in data
-    assert data["name"] == "Entrance Camera"
-
-
-def test_get_camera(db_camera):
-    response = client.get(f"/api/v1/cameras/{db_camera.id}")
-    assert response.status_code == 200
-    data = response.json()
-    assert data["id"] == db_camera.id
-    assert data["name"] == db_camera.name
-
-
-def test_get_camera_not_found():
-    response = client.get("/api/v1/cameras/9999")
-    assert response.status_code == 404
-    assert response.json()["detail"] == "Camera not found"
+def test_get_camera_not_found(make_client):
+    with make_client(ROUTER) as client:
+        response = client.get("/api/v1/cameras/9999")
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Camera not found"
@@ -0,0 +1,120 @@
+import sys
+import time
+
+import pytest
+
+from app.api.v1.endpoints import metrics, t19
+from app.config import settings
+from app.services.metrics_service import MetricsRegistry, get_metrics_registry
+from app.services.t19_service import get_t19_service
+
+CONFIG = {"Source file": {"id": "WT1"}}
+
+RESULT = {
+    "summary": {"Dataset name": "WT1"},
+    "power_curve": {"wind_speed": [0.0], "direction": [0.0], "p50": [[0.0]], "p10": [[0.0]], "p90": [[0.0]]},
+    "events": {},
+}
+
+
+def stage_records(dataset="WT1"):
+    """records of a run made by the T19 instrumentation"""
+    if settings.T19_REPO_DIR not in sys.path:
+        sys.path.insert(0, settings.T19_REPO_DIR)
+    from t19_ice_loss.instrumentation import Instrumentation
+
+    instrumentation = Instrumentation(dataset)
+    with instrumentation.stage("read") as record:
+        record["rows_out"] = 100
+    with instrumentation.stage("filter", rows_in=100) as record:
+        record["rows_out"] = 60
+    instrumentation.finish(100)
+    return [dict(record) for record in instrumentation.records]
+
+
+class FakeRunner:
+    def __init__(self):
+        self.records = stage_records()
+
+    def __call__(self, config_path, t19_repo_dir):
+        return {**RESULT, "metrics": self.records}
+
+
+@pytest.fixture
+def metrics_client(make_client, t19_service):
+    def make(registry):
+        service = t19_service(FakeRunner(), metrics=registry)
+        return make_client(
+            (t19.router, "/api/v1/t19"),
+            (metrics.router, ""),
+            overrides={get_t19_service: lambda: service, get_metrics_registry: lambda: registry},
+        )
+
+    return make
+
+
+def wait_for_job(client, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/v1/t19/jobs/{job_id}").json()
+        if job["status"] in ("finished", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError("job did not finish")
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    registry.define("requests_total", "counter", "Requests.")
+    registry.define("temperature", "gauge", "Temperature.")
+    registry.inc("requests_total", path='/a"b\\')
+    registry.inc("requests_total", 2, path='/a"b\\')
+    registry.set_max("temperature", 3.5)
+    registry.set_max("temperature", 1.0)
+
+    assert registry.render() == (
+        "# HELP requests_total Requests.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{path="/a\\"b\\\\"} 3.0\n'
+        "# HELP temperature Temperature.\n"
+        "# TYPE temperature gauge\n"
+        "temperature 3.5\n"
+    )
+
+
+def test_invalid_updates():
+    registry = MetricsRegistry()
+    registry.define("requests_total", "counter", "Requests.")
+    registry.define("requests_total", "counter", "Defining again keeps the values.")
+    with pytest.raises(ValueError):
+        registry.define("requests_total", "gauge", "Requests.")
+    with pytest.raises(ValueError):
+        registry.inc("requests_total", -1)
+
+
+def test_job_stages_are_exposed(metrics_client):
+    with metrics_client(MetricsRegistry()) as client:
+        job = client.post("/api/v1/t19/jobs", json={"dataset": "scada.csv", "config": CONFIG}).json()
+        assert wait_for_job(client, job["id"])["status"] == "finished"
+        # the stage records are not part of the result
+        assert client.get(f"/api/v1/t19/jobs/{job['id']}/result").json() == RESULT
+        # served from the cache
+        client.post("/api/v1/t19/jobs", json={"dataset": "scada.csv", "config": CONFIG})
+
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        lines = response.text.splitlines()
+        assert "# TYPE t19_stage_seconds_total counter" in lines
+        assert 't19_jobs_total{status="finished"} 1.0' in lines
+        assert 't19_jobs_total{status="cached"} 1.0' in lines
+        assert "t19_jobs_running 0.0" in lines
+        assert 't19_stage_runs_total{stage="read"} 1.0' in lines
+        assert 't19_stage_rows_out_total{stage="read"} 100.0' in lines
+        assert 't19_stage_rows_in_total{stage="filter"} 100.0' in lines
+        assert 't19_stage_rows_out_total{stage="filter"} 60.0' in lines
+        assert 't19_dataset_last_run_rows{dataset="WT1"} 100.0' in lines
+        assert any(line.startswith('t19_dataset_last_run_seconds{dataset="WT1"} ') for line in lines)
+        # read has no rows going in, the total is not a stage
+        assert not any(line.startswith('t19_stage_rows_in_total{stage="read"}') for line in lines)
+        assert not any('stage="total"' in line for line in lines)
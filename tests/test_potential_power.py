@@ -0,0 +1,143 @@
+import json
+import os
+
+import pytest
+
+from app.api.v1.endpoints import potential_power
+from app.services.potential_power_service import (
+    CsvPotentialPower,
+    PotentialPowerService,
+    PowerCurveCache,
+    get_potential_power_service,
+    process_lines,
+    read_power_curve_file,
+)
+
+SPEEDS = [0.0, 5.0, 10.0, 15.0]
+DIRECTIONS = [0.0, 90.0, 180.0, 270.0]
+
+
+def curve_text(dataset="WT1", scale=1.0):
+    """powercurve.txt in the layout written by Task19, sector s has s + 1 times the power of sector 0"""
+    lines = []
+    for title, factor in (("Power Curve", 1.0), ("P10 ", 0.5), ("P90 ", 1.5), ("Std.dev. ", 0.1)):
+        lines.append(f"{dataset} {title}")
+        lines.append(" " * 10 + "\t" + "\t".join(f"{d:10.1f}" for d in DIRECTIONS))
+        for speed in SPEEDS:
+            values = [speed * 100 * (sector + 1) * factor * scale for sector in range(len(DIRECTIONS))]
+            lines.append(f"{speed:10.1f}\t" + "\t".join(f"{v:10.1f}" for v in values))
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture
+def curve_dir(tmp_path):
+    directory = tmp_path / "curves"
+    directory.mkdir()
+    (directory / "WT1_powercurve.txt").write_text(curve_text())
+    (directory / "WT2_powercurve.txt").write_text(curve_text("WT2", scale=2.0))
+    return directory
+
+
+@pytest.fixture
+def client(make_client, curve_dir):
+    service = PotentialPowerService(str(curve_dir))
+    router = (potential_power.router, "/api/v1/potential-power")
+    with make_client(router, overrides={get_potential_power_service: lambda: service}) as test_client:
+        yield test_client
+
+
+def test_parse_all_sectors_and_percentiles(curve_dir):
+    curves = read_power_curve_file(str(curve_dir / "WT1_powercurve.txt"))
+    assert curves.wind_speeds.tolist() == SPEEDS
+    assert curves.directions.tolist() == DIRECTIONS
+    assert curves.curves["p50"][:, 2].tolist() == [0.0, 1500.0, 3000.0, 4500.0]
+    assert curves.curves["p10"][1].tolist() == [250.0, 500.0, 750.0, 1000.0]
+
+    power = curves.interpolate([7.5, 7.5, 7.5, 20.0, float("nan")], [10.0, 100.0, 260.0, None, 0.0])
+    assert power["p50"][:4].tolist() == [750.0, 1500.0, 3000.0, 1500.0]
+    assert power["p90"][0] == 1125.0
+    assert power["p50"][4] != power["p50"][4]
+
+
+def test_cache_reparses_changed_file(curve_dir):
+    cache = PowerCurveCache()
+    path = str(curve_dir / "WT1_powercurve.txt")
+    first = cache.get(path)
+    assert cache.get(path) is first
+
+    (curve_dir / "WT1_powercurve.txt").write_text(curve_text(scale=3.0))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    second = cache.get(path)
+    assert second is not first
+    assert second.curves["p50"][1, 0] == 1500.0
+
+
+def test_csv_chunks_match_single_pass(curve_dir):
+    curves = read_power_curve_file(str(curve_dir / "WT1_powercurve.txt"))
+    lines = ["ws,wd,other\n"] + [f"{i % 17},{(i * 37) % 360},x{i}\n" for i in range(1000)] + [",0,missing\n"]
+    whole = "".join(process_lines(CsvPotentialPower(curves, "ws", "wd"), lines, chunk_rows=10 ** 6))
+    chunked = "".join(process_lines(CsvPotentialPower(curves, "ws", "wd"), lines, chunk_rows=7))
+    assert whole == chunked
+    rows = whole.splitlines()
+    assert rows[0] == "ws,wd,other,P_potential_p50,P_potential_p10,P_potential_p90"
+    assert rows[-1] == ",0,missing,,,"
+
+
+def test_batch_groups_turbines(client):
+    response = client.post("/api/v1/potential-power/batch", json={"readings": [
+        {"curve": "WT1_powercurve.txt", "wind_speed": 5.0, "direction": 90.0},
+        {"curve": "WT2_powercurve.txt", "wind_speed": 5.0, "direction": 90.0},
+        {"curve": "WT1_powercurve.txt", "wind_speed": None},
+    ]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0] == {"p50": 1000.0, "p10": 500.0, "p90": 1500.0}
+    assert results[1]["p50"] == 2000.0
+    assert results[2] == {"p50": None, "p10": None, "p90": None}
+
+    response = client.post("/api/v1/potential-power/batch", json={"readings": [
+        {"curve": "../WT1_powercurve.txt", "wind_speed": 5.0},
+    ]})
+    assert response.status_code == 400
+
+
+def test_stream_csv(client):
+    body = "Timestamp,Wind speed [m/s],Wind direction [deg]\n" + "".join(
+        f"{i},{i % 16},180\n" for i in range(20000)
+    )
+    response = client.post(
+        "/api/v1/potential-power/stream",
+        params={"curve": "WT1_powercurve.txt", "dir_col": "Wind direction [deg]", "percentiles": ["p50"]},
+        content=(body[i:i + 4096].encode() for i in range(0, len(body), 4096)),
+        headers={"Content-Type": "text/csv"},
+    )
+    assert response.status_code == 200
+    rows = response.text.splitlines()
+    assert len(rows) == 20001
+    assert rows[0] == "Timestamp,Wind speed [m/s],Wind direction [deg],P_potential_p50"
+    assert rows[6] == "5,5,180,1500.0"
+    assert rows[16] == "15,15,180,4500.0"
+
+    response = client.post(
+        "/api/v1/potential-power/stream",
+        params={"curve": "WT1_powercurve.txt", "wind_col": "wind"},
+        content=body.encode(),
+        headers={"Content-Type": "text/csv"},
+    )
+    assert response.status_code == 400
+
+
+def test_stream_ndjson(client):
+    body = "".join(json.dumps({"id": i, "wind_speed": 10.0, "direction": 270.0}) + "\n" for i in range(3))
+    response = client.post(
+        "/api/v1/potential-power/stream",
+        params={"curve": "WT2_powercurve.txt"},
+        content=body.encode(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    items = [json.loads(line) for line in response.text.splitlines()]
+    assert [item["id"] for item in items] == [0, 1, 2]
+    assert items[0]["p50"] == 8000.0 and items[0]["p10"] == 4000.0
@@ -0,0 +1,213 @@
+import asyncio
+import csv
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from app.api.v1.endpoints import scada
+
+STEP_MS = 10 * 60 * 1000
+
+
+def api_time_to_ms(value):
+    moment = datetime.strptime(value, scada.API_TIME_FORMAT).replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+class MockScadaServer:
+    """Serves one record every 10 minutes, end_time inclusive like a careless API would."""
+
+    def __init__(self):
+        self.requests = []
+        self.fail_once = set()  # start_time values answered with 503 on the first request
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                start = query["start_time"][0]
+                end = query["end_time"][0]
+                with server.lock:
+                    server.requests.append((start, end))
+                    fail = start in server.fail_once
+                    server.fail_once.discard(start)
+                if fail:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                first = api_time_to_ms(start)
+                last = api_time_to_ms(end)
+                records = [
+                    {"timepoint": t, "wind_speed": 5.0, "wind_direction": None, "P_actual_kW": 100.0,
+                     "main_status": 0, "sub_status": 1}
+                    for t in range(first, last + 1, STEP_MS)
+                ]
+                body = json.dumps({"last_data": records[-1] if records else {}, "data_vector": records}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                # odd sized chunks so records are split between chunks
+                for i in range(0, len(body), 97):
+                    chunk = body[i:i + 97]
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/api/scada/wt1/data-log/"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    with MockScadaServer() as mock:
+        yield mock
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def run_ingest(server, out_path, start, end, **kwargs):
+    kwargs.setdefault("window", timedelta(hours=6))
+    kwargs.setdefault("parallel", 3)
+    kwargs.setdefault("backoff", 0.01)
+    return asyncio.run(scada.ingest(server.url, start, end, str(out_path), **kwargs))
+
+
+def test_parser_handles_any_chunking():
+    records = [{"timepoint": i, "wind_speed": i / 2, "note": "a,]}\"b"} for i in range(5)]
+    text = json.dumps({"last_data": {"timepoint": 99}, "data_vector": records, "tail": [1, 2]})
+    for size in (1, 2, 3, 7, len(text)):
+        parser = scada.DataVectorParser()
+        parsed = []
+        for i in range(0, len(text), size):
+            parsed.extend(parser.feed(text[i:i + size]))
+        parsed.extend(parser.close())
+        assert parsed == records
+
+
+def test_parser_fallbacks():
+    parser = scada.DataVectorParser()
+    assert parser.feed(json.dumps([{"timepoint": 1}, {"timepoint": 2}])) == [{"timepoint": 1}, {"timepoint": 2}]
+    assert parser.close() == []
+
+    parser = scada.DataVectorParser()
+    assert parser.feed(json.dumps({"last_data": {"timepoint": 1}})) == []
+    assert parser.close() == [{"timepoint": 1}]
+
+    parser = scada.DataVectorParser()
+    parser.feed('{"data_vector": [{"timepoint": 1}, {"timep')
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_ingest_writes_every_record_once_in_order(server, tmp_path):
+    out_path = tmp_path / "scada_data.csv"
+    start = datetime(2024, 1, 1)
+    end = datetime(2024, 1, 3)
+    written = run_ingest(server, out_path, start, end)
+
+    rows = read_rows(out_path)
+    assert written == len(rows) == 2 * 24 * 6
+    assert rows[0]["Timestamp"] == "1.1.2024 0:00"
+    assert rows[-1]["Timestamp"] == "2.1.2024 23:50"
+    assert rows[0]["Wind direction [deg]"] == "0.0"
+    assert rows[0]["Status"] == "OK" and rows[0]["State"] == "NO"
+    assert len(server.requests) == 8
+    assert not (tmp_path / "scada_data.csv.parts").exists()
+
+
+def test_ingest_retries_failed_windows(server, tmp_path):
+    out_path = tmp_path / "scada_data.csv"
+    server.fail_once = {"2024-01-01T06:00", "2024-01-01T18:00"}
+    run_ingest(server, out_path, datetime(2024, 1, 1), datetime(2024, 1, 2))
+
+    assert len(read_rows(out_path)) == 24 * 6
+    assert len(server.requests) == 4 + 2
+
+
+def test_ingest_resumes_after_last_timepoint(server, tmp_path):
+    out_path = tmp_path / "scada_data.csv"
+    run_ingest(server, out_path, datetime(2024, 1, 1), datetime(2024, 1, 2))
+    server.requests.clear()
+
+    written = run_ingest(server, out_path, datetime(2024, 1, 1), datetime(2024, 1, 2, 12, 0))
+
+    rows = read_rows(out_path)
+    assert written == 12 * 6
+    assert len(rows) == 36 * 6
+    assert len({row["Timestamp"] for row in rows}) == len(rows)
+    # only the new part of the range is requested
+    assert min(start for start, _ in server.requests) == "2024-01-01T23:50"
+    assert max(end for _, end in server.requests) == "2024-01-02T12:00"
+    assert len(server.requests) == 3
+
+
+def test_ingest_drops_rows_of_an_interrupted_append(server, tmp_path):
+    out_path = tmp_path / "scada_data.csv"
+    run_ingest(server, out_path, datetime(2024, 1, 1), datetime(2024, 1, 1, 12, 0))
+    with open(out_path, "a", encoding="utf-8") as f:
+        f.write("1.1.2024 12:00,5.0,0.0,5.0,100.0,OK,NO,NO,OFF\n1.1.2024 12:")
+
+    run_ingest(server, out_path, datetime(2024, 1, 1), datetime(2024, 1, 2))
+
+    rows = read_rows(out_path)
+    assert len(rows) == 24 * 6
+    assert len({row["Timestamp"] for row in rows}) == len(rows)
+
+
+def test_ingest_fails_after_retries(server, tmp_path):
+    out_path = tmp_path / "scada_data.csv"
+    server.fail_once = {"2024-01-01T06:00"}
+    with pytest.raises(scada.httpx.HTTPStatusError):
+        run_ingest(server, out_path, datetime(2024, 1, 1), datetime(2024, 1, 2), retries=0)
+
+    # windows before the failed one are kept and the next run continues from them
+    assert len(read_rows(out_path)) == 6 * 6
+    run_ingest(server, out_path, datetime(2024, 1, 1), datetime(2024, 1, 2))
+    assert len(read_rows(out_path)) == 24 * 6
+
+
+def test_ingest_to_column_store_and_resume(server, tmp_path):
+    column_store = scada.column_store_module()
+    store_path = str(tmp_path / "scada_store")
+    written = asyncio.run(scada.ingest_to_store(
+        server.url, datetime(2024, 1, 1), datetime(2024, 1, 2), store_path,
+        window=timedelta(hours=6), parallel=3, backoff=0.01,
+    ))
+    store = column_store.ColumnStore(store_path)
+    assert written == len(store) == 24 * 6
+    assert store.headers == scada.OUTPUT_FIELDS
+    assert store.timestamps()[0] == column_store.np.datetime64("2024-01-01T00:00")
+    assert store.last_timestamp() == column_store.np.datetime64("2024-01-01T23:50")
+    assert list(store.column(1)[:2]) == [5.0, 5.0]
+    assert store.categories(5) == ["OK"] and store.categories(6) == ["NO"]
+    server.requests.clear()
+
+    written = asyncio.run(scada.ingest_to_store(
+        server.url, datetime(2024, 1, 1), datetime(2024, 1, 2, 12, 0), store_path,
+        window=timedelta(hours=6), parallel=3, backoff=0.01,
+    ))
+    store = column_store.ColumnStore(store_path)
+    assert written == 12 * 6
+    assert len(store) == 36 * 6
+    assert len(set(store.timestamps().tolist())) == len(store)
+    assert min(start for start, _ in server.requests) == "2024-01-01T23:50"
@@ -0,0 +1,91 @@
+import asyncio
+import csv
+import io
+from datetime import datetime, timedelta
+
+from app.api.v1.endpoints import scada_measurements
+from app.api.v1.endpoints.scada import OUTPUT_FIELDS, transform_row
+from app.services import scada_service
+
+ROUTER = (scada_measurements.router, "/api/v1/scada")
+START = datetime(2003, 1, 1)
+STEP_MS = 10 * 60 * 1000
+START_MS = 1041379200000  # 2003-01-01 00:00 UTC
+
+
+def records(days=3):
+    """10 minute records, the power is the number of the record within its day"""
+    per_day = 144
+    return [
+        {"timepoint": START_MS + n * STEP_MS, "wind_speed": 5.0, "wind_direction": None,
+         "P_actual_kW": float(n % per_day), "main_status": 0, "sub_status": 1}
+        for n in range(days * per_day)
+    ]
+
+
+def scada_csv(rows):
+    text = io.StringIO()
+    writer = csv.DictWriter(text, fieldnames=OUTPUT_FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+    return text.getvalue()
+
+
+def test_ingest_and_downsample(make_client, monkeypatch):
+    # small batches, the body is inserted in several transactions
+    monkeypatch.setattr(scada_measurements.settings, "SCADA_INSERT_BATCH_ROWS", 100)
+    body = scada_csv([transform_row(record) for record in records()])
+    with make_client(ROUTER) as client:
+        response = client.post("/api/v1/scada/WT1/measurements", content=body,
+                               headers={"Content-Type": "text/csv"})
+        assert response.status_code == 200
+        assert response.json() == {"received": 432, "inserted": 432}
+        # stored already
+        response = client.post("/api/v1/scada/WT1/measurements", content=body)
+        assert response.json() == {"received": 432, "inserted": 0}
+
+        params = {"start": "2003-01-01T00:00:00", "end": "2003-01-04T00:00:00", "points": 3,
+                  "fields": ["power", "wind_speed"]}
+        series = client.get("/api/v1/scada/WT1/measurements", params=params).json()
+        assert series["bucket_seconds"] == 86400
+        assert [bucket["start"] for bucket in series["buckets"]] == [
+            "2003-01-01T00:00:00", "2003-01-02T00:00:00", "2003-01-03T00:00:00"]
+        for bucket in series["buckets"]:
+            assert bucket["count"] == 144
+            assert bucket["values"]["power"] == {"min": 0.0, "mean": 71.5, "max": 143.0}
+            assert bucket["values"]["wind_speed"] == {"min": 5.0, "mean": 5.0, "max": 5.0}
+
+        # end is exclusive, the bucket length is rounded up
+        params = {"start": "2003-01-01T01:00:00+01:00", "end": "2003-01-01T02:00:00", "points": 7}
+        series = client.get("/api/v1/scada/WT1/measurements", params=params).json()
+        assert series["bucket_seconds"] == 1029
+        assert sum(bucket["count"] for bucket in series["buckets"]) == 12
+        assert [bucket["values"]["power"]["min"] for bucket in series["buckets"]] == [0, 2, 4, 6, 7, 9, 11]
+
+        other = client.get("/api/v1/scada/WT2/measurements", params=params).json()
+        assert other["buckets"] == []
+
+
+def test_invalid_requests(make_client):
+    with make_client(ROUTER) as client:
+        response = client.post("/api/v1/scada/WT1/measurements", content="Time,Power\n1,2\n")
+        assert response.status_code == 400
+        params = {"start": "2003-01-02T00:00:00", "end": "2003-01-01T00:00:00"}
+        assert client.get("/api/v1/scada/WT1/measurements", params=params).status_code == 400
+        params = {"start": "2003-01-01T00:00:00", "end": "2003-01-02T00:00:00", "fields": ["status"]}
+        assert client.get("/api/v1/scada/WT1/measurements", params=params).status_code == 422
+
+
+def test_ingest_rows_skips_rows_without_timestamp(session_factory):
+    rows = [transform_row(record) for record in records(days=1)]
+    rows.append(transform_row({"timepoint": None}))
+
+    async def ingest():
+        async with session_factory() as db:
+            counts = await scada_service.ingest_rows(db, "WT1", rows, batch_rows=50)
+            series = await scada_service.downsample(db, "WT1", START, START + timedelta(days=1), 1, ["power"])
+        return counts, series
+
+    counts, series = asyncio.run(ingest())
+    assert counts == {"received": 144, "inserted": 144}
+    assert series["buckets"][0]["count"] == 144
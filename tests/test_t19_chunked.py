@@ -0,0 +1,71 @@
+import csv
+import math
+import re
+from datetime import datetime
+
+import numpy as np
+
+import t19_chunked
+import t19_counter
+from t19_ice_loss import data_file_handler as dfh
+
+# files of t19_counter that are not written in chunked mode
+NOT_CHUNKED = ("ExampleDataset_alarms.csv", "ExampleDataset_filtered.csv")
+
+
+def longest_event(path, after):
+    with open(path, newline="") as f:
+        events = list(csv.DictReader(f, delimiter=";"))
+    times = [(datetime.fromisoformat(event["start"]), datetime.fromisoformat(event["stop"])) for event in events]
+    return max((event for event in times if event[0] > after), key=lambda event: event[1] - event[0])
+
+
+def assert_same_values(path, expected_path):
+    """same text, numbers may differ in the last digits as chunked sums are added up in a different order"""
+    lines = path.read_text().splitlines()
+    expected_lines = expected_path.read_text().splitlines()
+    assert len(lines) == len(expected_lines), path.name
+    for line, expected_line in zip(lines, expected_lines):
+        if line == expected_line:
+            continue
+        values = re.split(r"[;\t]", line)
+        expected_values = re.split(r"[;\t]", expected_line)
+        assert len(values) == len(expected_values), (path.name, line)
+        for value, expected in zip(values, expected_values):
+            if value.strip() != expected.strip():
+                assert math.isclose(float(value), float(expected), rel_tol=1e-9, abs_tol=1e-9), (path.name, line)
+
+
+def test_chunk_boundaries_inside_events(t19_config, tmp_path):
+    config = t19_config(name="counter")
+    t19_counter.main(config)
+    expected_dir = tmp_path / "counter"
+
+    reader = dfh.CSVimporter()
+    reader.read_file_options_from_file(config)
+    reader.read_data()
+    timestamps = np.array(reader.full_data[:, 0], dtype="datetime64[us]")
+    # the example file is in time order, line n of the data is line n of the file
+    assert len(timestamps) == len(np.unique(timestamps))
+
+    # the first chunk ends right after the first line or in the middle of the longest icing loss or stop of the
+    # second half of the data, the chunks stay large
+    chunk_sizes = []
+    half = timestamps[len(timestamps) // 2].astype(datetime)
+    for name in ("losses", "stops"):
+        start, stop = longest_event(expected_dir / f"ExampleDataset_{name}.csv", half)
+        first = int(np.searchsorted(timestamps, np.datetime64(start, "us")))
+        middle = int(np.searchsorted(timestamps, np.datetime64(start + (stop - start) / 2, "us")))
+        for boundary in (first + 1, middle):
+            assert start < timestamps[boundary].astype(datetime) < stop
+            chunk_sizes.append(boundary)
+
+    for chunk_size in chunk_sizes:
+        name = f"chunks_{chunk_size}"
+        summary = t19_chunked.main(t19_config({"Source file": {"chunk size": str(chunk_size)}}, name=name))
+        assert summary is not None
+        result_dir = tmp_path / name
+        expected_files = sorted(path.name for path in expected_dir.iterdir() if path.name not in NOT_CHUNKED)
+        assert sorted(path.name for path in result_dir.iterdir()) == expected_files
+        for filename in expected_files:
+            assert_same_values(result_dir / filename, expected_dir / filename)
@@ -0,0 +1,138 @@
+import os
+
+import numpy as np
+import pytest
+
+from t19_ice_loss import column_store as cs
+from t19_ice_loss import data_file_handler as dfh
+
+HEADER = "Timestamp,Wind speed [m/s],output power [kW],Status,Heating\n"
+# empty cells and nan, a line out of time order, a status text that only appears in the later lines
+LINES = [
+    "1.1.2003 0:00,9.7,1387,OK,FALSE\n",
+    "1.1.2003 0:10,,990,OK,FALSE\n",
+    "1.1.2003 0:20,nan,1010,STOP,TRUE\n",
+    "1.1.2003 0:40,8.1,,OK,TRUE\n",
+    "1.1.2003 0:30,7.5,800,ERR,FALSE\n",
+]
+
+
+@pytest.fixture
+def small_config(t19_config, tmp_path):
+    data_file = tmp_path / "small.csv"
+    config = t19_config({"Source file": {"filename": str(data_file), "fault columns": "3"}}, name="small")
+
+    def write(lines):
+        data_file.write_text(HEADER + "".join(lines))
+        return config
+
+    return write
+
+
+def reader_for(config, filename=None):
+    reader = dfh.CSVimporter()
+    reader.read_file_options_from_file(config)
+    if filename is not None:
+        reader.filename = filename
+    return reader
+
+
+def assert_same_columns(data, expected):
+    assert data.headers == expected.headers
+    assert len(data) == len(expected)
+    for index in range(len(expected.headers)):
+        column = np.asarray(data.column(index))
+        assert column.dtype == expected.column(index).dtype
+        np.testing.assert_array_equal(column, expected.column(index))
+
+
+def test_store_keeps_dtypes_and_missing_values(small_config, tmp_path):
+    config = small_config(LINES)
+    store_path = str(tmp_path / "store")
+    assert reader_for(config).write_column_store(store_path) == len(LINES)
+
+    assert cs.is_column_store(store_path)
+    assert not cs.is_column_store(str(tmp_path / "small.csv"))
+    store = cs.ColumnStore(store_path)
+    assert store.headers == HEADER.strip().split(",")
+    assert len(store) == len(LINES)
+    assert [store.column(index).dtype for index in range(5)] == [
+        cs.TIMESTAMP_DTYPE, cs.FLOAT_DTYPE, cs.FLOAT_DTYPE, cs.CODE_DTYPE, cs.BOOL_DTYPE]
+    # rows are in time order
+    assert np.all(np.diff(store.timestamps()) > np.timedelta64(0))
+    np.testing.assert_array_equal(np.isnan(store.column(1)), [False, True, True, False, False])
+    np.testing.assert_array_equal(np.isnan(store.column(2)), [False, False, False, False, True])
+    assert store.is_text(3) and not store.is_text(4)
+    assert store.categories(3) == ["OK", "STOP", "ERR"]
+    assert [store.categories(3)[code] for code in store.column(3)] == ["OK", "OK", "STOP", "ERR", "OK"]
+    np.testing.assert_array_equal(store.column(4), [False, False, True, False, True])
+
+    # reading the store gives the typed columns and rows of the .csv file
+    expected = reader_for(config).read_data_columns()
+    from_store = reader_for(config, store_path)
+    from_store.read_data()
+    assert_same_columns(from_store.column_data, expected)
+    from_csv = reader_for(config)
+    from_csv.read_data()
+    assert from_store.fault_dict == from_csv.fault_dict
+    np.testing.assert_array_equal(from_store.full_data[:, 0], from_csv.full_data[:, 0])
+    np.testing.assert_allclose(np.asarray(from_store.full_data[:, 1:], dtype=float),
+                               np.asarray(from_csv.full_data[:, 1:], dtype=float), equal_nan=True)
+
+
+def test_appending_to_an_existing_store(small_config, tmp_path):
+    store_path = str(tmp_path / "store")
+    assert reader_for(small_config(LINES[:3])).write_column_store(store_path) == 3
+    assert cs.ColumnStore(store_path).categories(3) == ["OK", "STOP"]
+
+    # bytes left behind by an interrupted append are not part of the store
+    with open(os.path.join(store_path, "column_1.bin"), "ab") as column_file:
+        column_file.write(b"\x00" * 5)
+
+    # the whole file again, the rows that are already in the store are dropped
+    config = small_config(LINES)
+    assert reader_for(config).write_column_store(store_path) == 2
+    assert reader_for(config).write_column_store(store_path) == 0
+    store = cs.ColumnStore(store_path)
+    assert len(store) == len(LINES)
+    assert store.categories(3) == ["OK", "STOP", "ERR"]
+    assert store.last_timestamp() == np.datetime64("2003-01-01T00:40")
+    assert_same_columns(reader_for(config, store_path).read_store(), reader_for(config).read_data_columns())
+
+    # older and repeated rows are dropped, the new ones are sorted
+    writer = cs.ColumnStoreWriter(store_path)
+    timestamps = np.array(["2003-01-01T00:50", "2003-01-01T00:30", "2003-01-01T01:00", "2003-01-01T00:50"],
+                          dtype="datetime64[us]")
+    added = writer.append([timestamps, [1.0, 2.0, np.nan, 4.0], [5.0, 6.0, 7.0, 8.0], ["OK", "OK", "ICE", "OK"],
+                           [True, False, True, False]])
+    assert added == 2
+    store = cs.ColumnStore(store_path)
+    np.testing.assert_array_equal(store.timestamps(len(LINES)), timestamps[[0, 2]])
+    np.testing.assert_array_equal(store.column(1, len(LINES)), [1.0, np.nan])
+    assert store.categories(3) == ["OK", "STOP", "ERR", "ICE"]
+    np.testing.assert_array_equal(store.column(3, len(LINES)), [0, 3])
+
+    # only the rows between the start and stop time are read
+    data = reader_for(config, store_path).read_store(np.datetime64("2003-01-01T00:20"),
+                                                     np.datetime64("2003-01-01T00:50"))
+    np.testing.assert_array_equal(data.timestamps, store.timestamps(2, 6))
+
+    with pytest.raises(ValueError):
+        cs.ColumnStoreWriter(store_path, ["Timestamp", "Wind speed [m/s]"])
+    with pytest.raises(ValueError):
+        writer.append([timestamps])
+
+
+def test_example_dataset_round_trip(t19_config, tmp_path):
+    config = t19_config()
+    store_path = str(tmp_path / "store")
+    from_csv = reader_for(config)
+    from_csv.read_data()
+    assert from_csv.write_column_store(store_path) == len(from_csv.full_data)
+
+    from_store = reader_for(config, store_path)
+    from_store.read_data()
+    assert from_store.headers == from_csv.headers
+    np.testing.assert_array_equal(from_store.full_data[:, 0], from_csv.full_data[:, 0])
+    np.testing.assert_allclose(np.asarray(from_store.full_data[:, 1:], dtype=float),
+                               np.asarray(from_csv.full_data[:, 1:], dtype=float), equal_nan=True)
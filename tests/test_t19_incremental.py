@@ -0,0 +1,110 @@
+import numpy as np
+
+import t19_incremental
+from t19_ice_loss import data_file_handler as dfh
+from t19_ice_loss import incremental as inc
+
+from tests.conftest import T19_DIR
+
+
+def read_data(config):
+    reader = dfh.CSVimporter()
+    reader.read_file_options_from_file(config)
+    reader.read_data()
+    return reader
+
+
+def new_counter(config, reader):
+    aepc = inc.IncrementalAEPcounter()
+    aepc.fault_dict = reader.fault_dict
+    aepc.set_data_options_from_file(config)
+    aepc.set_binning_options_from_file(config)
+    aepc.set_filtering_options_from_file(config)
+    aepc.set_ips_options_from_file(config)
+    aepc.set_incremental_options_from_file(config)
+    return aepc
+
+
+def update_in_parts(aepc, data, splits):
+    events = []
+    for part in np.split(data, splits):
+        events.extend(aepc.update(part.copy()))
+    return events
+
+
+def closed_events(events):
+    return sorted((event for event in events if event[1] == "closed"), key=lambda event: (event[0], event[2]))
+
+
+def splits_inside_events(data, events):
+    """line indices that split the data evenly and in the middle of the longest loss and stop events"""
+    timestamps = np.array(data[:, 0], dtype="datetime64[us]")
+    splits = [len(data) // 4, len(data) // 2, 3 * len(data) // 4]
+    for name in ("losses", "stops"):
+        start, stop = max(((event[2], event[3]) for event in events if event[0] == name and event[1] == "closed"),
+                          key=lambda times: times[1] - times[0])
+        splits.append(int(np.searchsorted(timestamps, np.datetime64(start + (stop - start) / 2, "us"))))
+    return sorted(splits)
+
+
+def test_appends_give_the_results_of_one_update(t19_config):
+    config = t19_config()
+    reader = read_data(config)
+    full = new_counter(config, reader)
+    full_events = full.update(reader.full_data.copy())
+    pc = full.power_curves()
+    splits = splits_inside_events(reader.full_data, full_events)
+
+    # the power curve sketch does not depend on how the data is split
+    appended = new_counter(config, reader)
+    update_in_parts(appended, reader.full_data, splits)
+    np.testing.assert_allclose(appended.power_curves(), pc, rtol=1e-9, equal_nan=True)
+
+    # with the same curve the events are the same, the curve drift of earlier updates is left out
+    full = new_counter(config, reader)
+    full.power_curves = lambda: pc
+    full_events = full.update(reader.full_data.copy())
+    appended = new_counter(config, reader)
+    appended.power_curves = lambda: pc
+    appended_events = update_in_parts(appended, reader.full_data, splits)
+
+    assert len(closed_events(full_events)) > 0
+    assert closed_events(appended_events) == closed_events(full_events)
+    assert appended.open_events == full.open_events
+    assert appended.finalized == full.finalized
+    assert appended.last_timestamp == full.last_timestamp
+
+
+def test_runs_resume_from_the_state_file(t19_config, tmp_path):
+    lines = (T19_DIR / "fake_data2.csv").read_text().splitlines(keepends=True)
+    data_file = tmp_path / "data.csv"
+    cli_config = t19_config({"Source file": {"filename": str(data_file)}}, name="cli")
+    memory_config = t19_config({"Source file": {"filename": str(data_file)}}, name="memory")
+
+    # the data file grows between the runs, the script reads the new lines and saves its state every time
+    memory = None
+    memory_events = []
+    for end in (len(lines) // 3, 2 * len(lines) // 3, len(lines)):
+        data_file.write_text("".join(lines[:end]))
+        t19_incremental.main(cli_config)
+        reader = read_data(memory_config)
+        if memory is None:
+            memory = new_counter(memory_config, reader)
+        memory_events.extend(memory.update(reader.full_data))
+
+    memory_file = tmp_path / "memory_event_updates.csv"
+    dfh.Result_file_writer().write_event_updates(str(memory_file), memory_events)
+    assert (tmp_path / "cli" / "ExampleDataset_event_updates.csv").read_text() == memory_file.read_text()
+
+    reader = read_data(cli_config)
+    resumed = new_counter(cli_config, reader)
+    assert resumed.load_state(resumed.state_file)
+    assert resumed.last_timestamp == memory.last_timestamp
+    assert resumed.finalized == memory.finalized
+    assert resumed.open_events == memory.open_events
+    np.testing.assert_allclose(resumed.power_curves(), memory.power_curves(), equal_nan=True)
+    assert np.array_equal(resumed.pending[:, 0], memory.pending[:, 0])
+    np.testing.assert_allclose(np.asarray(resumed.pending[:, 1:], dtype=float),
+                               np.asarray(memory.pending[:, 1:], dtype=float), equal_nan=True)
+    # nothing new, nothing to report
+    assert resumed.update(reader.full_data) == []
@@ -0,0 +1,181 @@
+import configparser
+import csv
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+
+from app.api.v1.endpoints import t19
+from app.config import settings
+from app.services.t19_service import get_t19_service, job_config, run_t19_job
+
+CONFIG = {
+    "Source file": {"id": "WT1", "datetime format": "%d.%m.%Y %H:%M"},
+    "Data Structure": {"rated power": "2000"},
+}
+
+RESULT = {
+    "summary": {"Dataset name": "WT1", "Total Losses": "123.4"},
+    "power_curve": {
+        "wind_speed": [0.0, 1.0],
+        "direction": [0.0],
+        "p50": [[0.0], [10.0]],
+        "p10": [[0.0], [5.0]],
+        "p90": [[0.0], [15.0]],
+    },
+    "events": {"losses": [{"start": "2003-01-01 00:00:00", "loss": "1.0"}]},
+}
+
+
+class FakeRunner:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, config_path, t19_repo_dir):
+        self.calls.append(config_path)
+        if self.fail:
+            raise RuntimeError("T19 crashed")
+        with open(config_path) as f:
+            assert "%d.%m.%Y %H:%M" in f.read()
+        return RESULT
+
+
+@pytest.fixture
+def t19_client(make_client, t19_service):
+    def make(runner):
+        service = t19_service(runner)
+        return make_client((t19.router, "/api/v1/t19"), overrides={get_t19_service: lambda: service})
+
+    return make
+
+
+def example_config():
+    """Sections of the example.ini of the T19 repository."""
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read(Path(settings.T19_REPO_DIR) / "example.ini")
+    return {section: dict(parser.items(section)) for section in parser.sections()}
+
+
+def wait_for_job(client, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/v1/t19/jobs/{job_id}").json()
+        if job["status"] in ("finished", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError("job did not finish")
+
+
+def test_submit_job_and_get_result(t19_client):
+    runner = FakeRunner()
+    with t19_client(runner) as client:
+        response = client.post("/api/v1/t19/jobs", json={"dataset": "scada.csv", "config": CONFIG})
+        assert response.status_code == 202
+        job = response.json()
+        assert job["cached"] is False
+
+        job = wait_for_job(client, job["id"])
+        assert job["status"] == "finished"
+
+        response = client.get(f"/api/v1/t19/jobs/{job['id']}/result")
+        assert response.status_code == 200
+        assert response.json() == RESULT
+        assert len(runner.calls) == 1
+
+
+def test_identical_job_is_served_from_cache(t19_client):
+    runner = FakeRunner()
+    with t19_client(runner) as client:
+        first = client.post("/api/v1/t19/jobs", json={"dataset": "scada.csv", "config": CONFIG}).json()
+        wait_for_job(client, first["id"])
+
+        second = client.post("/api/v1/t19/jobs", json={"dataset": "scada.csv", "config": CONFIG}).json()
+        assert second["status"] == "finished"
+        assert second["cached"] is True
+        assert second["fingerprint"] == first["fingerprint"]
+        assert client.get(f"/api/v1/t19/jobs/{second['id']}/result").json() == RESULT
+        assert len(runner.calls) == 1
+
+        # a different config is a different job
+        other_config = {**CONFIG, "Filtering": {"icing time": "6"}}
+        third = client.post("/api/v1/t19/jobs", json={"dataset": "scada.csv", "config": other_config}).json()
+        assert third["cached"] is False
+        assert third["fingerprint"] != first["fingerprint"]
+        wait_for_job(client, third["id"])
+        assert len(runner.calls) == 2
+
+
+def test_failed_job(t19_client):
+    with t19_client(FakeRunner(fail=True)) as client:
+        job = client.post("/api/v1/t19/jobs", json={"dataset": "scada.csv", "config": CONFIG}).json()
+        job = wait_for_job(client, job["id"])
+        assert job["status"] == "failed"
+        assert "T19 crashed" in job["error"]
+
+        response = client.get(f"/api/v1/t19/jobs/{job['id']}/result")
+        assert response.status_code == 409
+
+
+def test_invalid_requests(t19_client):
+    with t19_client(FakeRunner()) as client:
+        response = client.post("/api/v1/t19/jobs", json={"dataset": "../secret.csv", "config": CONFIG})
+        assert response.status_code == 400
+
+        response = client.post("/api/v1/t19/jobs", json={"dataset": "missing.csv", "config": CONFIG})
+        assert response.status_code == 400
+
+        response = client.post("/api/v1/t19/jobs", json={"dataset": "scada.csv", "config": {"Output": {}}})
+        assert response.status_code == 400
+
+        response = client.get("/api/v1/t19/jobs/doesnotexist")
+        assert response.status_code == 404
+
+
+def test_hostile_config_is_rejected(t19_client, tmp_path):
+    victim = tmp_path / "victim"
+    victim.mkdir()
+    (victim / "keep.npy").write_bytes(b"data")
+    hostile = {"cache directory": str(victim), "max size": "0", "max age": "0"}
+    runner = FakeRunner()
+    with t19_client(runner) as client:
+        for config in ({**CONFIG, "Cache": hostile},
+                       {**CONFIG, "Output": {"metrics file": str(victim / "metrics.jsonl")}},
+                       {**CONFIG, "Incremental": {"state file": str(victim / "state.npz")}},
+                       {**CONFIG, "Filtering": {"no such option": "1"}}):
+            response = client.post("/api/v1/t19/jobs", json={"dataset": "scada.csv", "config": config})
+            assert response.status_code == 400, config
+    assert runner.calls == []
+    assert [path.name for path in victim.iterdir()] == ["keep.npy"]
+
+    # the service's own cache options replace any Cache section
+    parser = job_config({**CONFIG, "Cache": hostile}, "data.csv", str(tmp_path / "result"), str(tmp_path / "cache"))
+    assert dict(parser.items("Cache")) == {"power curve cache": "True", "cache directory": str(tmp_path / "cache")}
+
+
+def test_real_runner_on_example_dataset(t19_client, tmp_path, data_dir):
+    shutil.copy(Path(settings.T19_REPO_DIR) / "fake_data2.csv", data_dir / "fake_data2.csv")
+    with t19_client(run_t19_job) as client:
+        job = client.post("/api/v1/t19/jobs", json={"dataset": "fake_data2.csv", "config": example_config()}).json()
+        job = wait_for_job(client, job["id"], timeout=300.0)
+        assert job["status"] == "finished", job["error"]
+
+        response = client.get(f"/api/v1/t19/jobs/{job['id']}/result")
+        assert response.status_code == 200
+        result = response.json()
+    # the power curves are cached in the work directory of the service
+    assert list((tmp_path / "work" / "pc_cache").glob("*.npy"))
+
+    result_dir = tmp_path / "work" / job["fingerprint"]
+    with open(result_dir / "ExampleDataset_ips.csv", newline="") as f:
+        ips_rows = list(csv.reader(f, delimiter=";"))[1:]
+    assert ips_rows
+    assert [list(row.values()) for row in result["events"]["ips"]] == ips_rows
+    assert [row["ips consumption"] for row in result["events"]["ips"]] == [row[9] for row in ips_rows]
+
+    # P10 section of the powercurve file: title, sector centers, one line per wind speed bin
+    lines = (result_dir / "ExampleDataset_powercurve.txt").read_text().splitlines()
+    start = lines.index("ExampleDataset P10 ") + 2
+    p10 = [[float(value) for value in line.split("\t")[1:]] for line in lines[start:start + len(result["power_curve"]["wind_speed"])]]
+    assert result["power_curve"]["p10"] == p10
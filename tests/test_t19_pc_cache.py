@@ -0,0 +1,10 @@
+import t19_counter
+
+
+def test_power_curve_cache_is_opt_in(t19_config, tmp_path):
+    t19_counter.main(t19_config(name="default"))
+    assert (tmp_path / "default" / "ExampleDataset_summary.txt").exists()
+    assert not (tmp_path / "default" / "pc_cache").exists()
+
+    t19_counter.main(t19_config({"Cache": {"power curve cache": "True"}}, name="cached"))
+    assert list((tmp_path / "cached" / "pc_cache").glob("*.npy"))
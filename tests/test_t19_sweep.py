@@ -0,0 +1,51 @@
+import csv
+
+import pytest
+
+import t19_counter
+import t19_sweep
+
+# sweep result field, t19_counter summary field
+SUMMARY_FIELDS = [
+    ("icing hours", "Icing during production"),
+    ("stop hours", "Turbine stopped during production"),
+    ("overproduction hours", "Over production hours"),
+    ("theoretical production", "Theoretical mean production"),
+    ("production", "Observed power production"),
+    ("icing loss %", "Relative production losses due to icing"),
+    ("stop loss %", "Relative losses due to icing related stops"),
+]
+
+
+def read_events(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f, delimiter=";"))
+
+
+def test_combinations_match_plain_runs(t19_config, tmp_path):
+    result_file = tmp_path / "sweep.csv"
+    rows = t19_sweep.main(t19_config(name="sweep"), workers=2, result_file=str(result_file),
+                          values=["icing time=3,6"])
+
+    assert [row["icing time"] for row in rows] == [3, 6]
+    with open(result_file, newline="") as f:
+        assert [line["icing time"] for line in csv.DictReader(f)] == ["3", "6"]
+    # the icing time changes the alarms and nothing else
+    assert rows[0]["icing events"] != rows[1]["icing events"]
+    assert rows[0]["stop loss"] == rows[1]["stop loss"]
+
+    for row in rows:
+        name = f"icing_time_{row['icing time']}"
+        summary = t19_counter.main(t19_config({"Filtering": {"icing time": str(row["icing time"])}}, name=name))
+        losses = read_events(tmp_path / name / "ExampleDataset_losses.csv")
+        stops = read_events(tmp_path / name / "ExampleDataset_stops.csv")
+
+        assert row["icing events"] == len(losses)
+        assert row["icing loss"] == pytest.approx(sum(float(event["loss"]) for event in losses), rel=1e-9)
+        assert row["stop events"] == len(stops)
+        assert row["stop loss"] == pytest.approx(sum(float(event["loss"]) for event in stops), rel=1e-9)
+        assert row["icing loss"] == pytest.approx(float(summary["Production losses due to icing"]), abs=0.05)
+        assert row["stop loss"] == pytest.approx(float(summary["Losses due to icing related stops"]), abs=0.05)
+        # the summary has one decimal
+        for field, summary_field in SUMMARY_FIELDS:
+            assert row[field] == pytest.approx(float(summary[summary_field]), abs=0.05), field